@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Benchmark HTTP gateway throughput with each gateway server mode.
+
+Starts a gRPC server in a scratch directory, then for each configuration
+starts the gateway, drives it with ``--clients`` concurrent keep-alive
+connections for ``--duration`` seconds and reports requests per second.
+
+Two workloads are measured:
+
+- ``run``: ``POST /makefile/run_command`` on a target that sleeps for
+  ``--delay`` seconds, so each request mostly waits on make. This shows how
+  many requests the gateway keeps in flight.
+- ``stats``: ``GET /makefile/scheduler``, a cheap gRPC call, so the gateway's
+  own per-request CPU cost dominates. This shows scaling with worker
+  processes, which needs as many cores.
+
+    python benchmarks/bench_gateway.py --clients 32 --duration 5
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+WORKLOADS = {
+    "run": ("POST", "/makefile/run_command", {"command": "work"}),
+    "stats": ("GET", "/makefile/scheduler", None),
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def _start(args, cwd, env):
+    return subprocess.Popen(
+        [sys.executable, "-m", *args],
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def _stop(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _drive(port, workload, clients, duration):
+    """Run ``clients`` keep-alive clients in parallel; returns (requests, errors)."""
+    method, path, body = WORKLOADS[workload]
+    payload = json.dumps(body) if body else None
+    headers = {"Content-Type": "application/json"} if body else {}
+    counts = [[0, 0] for _ in range(clients)]
+    deadline = time.monotonic() + duration
+
+    def client(count):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        while time.monotonic() < deadline:
+            try:
+                conn.request(method, path, payload, headers)
+                response = conn.getresponse()
+                response.read()
+                count[0 if response.status == 200 else 1] += 1
+            except (OSError, http.client.HTTPException):
+                count[1] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in counts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(c[0] for c in counts), sum(c[1] for c in counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument(
+        "--delay", type=float, default=0.05,
+        help="Seconds the make target of the run workload sleeps",
+    )
+    parser.add_argument(
+        "--workers", default=f"1,{os.cpu_count() or 1}",
+        help="Comma-separated gunicorn worker counts to measure",
+    )
+    parser.add_argument(
+        "--workloads", default=",".join(WORKLOADS),
+        help="Comma-separated workloads to measure",
+    )
+    args = parser.parse_args()
+
+    configs = [("development", 1), ("threaded", 1)]
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print("gunicorn is not installed, skipping the gunicorn mode")
+    else:
+        for workers in dict.fromkeys(int(w) for w in args.workers.split(",")):
+            configs.append(("gunicorn", workers))
+
+    grpc_port = _free_port()
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        GRPC_PORT=str(grpc_port),
+        GRPC_MAX_CONCURRENT=str(args.clients),
+        GRPC_MAX_QUEUE=str(args.clients),
+        GRPC_JOB_DB=":memory:",
+        HTTP_GATEWAY_THREADS=str(args.clients),
+    )
+    with tempfile.TemporaryDirectory() as cwd:
+        with open(os.path.join(cwd, "Makefile"), "w") as f:
+            f.write(f"work:\n\t@sleep {args.delay}\n")
+        server = _start(["veridock.grpc_server", "--port", str(grpc_port)], cwd, env)
+        try:
+            _wait_for_port(grpc_port)
+            results = []
+            for mode, workers in configs:
+                port = _free_port()
+                gateway = _start(
+                    [
+                        "veridock.http_gateway",
+                        "--port", str(port),
+                        "--server", mode,
+                        "--workers", str(workers),
+                    ],
+                    cwd,
+                    env,
+                )
+                try:
+                    _wait_for_port(port)
+                    for workload in args.workloads.split(","):
+                        _drive(port, workload, args.clients, 0.5)  # warm up
+                        done, errors = _drive(
+                            port, workload, args.clients, args.duration
+                        )
+                        results.append(
+                            (mode, workers, workload, done / args.duration, errors)
+                        )
+                finally:
+                    _stop(gateway)
+        finally:
+            _stop(server)
+
+    print(
+        f"{args.clients} clients, {args.duration:g}s per run, "
+        f"{os.cpu_count()} CPUs, run target sleeps {args.delay:g}s"
+    )
+    print(f"{'server':<14}{'workers':>8}{'workload':>10}{'req/s':>10}{'errors':>8}")
+    for mode, workers, workload, rate, errors in results:
+        print(f"{mode:<14}{workers:>8}{workload:>10}{rate:>10.1f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
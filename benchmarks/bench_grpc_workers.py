@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Benchmark gRPC server throughput with each number of worker processes.
+
+For each count in ``--workers``, starts ``python -m veridock.grpc_server
+--workers N`` in a scratch directory and drives it for ``--duration``
+seconds from ``--clients`` client processes. Each client process has its own
+channels, so its connections are spread over the workers by SO_REUSEPORT.
+Reports requests per second.
+
+Two workloads are measured:
+
+- ``stats``: ``GetSchedulerStats``, so the server's own per-request CPU cost
+  (protobuf, interceptors, logging) dominates. This shows scaling with
+  worker processes, which needs as many cores.
+- ``run``: ``RunCommand`` on a no-op make target, adding the cost of
+  starting make.
+
+    python benchmarks/bench_grpc_workers.py --clients 8 --workers 1,4
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT)
+
+WORKLOADS = ("stats", "run")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def _client(port, workload, channels, start, deadline, results):
+    """Call the server in a loop until ``deadline``; puts (requests, errors)."""
+    import grpc
+
+    from veridock import service_pb2, service_pb2_grpc
+
+    # A new connection per channel, not a subchannel shared with the others
+    options = [("grpc.use_local_subchannel_pool", 1)]
+    stubs = [
+        service_pb2_grpc.MakefileServiceStub(
+            grpc.insecure_channel(f"127.0.0.1:{port}", options=options)
+        )
+        for _ in range(channels)
+    ]
+    done = errors = 0
+    while time.time() < start:
+        time.sleep(0.01)
+    while time.time() < deadline:
+        stub = stubs[(done + errors) % channels]
+        try:
+            if workload == "stats":
+                stub.GetSchedulerStats(service_pb2.SchedulerStatsRequest(), timeout=30)
+            else:
+                stub.RunCommand(service_pb2.CommandRequest(command="noop"), timeout=30)
+            done += 1
+        except grpc.RpcError:
+            errors += 1
+    results.put((done, errors))
+
+
+def _drive(port, workload, clients, channels, duration):
+    """Run ``clients`` client processes in parallel; returns (requests, errors)."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    # Leave the client processes time to start before counting
+    start = time.time() + 2
+    processes = [
+        context.Process(
+            target=_client,
+            args=(port, workload, channels, start, start + duration, results),
+        )
+        for _ in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    counts = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return sum(c[0] for c in counts), sum(c[1] for c in counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument(
+        "--channels", type=int, default=4, help="Channels per client process"
+    )
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument(
+        "--workers", default=f"1,{os.cpu_count() or 1}",
+        help="Comma-separated gRPC server worker counts to measure",
+    )
+    parser.add_argument(
+        "--workloads", default=",".join(WORKLOADS),
+        help="Comma-separated workloads to measure",
+    )
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as cwd:
+        with open(os.path.join(cwd, "Makefile"), "w") as f:
+            f.write("noop:\n\t@:\n")
+        for workers in dict.fromkeys(int(w) for w in args.workers.split(",")):
+            port = _free_port()
+            env = dict(
+                os.environ,
+                PYTHONPATH=ROOT,
+                GRPC_PORT=str(port),
+                GRPC_MAX_CONCURRENT=str(args.clients * args.channels),
+                GRPC_MAX_QUEUE=str(args.clients * args.channels),
+                GRPC_JOB_DB=os.path.join(cwd, "jobs.db"),
+                LOG_LEVEL="WARNING",
+            )
+            server = subprocess.Popen(
+                [sys.executable, "-m", "veridock.grpc_server",
+                 "--workers", str(workers)],
+                cwd=cwd,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                _wait_for_port(port)
+                for workload in args.workloads.split(","):
+                    done, errors = _drive(
+                        port, workload, args.clients, args.channels, args.duration
+                    )
+                    results.append(
+                        (workers, workload, done / args.duration, errors)
+                    )
+            finally:
+                server.terminate()
+                try:
+                    server.wait(30)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+                    server.wait()
+
+    print(
+        f"{args.clients} client processes of {args.channels} channels, "
+        f"{args.duration:g}s per run, {os.cpu_count()} CPUs"
+    )
+    print(f"{'workers':>8}{'workload':>10}{'req/s':>10}{'errors':>8}")
+    for workers, workload, rate, errors in results:
+        print(f"{workers:>8}{workload:>10}{rate:>10.1f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
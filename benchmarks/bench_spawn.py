@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Benchmark the cost of starting make from the gRPC server process.
+
+Compares the original ``subprocess.run`` path with each launcher mode on a
+trivial target, so the numbers are dominated by spawn overhead rather than by
+make's own work. The server's heap is what makes forking expensive, so the
+benchmark first grows this process to ``--heap-mb`` (and imports grpc) to
+resemble a running server.
+
+    python benchmarks/bench_spawn.py --runs 200 --heap-mb 300
+
+CPython 3.10+ on Linux already uses vfork in ``subprocess``, which hides most
+of the heap cost; ``--no-vfork`` shows the cost where plain fork is used.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from veridock.launcher import LAUNCHER_MODES, Launcher  # noqa: E402
+
+
+def _subprocess_run(cmd, cwd):
+    """The pre-launcher RunCommand path."""
+    subprocess.run(cmd, capture_output=True, text=True, cwd=cwd)
+
+
+def _launcher_run(launcher):
+    def run(cmd, cwd):
+        process = launcher.spawn(cmd, cwd=cwd)
+        try:
+            process.stdout.read()
+            process.stderr.read()
+        finally:
+            process.stdout.close()
+            process.stderr.close()
+        process.wait()
+
+    return run
+
+
+def _measure(run, cmd, cwd, runs):
+    # Warm up caches (make binary, page cache, fork server start)
+    for _ in range(5):
+        run(cmd, cwd)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run(cmd, cwd)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median": statistics.median(samples),
+        "p95": samples[int(len(samples) * 0.95) - 1],
+        "mean": statistics.fmean(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument(
+        "--heap-mb", type=int, default=300,
+        help="Memory to allocate first, to resemble a loaded server",
+    )
+    parser.add_argument(
+        "--command", default="make -s noop",
+        help="Command to time, run in a directory with a no-op Makefile",
+    )
+    parser.add_argument(
+        "--modes", default=",".join(LAUNCHER_MODES),
+        help="Comma-separated launcher modes to compare",
+    )
+    parser.add_argument(
+        "--no-vfork", action="store_true",
+        help="Make subprocess fork instead of vfork, as CPython < 3.10 and "
+        "platforms without vfork do",
+    )
+    args = parser.parse_args()
+    if args.no_vfork:
+        subprocess._USE_VFORK = False
+
+    import grpc  # noqa: F401  (the server always has it loaded)
+
+    # Touch every page so the memory is really mapped
+    ballast = bytearray(args.heap_mb * 1024 * 1024)
+    for i in range(0, len(ballast), 4096):
+        ballast[i] = 1
+
+    with tempfile.TemporaryDirectory() as cwd:
+        with open(os.path.join(cwd, "Makefile"), "w") as f:
+            f.write("noop:\n\t@:\n")
+        cmd = args.command.split()
+
+        results = {"subprocess.run": _measure(_subprocess_run, cmd, cwd, args.runs)}
+        for mode in args.modes.split(","):
+            launcher = Launcher(mode)
+            launcher.start()
+            try:
+                results[mode] = _measure(_launcher_run(launcher), cmd, cwd, args.runs)
+            finally:
+                launcher.close()
+
+    baseline = results["subprocess.run"]["median"]
+    vfork = "without" if args.no_vfork else "with"
+    print(
+        f"{args.command}, {args.runs} runs, {args.heap_mb} MB heap, "
+        f"subprocess {vfork} vfork"
+    )
+    print(
+        f"{'launcher':<16}{'median ms':>11}{'p95 ms':>10}{'mean ms':>10}"
+        f"{'vs run':>9}"
+    )
+    for name, r in results.items():
+        change = (r["median"] - baseline) / baseline * 100
+        print(
+            f"{name:<16}{r['median']:>11.2f}{r['p95']:>10.2f}{r['mean']:>10.2f}"
+            f"{change:>+8.0f}%"
+        )
+    del ballast
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,48 @@ from pathlib import Path
 from dotenv import load_dotenv
 import os
 
+# Sends /makefile/makefile.MakefileService/<Method> calls straight to the gRPC
+# server's HTTP/JSON and gRPC-Web listener; the other /makefile/* routes stay
+# on the HTTP gateway
+MAKEFILE_RPC_PROXY = """    # Makefile RPCs - gRPC server's HTTP/JSON and gRPC-Web listener
+    handle /makefile/makefile.MakefileService/* {{
+{tracing}        uri strip_prefix /makefile
+        reverse_proxy http://localhost:{port} {{
+            header_up X-Real-IP {{remote}}
+            header_up X-Forwarded-For {{remote}}
+            header_up X-Forwarded-Proto {{scheme}}
+            flush_interval -1
+        }}
+    }}
+
+"""
+
+# Records a span per /makefile/* request and passes its traceparent on; Caddy
+# exports it over OTLP to OTEL_EXPORTER_OTLP_ENDPOINT from its own environment.
+# Without it, a traceparent sent by the browser is still forwarded as it is.
+TRACING = """        tracing {
+            span caddy
+        }
+"""
+
+# Takes a gateway whose /readyz fails (gRPC server down or saturated) out of
+# rotation until it passes again, and retries a request that could not reach
+# one gateway on another, or on the same one once it is back
+GATEWAY_HEALTH = """            health_uri /readyz
+            health_interval {interval}
+            health_timeout 2s
+            fail_duration 30s
+            lb_try_duration 5s
+            lb_try_interval 250ms
+"""
+
+# Serves static/ as it is; replaced by the directives `veridock build` writes
+# next to its output, which serve precompressed and fingerprinted files
+STATIC_FILES = """    # Serve static files
+    root * ./static
+    file_server
+"""
+
 # Load environment variables from .env file
 env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
@@ -13,8 +55,50 @@ load_dotenv(dotenv_path=env_path)
 with open('Caddyfile.template', 'r') as f:
     template = f.read()
 
+# "gateway" proxies every /makefile/* call to the HTTP gateway; "grpc" sends
+# the RPC routes to the gRPC server directly (needs GRPC_HTTP_PORT)
+makefile_backend = os.getenv('MAKEFILE_BACKEND', 'gateway')
+grpc_http_port = os.getenv('GRPC_HTTP_PORT', '0')
+if makefile_backend not in ('gateway', 'grpc'):
+    raise SystemExit(
+        f"Unknown MAKEFILE_BACKEND {makefile_backend!r}, expected gateway or grpc"
+    )
+if makefile_backend == 'grpc' and grpc_http_port in ('', '0'):
+    raise SystemExit("MAKEFILE_BACKEND=grpc needs GRPC_HTTP_PORT to be set")
+
+tracing = ''
+if os.getenv('TRACING_EXPORTER', 'none').strip().lower() == 'otlp':
+    tracing = TRACING
+
+rpc_proxy = ''
+if makefile_backend == 'grpc':
+    rpc_proxy = MAKEFILE_RPC_PROXY.format(port=grpc_http_port, tracing=tracing)
+
+# Space- or comma-separated gateway addresses, one per gateway instance
+gateway_upstreams = os.getenv(
+    'GATEWAY_UPSTREAMS',
+    f"http://localhost:{os.getenv('HTTP_GATEWAY_PORT', '8082')}",
+).replace(',', ' ').split()
+# How often Caddy asks each gateway's /readyz; 0 turns the checks off
+gateway_health_interval = os.getenv('GATEWAY_HEALTH_INTERVAL', '5s')
+gateway_health = ''
+if gateway_health_interval not in ('', '0'):
+    gateway_health = GATEWAY_HEALTH.format(interval=gateway_health_interval)
+
+static_build_dir = os.getenv('STATIC_BUILD_DIR', '.veridock/static')
+static_snippet = os.path.join(static_build_dir, 'caddy.conf')
+static_files = STATIC_FILES
+if os.path.isfile(static_snippet):
+    with open(static_snippet) as f:
+        static_files = f.read()
+
 # Replace placeholders with environment variables
 caddyfile = template.replace('${HTTP_PORT}', os.getenv('HTTP_PORT', '8088'))
+caddyfile = caddyfile.replace('${MAKEFILE_RPC_PROXY}\n', rpc_proxy)
+caddyfile = caddyfile.replace('${STATIC_FILES}', static_files)
+caddyfile = caddyfile.replace('${TRACING}', tracing)
+caddyfile = caddyfile.replace('${GATEWAY_UPSTREAMS}', ' '.join(gateway_upstreams))
+caddyfile = caddyfile.replace('${GATEWAY_HEALTH}', gateway_health)
 
 # Write the generated Caddyfile
 with open('Caddyfile', 'w') as f:
@@ -22,3 +106,15 @@ with open('Caddyfile', 'w') as f:
 
 print("Generated Caddyfile with the following configuration:")
 print(f"- HTTP_PORT: {os.getenv('HTTP_PORT', '8088')}")
+print(f"- MAKEFILE_BACKEND: {makefile_backend}")
+if makefile_backend == 'grpc':
+    print(f"- GRPC_HTTP_PORT: {grpc_http_port}")
+print(f"- Gateways: {', '.join(gateway_upstreams)}")
+if gateway_health:
+    print(f"- Gateway health checks: /readyz every {gateway_health_interval}")
+if tracing:
+    print("- Tracing: OTLP")
+if static_files is STATIC_FILES:
+    print("- Static files: ./static")
+else:
+    print(f"- Static files: {static_build_dir} (built)")
@@ -0,0 +1,2 @@
+from veridock.service_pb2 import *  # noqa
+from veridock.service_pb2 import DESCRIPTOR  # noqa
@@ -0,0 +1 @@
+from veridock.service_pb2_grpc import *  # noqa
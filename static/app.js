@@ -24,19 +24,13 @@ async function init() {
     }
 }
 
-// Load available commands from the server
+// Load available commands from the server's Makefile target index
 async function loadCommands() {
     try {
-        // First try to load from the generated commands.js file
-        if (typeof availableCommands !== 'undefined' && Array.isArray(availableCommands)) {
-            console.log('Using preloaded commands');
-        } else {
-            // Fallback to fetching from the server
-            const response = await fetch('/api/commands');
-            if (!response.ok) throw new Error('Failed to load commands');
-            const data = await response.json();
-            availableCommands = data.commands;
-        }
+        const response = await fetch('/makefile/targets');
+        if (!response.ok) throw new Error('Failed to load commands');
+        const data = await response.json();
+        availableCommands = data.targets.map(target => target.name);
         
         renderCommandList();
     } catch (error) {
@@ -117,7 +111,7 @@ function setupEventListeners() {
     });
 }
 
-// Run the selected command
+// Run the selected command, rendering its output live as it streams in
 async function runCommand() {
     const command = commandInput.value.trim();
     if (!command || isRunning) return;
@@ -127,11 +121,13 @@ async function runCommand() {
     runButton.textContent = 'Running...';
     
     // Clear previous output
-    outputElement.textContent = `$ make ${command}\n\nRunning...`;
-    outputElement.scrollTop = outputElement.scrollHeight;
+    outputElement.textContent = `$ make ${command}\n\n`;
+    outputElement.className = '';
+    
+    let hadError = false;
     
     try {
-        const response = await fetch('/api/run', {
+        const response = await fetch('/makefile/run_command_stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -143,26 +139,39 @@ async function runCommand() {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        const data = await response.json();
-        
-        // Display the command output
-        let output = `$ make ${command}\n\n`;
-        
-        if (data.output) {
-            output += data.output;
-        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
         
-        if (data.error) {
-            output += `\n\nError:\n${data.error}`;
-            outputElement.className = 'error';
-        } else {
-            outputElement.className = 'success';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Server-Sent Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const event = parseServerSentEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+                
+                if (event.type === 'stdout' || event.type === 'stderr') {
+                    outputElement.textContent += event.data.data;
+                } else if (event.type === 'exit') {
+                    hadError = event.data.return_code !== 0;
+                    outputElement.textContent += `\n[exit code ${event.data.return_code}]`;
+                } else if (event.type === 'error') {
+                    hadError = true;
+                    outputElement.textContent += `\n\nError:\n${event.data.error}`;
+                }
+                outputElement.scrollTop = outputElement.scrollHeight;
+            }
         }
         
-        outputElement.textContent = output;
+        outputElement.className = hadError ? 'error' : 'success';
     } catch (error) {
         console.error('Error running command:', error);
-        outputElement.textContent = `$ make ${command}\n\nError: ${error.message}`;
+        outputElement.textContent += `\n\nError: ${error.message}`;
         outputElement.className = 'error';
     } finally {
         isRunning = false;
@@ -172,6 +181,25 @@ async function runCommand() {
     }
 }
 
+// Parse a single Server-Sent Events block into its event type and JSON data
+function parseServerSentEvent(block) {
+    const event = { type: 'message', data: null };
+    const dataLines = [];
+    
+    block.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            event.type = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    
+    if (dataLines.length > 0) {
+        event.data = JSON.parse(dataLines.join('\n'));
+    }
+    return event;
+}
+
 // Show error message
 function showError(message) {
     const errorElement = document.createElement('div');
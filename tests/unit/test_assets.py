@@ -0,0 +1,155 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from veridock import assets
+from veridock.assets import IMMUTABLE, REVALIDATE, StaticSite, build
+
+PAGE = """<html>
+<link rel="stylesheet" href="css/site.css">
+<script src="/app.js"></script>
+<script src="https://cdn.example.com/app.js"></script>
+<p>Loading app.js...</p>
+<script src="{{ url_for('static', filename='app.js') }}"></script>
+</html>
+"""
+
+SCRIPT = "console.log('hello');\n" * 40
+
+
+class AssetsTestCase(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.source = os.path.join(temp_dir.name, "static")
+        self.output = os.path.join(temp_dir.name, "out")
+        self._write("index.html", PAGE)
+        self._write("app.js", SCRIPT)
+        self._write("css/site.css", "body { margin: 0 }\n")
+        self.manifest = build(self.source, self.output)
+
+    def _write(self, path, text):
+        filename = os.path.join(self.source, path)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as f:
+            f.write(text)
+
+    def _read(self, path, mode="r"):
+        with open(os.path.join(self.output, path), mode) as f:
+            return f.read()
+
+
+class TestBuild(AssetsTestCase):
+    def test_fingerprints_and_rewrites(self):
+        """Test that assets get hashed copies that pages point to."""
+        self.assertEqual(sorted(self.manifest), ["app.js", "css/site.css"])
+        hashed = self.manifest["app.js"]
+        self.assertRegex(hashed, r"^app\.[0-9a-f]{10}\.js$")
+        self.assertEqual(self._read(hashed), SCRIPT)
+        self.assertEqual(self._read("app.js"), SCRIPT)
+
+        page = self._read("index.html")
+        site_css = os.path.basename(self.manifest["css/site.css"])
+        self.assertIn(f'href="css/{site_css}"', page)
+        self.assertIn(f'src="/{hashed}"', page)
+        self.assertIn(f"filename='{hashed}'", page)
+        self.assertIn('src="https://cdn.example.com/app.js"', page)
+        self.assertIn("Loading app.js...", page)
+        self.assertEqual(json.loads(self._read("manifest.json")), self.manifest)
+
+    def test_hash_follows_content(self):
+        """Test that only a changed file gets a new name."""
+        self._write("app.js", SCRIPT + "// changed\n")
+        manifest = build(self.source, self.output)
+        self.assertNotEqual(manifest["app.js"], self.manifest["app.js"])
+        self.assertEqual(manifest["css/site.css"], self.manifest["css/site.css"])
+        self.assertFalse(
+            os.path.exists(os.path.join(self.output, self.manifest["app.js"]))
+        )
+
+    def test_precompressed(self):
+        """Test that large text files get compressed siblings, small ones not."""
+        self.assertEqual(
+            gzip.decompress(self._read("app.js.gz", "rb")), SCRIPT.encode()
+        )
+        self.assertFalse(os.path.exists(os.path.join(self.output, "css/site.css.gz")))
+        if assets.brotli is not None:
+            self.assertEqual(
+                assets.brotli.decompress(self._read("app.js.br", "rb")),
+                SCRIPT.encode(),
+            )
+
+    def test_caddy_directives(self):
+        """Test the directives for precompressed, immutable serving."""
+        caddy = self._read("caddy.conf")
+        self.assertIn(f"root * {self.output}", caddy)
+        self.assertIn(f"@immutable path /{self.manifest['app.js']} ", caddy)
+        self.assertIn(f'header @immutable Cache-Control "{IMMUTABLE}"', caddy)
+        self.assertIn("precompressed br gzip", caddy)
+
+    def test_refuses_foreign_output(self):
+        """Test that a directory not built here is never replaced."""
+        self._write("x", "")
+        with self.assertRaisesRegex(ValueError, "not built by veridock"):
+            build(self.source, self.source)
+
+
+class TestStaticSite(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.site = StaticSite(self.output)
+
+    def test_encoding_and_caching(self):
+        """Test that a compressed sibling is chosen and hashed files kept."""
+        hashed = self.manifest["app.js"]
+        found = self.site.lookup(hashed, "gzip, deflate")
+        self.assertEqual(found.filename, os.path.join(self.output, hashed + ".gz"))
+        self.assertEqual(found.encoding, "gzip")
+        self.assertEqual(found.mimetype, "text/javascript")
+        self.assertEqual(found.cache_control, IMMUTABLE)
+
+        found = self.site.lookup("app.js", "gzip;q=0")
+        self.assertIsNone(found.encoding)
+        self.assertEqual(found.cache_control, REVALIDATE)
+
+    def test_etag_depends_on_representation(self):
+        """Test that each encoding of a file has its own ETag."""
+        plain = self.site.lookup("app.js").etag
+        self.assertEqual(self.site.lookup("app.js").etag, plain)
+        self.assertNotEqual(self.site.lookup("app.js", "gzip").etag, plain)
+
+    def test_index_and_fallback(self):
+        """Test that directories and unknown paths serve index.html."""
+        index = os.path.join(self.output, "index.html")
+        self.assertEqual(self.site.lookup("").filename, index)
+        self.assertEqual(self.site.lookup("some/route").filename, index)
+        self.assertEqual(self.site.lookup("manifest.json").filename, index)
+        self.assertIsNone(self.site.lookup("../static/app.js"))
+
+
+class TestGatewayStatic(AssetsTestCase):
+    def test_not_modified(self):
+        """Test that the gateway answers a matching If-None-Match with 304."""
+        from veridock import http_gateway
+
+        with patch.object(http_gateway, "static_site", StaticSite(self.output)):
+            app = http_gateway.app
+            with app.test_request_context("/", headers={"Accept-Encoding": "gzip"}):
+                response = http_gateway.static_file("app.js")
+                etag = response.headers["ETag"]
+                self.assertEqual(response.headers["Content-Encoding"], "gzip")
+                self.assertEqual(response.headers["Cache-Control"], REVALIDATE)
+                response.close()
+
+            headers = {"Accept-Encoding": "gzip", "If-None-Match": etag}
+            with app.test_request_context("/", headers=headers):
+                response = http_gateway.static_file("app.js")
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.headers["ETag"], etag)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from veridock.batch import (
+    FAILED,
+    SKIPPED,
+    SUCCEEDED,
+    BatchError,
+    BatchItem,
+    BatchRunner,
+    validate,
+)
+
+
+def item(id, depends_on=()):
+    return BatchItem(id, id, (), tuple(depends_on))
+
+
+class TestValidate(unittest.TestCase):
+    def test_dependents(self):
+        """Test that dependents are indexed by dependency."""
+        dependents = validate([item("a"), item("b", ["a"]), item("c", ["a"])])
+        self.assertEqual(dependents, {"a": ["b", "c"], "b": [], "c": []})
+
+    def test_invalid_batches(self):
+        """Test that duplicates, unknown ids and cycles are rejected."""
+        with self.assertRaisesRegex(BatchError, "Duplicate"):
+            validate([item("a"), item("a")])
+        with self.assertRaisesRegex(BatchError, "unknown"):
+            validate([item("a", ["b"])])
+        with self.assertRaisesRegex(BatchError, "cycle between: a, b"):
+            validate([item("a", ["b"]), item("b", ["a"]), item("c")])
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        """Set up a runner and a recorder of concurrent runs."""
+        self.runner = BatchRunner(max_parallel=4)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.order = []
+
+    def _run(self, batch_item):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.order.append(batch_item.id)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        return batch_item.id, not batch_item.id.startswith("bad")
+
+    def test_independent_commands_run_in_parallel(self):
+        """Test that independent commands overlap and dependents wait."""
+        results, wall = self.runner.run(
+            [item("lint"), item("types"), item("test", ["lint", "types"])],
+            self._run,
+        )
+        self.assertEqual([r.status for r in results], [SUCCEEDED] * 3)
+        self.assertEqual(self.peak, 2)
+        self.assertEqual(self.order[-1], "test")
+        self.assertGreaterEqual(results[2].started, results[0].finished)
+        self.assertLess(wall, 0.14)
+
+    def test_width_limit(self):
+        """Test that no more than the requested width run at once."""
+        self.runner.run([item(str(i)) for i in range(6)], self._run, max_parallel=2)
+        self.assertEqual(self.peak, 2)
+        self.assertEqual(self.runner.width(10), 4)
+
+    def test_failure_skips_dependents(self):
+        """Test that a failed command skips its dependents only."""
+        results, _ = self.runner.run(
+            [item("bad"), item("after", ["bad"]), item("later", ["after"]), item("ok")],
+            self._run,
+        )
+        self.assertEqual(
+            [r.status for r in results], [FAILED, SKIPPED, SKIPPED, SUCCEEDED]
+        )
+        self.assertEqual(sorted(self.order), ["bad", "ok"])
+
+    def test_fail_fast(self):
+        """Test that fail-fast skips everything not yet started."""
+        results, _ = self.runner.run(
+            [item("bad"), item("a"), item("b")],
+            self._run,
+            max_parallel=1,
+            fail_fast=True,
+        )
+        self.assertEqual([r.status for r in results], [FAILED, SKIPPED, SKIPPED])
+
+    def test_exception_is_a_failure(self):
+        """Test that a run raising an exception fails that command."""
+
+        def run(batch_item):
+            raise RuntimeError("boom")
+
+        results, _ = self.runner.run([item("a"), item("b", ["a"])], run)
+        self.assertEqual([r.status for r in results], [FAILED, SKIPPED])
+        self.assertIsInstance(results[0].result, RuntimeError)
+
+    def test_run_async(self):
+        """Test the asyncio runner."""
+
+        async def run(batch_item):
+            await asyncio.sleep(0.05)
+            return batch_item.id, batch_item.id != "bad"
+
+        results, wall = asyncio.run(
+            self.runner.run_async(
+                [item("a"), item("b"), item("bad", ["a"]), item("c", ["bad"])], run
+            )
+        )
+        self.assertEqual(
+            [r.status for r in results], [SUCCEEDED, SUCCEEDED, FAILED, SKIPPED]
+        )
+        self.assertLess(wall, 0.14)
+
+
+if __name__ == "__main__":
+    unittest.main()
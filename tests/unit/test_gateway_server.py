@@ -0,0 +1,129 @@
+import http.client
+import os
+import socket
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from veridock.gateway_server import GatewayServer
+
+
+def slow_app(environ, start_response):
+    """WSGI app that takes a while, like a gateway call waiting on make."""
+    time.sleep(0.2)
+    start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", "2")])
+    return [b"ok"]
+
+
+class TestGatewayServer(unittest.TestCase):
+    def _start(self, **kwargs):
+        """Run a threaded server on a free port; returns the port."""
+        server = GatewayServer(**kwargs)._threaded_server(slow_app, "127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server.server_address[1]
+
+    def _get(self, conn):
+        conn.request("GET", "/")
+        response = conn.getresponse()
+        return response.read()
+
+    def test_concurrent_requests(self):
+        """Test that requests run in parallel up to the thread count."""
+        port = self._start(threads=4)
+        results = []
+
+        def get():
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            results.append(self._get(conn))
+            conn.close()
+
+        start = time.monotonic()
+        clients = [threading.Thread(target=get) for _ in range(4)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        self.assertEqual(results, [b"ok"] * 4)
+        self.assertLess(time.monotonic() - start, 0.6)
+
+    def test_idle_client_times_out(self):
+        """Test that a client that sends nothing does not hold a thread."""
+        port = self._start(threads=1, timeout=0.2)
+        idle = socket.create_connection(("127.0.0.1", port))
+        self.addCleanup(idle.close)
+        idle.settimeout(5)
+        self.assertEqual(idle.recv(1), b"")
+
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        self.addCleanup(conn.close)
+        self.assertEqual(self._get(conn), b"ok")
+
+    def test_invalid_mode(self):
+        """Test that unknown modes are rejected."""
+        with self.assertRaisesRegex(ValueError, "Unknown gateway server"):
+            GatewayServer("uwsgi")
+
+    def test_from_env(self):
+        """Test that settings are read from the environment."""
+        env = {
+            "HTTP_GATEWAY_SERVER": "gunicorn",
+            "HTTP_GATEWAY_WORKERS": "3",
+            "HTTP_GATEWAY_THREADS": "8",
+            "HTTP_GATEWAY_KEEPALIVE": "2",
+            "HTTP_GATEWAY_TIMEOUT": "60",
+        }
+        with patch.dict(os.environ, env):
+            server = GatewayServer.from_env()
+        self.assertEqual(
+            (server.mode, server.workers, server.threads),
+            ("gunicorn", 3, 8),
+        )
+        self.assertEqual((server.keepalive, server.timeout), (2.0, 60.0))
+
+
+class TestServeHttp(unittest.TestCase):
+    def setUp(self):
+        from veridock import http_gateway
+
+        self.gateway = http_gateway
+        for name, value in (("_initialized", True), ("pool", None)):
+            patcher = patch.object(http_gateway, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(http_gateway.ChannelPool, "from_env")
+        self.from_env = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _serve(self, mode):
+        """Run serve_http with a fake server; returns the pool it served with."""
+        server = MagicMock(mode=mode, threads=4)
+        seen = []
+        server.serve.side_effect = lambda app, host, port, post_fork: seen.append(
+            self.gateway.pool
+        )
+        self.gateway.serve_http("127.0.0.1", 8082, server=server)
+        return seen[0], server.serve.call_args.kwargs["post_fork"]
+
+    def test_gunicorn_master_has_no_channels(self):
+        """Test that a gunicorn master closes its pool and workers open their own."""
+        master_pool = self.gateway.pool = MagicMock()
+        pool, post_fork = self._serve("gunicorn")
+        self.assertIsNone(pool)
+        master_pool.close.assert_called_once()
+        self.from_env.assert_not_called()
+
+        post_fork()
+        self.assertIs(self.gateway.pool, self.from_env.return_value)
+
+    def test_threaded_connects(self):
+        """Test that a single-process server opens the pool before serving."""
+        pool, _ = self._serve("threaded")
+        self.assertIs(pool, self.from_env.return_value)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+from veridock.grpc_client import ChannelPool, Deadlines, _service_config
+
+
+class TestDeadlines(unittest.TestCase):
+    def test_endpoint_defaults(self):
+        """Test that long-running endpoints get longer deadlines."""
+        deadlines = Deadlines(default=10, overrides={"list_targets": 5})
+        self.assertEqual(deadlines.timeout("run_command"), 600)
+        self.assertEqual(deadlines.timeout("list_targets"), 5)
+        self.assertEqual(deadlines.timeout("scheduler_stats"), 10)
+        self.assertEqual(deadlines.timeout(None), 10)
+
+    def test_header_override(self):
+        """Test that the request header overrides the deadline up to the max."""
+        deadlines = Deadlines(default=10, maximum=100)
+        self.assertEqual(deadlines.timeout("job", "2.5"), 2.5)
+        self.assertEqual(deadlines.timeout("job", "500"), 100)
+        self.assertEqual(deadlines.timeout("job", "soon"), 10)
+        self.assertEqual(deadlines.timeout("job", "-1"), 10)
+
+    def test_from_env(self):
+        """Test that deadlines are read from the environment."""
+        env = {
+            "HTTP_GATEWAY_DEADLINE": "20",
+            "HTTP_GATEWAY_DEADLINES": "run_command=120, run_batch=900",
+            "HTTP_GATEWAY_MAX_DEADLINE": "600",
+        }
+        with patch.dict(os.environ, env):
+            deadlines = Deadlines.from_env()
+        self.assertEqual(deadlines.timeout("job"), 20)
+        self.assertEqual(deadlines.timeout("run_command"), 120)
+        self.assertEqual(deadlines.timeout("run_batch"), 600)
+
+
+class TestChannelPool(unittest.TestCase):
+    def test_round_robin(self):
+        """Test that calls rotate over the channels."""
+        pool = ChannelPool("localhost:1", size=3)
+        self.addCleanup(pool.close)
+        stubs = [pool.stub() for _ in range(6)]
+        self.assertEqual(len({id(stub) for stub in stubs[:3]}), 3)
+        self.assertEqual(stubs[:3], stubs[3:])
+        self.assertEqual(len(pool.stats()["channels"]), 3)
+
+    def test_retry_policy(self):
+        """Test that only UNAVAILABLE is retried, and only when enabled."""
+        config = json.loads(_service_config(4))["methodConfig"][0]
+        self.assertEqual(config["name"], [{"service": "makefile.MakefileService"}])
+        self.assertEqual(config["retryPolicy"]["maxAttempts"], 4)
+        self.assertEqual(config["retryPolicy"]["retryableStatusCodes"], ["UNAVAILABLE"])
+        config = json.loads(_service_config(1))["methodConfig"][0]
+        self.assertNotIn("retryPolicy", config)
+
+
+if __name__ == "__main__":
+    unittest.main()
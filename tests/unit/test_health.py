@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import unittest
+from concurrent import futures
+from unittest.mock import patch
+
+import grpc
+
+from veridock import health
+from veridock.grpc_client import ChannelPool
+from veridock.health import SERVICES, HealthReporter, ThreadReservation
+from veridock.scheduler import Scheduler
+
+
+class TestHealthReporter(unittest.TestCase):
+    def _statuses(self, target):
+        return [health.check(target, service=service) for service in SERVICES]
+
+    def test_thread_server(self):
+        """Test that the status follows the scheduler's saturation."""
+        scheduler = Scheduler(max_concurrent=1, max_queue=0)
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+        reporter = HealthReporter()
+        reporter.add_to_server(server, scheduler)
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        self.addCleanup(server.stop, None)
+        target = f"127.0.0.1:{port}"
+
+        self.assertEqual(self._statuses(target), ["serving", "serving"])
+        self.assertTrue(health.serving("0.0.0.0", port))
+        ticket = scheduler.submit("test", "a", "interactive")
+        self.assertEqual(self._statuses(target), ["not_serving", "not_serving"])
+        scheduler.release(ticket)
+        self.assertEqual(self._statuses(target), ["serving", "serving"])
+        self.assertEqual(health.check(target, service="other"), "service_unknown")
+
+        # Not serving for good once shutting down
+        reporter.shutdown()
+        scheduler.release(scheduler.submit("test", "a", "interactive"))
+        self.assertEqual(self._statuses(target), ["not_serving", "not_serving"])
+
+    def test_aio_server(self):
+        """Test that changes reported from any thread reach an aio servicer."""
+        scheduler = Scheduler(max_concurrent=1, max_queue=0)
+
+        async def run():
+            server = grpc.aio.server()
+            reporter = HealthReporter(loop=asyncio.get_running_loop())
+            reporter.add_to_server(server, scheduler)
+            port = server.add_insecure_port("127.0.0.1:0")
+            await server.start()
+            target = f"127.0.0.1:{port}"
+            try:
+                seen = [await asyncio.to_thread(health.check, target)]
+                ticket = await asyncio.to_thread(
+                    scheduler.submit, "test", "a", "interactive"
+                )
+                await asyncio.sleep(0.05)
+                seen.append(await asyncio.to_thread(health.check, target))
+                scheduler.release(ticket)
+                await asyncio.sleep(0.05)
+                seen.append(await asyncio.to_thread(health.check, target))
+                await reporter.shutdown_async()
+                seen.append(await asyncio.to_thread(health.check, target))
+                return seen
+            finally:
+                await server.stop(None)
+
+        self.assertEqual(
+            asyncio.run(run()), ["serving", "not_serving", "serving", "not_serving"]
+        )
+
+    def test_unreachable(self):
+        """Test that a server that cannot be reached is reported unavailable."""
+        self.assertEqual(health.check("127.0.0.1:1", timeout=0.5), "unavailable")
+        self.assertFalse(health.serving("127.0.0.1", 1, timeout=0.5))
+
+
+class TestThreadReservation(unittest.TestCase):
+    def test_health_keeps_its_threads(self):
+        """Test that busy calls cannot take the threads kept for health checks."""
+        entered, release = threading.Event(), threading.Event()
+        self.addCleanup(release.set)
+
+        def hold(request, context):
+            entered.set()
+            release.wait(5)
+            return request
+
+        server = grpc.server(
+            futures.ThreadPoolExecutor(max_workers=3),
+            interceptors=[ThreadReservation(3, 2)],
+        )
+        server.add_generic_rpc_handlers([grpc.method_handlers_generic_handler(
+            "test.Slow", {"Hold": grpc.unary_unary_rpc_method_handler(hold)}
+        )])
+        HealthReporter().add_to_server(server)
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        self.addCleanup(server.stop, None)
+        channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+        self.addCleanup(channel.close)
+        call = channel.unary_unary("/test.Slow/Hold")
+
+        running = call.future(b"first", timeout=5)
+        self.assertTrue(entered.wait(5))
+        with self.assertRaises(grpc.RpcError) as raised:
+            call(b"second", timeout=5)
+        self.assertEqual(raised.exception.code(), grpc.StatusCode.RESOURCE_EXHAUSTED)
+        self.assertEqual(health.check_channel(channel), "serving")
+
+        release.set()
+        self.assertEqual(running.result(), b"first")
+        self.assertEqual(call(b"third", timeout=5), b"third")
+
+
+class TestGatewayHealth(unittest.TestCase):
+    def setUp(self):
+        from veridock import http_gateway
+
+        self.scheduler = Scheduler(max_concurrent=1, max_queue=0)
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+        HealthReporter().add_to_server(server, self.scheduler)
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        self.addCleanup(server.stop, None)
+        self.client = http_gateway.app.test_client()
+        self._use_pool(f"127.0.0.1:{port}")
+
+    def _use_pool(self, target):
+        from veridock import http_gateway
+
+        pool = ChannelPool(target, size=2)
+        self.addCleanup(pool.close)
+        patcher = patch.object(http_gateway, "pool", pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_healthz(self):
+        """Test that liveness does not depend on the gRPC server."""
+        self._use_pool("127.0.0.1:1")
+        for path in ("/healthz", "/makefile/healthz"):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(), {"status": "ok"})
+
+    def test_readyz(self):
+        """Test readiness while the gRPC server serves, is saturated and is down."""
+        response = self.client.get("/makefile/readyz")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["grpc_server"], "serving")
+        self.assertEqual(len(response.get_json()["channels"]), 2)
+
+        ticket = self.scheduler.submit("test", "a", "interactive")
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()["status"], "not_ready")
+        self.assertEqual(response.get_json()["grpc_server"], "not_serving")
+        self.scheduler.release(ticket)
+        self.assertEqual(self.client.get("/readyz").status_code, 200)
+
+        self._use_pool("127.0.0.1:1")
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()["grpc_server"], "unavailable")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from veridock import http_gateway
+
+
+class TestRequestBodies(unittest.TestCase):
+    def setUp(self):
+        self.pool = MagicMock()
+        patcher = patch.object(http_gateway, "pool", self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = http_gateway.app.test_client()
+
+    def test_stream_body_not_an_object(self):
+        """Test that a JSON body other than an object is a client error."""
+        for body in ([1, 2], "test", None):
+            response = self.client.post("/run_command_stream", json=body)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json()["return_code"], -1)
+        self.pool.stub.assert_not_called()
+
+    def test_run_command_body_not_an_object(self):
+        """Test that an invalid or non-object JSON body is a client error."""
+        invalid = {"data": "{", "content_type": "application/json"}
+        for kwargs in ({"json": [1, 2]}, invalid):
+            response = self.client.post("/run_command", **kwargs)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json()["error"], "Expected a JSON object")
+        self.pool.stub.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from veridock.jobs import (
+    CANCELLED,
+    LOST,
+    QUEUED,
+    RUNNING,
+    SUCCEEDED,
+    JobQueueFullError,
+    JobStore,
+)
+
+
+class TestJobStore(unittest.TestCase):
+    def setUp(self):
+        """Set up an in-memory store."""
+        self.store = JobStore(max_jobs=3)
+        self.addCleanup(self.store.close)
+
+    def test_lifecycle(self):
+        """Test that a job goes from queued to running to finished."""
+        job = self.store.submit("build", ["X=1"], "ci", priority="high")
+        self.assertEqual(job.state, QUEUED)
+        self.assertEqual(self.store.get(job.id).args, ("X=1",))
+
+        claimed = self.store.claim(timeout=0)
+        self.assertEqual((claimed.id, claimed.state), (job.id, RUNNING))
+        self.assertIsNotNone(claimed.started_at)
+        self.assertIsNone(self.store.claim(timeout=0))
+
+        finished = self.store.finish(job.id, SUCCEEDED, b"result")
+        self.assertTrue(finished.finished)
+        self.assertEqual((finished.state, finished.result), (SUCCEEDED, b"result"))
+
+    def test_claim_order(self):
+        """Test that jobs are claimed oldest first."""
+        first = self.store.submit("a", [], "ci")
+        second = self.store.submit("b", [], "ci")
+        self.assertEqual(self.store.claim(timeout=0).id, first.id)
+        self.assertEqual(self.store.claim(timeout=0).id, second.id)
+
+    def test_cancel(self):
+        """Test that a cancelled job stays cancelled when its run finishes."""
+        job = self.store.submit("build", [], "ci")
+        self.store.claim(timeout=0)
+        self.assertEqual(self.store.cancel(job.id).state, CANCELLED)
+        self.assertEqual(self.store.finish(job.id, SUCCEEDED, b"").state, CANCELLED)
+        self.assertIsNone(self.store.cancel("unknown"))
+
+    def test_wait(self):
+        """Test that waiters wake up when the job finishes."""
+        job = self.store.submit("build", [], "ci")
+        self.assertEqual(self.store.wait(job.id, timeout=0.05).state, QUEUED)
+
+        def finish():
+            time.sleep(0.05)
+            self.store.finish(job.id, SUCCEEDED, b"")
+
+        threading.Thread(target=finish).start()
+        self.assertEqual(self.store.wait(job.id, timeout=5).state, SUCCEEDED)
+        self.assertIsNone(self.store.wait("unknown", timeout=5))
+
+    def test_async(self):
+        """Test the asyncio claim and wait."""
+
+        async def run():
+            claim = asyncio.ensure_future(self.store.claim_async())
+            await asyncio.sleep(0.01)
+            job = self.store.submit("build", [], "ci")
+            self.assertEqual((await claim).id, job.id)
+            waiter = asyncio.ensure_future(self.store.wait_async(job.id, 5))
+            await asyncio.sleep(0.01)
+            self.store.finish(job.id, SUCCEEDED, b"")
+            return await waiter
+
+        self.assertEqual(asyncio.run(run()).state, SUCCEEDED)
+
+    def test_queue_full(self):
+        """Test that unfinished jobs are never pruned to make room."""
+        for _ in range(3):
+            self.store.submit("build", [], "ci")
+        with self.assertRaises(JobQueueFullError):
+            self.store.submit("build", [], "ci")
+
+    def test_prune_finished(self):
+        """Test that the oldest finished jobs make room for new ones."""
+        jobs = [self.store.submit("build", [], "ci") for _ in range(3)]
+        for job in jobs[:2]:
+            self.store.cancel(job.id)
+        self.store.submit("build", [], "ci")
+        self.assertIsNone(self.store.get(jobs[0].id))
+        self.assertIsNotNone(self.store.get(jobs[1].id))
+
+    def test_ttl(self):
+        """Test that finished jobs expire."""
+        store = JobStore(ttl=0)
+        self.addCleanup(store.close)
+        job = store.submit("build", [], "ci")
+        store.cancel(job.id)
+        store.submit("build", [], "ci")
+        self.assertIsNone(store.get(job.id))
+
+
+class TestJobRecovery(unittest.TestCase):
+    def test_restart(self):
+        """Test that queued jobs survive a restart and running ones are lost."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "jobs", "jobs.db")
+            store = JobStore(path)
+            running = store.submit("a", [], "ci")
+            queued = store.submit("b", [], "ci")
+            store.claim(timeout=0)
+            store.close()
+
+            store = JobStore(path)
+            try:
+                self.assertEqual(store.get(running.id).state, LOST)
+                self.assertIsNotNone(store.get(running.id).finished_at)
+                self.assertEqual(store.claim(timeout=0).id, queued.id)
+            finally:
+                store.close()
+
+
+class TestSharedJobStore(unittest.TestCase):
+    def setUp(self):
+        """Set up two stores on one database, as two server processes."""
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        path = os.path.join(temp_dir.name, "jobs.db")
+        self.first = JobStore(path, shared=True)
+        self.addCleanup(self.first.close)
+        self.second = JobStore(path, shared=True)
+        self.addCleanup(self.second.close)
+
+    def test_claims_and_waits(self):
+        """Test each job is claimed once and waits see the other store."""
+        job = self.first.submit("a", [], "ci")
+        self.assertEqual(self.second.claim(timeout=0).id, job.id)
+        self.assertIsNone(self.first.claim(timeout=0))
+
+        # Opening a shared store leaves the other one's running jobs alone
+        JobStore(self.first.path, shared=True).close()
+        self.assertEqual(self.first.get(job.id).state, RUNNING)
+
+        threading.Timer(0.1, self.second.finish, (job.id, SUCCEEDED, b"")).start()
+        started = time.monotonic()
+        self.assertEqual(self.first.wait(job.id, 5).state, SUCCEEDED)
+        self.assertLess(time.monotonic() - started, 2)
+
+        # A job submitted through the other store wakes a blocked claim
+        threading.Timer(0.1, self.second.submit, ("b", [], "ci")).start()
+        self.assertEqual(self.first.claim(timeout=5).command, "b")
+
+    def test_claim_async(self):
+        """Test an asyncio claim polls for jobs of the other store."""
+        threading.Timer(0.1, self.second.submit, ("b", [], "ci")).start()
+        job = asyncio.run(asyncio.wait_for(self.first.claim_async(), 5))
+        self.assertEqual(job.command, "b")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+
+from veridock.launcher import Launcher
+
+
+class LauncherTestMixin:
+    mode = None
+
+    def setUp(self):
+        """Set up a launcher for the mode under test."""
+        self.launcher = Launcher(self.mode)
+        self.addCleanup(self.launcher.close)
+
+    def _run(self, cmd, cwd=None):
+        process = self.launcher.spawn(cmd, cwd=cwd)
+        try:
+            stdout = process.stdout.read()
+            stderr = process.stderr.read()
+        finally:
+            process.stdout.close()
+            process.stderr.close()
+        return stdout, stderr, process.wait()
+
+    def test_output_and_return_code(self):
+        """Test that output is piped and the exit status reported."""
+        stdout, stderr, returncode = self._run(
+            ["sh", "-c", "echo out; echo err >&2; exit 3"]
+        )
+        self.assertEqual(stdout, b"out\n")
+        self.assertEqual(stderr, b"err\n")
+        self.assertEqual(returncode, 3)
+
+    def test_runs_make_in_directory(self):
+        """Test that make runs in the requested directory."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, "Makefile"), "w") as f:
+                f.write("test:\n\t@pwd\n")
+            stdout, _, returncode = self._run(["make", "test"], cwd=temp_dir)
+        self.assertEqual(returncode, 0)
+        self.assertEqual(stdout.decode().strip(), os.path.realpath(temp_dir))
+
+    def test_missing_executable(self):
+        """Test that a missing executable raises like subprocess does."""
+        with self.assertRaises(FileNotFoundError):
+            self.launcher.spawn(["veridock-no-such-command"])
+
+    def test_kill(self):
+        """Test that a running child can be killed."""
+        process = self.launcher.spawn(["sleep", "10"])
+        self.assertIsNone(process.poll())
+        process.kill()
+        self.assertEqual(process.wait(), -9)
+        process.stdout.close()
+        process.stderr.close()
+
+    def test_spawn_async(self):
+        """Test the asyncio interface."""
+
+        async def run():
+            process = await self.launcher.spawn_async(
+                ["sh", "-c", "echo async; exit 4"]
+            )
+            stdout = await process.stdout.read()
+            await process.stderr.read()
+            return stdout, await process.wait()
+
+        self.assertEqual(asyncio.run(run()), (b"async\n", 4))
+
+    def test_wait_async_uses_no_thread(self):
+        """Test that waiting for a child on the event loop starts no thread."""
+        if self.mode == "subprocess":
+            self.skipTest("asyncio's child watcher waits for subprocesses")
+
+        async def run():
+            process = await self.launcher.spawn_async(["sleep", "0.3"])
+            threads = threading.active_count()
+            wait = asyncio.create_task(process.wait())
+            await asyncio.sleep(0.1)
+            self.assertEqual(threading.active_count(), threads)
+            return await wait
+
+        self.assertEqual(asyncio.run(run()), 0)
+
+    def test_kill_async(self):
+        """Test that an asyncio child can be killed while it runs."""
+
+        async def run():
+            process = await self.launcher.spawn_async(["sleep", "10"])
+            self.assertIsNone(process.returncode)
+            process.kill()
+            return await process.wait()
+
+        self.assertEqual(asyncio.run(run()), -9)
+
+
+class TestSubprocessLauncher(LauncherTestMixin, unittest.TestCase):
+    mode = "subprocess"
+
+
+class TestPosixSpawnLauncher(LauncherTestMixin, unittest.TestCase):
+    mode = "posix_spawn"
+
+
+class TestForkServerLauncher(LauncherTestMixin, unittest.TestCase):
+    mode = "forkserver"
+
+
+class TestLauncherConfig(unittest.TestCase):
+    def test_unknown_mode(self):
+        """Test that an unknown mode is rejected."""
+        with self.assertRaises(ValueError):
+            Launcher("threads")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from veridock.log_collector import LogCollector, RotatingLog
+
+
+class TestRotatingLog(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, "logs", "grpc.log")
+
+    def _read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_rotation(self):
+        """Test that full files are moved to .1, .2 and the oldest dropped."""
+        log = RotatingLog(self.path, max_bytes=10, backup_count=2)
+        for chunk in (b"aaaaaa", b"bbbbbb", b"cccc", b"dddddd", b"eeeeee"):
+            log.write(chunk)
+        log.close()
+        self.assertEqual(self._read(self.path), b"eeeeee")
+        self.assertEqual(self._read(self.path + ".1"), b"dddddd")
+        self.assertEqual(self._read(self.path + ".2"), b"bbbbbbcccc")
+        self.assertFalse(os.path.exists(self.path + ".3"))
+
+        # Appended to when opened again
+        log = RotatingLog(self.path, max_bytes=10, backup_count=0)
+        self.assertEqual(log.size, 6)
+        log.write(b"ffff")
+        log.write(b"g")
+        log.close()
+        self.assertEqual(self._read(self.path), b"g")
+
+
+class TestLogCollector(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.dir = temp_dir.name
+        self.lines = []
+
+    def _collector(self, **options):
+        collector = LogCollector(self.dir, echo=self.lines.append, **options)
+        self.addCleanup(collector.close)
+        return collector
+
+    def _spawn(self, code):
+        process = subprocess.Popen(
+            [sys.executable, "-c", code],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        self.addCleanup(process.kill)
+        return process
+
+    def test_collects_every_process(self):
+        """Test output to files and console, partial lines and restarts."""
+        collector = self._collector()
+        grpc = self._spawn("print('one'); print('two', end='')")
+        gateway = self._spawn("import sys; sys.stdout.buffer.write(b'\\xff\\n')")
+        collector.add("grpc", grpc.stdout)
+        collector.add("gateway", gateway.stdout)
+        grpc.wait()
+        gateway.wait()
+        # Restarted: goes on in the same file
+        grpc = self._spawn("print('three')")
+        collector.add("grpc", grpc.stdout)
+        grpc.wait()
+        collector.close()
+
+        with open(collector.path("grpc"), "rb") as f:
+            self.assertEqual(f.read(), b"one\ntwothree\n")
+        with open(collector.path("gateway"), "rb") as f:
+            self.assertEqual(f.read(), b"\xff\n")
+        self.assertEqual(
+            sorted(self.lines),
+            ["[gateway] �", "[grpc] one", "[grpc] three", "[grpc] two"],
+        )
+
+    def test_heavy_output_is_not_blocked(self):
+        """Test that a chatty process runs on while the console is limited."""
+        collector = self._collector(console_rate=20, flush_interval=0.05)
+        process = self._spawn(
+            "import sys\n"
+            "for i in range(200000):\n"
+            "    sys.stdout.write(f'line {i}\\n')\n"
+        )
+        collector.add("grpc", process.stdout)
+        process.wait(10)
+        collector.close()
+
+        with open(collector.path("grpc")) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 200000)
+        self.assertEqual(lines[-1], "line 199999")
+        shown = [line for line in self.lines if "lines not shown" not in line]
+        self.assertLess(len(shown), 200)
+        self.assertEqual(shown[0], "[grpc] line 0")
+        # Every line is shown or counted, the last count at the end
+        self.assertTrue(self.lines[-1].endswith(f"(see {collector.path('grpc')})"))
+        hidden = [int(line.split()[2]) for line in self.lines if line not in shown]
+        self.assertEqual(len(shown) + sum(hidden), 200000)
+
+    def test_flush_interval(self):
+        """Test that pending output is written within the flush interval."""
+        collector = self._collector(flush_interval=0.05)
+        read, write = os.pipe()
+        collector.add("caddy", read)
+        os.write(write, b"started\n")
+        path = collector.path("caddy")
+        deadline = time.monotonic() + 5
+        while not (os.path.exists(path) and os.path.getsize(path)):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        os.close(write)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"started\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
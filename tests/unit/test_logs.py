@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from veridock import logs
+from veridock.logs import JsonFormatter, _QueueHandler, brief, configure_logging
+
+
+class TestBrief(unittest.TestCase):
+    def test_truncates(self):
+        """Test that long payloads are cut and short ones kept."""
+        self.assertEqual(str(brief("short", limit=10)), "short")
+        self.assertEqual(
+            str(brief("x" * 25, limit=10)), "xxxxxxxxxx... [15 more characters]"
+        )
+        self.assertEqual(str(brief(["a"], limit=10)), "['a']")
+
+    def test_lazy(self):
+        """Test that nothing is converted for a disabled level."""
+        converted = []
+
+        class Payload:
+            def __repr__(self):
+                converted.append(self)
+                return "payload"
+
+        logger = logging.getLogger("test_logs.lazy")
+        logger.setLevel(logging.INFO)
+        logger.debug("payload: %s", brief(Payload()))
+        self.assertEqual(converted, [])
+
+
+class TestJsonFormatter(unittest.TestCase):
+    def test_extra_fields(self):
+        """Test that extra fields become JSON keys."""
+        record = logging.makeLogRecord({
+            "name": "veridock.access",
+            "levelname": "INFO",
+            "msg": "%s done",
+            "args": ("GET",),
+            "status": 200,
+        })
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["message"], "GET done")
+        self.assertEqual(entry["logger"], "veridock.access")
+        self.assertEqual(entry["status"], 200)
+        self.assertNotIn("args", entry)
+
+
+class TestQueueHandler(unittest.TestCase):
+    def test_drops_when_full(self):
+        """Test that a full queue drops records and reports how many."""
+        log_queue = queue.Queue(1)
+        handler = _QueueHandler(log_queue)
+        record = logging.makeLogRecord({"msg": "hello"})
+        for _ in range(3):
+            handler.enqueue(record)
+        self.assertEqual(handler.dropped, 2)
+
+        log_queue.get_nowait()
+        handler.enqueue(record)
+        report = log_queue.get_nowait()
+        self.assertEqual(
+            report.getMessage(), "Dropped 2 log records, the log queue was full"
+        )
+
+
+class TestConfigureLogging(unittest.TestCase):
+    def setUp(self):
+        """Restore the root logger after each test."""
+        root = logging.getLogger()
+        saved = root.handlers[:], root.level
+
+        def restore():
+            logs.shutdown()
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+            root.handlers[:], root.level = saved
+
+        self.addCleanup(restore)
+
+    def test_writes_from_background_thread(self):
+        """Test that records reach the file through the writer thread."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "app.log")
+            env = {"LOG_FILE": path, "LOG_FORMAT": "json", "LOG_LEVEL": "DEBUG"}
+            with patch.dict(os.environ, env):
+                configure_logging()
+
+            threads = []
+            handler = logs._listener.handlers[-1]
+            original_emit = handler.emit
+
+            def emit(record):
+                threads.append(threading.current_thread())
+                original_emit(record)
+
+            handler.emit = emit
+            logging.getLogger("test_logs").debug("hello %s", "world")
+            logs.shutdown()
+
+            with open(path) as f:
+                entry = json.loads(f.readline())
+            self.assertEqual(entry["message"], "hello world")
+            self.assertNotIn(threading.current_thread(), threads)
+
+    def test_forked_child_writes_its_own_file(self):
+        """Test that a forked child rotates a file of its own, not the parent's."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "app.log")
+            env = {"LOG_FILE": path, "LOG_MAX_BYTES": "1000", "LOG_BACKUP_COUNT": "2"}
+            with patch.dict(os.environ, env):
+                configure_logging()
+            # What a fork leaves behind: the lock taken, no writer thread
+            logs._listener.stop()
+            logs._lock.acquire()
+            logs._after_fork_in_child()
+
+            handler = logs._listener.handlers[-1]
+            own_path = os.path.join(temp_dir, f"app.{os.getpid()}.log")
+            self.assertEqual(handler.baseFilename, own_path)
+            self.assertEqual((handler.maxBytes, handler.backupCount), (1000, 2))
+            logging.getLogger("test_logs").warning("from the child")
+            logs.shutdown()
+
+            with open(own_path) as f:
+                self.assertIn("from the child", f.read())
+            with open(path) as f:
+                self.assertEqual(f.read(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,22 @@
 import os
+import signal
 import subprocess
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import MagicMock, patch
 
+import grpc
 import service_pb2
 
 # Import the service to test
-from veridock.grpc_server import MakefileService
+from veridock import jobs, launcher
+from veridock.grpc_server import AsyncMakefileService, MakefileService, _serve_workers
+from veridock.jobs import JobStore
+from veridock.output import OutputStore
+from veridock.scheduler import Scheduler
+from veridock.singleflight import SingleFlight
 
 
 class TestMakefileService(unittest.TestCase):
@@ -23,15 +33,21 @@ class TestMakefileService(unittest.TestCase):
         # Restore the original working directory
         os.chdir(self.original_cwd)
 
-    @patch("subprocess.run")
-    def test_run_command_success(self, mock_run):
+    def _write_makefile(self, content):
+        """Create a Makefile in a temporary directory and change into it."""
+        import tempfile
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        with open(os.path.join(temp_dir.name, "Makefile"), "w") as f:
+            f.write(content)
+        os.chdir(temp_dir.name)
+        return temp_dir.name
+
+    @patch("veridock.launcher._Popen", wraps=launcher._Popen)
+    def test_run_command_success(self, mock_popen):
         """Test running a command successfully."""
-        # Setup mock
-        mock_result = MagicMock()
-        mock_result.returncode = 0
-        mock_result.stdout = "Command output"
-        mock_result.stderr = ""
-        mock_run.return_value = mock_result
+        temp_dir = self._write_makefile('test:\n\t@echo "Command output"\n')
 
         # Create a request
         request = service_pb2.CommandRequest(command="test")
@@ -40,51 +56,51 @@ class TestMakefileService(unittest.TestCase):
         response = self.service.RunCommand(request, self.context)
 
         # Assertions
-        self.assertEqual(response.output, "Command output")
+        self.assertEqual(response.output, "Command output\n")
         self.assertEqual(response.error, "")
         self.assertEqual(response.return_code, 0)
-        mock_run.assert_called_once_with(
+        self.assertFalse(response.truncated)
+        self.assertEqual(response.output_size, len("Command output\n"))
+        mock_popen.assert_called_once_with(
             ["make", "test"],
-            capture_output=True,
-            text=True,
-            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=temp_dir,
+            env=None,
+            start_new_session=True,
         )
 
-    @patch("subprocess.run")
-    def test_run_command_with_args(self, mock_run):
+    @patch("veridock.launcher._Popen", wraps=launcher._Popen)
+    def test_run_command_with_args(self, mock_popen):
         """Test running a command with arguments."""
-        # Setup mock
-        mock_result = MagicMock()
-        mock_result.returncode = 0
-        mock_result.stdout = "Command with args"
-        mock_result.stderr = ""
-        mock_run.return_value = mock_result
+        temp_dir = self._write_makefile(
+            'test:\n\t@echo "Command with args $(ARG)"\n'
+        )
 
         # Create a request with arguments
-        request = service_pb2.CommandRequest(command="test", args=["arg1", "arg2"])
+        request = service_pb2.CommandRequest(command="test", args=["ARG=arg1"])
 
         # Call the method
         response = self.service.RunCommand(request, self.context)
 
         # Assertions
-        self.assertEqual(response.output, "Command with args")
-        mock_run.assert_called_once_with(
-            ["make", "test", "arg1", "arg2"],
-            capture_output=True,
-            text=True,
-            cwd=os.path.dirname(os.path.abspath(__file__)),
+        self.assertEqual(response.output, "Command with args arg1\n")
+        mock_popen.assert_called_once_with(
+            ["make", "test", "ARG=arg1"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=temp_dir,
+            env=None,
+            start_new_session=True,
         )
 
-    @patch("subprocess.run")
-    def test_run_command_error(self, mock_run):
+    @patch("veridock.launcher._Popen")
+    def test_run_command_error(self, mock_popen):
         """Test handling command execution errors."""
         # Setup mock to raise an exception
-        mock_run.side_effect = subprocess.CalledProcessError(
-            returncode=1,
-            cmd=["make", "test"],
-            output="Command failed",
-            stderr="Error details",
-        )
+        mock_popen.side_effect = OSError("make not found")
 
         # Create a request
         request = service_pb2.CommandRequest(command="test")
@@ -93,32 +109,329 @@ class TestMakefileService(unittest.TestCase):
         response = self.service.RunCommand(request, self.context)
 
         # Assertions
-        self.assertEqual(response.return_code, 1)
+        self.assertEqual(response.return_code, -1)
         self.assertIn("Error executing command", response.error)
         self.context.set_code.assert_called_once()
         self.context.set_details.assert_called_once()
 
     def test_working_directory(self):
         """Test that the service runs commands in the correct directory."""
-        # Change to a temporary directory
+        self._write_makefile('test:\n\t@echo "Test output"')
+
+        # Create a request
+        request = service_pb2.CommandRequest(command="test")
+
+        # Call the method
+        response = self.service.RunCommand(request, self.context)
+
+        # Assertions
+        self.assertEqual(response.return_code, 0)
+        self.assertEqual(response.output.strip(), "Test output")
+        self.assertEqual(response.error, "")
+
+    def test_large_output_is_truncated(self):
+        """Test that oversized output spills to disk and is readable by range."""
+        self._write_makefile("test:\n\t@seq 1 20000\n")
+        service = MakefileService(
+            output_store=OutputStore(
+                memory_limit=1024, preview=64, spool_dir=os.getcwd()
+            )
+        )
+        expected = "".join(f"{i}\n" for i in range(1, 20001)).encode()
+
+        request = service_pb2.CommandRequest(command="test")
+        response = service.RunCommand(request, self.context)
+
+        self.assertTrue(response.truncated)
+        self.assertEqual(response.output_size, len(expected))
+        self.assertTrue(response.output.startswith("1\n2\n"))
+        self.assertTrue(response.output.endswith("19999\n20000\n"))
+        self.assertIn("bytes omitted", response.output)
+
+        read = service_pb2.ReadOutputRequest(
+            output_id=response.output_id, offset=100, length=50
+        )
+        chunk = service.ReadOutput(read, self.context)
+        self.assertEqual(chunk.data, expected[100:150])
+        self.assertEqual(chunk.total_size, len(expected))
+        self.assertFalse(chunk.eof)
+
+        missing = service_pb2.ReadOutputRequest(output_id="nope")
+        service.ReadOutput(missing, self.context)
+        self.context.set_code.assert_called_once_with(grpc.StatusCode.NOT_FOUND)
+
+    def test_run_command_stream(self):
+        """Test streaming command output with a final exit-status chunk."""
         import tempfile
 
         with tempfile.TemporaryDirectory() as temp_dir:
-            # Create a test Makefile
             makefile_path = os.path.join(temp_dir, "Makefile")
             with open(makefile_path, "w") as f:
-                f.write('test:\n\techo "Test output"')
+                f.write('test:\n\t@echo "line one"\n\t@echo "oops" >&2\n\t@exit 3\n')
+            os.chdir(temp_dir)
 
-            # Create a request
             request = service_pb2.CommandRequest(command="test")
+            chunks = list(self.service.RunCommandStream(request, self.context))
+
+            # Sequence numbers are contiguous and the last chunk carries the status
+            self.assertEqual([c.sequence for c in chunks], list(range(len(chunks))))
+            self.assertTrue(chunks[-1].done)
+            self.assertEqual(chunks[-1].return_code, 2)
 
-            # Call the method
-            response = self.service.RunCommand(request, self.context)
+            stdout = "".join(
+                c.data
+                for c in chunks
+                if c.stream == service_pb2.CommandOutputChunk.STDOUT
+            )
+            stderr = "".join(
+                c.data
+                for c in chunks
+                if c.stream == service_pb2.CommandOutputChunk.STDERR
+            )
+            self.assertIn("line one", stdout)
+            self.assertIn("oops", stderr)
+
+    def test_async_run_command(self):
+        """Test the asyncio service runs make through an asyncio subprocess."""
+        import asyncio
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            makefile_path = os.path.join(temp_dir, "Makefile")
+            with open(makefile_path, "w") as f:
+                f.write('test:\n\t@echo "Test output"\n')
+            os.chdir(temp_dir)
+
+            request = service_pb2.CommandRequest(command="test")
+            response = asyncio.run(
+                AsyncMakefileService().RunCommand(request, self.context)
+            )
 
-            # Assertions
             self.assertEqual(response.return_code, 0)
             self.assertEqual(response.output.strip(), "Test output")
-            self.assertEqual(response.error, "")
+
+
+
+class TestSharedJobCancellation(unittest.TestCase):
+    def setUp(self):
+        """Set up a job store shared with another worker process's store."""
+        import tempfile
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        with open(os.path.join(temp_dir.name, "Makefile"), "w") as f:
+            f.write("slow:\n\t@sleep 30\n")
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(temp_dir.name)
+        path = os.path.join(temp_dir.name, "jobs.db")
+        self.store = JobStore(path, workers=1, shared=True)
+        self.other = JobStore(path, shared=True)
+
+    def _wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+
+    def test_thread_service(self):
+        """Test that a job cancelled through another worker is killed."""
+        service = MakefileService(job_store=self.store)
+        job = self.other.submit("slow", [], "ci")
+        service.start_job_workers()
+        self._wait_for(lambda: job.id in service._job_processes)
+        process = service._job_processes[job.id]
+
+        self.other.cancel(job.id)
+        self._wait_for(lambda: process.poll() is not None)
+        self._wait_for(lambda: job.id not in service._job_processes)
+        self.assertEqual(self.store.get(job.id).state, jobs.CANCELLED)
+
+    def test_async_service(self):
+        """Test that the asyncio service cancels the job's task."""
+        import asyncio
+
+        service = AsyncMakefileService(job_store=self.store)
+        job = self.other.submit("slow", [], "ci")
+
+        async def run():
+            service.start_job_workers()
+            while job.id not in service._job_tasks:
+                await asyncio.sleep(0.05)
+            task = service._job_tasks[job.id]
+            self.other.cancel(job.id)
+            await asyncio.wait_for(asyncio.wait({task}), 5)
+            return task.cancelled()
+
+        self.assertTrue(asyncio.run(run()))
+        self.assertEqual(self.store.get(job.id).state, jobs.CANCELLED)
+
+
+class TestCoalescedRun(unittest.TestCase):
+    def setUp(self):
+        """Set up a service coalescing runs of `help`, one run at a time."""
+        import tempfile
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        with open(os.path.join(temp_dir.name, "Makefile"), "w") as f:
+            f.write("help:\n\t@echo shared\n")
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(temp_dir.name)
+        self.scheduler = Scheduler(max_concurrent=1)
+        self.service = MakefileService(
+            scheduler=self.scheduler, single_flight=SingleFlight(["help"])
+        )
+        self.request = service_pb2.CommandRequest(command="help")
+
+    def _context(self, active=True):
+        context = MagicMock()
+        context.is_active.return_value = active
+        context.invocation_metadata.return_value = ()
+        context.peer.return_value = "ipv4:127.0.0.1:1234"
+        return context
+
+    def _start(self, context, results):
+        def run():
+            try:
+                results.append(self.service.RunCommand(self.request, context))
+            except Exception as e:
+                results.append(e)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread
+
+    def _flight(self):
+        deadline = time.monotonic() + 5
+        while not self.service.single_flight._flights:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        return next(iter(self.service.single_flight._flights.values()))
+
+    def test_leader_caller_gone_while_queued(self):
+        """Test that followers still get the result if the leader's caller leaves."""
+        blocker = self.scheduler.submit("other", "x", "interactive")
+        leader, follower = [], []
+        self._start(self._context(active=False), leader)
+        flight = self._flight()
+        thread = self._start(self._context(), follower)
+        while flight.subscribers < 2:
+            time.sleep(0.01)
+        # Longer than the scheduler polls the callers of queued requests
+        time.sleep(0.7)
+        self.scheduler.release(blocker)
+
+        thread.join(5)
+        self.assertEqual(follower[0].return_code, 0)
+        self.assertEqual(follower[0].output, "shared\n")
+
+    def test_leader_error_reaches_followers(self):
+        """Test that followers are released when the shared run raises."""
+        leader, follower = [], []
+        joined = threading.Event()
+
+        def run(request, context):
+            joined.wait(5)
+            raise RuntimeError("boom")
+
+        with patch.object(self.service, "_run", side_effect=run):
+            leader_thread = self._start(self._context(), leader)
+            flight = self._flight()
+            follower_thread = self._start(self._context(), follower)
+            while flight.subscribers < 2:
+                time.sleep(0.01)
+            joined.set()
+            leader_thread.join(5)
+            follower_thread.join(5)
+        self.assertIsInstance(leader[0], RuntimeError)
+        self.assertIsInstance(follower[0], RuntimeError)
+
+
+class _FakeWorker:
+    """Stands in for a worker's Popen: runs until signalled or ``exit()``."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+        read, write = os.pipe()
+        os.close(write)
+        self.stdout = os.fdopen(read, "rb")
+
+    def exit(self, code):
+        self.returncode = code
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+
+class TestServeWorkers(unittest.TestCase):
+    def setUp(self):
+        """Spawn fake workers, and record the signals sent to them."""
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.spawned = []
+        self.signalled = []
+
+        def popen(cmd, **kwargs):
+            worker = _FakeWorker(100000 + len(self.spawned))
+            self.spawned.append((cmd[cmd.index("--worker-id") + 1], worker))
+            return worker
+
+        def signal_group(pid, sig):
+            self.signalled.append((pid, sig))
+            next(w for _, w in self.spawned if w.pid == pid).exit(-sig)
+
+        for target, value in (
+            ("veridock.grpc_server.WORKERS_STATE_DIR", temp_dir.name),
+            ("veridock.grpc_server.JobStore", MagicMock()),
+            ("veridock.supervisor.subprocess.Popen", popen),
+            ("veridock.supervisor._signal_group", signal_group),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            self.addCleanup(signal.signal, sig, signal.getsignal(sig))
+
+    def _serve(self, stop_with):
+        """Serve two workers; kill worker 0 once, then send ``stop_with``."""
+
+        def drive():
+            deadline = time.monotonic() + 10
+            while len(self.spawned) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.spawned[0][1].exit(1)
+            while len(self.spawned) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            os.kill(os.getpid(), stop_with)
+
+        driver = threading.Thread(target=drive, daemon=True)
+        driver.start()
+        _serve_workers("127.0.0.1", 50051, "thread", 0, 2)
+        driver.join(5)
+
+    def test_restart_then_stop(self):
+        """Test that a dead worker is restarted and a signal stops them all."""
+        for stop_with in (signal.SIGTERM, signal.SIGINT):
+            with self.subTest(signal=stop_with.name):
+                self.spawned.clear()
+                self.signalled.clear()
+                self._serve(stop_with)
+
+                # worker-0 died and was started again; worker-1 kept running
+                self.assertEqual([name for name, _ in self.spawned], ["0", "1", "0"])
+                running = [worker for _, worker in self.spawned[1:]]
+                self.assertCountEqual(
+                    self.signalled,
+                    [(worker.pid, signal.SIGTERM) for worker in running],
+                )
+                # _serve_workers returned once every worker had stopped
+                for _, worker in self.spawned:
+                    self.assertIsNotNone(worker.poll())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+import unittest
+import urllib.request
+from concurrent import futures
+from unittest.mock import patch
+
+import grpc
+
+from veridock import metrics, service_pb2, service_pb2_grpc
+from veridock.metrics import MetricsInterceptor, MetricsServer, Registry
+
+
+class TestRegistry(unittest.TestCase):
+    def test_text_format(self):
+        """Test counters, gauges, histograms and collectors in text format."""
+        registry = Registry()
+        requests = registry.counter("requests_total", "Requests.", ("route",))
+        registry.gauge("threads", "Threads.").set(4)
+        seconds = registry.histogram("seconds", "Latency.", buckets=(0.1, 1))
+        registry.histogram("unused_seconds", "Not observed.")
+        registry.set_collector(
+            "queue", lambda: [("queued", "gauge", "Queued.", [({}, 2)])]
+        )
+        requests.inc('a"b')
+        requests.inc('a"b', amount=2)
+        seconds.observe(0.05)
+        seconds.observe(0.5)
+        seconds.observe(5)
+
+        text = registry.render()
+        self.assertIn("# TYPE requests_total counter\n", text)
+        self.assertIn('requests_total{route="a\\"b"} 3\n', text)
+        self.assertIn("threads 4\n", text)
+        self.assertIn('seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('seconds_bucket{le="1"} 2\n', text)
+        self.assertIn('seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertIn("seconds_count 3\nseconds_sum 5.55\n", text)
+        self.assertIn("queued 2\n", text)
+        self.assertNotIn("unused_seconds", text)
+
+    def test_series_are_bounded(self):
+        """Test that label sets past the limit are counted as "other"."""
+        registry = Registry()
+        runs = registry.counter("runs_total", "Runs.", ("target",))
+        with patch.object(metrics, "MAX_SERIES", 2):
+            for target in ("a", "b", "c", "d", "a"):
+                runs.inc(target)
+        self.assertEqual(runs.value("a"), 2)
+        self.assertEqual(runs.value(metrics.OVERFLOW), 2)
+
+    def test_metrics_server(self):
+        """Test that the metrics port serves the registry."""
+        registry = Registry()
+        registry.counter("up_total", "Up.").inc()
+        server = MetricsServer("127.0.0.1", 0, registry)
+        server.start()
+        self.addCleanup(server.stop)
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as r:
+            self.assertEqual(r.headers["Content-Type"], metrics.CONTENT_TYPE)
+            self.assertIn(b"up_total 1\n", r.read())
+
+
+class FakeService(service_pb2_grpc.MakefileServiceServicer):
+    def RunCommand(self, request, context):
+        if request.command == "missing":
+            context.abort(grpc.StatusCode.NOT_FOUND, "no such target")
+        return service_pb2.CommandResponse()
+
+    def RunCommandStream(self, request, context):
+        yield service_pb2.CommandOutputChunk(done=True)
+
+
+class TestInterceptor(unittest.TestCase):
+    def test_rpcs_are_counted(self):
+        """Test that RPCs are counted by method and status code, and timed."""
+        server = grpc.server(
+            futures.ThreadPoolExecutor(max_workers=2),
+            interceptors=[MetricsInterceptor()],
+        )
+        service_pb2_grpc.add_MakefileServiceServicer_to_server(FakeService(), server)
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        self.addCleanup(server.stop, None)
+        channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+        self.addCleanup(channel.close)
+        stub = service_pb2_grpc.MakefileServiceStub(channel)
+
+        before = {
+            code: metrics.RPCS.value("RunCommand", code) for code in ("OK", "NOT_FOUND")
+        }
+        streams = metrics.RPC_SECONDS.count("RunCommandStream")
+        stub.RunCommand(service_pb2.CommandRequest(command="test"))
+        with self.assertRaises(grpc.RpcError):
+            stub.RunCommand(service_pb2.CommandRequest(command="missing"))
+        list(stub.RunCommandStream(service_pb2.CommandRequest(command="test")))
+
+        self.assertEqual(metrics.RPCS.value("RunCommand", "OK"), before["OK"] + 1)
+        self.assertEqual(
+            metrics.RPCS.value("RunCommand", "NOT_FOUND"), before["NOT_FOUND"] + 1
+        )
+        self.assertEqual(metrics.RPC_SECONDS.count("RunCommandStream"), streams + 1)
+        self.assertEqual(metrics.ACTIVE_RPCS.value(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from veridock.output import MAX_READ_SIZE, OutputStore
+
+
+class TestOutputStore(unittest.TestCase):
+    def setUp(self):
+        """Set up a store spilling into a temporary directory."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.store = OutputStore(
+            memory_limit=100, preview=10, spool_dir=self.temp_dir.name
+        )
+
+    def test_small_output_stays_in_memory(self):
+        """Test that output under the limit is returned whole."""
+        buffer = self.store.new_buffer()
+        buffer.write(b"hello ")
+        buffer.write(b"world")
+
+        self.assertFalse(buffer.spilled)
+        self.assertEqual(buffer.text(), "hello world")
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_large_output_spills_with_head_and_tail(self):
+        """Test that output over the limit spills and keeps a preview."""
+        data = bytes(range(48, 58)) * 30
+        buffer = self.store.new_buffer()
+        for i in range(0, len(data), 7):
+            buffer.write(data[i:i + 7])
+
+        self.assertTrue(buffer.spilled)
+        self.assertEqual(buffer.size, len(data))
+        text = buffer.text()
+        self.assertTrue(text.startswith("0123456789\n"))
+        self.assertTrue(text.endswith("\n0123456789"))
+        self.assertIn("280 bytes omitted", text)
+
+    def test_spill_without_preview(self):
+        """Test that a preview of 0 keeps no output in memory after a spill."""
+        store = OutputStore(memory_limit=100, preview=0, spool_dir=self.temp_dir.name)
+        buffer = store.new_buffer()
+        for _ in range(50):
+            buffer.write(b"0123456789")
+        self.addCleanup(buffer.discard)
+
+        self.assertTrue(buffer.spilled)
+        self.assertEqual(len(buffer._tail), 0)
+        text = buffer.text()
+        self.assertTrue(text.startswith("\n... [500 bytes omitted"))
+        self.assertTrue(text.endswith(" ...\n"))
+
+    def test_read_ranges(self):
+        """Test ranged reads from spilled and in-memory streams."""
+        stdout = self.store.new_buffer()
+        stdout.write(b"x" * 150 + b"END")
+        stderr = self.store.new_buffer()
+        stderr.write(b"warning")
+
+        output_id = self.store.register({"stdout": stdout, "stderr": stderr})
+
+        self.assertEqual(self.store.read(output_id, "stdout", 150, 10), (b"END", 153))
+        self.assertEqual(self.store.read(output_id, "stdout", 500, 10), (b"", 153))
+        self.assertEqual(self.store.read(output_id, "stderr", 2, 3), (b"rni", 7))
+        data, _ = self.store.read(output_id, "stdout", 0)
+        self.assertEqual(len(data), min(153, MAX_READ_SIZE))
+
+        with self.assertRaises(KeyError):
+            self.store.read("unknown", "stdout", 0)
+
+    def test_discard_keeps_registered_files(self):
+        """Test that discard only deletes spill files nobody owns."""
+        orphan = self.store.new_buffer()
+        orphan.write(b"x" * 200)
+        orphan.discard()
+        self.assertFalse(os.path.exists(orphan.path))
+
+        kept = self.store.new_buffer()
+        kept.write(b"y" * 200)
+        self.store.register({"stdout": kept})
+        kept.discard()
+        self.assertTrue(os.path.exists(kept.path))
+
+    def test_eviction_deletes_spill_files(self):
+        """Test that evicted entries remove their spill files."""
+        store = OutputStore(
+            memory_limit=10, preview=2, spool_dir=self.temp_dir.name, max_entries=1
+        )
+        first = store.new_buffer()
+        first.write(b"a" * 20)
+        first_id = store.register({"stdout": first})
+
+        second = store.new_buffer()
+        second.write(b"b" * 20)
+        store.register({"stdout": second})
+
+        self.assertFalse(os.path.exists(first.path))
+        with self.assertRaises(KeyError):
+            store.read(first_id, "stdout", 0)
+
+        third = store.new_buffer()
+        third.write(b"c" * 20)
+        store.register({"stdout": third})
+        self.assertFalse(os.path.exists(second.path))
+
+
+class TestSharedOutputStore(unittest.TestCase):
+    def test_read_from_other_process(self):
+        """Test that an output is read through the store of another process."""
+        with tempfile.TemporaryDirectory() as spool_dir:
+            stores = [
+                OutputStore(
+                    memory_limit=10,
+                    preview=2,
+                    spool_dir=spool_dir,
+                    max_entries=1,
+                    shared=True,
+                )
+                for _ in range(2)
+            ]
+            small = stores[0].new_buffer()
+            small.write(b"small")
+            large = stores[0].new_buffer()
+            large.write(b"x" * 20)
+            output_id = stores[0].register({"stdout": small, "stderr": large})
+
+            self.assertEqual(stores[1].read(output_id, "stdout", 0), (b"small", 5))
+            self.assertEqual(stores[1].read(output_id, "stderr", 18), (b"xx", 20))
+            for bad_id in ("0" * 32, "../" + output_id):
+                with self.assertRaises(KeyError):
+                    stores[1].read(bad_id, "stdout", 0)
+
+            # Evicted by its owner
+            stores[0].register({"stdout": stores[0].new_buffer()})
+            with self.assertRaises(KeyError):
+                stores[1].read(output_id, "stdout", 0)
+            self.assertEqual(len(os.listdir(spool_dir)), 2)
+
+
+class TestReadOutputEndpoint(unittest.TestCase):
+    def setUp(self):
+        from veridock import http_gateway
+
+        self.pool = MagicMock()
+        patcher = patch.object(http_gateway, "pool", self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = http_gateway.app.test_client()
+
+    def test_negative_offset_or_length(self):
+        """Test that a negative offset or length is a client error."""
+        for query in ("offset=-1", "length=-5"):
+            response = self.client.get(f"/output/abc?{query}")
+            self.assertEqual(response.status_code, 400)
+        self.pool.stub.assert_not_called()
+
+    def test_inverted_range(self):
+        """Test that a Range ending before it starts cannot be satisfied."""
+        response = self.client.get("/output/abc", headers={"Range": "bytes=5-3"})
+        self.assertEqual(response.status_code, 416)
+        self.pool.stub.assert_not_called()
+
+    def test_signed_range_is_ignored(self):
+        """Test that a Range with a signed bound is ignored like any malformed one."""
+        from veridock import http_gateway
+
+        self.assertIsNone(http_gateway._parse_range("bytes=5--3"))
+        self.assertIsNone(http_gateway._parse_range("bytes=--3"))
+        self.assertEqual(http_gateway._parse_range("bytes=-3"), (None, None, 3))
+        self.assertEqual(http_gateway._parse_range("bytes=2-"), (2, None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
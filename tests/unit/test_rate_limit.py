@@ -0,0 +1,184 @@
+import os
+import unittest
+from unittest.mock import patch
+
+from veridock.rate_limit import (
+    Limit,
+    Overloaded,
+    RateLimited,
+    RateLimiter,
+    parse_limits,
+)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch(
+            "veridock.rate_limit.time.monotonic", side_effect=lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse_limits(self):
+        """Test route=rate/burst items, with the burst defaulting to the rate."""
+        self.assertEqual(
+            parse_limits("*=20/40, run_command=2, run_command:test=0.1/1,bad"),
+            {
+                "*": Limit(20.0, 40.0),
+                "run_command": Limit(2.0, 2.0),
+                "run_command:test": Limit(0.1, 1.0),
+            },
+        )
+
+    def test_burst_then_refill(self):
+        """Test that a client gets its burst, then tokens at the rate."""
+        limiter = RateLimiter({"*": Limit(2, 3)})
+        for _ in range(3):
+            limiter.check("a", "list_targets")
+        with self.assertRaises(RateLimited) as caught:
+            limiter.check("a", "list_targets")
+        self.assertAlmostEqual(caught.exception.retry_after, 0.5)
+
+        self.now += 0.5
+        limiter.check("a", "list_targets")
+        self.assertRaises(RateLimited, limiter.check, "a", "list_targets")
+        self.assertEqual(limiter.stats()["rejected"], {"rate_limited:*": 2})
+
+    def test_clients_are_independent(self):
+        """Test that one client's requests do not use another's tokens."""
+        limiter = RateLimiter({"*": Limit(1, 1)})
+        limiter.check("a", "list_targets")
+        limiter.check("b", "list_targets")
+        self.assertRaises(RateLimited, limiter.check, "a", "list_targets")
+
+    def test_route_and_target_limits(self):
+        """Test that every matching limit applies, and a rejection takes none."""
+        limiter = RateLimiter(
+            parse_limits("*=10/10,run_command=10/3,run_command:deploy=1/1")
+        )
+        limiter.check("a", "run_command", "deploy")
+        with self.assertRaises(RateLimited) as caught:
+            limiter.check("a", "run_command", "deploy")
+        self.assertEqual(caught.exception.route, "run_command:deploy")
+
+        limiter.check("a", "run_command", "test")
+        limiter.check("a", "run_command", "test")
+        self.assertRaises(RateLimited, limiter.check, "a", "run_command", "test")
+        # Rejected requests did not use tokens of the global bucket
+        for _ in range(7):
+            limiter.check("a", "list_targets")
+        self.assertRaises(RateLimited, limiter.check, "a", "list_targets")
+
+    def test_limits_targets(self):
+        """Test which endpoints have a limit per target."""
+        limiter = RateLimiter(parse_limits("*=10,run_command=5,run_command:test=1"))
+        self.assertTrue(limiter.limits_targets("run_command"))
+        self.assertFalse(limiter.limits_targets("run_batch"))
+        self.assertFalse(limiter.limits_targets("run"))
+
+    def test_client_bound(self):
+        """Test that the least recently seen clients are dropped first."""
+        limiter = RateLimiter({"*": Limit(1, 1)}, max_clients=2)
+        limiter.check("a", "job")
+        limiter.check("b", "job")
+        limiter.check("c", "job")
+        self.assertEqual(limiter.stats()["clients"], 2)
+        limiter.check("a", "job")
+        self.assertRaises(RateLimited, limiter.check, "c", "job")
+
+    def test_in_flight_cap(self):
+        """Test that requests over the cap are shed until a slot is released."""
+        limiter = RateLimiter({}, max_in_flight=2)
+        limiter.acquire()
+        limiter.acquire()
+        self.assertRaises(Overloaded, limiter.acquire)
+        limiter.release()
+        limiter.acquire()
+        stats = limiter.stats()
+        self.assertEqual(stats["in_flight"], 2)
+        self.assertEqual(stats["rejected"], {"overloaded": 1})
+
+    def test_from_env(self):
+        """Test the defaults and that empty values disable limits."""
+        limiter = RateLimiter.from_env()
+        self.assertEqual(limiter.limits, {"*": Limit(20.0, 40.0)})
+        env = {"HTTP_GATEWAY_RATE_LIMITS": "", "HTTP_GATEWAY_MAX_IN_FLIGHT": "0"}
+        with patch.dict(os.environ, env):
+            limiter = RateLimiter.from_env()
+        for _ in range(100):
+            limiter.check("a", "run_command", "test")
+            limiter.acquire()
+
+
+class TestGatewayRateLimit(unittest.TestCase):
+    def test_rejections(self):
+        """Test 429 over a client's limit and 503 over the in-flight cap."""
+        from veridock import http_gateway
+
+        limiter = RateLimiter({"list_targets": Limit(0.5, 1)}, max_in_flight=1)
+        client = http_gateway.app.test_client()
+        with patch.object(http_gateway, "rate_limiter", limiter), patch.dict(
+            http_gateway.app.view_functions, list_targets=lambda: "ok"
+        ):
+            headers = {"X-Real-IP": "10.0.0.1"}
+            self.assertEqual(client.get("/targets", headers=headers).status_code, 200)
+            response = client.get("/targets", headers=headers)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers["Retry-After"], "2")
+            headers = {"X-Real-IP": "10.0.0.2"}
+            self.assertEqual(client.get("/targets", headers=headers).status_code, 200)
+
+            limiter.acquire()
+            response = client.get("/targets", headers={"X-Real-IP": "10.0.0.3"})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers["Retry-After"], "1")
+            limiter.release()
+
+            stats = client.get("/limits").get_json()
+        # The /limits request itself
+        self.assertEqual(stats["in_flight"], 1)
+        self.assertEqual(
+            stats["rejected"], {"rate_limited:list_targets": 1, "overloaded": 1}
+        )
+
+    def test_shed_request_takes_no_token(self):
+        """Test that a request shed over the in-flight cap keeps its client's token."""
+        from veridock import http_gateway
+
+        limiter = RateLimiter({"list_targets": Limit(0.01, 1)}, max_in_flight=1)
+        client = http_gateway.app.test_client()
+        with patch.object(http_gateway, "rate_limiter", limiter), patch.dict(
+            http_gateway.app.view_functions, list_targets=lambda: "ok"
+        ):
+            limiter.acquire()
+            self.assertEqual(client.get("/targets").status_code, 503)
+            limiter.release()
+            self.assertEqual(client.get("/targets").status_code, 200)
+            self.assertEqual(client.get("/targets").status_code, 429)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_body_parsed_once(self):
+        """Test that the handler reuses the body parsed for a per-target limit."""
+        import flask
+
+        from veridock import http_gateway
+
+        limiter = RateLimiter(parse_limits("run_batch:test=0.01/1"))
+        client = http_gateway.app.test_client()
+        parse = patch.object(
+            flask.Request, "get_json", autospec=True, side_effect=flask.Request.get_json
+        )
+        with patch.object(http_gateway, "rate_limiter", limiter), patch.dict(
+            http_gateway.app.view_functions,
+            run_batch=lambda: flask.jsonify(http_gateway._request_json()),
+        ), parse as get_json:
+            response = client.post("/run_batch", json={"command": "test"})
+            self.assertEqual(response.get_json(), {"command": "test"})
+            self.assertEqual(get_json.call_count, 1)
+            response = client.post("/run_batch", json={"command": "test"})
+            self.assertEqual(response.status_code, 429)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import threading
+import unittest
+from unittest.mock import patch
+
+from veridock.response_cache import (
+    BYPASS,
+    HIT,
+    MISS,
+    STALE,
+    CachedResponse,
+    ResponseCache,
+    parse_routes,
+)
+
+
+class Loader:
+    """load() callable counting its calls, like a gateway gRPC call."""
+
+    def __init__(self, cacheable=True):
+        self.calls = 0
+        self.cacheable = cacheable
+        self.called = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.called.set()
+        return CachedResponse(f"body {self.calls}".encode()), self.cacheable
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch(
+            "veridock.response_cache.time.monotonic", side_effect=lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hit_within_ttl(self):
+        """Test that a fresh entry is served without loading again."""
+        cache = ResponseCache({"list_targets": 10})
+        load = Loader()
+        self.assertEqual(cache.fetch("k", 10, load)[1], MISS)
+        self.now += 5
+        response, status, age = cache.fetch("k", 10, load)
+        self.assertEqual((response.body, status, age), (b"body 1", HIT, 5))
+        self.assertEqual(load.calls, 1)
+
+    def test_stale_while_revalidate(self):
+        """Test that an expired entry is served while one refresh runs."""
+        cache = ResponseCache({"list_targets": 10}, stale=30)
+        load = Loader()
+        cache.fetch("k", 10, load)
+        self.now += 15
+        response, status, _ = cache.fetch("k", 10, load)
+        self.assertEqual((response.body, status), (b"body 1", STALE))
+        self.assertTrue(load.called.wait(5))
+        for _ in range(100):
+            response, status, _ = cache.fetch("k", 10, load)
+            if status == HIT:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual((response.body, status), (b"body 2", HIT))
+
+        self.now += 60
+        self.assertEqual(cache.fetch("k", 10, load)[1], MISS)
+
+    def test_client_cache_control(self):
+        """Test no-cache, max-age and no-store from the client."""
+        cache = ResponseCache({"list_targets": 10})
+        load = Loader()
+        cache.fetch("k", 10, load)
+        self.now += 5
+        self.assertEqual(cache.fetch("k", 10, load, "max-age=10")[1], HIT)
+        self.assertEqual(cache.fetch("k", 10, load, "max-age=2")[1], MISS)
+        self.assertEqual(cache.fetch("k", 10, load, "no-cache")[1], MISS)
+        self.assertEqual(cache.fetch("k", 10, load)[0].body, b"body 3")
+        self.assertEqual(cache.fetch("k", 10, load, "no-store")[1], BYPASS)
+        self.assertEqual(cache.fetch("k", 10, load)[0].body, b"body 3")
+
+    def test_uncacheable_responses(self):
+        """Test that responses marked uncacheable are not stored."""
+        cache = ResponseCache({"run_command": 10})
+        load = Loader(cacheable=False)
+        cache.fetch("k", 10, load)
+        self.assertEqual(cache.fetch("k", 10, load)[1], MISS)
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_bounds(self):
+        """Test that the least recently used entries are evicted first."""
+        cache = ResponseCache({"list_targets": 10}, max_entries=2)
+        for key in ("a", "b"):
+            cache.fetch(key, 10, Loader())
+        cache.fetch("a", 10, Loader())
+        cache.fetch("c", 10, Loader())
+        self.assertEqual(cache.fetch("a", 10, Loader())[1], HIT)
+        self.assertEqual(cache.fetch("b", 10, Loader())[1], MISS)
+
+        cache = ResponseCache({"list_targets": 10}, max_bytes=10)
+        cache.fetch("big", 10, lambda: (CachedResponse(b"x" * 20), True))
+        self.assertEqual(len(cache), 0)
+
+    def test_route_ttls(self):
+        """Test per-route TTLs, with per-target ones for run_command."""
+        routes = parse_routes("list_targets=30, run_command:help=300")
+        cache = ResponseCache(routes)
+        self.assertEqual(cache.ttl("list_targets"), 30)
+        self.assertEqual(cache.ttl("run_command", "help"), 300)
+        self.assertIsNone(cache.ttl("run_command", "deploy"))
+        self.assertIsNone(cache.ttl("scheduler_stats"))
+
+    def test_from_env(self):
+        """Test that an empty route list disables the cache."""
+        with patch.dict(os.environ, {"HTTP_GATEWAY_CACHE_ROUTES": ""}):
+            self.assertIsNone(ResponseCache.from_env())
+        env = {
+            "HTTP_GATEWAY_CACHE_ROUTES": "list_targets=5",
+            "HTTP_GATEWAY_CACHE_STALE": "0",
+        }
+        with patch.dict(os.environ, env):
+            cache = ResponseCache.from_env()
+        self.assertEqual((cache.routes, cache.stale), ({"list_targets": 5.0}, 0.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
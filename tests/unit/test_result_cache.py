@@ -0,0 +1,78 @@
+import os
+import tempfile
+import time
+import unittest
+
+from veridock.cache import CachedResult, ResultCache, parse_cache_targets
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        """Create a project directory with a Makefile and an input file."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cwd = self.temp_dir.name
+        self._write("Makefile", "help:\n\t@echo help\n")
+        self._write("input.txt", "v1")
+        self.cache = ResultCache({"help": ["*.txt"]}, ttl=60)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.cwd, name)
+        with open(path, "w") as f:
+            f.write(content)
+        # Make sure mtime-based memoization sees the change
+        stamp = time.time() + len(content)
+        os.utime(path, (stamp, stamp))
+
+    def test_parse_cache_targets(self):
+        """Test parsing targets with declared input globs."""
+        self.assertEqual(
+            parse_cache_targets("help, generate-commands:static/*.js:*.proto,"),
+            {"help": [], "generate-commands": ["static/*.js", "*.proto"]},
+        )
+
+    def test_hit_and_miss(self):
+        """Test that a stored result is returned for the same key."""
+        key = self.cache.key("help", [], self.cwd)
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, CachedResult("help\n", "", 0))
+        self.assertEqual(self.cache.get(key).output, "help\n")
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_key_covers_args_makefile_and_inputs(self):
+        """Test that changing args, the Makefile or an input changes the key."""
+        key = self.cache.key("help", [], self.cwd)
+        self.assertNotEqual(key, self.cache.key("help", ["V=1"], self.cwd))
+
+        self._write("input.txt", "v2")
+        changed_input = self.cache.key("help", [], self.cwd)
+        self.assertNotEqual(key, changed_input)
+
+        self._write("Makefile", "help:\n\t@echo changed\n")
+        self.assertNotEqual(changed_input, self.cache.key("help", [], self.cwd))
+
+    def test_ttl_expiry(self):
+        """Test that entries expire after the TTL."""
+        cache = ResultCache({"help": []}, ttl=0)
+        cache.put("k", CachedResult("out", "", 0))
+        self.assertIsNone(cache.get("k"))
+
+    def test_lru_eviction(self):
+        """Test eviction by entry count and by total size."""
+        cache = ResultCache({"help": []}, max_entries=2, max_bytes=10)
+        cache.put("a", CachedResult("aaa", "", 0))
+        cache.put("b", CachedResult("bbb", "", 0))
+        cache.get("a")
+        cache.put("c", CachedResult("ccc", "", 0))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+        cache.put("d", CachedResult("dddddddd", "", 0))
+        self.assertEqual(len(cache), 1)
+        self.assertIsNotNone(cache.get("d"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import unittest
+from concurrent import futures
+from unittest.mock import patch
+
+import grpc
+
+from veridock import rpc_json, service_pb2, service_pb2_grpc
+from veridock.grpc_client import ChannelPool
+from veridock.rpc_json import SchemaError, parse, validate
+
+
+class TestValidate(unittest.TestCase):
+    def test_valid_requests(self):
+        """Test that proto and JSON field names and JSON forms are accepted."""
+        request = parse(
+            service_pb2.BatchRequest,
+            b'{"commands": [{"command": "test", "depends_on": [], "dependsOn": null}],'
+            b' "maxParallel": "2", "fail_fast": true}',
+        )
+        self.assertEqual(request.commands[0].command, "test")
+        self.assertEqual(request.max_parallel, 2)
+        request = parse(
+            service_pb2.ReadOutputRequest,
+            b'{"stream": "STDERR", "offset": "18446744073709551615"}',
+        )
+        self.assertEqual(request.stream, service_pb2.CommandOutputChunk.STDERR)
+        self.assertEqual(
+            parse(service_pb2.ListTargetsRequest, b""),
+            service_pb2.ListTargetsRequest(),
+        )
+
+    def test_every_error_is_reported(self):
+        """Test that all wrong fields are reported with their path."""
+        errors = validate(
+            service_pb2.BatchRequest.DESCRIPTOR,
+            {
+                "commands": [{"command": "a"}, {"args": ["x", 1]}, "b"],
+                "max_parallel": 1.5,
+                "fail_fast": "yes",
+                "extra": 1,
+            },
+        )
+        self.assertEqual(
+            errors,
+            [
+                "commands[1].args[1]: expected a string, got number",
+                "commands[2]: expected an object, got string",
+                "max_parallel: expected an integer, got number",
+                "fail_fast: expected a boolean, got string",
+                "extra: unknown field",
+            ],
+        )
+
+    def test_ranges_and_enums(self):
+        """Test integer bounds and enum names."""
+        errors = validate(
+            service_pb2.ReadOutputRequest.DESCRIPTOR,
+            {"offset": -1, "length": 2**64, "stream": "STDIN"},
+        )
+        self.assertEqual(
+            errors,
+            [
+                "offset: -1 is out of range",
+                f"length: {2**64} is out of range",
+                "stream: expected one of STDOUT, STDERR, got 'STDIN'",
+            ],
+        )
+
+    def test_parse_errors(self):
+        """Test that bodies which are not a JSON object are rejected."""
+        with self.assertRaises(SchemaError) as caught:
+            parse(service_pb2.CommandRequest, b"[1]")
+        self.assertEqual(
+            caught.exception.errors, ["request: expected an object, got array"]
+        )
+        self.assertRaises(ValueError, parse, service_pb2.CommandRequest, b"{nope")
+
+    def test_message_json(self):
+        """Test that responses keep proto field names and default values."""
+        data = rpc_json.message_dict(service_pb2.CommandResponse(output="hi"))
+        self.assertEqual(data["output"], "hi")
+        self.assertEqual(data["return_code"], 0)
+
+
+class FakeService(service_pb2_grpc.MakefileServiceServicer):
+    def RunCommand(self, request, context):
+        if request.command == "busy":
+            context.set_trailing_metadata((("retry-after", "3"),))
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "queue full")
+        return service_pb2.CommandResponse(output=" ".join(request.args))
+
+    def RunCommandStream(self, request, context):
+        for sequence, arg in enumerate(request.args):
+            yield service_pb2.CommandOutputChunk(sequence=sequence, data=arg)
+        if request.command == "broken":
+            context.abort(grpc.StatusCode.INTERNAL, "make died")
+
+
+class TestGatewayRoutes(unittest.TestCase):
+    PATH = "/makefile/makefile.MakefileService/"
+
+    def setUp(self):
+        from veridock import http_gateway
+
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        service_pb2_grpc.add_MakefileServiceServicer_to_server(FakeService(), server)
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        self.addCleanup(server.stop, None)
+        pool = ChannelPool(f"127.0.0.1:{port}", size=1)
+        self.addCleanup(pool.close)
+        for patcher in (
+            patch.object(http_gateway, "pool", pool),
+            patch.object(http_gateway, "response_cache", None),
+            patch.dict(http_gateway._rpc_callables, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = http_gateway.app.test_client()
+
+    def test_every_rpc_is_routed(self):
+        """Test that each RPC of the service descriptor has a route."""
+        from veridock import http_gateway
+
+        endpoints = {rule.endpoint for rule in http_gateway.app.url_map.iter_rules()}
+        service = service_pb2.DESCRIPTOR.services_by_name["MakefileService"]
+        for method in service.methods:
+            self.assertIn(f"MakefileService.{method.name}", endpoints)
+
+    def test_unary(self):
+        """Test a call, a schema error and a gRPC error status."""
+        response = self.client.post(
+            self.PATH + "RunCommand", json={"command": "echo", "args": ["a", "b"]}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["output"], "a b")
+        self.assertEqual(response.json["return_code"], 0)
+
+        response = self.client.post(self.PATH + "RunCommand", json={"args": "a"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json["errors"], ["args: expected an array, got string"]
+        )
+
+        response = self.client.post(
+            self.PATH + "RunCommand", json={"command": "busy"}
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "3")
+        self.assertEqual(response.json, {"code": 8, "message": "queue full"})
+
+    def test_stream(self):
+        """Test NDJSON messages, ended by an error line on failure."""
+        response = self.client.post(
+            self.PATH + "RunCommandStream",
+            json={"command": "broken", "args": ["x", "y"]},
+        )
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = [rpc_json.loads(line) for line in response.get_data().splitlines()]
+        self.assertEqual([line.get("data") for line in lines[:2]], ["x", "y"])
+        self.assertEqual(lines[2], {"error": {"code": 13, "message": "make died"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
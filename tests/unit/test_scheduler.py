@@ -0,0 +1,102 @@
+import asyncio
+import unittest
+
+from veridock.scheduler import QueueFullError, Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+    def test_global_and_per_target_caps(self):
+        """Test that tickets wait once a global or per-target cap is reached."""
+        scheduler = Scheduler(max_concurrent=2, target_limits={"test": 1})
+        first = scheduler.submit("test", "a", "interactive")
+        second = scheduler.submit("test", "a", "interactive")
+        other = scheduler.submit("lint", "a", "interactive")
+
+        self.assertIsNotNone(first.granted_at)
+        self.assertIsNone(second.granted_at)
+        self.assertIsNotNone(other.granted_at)
+
+        scheduler.release(first)
+        self.assertIsNotNone(second.granted_at)
+
+    def test_priority_classes(self):
+        """Test that interactive requests go ahead of queued batch requests."""
+        scheduler = Scheduler(max_concurrent=1, batch_targets=["build"])
+        running = scheduler.submit("build", "a", scheduler.priority_for("build"))
+        batch = scheduler.submit("build", "a", scheduler.priority_for("build"))
+        interactive = scheduler.submit("help", "b", scheduler.priority_for("help"))
+
+        scheduler.release(running)
+        self.assertIsNotNone(interactive.granted_at)
+        self.assertIsNone(batch.granted_at)
+
+    def test_weighted_fairness(self):
+        """Test that a heavy caller cannot starve a light one."""
+        scheduler = Scheduler(max_concurrent=1, caller_weights={"ci": 2})
+        running = scheduler.submit("test", "ci", "interactive")
+        heavy = [scheduler.submit("test", "ci", "interactive") for _ in range(4)]
+        light = [scheduler.submit("test", "dev", "interactive") for _ in range(2)]
+
+        order = []
+        current = running
+        for _ in range(6):
+            scheduler.release(current)
+            current = next(t for t in heavy + light if t.granted_at and t not in order)
+            order.append(current)
+
+        callers = [t.caller for t in order]
+        # ci has twice the weight of dev, so it gets about two slots per dev slot
+        self.assertEqual(callers[:3].count("dev"), 1)
+        self.assertEqual(callers.count("dev"), 2)
+
+    def test_queue_full(self):
+        """Test rejection with a retry hint once the queue is full."""
+        scheduler = Scheduler(max_concurrent=1, max_queue=1)
+        scheduler.submit("test", "a", "interactive")
+        scheduler.submit("test", "a", "interactive")
+        with self.assertRaises(QueueFullError) as raised:
+            scheduler.submit("test", "a", "interactive")
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertEqual(scheduler.stats()["rejected"], 1)
+        self.assertEqual(scheduler.stats()["queued"], 1)
+
+    def test_saturation(self):
+        """Test that saturation is reported once no request could be admitted."""
+        scheduler = Scheduler(max_concurrent=1, max_queue=1)
+        changes = []
+        scheduler.on_saturation = changes.append
+        running = scheduler.submit("test", "a", "interactive")
+        self.assertFalse(scheduler.saturated())
+        queued = scheduler.submit("test", "a", "interactive")
+        self.assertTrue(scheduler.saturated())
+        with self.assertRaises(QueueFullError):
+            scheduler.submit("test", "a", "interactive")
+
+        scheduler.release(running)
+        self.assertFalse(scheduler.saturated())
+        waiting = scheduler.submit("test", "a", "interactive")
+        scheduler.cancel(waiting)
+        scheduler.release(queued)
+        self.assertEqual(changes, [True, False, True, False])
+
+    def test_slot_async(self):
+        """Test that async waiters are woken when a slot frees up."""
+        scheduler = Scheduler(max_concurrent=1)
+
+        async def run():
+            order = []
+
+            async def job(name):
+                async with scheduler.slot_async("test", name, "interactive"):
+                    order.append(name)
+                    await asyncio.sleep(0.01)
+
+            await asyncio.gather(job("a"), job("b"), job("c"))
+            return order
+
+        self.assertEqual(sorted(asyncio.run(run())), ["a", "b", "c"])
+        self.assertEqual(scheduler.stats()["running"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
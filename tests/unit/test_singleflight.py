@@ -0,0 +1,60 @@
+import threading
+import unittest
+
+from veridock.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.group = SingleFlight(["help"])
+
+    def test_followers_share_the_leader_result(self):
+        """Test that concurrent joiners of the same key get one result."""
+        flight, leader = self.group.join("key")
+        follower_flight, follower_leader = self.group.join("key")
+        self.assertTrue(leader)
+        self.assertFalse(follower_leader)
+        self.assertIs(follower_flight, flight)
+
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(flight.wait()))
+        waiter.start()
+        self.group.land("key", flight)
+        flight.finish("output")
+        waiter.join(timeout=5)
+
+        self.assertEqual(results, ["output"])
+        self.assertEqual(self.group.coalesced, 1)
+        # Once landed, the next request starts a fresh run
+        self.assertTrue(self.group.join("key")[1])
+
+    def test_late_joiners_replay_chunks(self):
+        """Test that followers see every chunk, including ones already sent."""
+        flight, _ = self.group.join("key")
+        flight.publish("a")
+        flight.publish("b")
+        flight.finish()
+        self.assertEqual(list(flight.iter_chunks()), ["a", "b"])
+
+    def test_errors_reach_followers(self):
+        """Test that a failed run raises in every subscriber."""
+        flight, _ = self.group.join("key")
+        flight.finish(error=RuntimeError("boom"))
+        with self.assertRaises(RuntimeError):
+            flight.wait()
+
+    def test_abandoned_flight_is_cancelled(self):
+        """Test that the work is cancelled when the last subscriber leaves."""
+        cancelled = []
+        flight, _ = self.group.join("key")
+        self.group.join("key")
+        flight.add_cancel_callback(lambda: cancelled.append(True))
+
+        flight.unsubscribe()
+        self.assertEqual(cancelled, [])
+        flight.unsubscribe()
+        self.assertEqual(cancelled, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
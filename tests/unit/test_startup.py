@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Most milliseconds `veridock --help` may spend importing modules
+IMPORT_BUDGET_MS = float(os.getenv("VERIDOCK_IMPORT_BUDGET_MS", "250"))
+
+# Imported by the servers only
+SERVER_MODULES = ("grpc", "flask", "werkzeug", "dotenv", "google.protobuf")
+
+
+def _import_times(code):
+    """Modules imported by ``code``, with their cumulative import time in us.
+
+    Top-level imports are the ones whose name is not indented.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise AssertionError(result.stderr)
+    times = {}
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if line.startswith("import time:") and fields[1].strip().isdigit():
+            times[fields[2][1:].rstrip()] = int(fields[1])
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    def test_cli_help(self):
+        """Test that `veridock --help` imports no server code, within budget."""
+        times = _import_times(
+            "import sys\n"
+            "from veridock.cli import cli\n"
+            "try:\n"
+            "    cli(['--help'])\n"
+            "except SystemExit as e:\n"
+            "    assert not e.code\n"
+            "assert 'veridock.cli.commands.server' in sys.modules\n"
+            f"for module in {SERVER_MODULES + ('veridock.http_gateway',)}:\n"
+            "    assert module not in sys.modules, module\n"
+        )
+        total_ms = sum(t for name, t in times.items() if name[:1] != " ") / 1000
+        self.assertLess(
+            total_ms,
+            IMPORT_BUDGET_MS,
+            f"imports took {total_ms:.0f}ms (VERIDOCK_IMPORT_BUDGET_MS)",
+        )
+
+    def test_gateway_import(self):
+        """Test that importing the gateway reads no .env and opens no channel."""
+        _import_times(
+            "import sys\n"
+            "from veridock import http_gateway\n"
+            "assert http_gateway.pool is None\n"
+            "assert 'dotenv' not in sys.modules\n"
+            "assert 'metrics' not in http_gateway.app.view_functions\n"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from veridock import supervisor
+from veridock.supervisor import (
+    BACKOFF,
+    RUNNING,
+    Component,
+    Supervisor,
+    SupervisorError,
+    startup_order,
+)
+
+# Touches its first argument after a moment, writing whether the second
+# existed by then, and stays up
+SERVE = (
+    "import os, sys, time; time.sleep(0.2); "
+    "open(sys.argv[1], 'w').write(str(os.path.exists(sys.argv[2]))); "
+    "time.sleep(60)"
+)
+
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.dir = temp_dir.name
+        self.state_dir = os.path.join(self.dir, "run")
+
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _serving(self, name, after="", depends_on=()):
+        """A component that is ready once it has written its marker file."""
+        marker = self._path(name)
+        return Component(
+            name,
+            [sys.executable, "-c", SERVE, marker, self._path(after or "none")],
+            lambda: os.path.exists(marker),
+            depends_on,
+        )
+
+    def _supervisor(self, components, **options):
+        runner = Supervisor(
+            components, self.state_dir, echo=lambda line: None, **options
+        )
+        self.addCleanup(runner.stop)
+        return runner
+
+    def test_startup_order(self):
+        """Test that dependencies come first, and cycles are refused."""
+        a = Component("a", [], depends_on=("b",))
+        b = Component("b", [], depends_on=("c",))
+        c = Component("c", [])
+        self.assertEqual(startup_order([a, b, c]), [c, b, a])
+        self.assertRaises(
+            SupervisorError, startup_order, [a, b, c._replace(depends_on=("a",))]
+        )
+        self.assertRaises(SupervisorError, startup_order, [a])
+
+    def test_start_waits_for_readiness(self):
+        """Test ordered, readiness-gated startup, the state files and stop."""
+        runner = self._supervisor([
+            self._serving("gateway", after="grpc", depends_on=("grpc",)),
+            self._serving("grpc"),
+        ])
+        runner.start()
+        # The gateway started only once the gRPC server was ready
+        with open(self._path("gateway")) as f:
+            self.assertEqual(f.read(), "True")
+
+        state = supervisor.read_state(self.state_dir)
+        self.assertEqual(state["supervisor"], os.getpid())
+        self.assertEqual(
+            {name: c["state"] for name, c in state["components"].items()},
+            {"grpc": RUNNING, "gateway": RUNNING},
+        )
+        pid = state["components"]["grpc"]["pid"]
+        with open(os.path.join(self.state_dir, "grpc.pid")) as f:
+            self.assertEqual(int(f.read()), pid)
+
+        runner.stop()
+        self.assertFalse(supervisor._alive(pid))
+        self.assertEqual(os.listdir(self.state_dir), [])
+        self.assertIsNone(supervisor.read_state(self.state_dir))
+
+    def test_start_fails_when_not_ready(self):
+        """Test that startup stops at a component that exits early."""
+        failing = Component("grpc", [sys.executable, "-c", "exit(3)"], lambda: False)
+        runner = self._supervisor(
+            [failing, self._serving("gateway", depends_on=("grpc",))]
+        )
+        with self.assertRaisesRegex(SupervisorError, "grpc exited with 3"):
+            runner.start()
+        self.assertFalse(os.path.exists(self._path("gateway")))
+
+    def test_restart_with_backoff(self):
+        """Test that an exiting component is restarted, ever less often."""
+        crashing = Component("grpc", [sys.executable, "-c", "exit(1)"])
+        runner = self._supervisor(
+            [crashing], backoff_initial=0.05, backoff_max=0.2, poll_interval=0.01
+        )
+        runner.start()
+        thread = threading.Thread(target=runner.run)
+        thread.start()
+        time.sleep(1)
+        runner.shutdown()
+        thread.join()
+
+        child = runner.children[0]
+        # 0.05 + 0.1 + 0.2 + 0.2 ... plus the time to start Python
+        self.assertGreaterEqual(child.restarts, 2)
+        self.assertLessEqual(child.restarts, 6)
+        self.assertGreaterEqual(child.failures, 3)
+
+    def test_restart_recovers(self):
+        """Test that a killed component is back within the poll interval."""
+        runner = self._supervisor([self._serving("grpc")], poll_interval=0.01)
+        runner.start()
+        first = runner.children[0].process
+        first.kill()
+        first.wait()
+        os.remove(self._path("grpc"))
+        runner.check()
+        self.assertEqual(runner.children[0].state, BACKOFF)
+        time.sleep(runner.backoff_initial)
+        runner.check()
+        self.assertNotEqual(runner.children[0].process.pid, first.pid)
+        with open(os.path.join(self.state_dir, supervisor.STATE_FILE)) as f:
+            self.assertEqual(json.load(f)["components"]["grpc"]["restarts"], 1)
+
+    def test_stop_orphans(self):
+        """Test that components left by a dead supervisor are stopped."""
+        os.makedirs(self.state_dir)
+        orphan = subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(60)"],
+            start_new_session=True,
+        )
+        self.addCleanup(orphan.kill)
+        # Reaped as init would reap a real orphan
+        reaper = threading.Thread(target=orphan.wait)
+        reaper.start()
+        with open(os.path.join(self.state_dir, "grpc.pid"), "w") as f:
+            f.write(f"{orphan.pid}\n")
+        with open(os.path.join(self.state_dir, "supervisor.pid"), "w") as f:
+            f.write("999999999\n")
+
+        self.assertTrue(supervisor.stop_running(self.state_dir, echo=lambda m: None))
+        reaper.join(5)
+        self.assertIsNotNone(orphan.returncode)
+        self.assertEqual(os.listdir(self.state_dir), [])
+        self.assertFalse(supervisor.stop_running(self.state_dir, echo=lambda m: None))
+        self.assertRaises(SupervisorError, supervisor.request_restart, self.state_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import time
+import unittest
+
+from veridock.targets import TargetIndex, parse_makefile
+
+MAKEFILE = """\
+.PHONY: help test
+include rules.mk
+-include optional.mk
+
+VERSION := 1.0
+CFLAGS ?= -O2
+
+help:  ## Show this help
+\t@echo help
+
+# Run the test suite
+test: build lint
+\t@echo test
+
+build lint: | out
+\t@echo $@
+
+%.o: %.c
+\t@cc -c $<
+
+debug: CFLAGS = -g
+"""
+
+RULES = """\
+.PHONY: deploy
+deploy: build  ## Deploy the build
+\t@echo deploy
+"""
+
+
+class TestTargetIndex(unittest.TestCase):
+    def setUp(self):
+        """Create a Makefile that includes a second file."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cwd = self.temp_dir.name
+        self._write("Makefile", MAKEFILE)
+        self._write("rules.mk", RULES)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.cwd, name)
+        with open(path, "w") as f:
+            f.write(content)
+        stamp = time.time() + len(content)
+        os.utime(path, (stamp, stamp))
+
+    def test_parse_makefile(self):
+        """Test names, descriptions, prerequisites and .PHONY status."""
+        targets, files = parse_makefile(os.path.join(self.cwd, "Makefile"))
+        by_name = {t.name: t for t in targets}
+
+        self.assertEqual(
+            [t.name for t in targets], ["help", "test", "build", "lint", "deploy"]
+        )
+        self.assertEqual(by_name["help"].description, "Show this help")
+        self.assertTrue(by_name["help"].phony)
+        self.assertEqual(by_name["test"].description, "Run the test suite")
+        self.assertEqual(by_name["test"].prerequisites, ("build", "lint"))
+        self.assertEqual(by_name["build"].prerequisites, ("out",))
+        self.assertFalse(by_name["build"].phony)
+        self.assertEqual(by_name["deploy"].description, "Deploy the build")
+        self.assertTrue(by_name["deploy"].phony)
+
+        self.assertIsNone(files[os.path.join(self.cwd, "optional.mk")])
+
+    def test_index_is_cached_until_a_file_changes(self):
+        """Test that the index is rebuilt only when the Makefile or includes change."""
+        index = TargetIndex()
+        first = index.get(self.cwd)
+        self.assertIs(index.get(self.cwd), first)
+
+        self._write("rules.mk", RULES + "release: deploy\n")
+        self.assertIn("release", [t.name for t in index.get(self.cwd)])
+
+        self._write("optional.mk", "extra:\n")
+        self.assertIn("extra", [t.name for t in index.get(self.cwd)])
+
+
+if __name__ == "__main__":
+    unittest.main()
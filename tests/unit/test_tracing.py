@@ -0,0 +1,197 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from veridock import service_pb2, tracing
+from veridock.grpc_server import MakefileService
+from veridock.tracing import FileExporter, SpanContext, Tracer, parse_traceparent
+
+TRACEPARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+def _spans(path):
+    """Spans written by a FileExporter, by name."""
+    spans = {}
+    with open(path) as f:
+        for line in f:
+            for resource in json.loads(line)["resourceSpans"]:
+                for span in resource["scopeSpans"][0]["spans"]:
+                    spans[span["name"]] = span
+    return spans
+
+
+class TestTraceContext(unittest.TestCase):
+    def test_parse_traceparent(self):
+        """Test valid headers round-trip and invalid ones are ignored."""
+        context = parse_traceparent(TRACEPARENT)
+        self.assertEqual(
+            context,
+            SpanContext("0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331", True),
+        )
+        self.assertEqual(context.traceparent(), TRACEPARENT)
+        self.assertFalse(parse_traceparent(TRACEPARENT[:-1] + "0").sampled)
+        # Later versions may append fields
+        self.assertIsNotNone(parse_traceparent("01" + TRACEPARENT[2:] + "-x"))
+        for value in (
+            None,
+            "",
+            "garbage",
+            "ff" + TRACEPARENT[2:],
+            TRACEPARENT + "-x",
+            "00-" + "0" * 32 + "-b7ad6b7169203331-01",
+            "00-0af7651916cd43dd8448eb211c80319c-" + "0" * 16 + "-01",
+        ):
+            self.assertIsNone(parse_traceparent(value), value)
+
+    def test_disabled_tracer_propagates(self):
+        """Test that without an exporter the incoming context is passed on."""
+        tracer = Tracer()
+        with tracer.span("run", parse_traceparent(TRACEPARENT)) as span:
+            self.assertFalse(span.recording)
+            env = tracing.child_env(span)
+            self.assertEqual(env[tracing.TRACEPARENT_ENV], TRACEPARENT)
+            self.assertEqual(env["PATH"], os.environ["PATH"])
+        with tracer.span("run") as span:
+            self.assertIsNone(tracing.child_env(span))
+
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, "traces", "spans.jsonl")
+        self.tracer = Tracer(FileExporter("test", self.path, interval=0.01))
+
+    def test_nested_spans_are_exported(self):
+        """Test parents, attributes, errors and the OTLP/JSON file format."""
+        with self.tracer.span("request", parse_traceparent(TRACEPARENT)) as root:
+            with self.tracer.span("step", size=3, ok=True):
+                pass
+            with self.assertRaises(RuntimeError):
+                with self.tracer.span("failing"):
+                    raise RuntimeError("boom")
+            self.tracer.record("queue", 0.5)
+        self.assertIsNone(tracing.current_span())
+        self.tracer.shutdown()
+
+        with open(self.path) as f:
+            resource = json.loads(f.readline())["resourceSpans"][0]["resource"]
+        self.assertEqual(
+            resource["attributes"],
+            [{"key": "service.name", "value": {"stringValue": "test"}}],
+        )
+        spans = _spans(self.path)
+        self.assertEqual(spans["request"]["parentSpanId"], "b7ad6b7169203331")
+        for name in ("step", "failing", "queue"):
+            self.assertEqual(spans[name]["traceId"], root.context.trace_id)
+            self.assertEqual(spans[name]["parentSpanId"], root.context.span_id)
+        self.assertEqual(
+            spans["step"]["attributes"],
+            [
+                {"key": "size", "value": {"intValue": "3"}},
+                {"key": "ok", "value": {"boolValue": True}},
+            ],
+        )
+        self.assertEqual(
+            spans["failing"]["status"],
+            {"code": tracing.STATUS_ERROR, "message": "boom"},
+        )
+        queue = spans["queue"]
+        duration = int(queue["endTimeUnixNano"]) - int(queue["startTimeUnixNano"])
+        self.assertEqual(duration, 500_000_000)
+
+    def test_iterate(self):
+        """Test that a span is current only while its iterator runs."""
+        seen = []
+
+        def produce():
+            for i in range(2):
+                seen.append(tracing.current_span())
+                yield i
+
+        span = self.tracer.start_span("stream")
+        self.assertEqual(list(tracing.iterate(span, produce())), [0, 1])
+        self.assertEqual(seen, [span, span])
+        self.assertIsNone(tracing.current_span())
+        self.assertIsNotNone(span.end_ns)
+
+    def test_from_env(self):
+        """Test the exporter choice."""
+        self.assertFalse(Tracer.from_env("test").enabled)
+        env = {"TRACING_EXPORTER": "file", "TRACING_FILE": self.path}
+        with patch.dict(os.environ, env):
+            tracer = Tracer.from_env("test")
+        self.assertEqual(tracer.exporter.path, self.path)
+        with patch.dict(os.environ, {"TRACING_EXPORTER": "zipkin"}):
+            self.assertRaises(ValueError, Tracer.from_env, "test")
+
+
+class TestServiceTracing(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        with open(os.path.join(temp_dir.name, "Makefile"), "w") as f:
+            f.write('trace:\n\t@echo "$$TRACEPARENT"\n')
+        cwd = os.getcwd()
+        os.chdir(temp_dir.name)
+        self.addCleanup(os.chdir, cwd)
+        self.path = os.path.join(temp_dir.name, "spans.jsonl")
+        tracer = Tracer(FileExporter("test", self.path, interval=0.01))
+        patcher = patch.object(tracing, "tracer", tracer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_run_command_spans(self):
+        """Test the spans of a run and the trace context make is given."""
+        context = MagicMock()
+        context.invocation_metadata.return_value = [
+            (tracing.TRACEPARENT_HEADER, TRACEPARENT)
+        ]
+        response = MakefileService().RunCommand(
+            service_pb2.CommandRequest(command="trace"), context
+        )
+        tracing.tracer.shutdown()
+
+        spans = _spans(self.path)
+        rpc = spans["makefile.MakefileService/RunCommand"]
+        self.assertEqual(rpc["parentSpanId"], "b7ad6b7169203331")
+        self.assertEqual(spans["run"]["parentSpanId"], rpc["spanId"])
+        self.assertEqual(spans["response"]["parentSpanId"], rpc["spanId"])
+        self.assertEqual(spans["spawn"]["parentSpanId"], spans["run"]["spanId"])
+        for span in spans.values():
+            self.assertEqual(span["traceId"], "0af7651916cd43dd8448eb211c80319c")
+        self.assertEqual(
+            response.output,
+            f"00-0af7651916cd43dd8448eb211c80319c-{spans['run']['spanId']}-01\n",
+        )
+
+
+class TestGatewayTracing(unittest.TestCase):
+    def test_traceparent_is_forwarded(self):
+        """Test that the gateway passes the trace on to the gRPC call."""
+        from veridock import http_gateway
+
+        headers = {"traceparent": TRACEPARENT}
+        with http_gateway.app.test_request_context("/targets", headers=headers):
+            http_gateway._start_timer()
+            metadata = dict(http_gateway._call_metadata())
+        # Not tracing: the caller's span is the parent
+        self.assertEqual(metadata[tracing.TRACEPARENT_HEADER], TRACEPARENT)
+
+        tracer = Tracer(MagicMock())
+        with patch.object(tracing, "tracer", tracer):
+            with http_gateway.app.test_request_context("/targets", headers=headers):
+                http_gateway._start_timer()
+                span = http_gateway.g.span
+                metadata = dict(http_gateway._call_metadata())
+        self.assertEqual(span.name, "GET /targets")
+        self.assertEqual(span.parent_id, "b7ad6b7169203331")
+        self.assertEqual(
+            parse_traceparent(metadata[tracing.TRACEPARENT_HEADER]), span.context
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+import asyncio
+import http.client
+import json
+import threading
+import unittest
+
+import grpc
+
+from veridock import service_pb2
+from veridock.transcoder import TranscodingListener, _grpc_web_frame, routes
+
+PATH = "/makefile.MakefileService/"
+
+
+class FakeService:
+    """Answers like MakefileService, recording the metadata it was called with."""
+
+    def __init__(self):
+        self.metadata = None
+
+    def RunCommand(self, request, context):
+        self.metadata = dict(context.invocation_metadata())
+        if request.command == "busy":
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            context.set_details("queue full")
+            context.set_trailing_metadata((("retry-after", "3"),))
+            return service_pb2.CommandResponse(return_code=-1)
+        context.set_trailing_metadata((("x-cache", "hit"),))
+        return service_pb2.CommandResponse(output=request.command)
+
+    def RunCommandStream(self, request, context):
+        for sequence, arg in enumerate(request.args):
+            yield service_pb2.CommandOutputChunk(sequence=sequence, data=arg)
+        if request.command == "broken":
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details("make died")
+
+
+class AsyncFakeService:
+    async def RunCommand(self, request, context):
+        await asyncio.sleep(0)
+        return service_pb2.CommandResponse(output=request.command)
+
+    async def RunCommandStream(self, request, context):
+        for sequence, arg in enumerate(request.args):
+            await asyncio.sleep(0)
+            yield service_pb2.CommandOutputChunk(sequence=sequence, data=arg)
+
+
+class TestRoutes(unittest.TestCase):
+    def test_every_rpc_has_a_route(self):
+        """Test that routes are generated from the service descriptor."""
+        service = service_pb2.DESCRIPTOR.services_by_name["MakefileService"]
+        table = routes(service)
+        self.assertEqual(
+            sorted(table), sorted(PATH + method.name for method in service.methods)
+        )
+        stream = table[PATH + "RunCommandStream"]
+        self.assertTrue(stream.server_streaming)
+        self.assertIs(stream.request_class, service_pb2.CommandRequest)
+
+
+class ListenerTestCase(unittest.TestCase):
+    def _start(self, service, loop=None):
+        listener = TranscodingListener(service, "127.0.0.1", 0, loop=loop)
+        listener.start()
+        self.addCleanup(listener.stop)
+        self.port = listener.port
+
+    def _request(self, method, path, body=b"", headers=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        self.addCleanup(conn.close)
+        conn.request(method, path, body, headers or {})
+        response = conn.getresponse()
+        return response, response.read()
+
+
+class TestJson(ListenerTestCase):
+    def setUp(self):
+        self.service = FakeService()
+        self._start(self.service)
+
+    def test_unary(self):
+        """Test a JSON call, with trailing metadata as headers."""
+        response, body = self._request(
+            "POST",
+            PATH + "RunCommand",
+            b'{"command": "test"}',
+            {"X-Real-IP": "10.0.0.1", "X-Priority": "Batch"},
+        )
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader("x-cache"), "hit")
+        reply = json.loads(body)
+        self.assertEqual(reply["output"], "test")
+        self.assertEqual(reply["return_code"], 0)
+        self.assertEqual(
+            self.service.metadata, {"x-client-id": "10.0.0.1", "x-priority": "batch"}
+        )
+
+    def test_query_string(self):
+        """Test that a GET takes the request fields from the query string."""
+        response, body = self._request("GET", PATH + "RunCommand?command=lint")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(body)["output"], "lint")
+
+    def test_errors(self):
+        """Test that gRPC status codes map to HTTP statuses."""
+        response, body = self._request(
+            "POST", PATH + "RunCommand", b'{"command": "busy"}'
+        )
+        self.assertEqual(response.status, 429)
+        self.assertEqual(response.getheader("retry-after"), "3")
+        self.assertEqual(json.loads(body), {"code": 8, "message": "queue full"})
+
+        response, body = self._request("POST", PATH + "RunCommand", b'{"nope": 1}')
+        self.assertEqual(response.status, 400)
+        self.assertEqual(json.loads(body)["code"], 3)
+
+        response, _ = self._request("POST", PATH + "Missing", b"{}")
+        self.assertEqual(response.status, 501)
+
+    def test_stream(self):
+        """Test that streamed messages arrive one JSON object per line."""
+        response, body = self._request(
+            "POST",
+            PATH + "RunCommandStream",
+            b'{"command": "broken", "args": ["a", "b"]}',
+        )
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader("Content-Type"), "application/x-ndjson")
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([line.get("data") for line in lines[:2]], ["a", "b"])
+        self.assertEqual(lines[2], {"error": {"code": 13, "message": "make died"}})
+
+
+class TestGrpcWeb(ListenerTestCase):
+    def setUp(self):
+        self._start(FakeService())
+
+    def _call(self, method, request):
+        response, body = self._request(
+            "POST",
+            PATH + method,
+            _grpc_web_frame(request.SerializeToString()),
+            {"Content-Type": "application/grpc-web+proto"},
+        )
+        self.assertEqual(response.status, 200)
+        frames = []
+        while body:
+            length = int.from_bytes(body[1:5], "big")
+            frames.append((body[0], body[5:5 + length]))
+            body = body[5 + length:]
+        return frames
+
+    def test_unary(self):
+        """Test that the reply and the trailers come as gRPC-Web frames."""
+        frames = self._call("RunCommand", service_pb2.CommandRequest(command="x"))
+        self.assertEqual([flag for flag, _ in frames], [0x00, 0x80])
+        reply = service_pb2.CommandResponse.FromString(frames[0][1])
+        self.assertEqual(reply.output, "x")
+        self.assertIn(b"grpc-status: 0\r\n", frames[1][1])
+        self.assertIn(b"x-cache: hit\r\n", frames[1][1])
+
+    def test_error_status(self):
+        """Test that a failed call sends only a trailer frame."""
+        frames = self._call("RunCommand", service_pb2.CommandRequest(command="busy"))
+        self.assertEqual(len(frames), 1)
+        self.assertIn(b"grpc-status: 8\r\n", frames[0][1])
+        self.assertIn(b"grpc-message: queue%20full\r\n", frames[0][1])
+
+    def test_stream(self):
+        """Test that each streamed message is a frame."""
+        frames = self._call(
+            "RunCommandStream", service_pb2.CommandRequest(args=["a", "b"])
+        )
+        self.assertEqual([flag for flag, _ in frames], [0x00, 0x00, 0x80])
+        chunks = [service_pb2.CommandOutputChunk.FromString(f) for _, f in frames[:2]]
+        self.assertEqual([chunk.data for chunk in chunks], ["a", "b"])
+
+
+class TestAsyncService(ListenerTestCase):
+    def setUp(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+        self.addCleanup(stop)
+        self._start(AsyncFakeService(), loop=loop)
+
+    def test_calls_run_on_the_loop(self):
+        """Test unary and streaming calls of an asyncio servicer."""
+        response, body = self._request(
+            "POST", PATH + "RunCommand", b'{"command": "test"}'
+        )
+        self.assertEqual(json.loads(body)["output"], "test")
+
+        response, body = self._request(
+            "POST", PATH + "RunCommandStream", b'{"args": ["a", "b"]}'
+        )
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([line["data"] for line in lines], ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""Fork server helper for the ``forkserver`` launcher.
+
+Runs as a separate, minimal interpreter (``python -S``) so that starting
+children from it is cheap: its address space is a few MB and it has no
+threads, against a gRPC server with a large heap and busy thread pools. It
+only imports modules that are built into the interpreter.
+
+Protocol (one JSON object per SOCK_SEQPACKET message):
+
+- ``{"op": "spawn", "id", "argv", "cwd", "env"}`` with the child's stdin,
+  stdout and stderr attached as SCM_RIGHTS file descriptors. Answered with
+  ``{"op": "spawned", "id", "pid"}`` or ``{"op": "error", "id", "errno",
+  "error"}``.
+- ``{"op": "kill", "pid"}`` kills the process group of a child that has not
+  been reaped yet.
+- ``{"op": "exit", "pid", "returncode"}`` is sent when a child terminates.
+
+The helper exits when the server closes its end of the socket.
+"""
+
+import json
+import os
+import select
+import signal
+import socket
+import sys
+
+MAX_MESSAGE_SIZE = 1024 * 1024
+
+
+def _spawn(request, fds):
+    """Start a child; returns its pid or raises OSError.
+
+    The helper is single-threaded, so it can simply change its own directory
+    around ``posix_spawnp``.
+    """
+    env = request.get("env")
+    cwd = request.get("cwd")
+    previous = os.getcwd() if cwd else None
+    if cwd:
+        os.chdir(cwd)
+    try:
+        return os.posix_spawnp(
+            request["argv"][0],
+            request["argv"],
+            os.environ if env is None else env,
+            file_actions=[
+                (os.POSIX_SPAWN_DUP2, fd, target) for target, fd in enumerate(fds)
+            ],
+            setsigdef=(signal.SIGCHLD, signal.SIGINT),
+            setsid=True,
+        )
+    finally:
+        if previous:
+            os.chdir(previous)
+
+
+def _reap(sock, children):
+    """Collect finished children and report their exit status."""
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        children.discard(pid)
+        returncode = os.waitstatus_to_exitcode(status)
+        _send(sock, {"op": "exit", "pid": pid, "returncode": returncode})
+
+
+def _send(sock, message):
+    sock.send(json.dumps(message).encode("utf-8"))
+
+
+def main(sock_fd):
+    sock = socket.socket(fileno=sock_fd)
+    children = set()
+
+    # SIGCHLD wakes the select loop through a self-pipe
+    wake_read, wake_write = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+    signal.set_wakeup_fd(wake_write)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    # The server handles Ctrl+C; don't die before our children do
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    while True:
+        try:
+            ready, _, _ = select.select([sock, wake_read], [], [])
+        except InterruptedError:
+            continue
+
+        if wake_read in ready:
+            try:
+                os.read(wake_read, 512)
+            except BlockingIOError:
+                pass
+            _reap(sock, children)
+
+        if sock not in ready:
+            continue
+        data, fds, _, _ = socket.recv_fds(sock, MAX_MESSAGE_SIZE, 3)
+        if not data:
+            break
+        request = json.loads(data)
+        try:
+            if request["op"] == "spawn":
+                try:
+                    pid = _spawn(request, fds)
+                except OSError as e:
+                    _send(sock, {
+                        "op": "error",
+                        "id": request["id"],
+                        "errno": e.errno,
+                        "error": e.strerror,
+                    })
+                else:
+                    children.add(pid)
+                    _send(sock, {"op": "spawned", "id": request["id"], "pid": pid})
+            elif request["op"] == "kill" and request["pid"] in children:
+                # Children lead their own session; kill the whole group
+                os.killpg(request["pid"], signal.SIGKILL)
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    # The server went away; don't leave orphaned make runs behind
+    for pid in children:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]))
@@ -0,0 +1,282 @@
+"""Static asset build and serving.
+
+``build`` copies ``static/`` into a directory meant to be served with
+long-lived caching:
+
+- Scripts, stylesheets, images and fonts also get a copy named after a hash of
+  their content (``app.js`` -> ``app.3f2a9c1be0.js``). References to them in
+  HTML pages and includes are rewritten to the hashed name, so those copies
+  never change and can be cached for good.
+- Text files get ``.gz`` and, when the ``brotli`` package is installed,
+  ``.br`` siblings, sent as they are to clients that accept them.
+- ``manifest.json`` maps original paths to hashed ones, and ``caddy.conf``
+  holds the Caddyfile directives that serve the directory this way.
+
+``StaticSite`` serves such a directory, or a plain ``static/``, from the HTTP
+gateway when Caddy is not in front of it.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import threading
+from typing import Dict, NamedTuple, Optional
+
+try:
+    import brotli
+except ImportError:  # optional: pip install 'veridock[assets]'
+    brotli = None
+
+# Where ``veridock build`` writes by default; overridden by STATIC_BUILD_DIR
+BUILD_DIR = ".veridock/static"
+MANIFEST = "manifest.json"
+CADDY_SNIPPET = "caddy.conf"
+
+# Hex digits of the content hash put in file names
+HASH_LENGTH = 10
+
+FINGERPRINT_EXTENSIONS = {
+    ".js", ".mjs", ".css", ".svg", ".png", ".jpg", ".jpeg", ".gif", ".webp",
+    ".ico", ".woff", ".woff2",
+}
+COMPRESS_EXTENSIONS = {
+    ".html", ".js", ".mjs", ".css", ".svg", ".json", ".txt", ".md", ".xml",
+    ".map",
+}
+# Smaller files are not worth a compressed copy
+MIN_COMPRESS_SIZE = 256
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# src="...", href="..." and url_for(..., filename='...') references
+_REFERENCE = re.compile(
+    r"""(\b(?:src|href)\s*=\s*["']|\bfilename\s*=\s*["'])([^"'?#{}]+)"""
+)
+
+
+def _fingerprint(path: str, data: bytes) -> str:
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def _rewrite(text: str, page: str, manifest: Dict[str, str]) -> str:
+    """Point the asset references of an HTML file at their hashed names.
+
+    Relative references are looked up next to ``page`` and then from the
+    root, since includes are rendered into pages elsewhere.
+    """
+    page_dir = posixpath.dirname(page)
+
+    def replace(match):
+        prefix, url = match.groups()
+        if "://" in url or url.startswith(("//", "data:")):
+            return match.group(0)
+        if prefix.startswith("filename") or url.startswith("/"):
+            candidates = [url.lstrip("/")]
+        else:
+            candidates = [posixpath.join(page_dir, url), url]
+        for candidate in candidates:
+            hashed = manifest.get(posixpath.normpath(candidate))
+            if hashed:
+                directory = url[: len(url) - len(posixpath.basename(url))]
+                return prefix + directory + posixpath.basename(hashed)
+        return match.group(0)
+
+    return _REFERENCE.sub(replace, text)
+
+
+def _write(root: str, path: str, data: bytes) -> None:
+    """Write a file and its compressed siblings."""
+    filename = os.path.join(root, *path.split("/"))
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "wb") as f:
+        f.write(data)
+    if posixpath.splitext(path)[1] not in COMPRESS_EXTENSIONS:
+        return
+    if len(data) < MIN_COMPRESS_SIZE:
+        return
+    compressed = {".gz": gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        compressed[".br"] = brotli.compress(data, quality=11)
+    for suffix, body in compressed.items():
+        if len(body) < len(data):
+            with open(filename + suffix, "wb") as f:
+                f.write(body)
+
+
+def caddy_directives(output: str, manifest: Dict[str, str]) -> str:
+    """Caddyfile site directives serving a built directory."""
+    lines = [
+        "    # Serve the built static files (veridock build)",
+        f"    root * {output}",
+    ]
+    if manifest:
+        paths = " ".join("/" + path for path in sorted(manifest.values()))
+        lines += [
+            f"    @immutable path {paths}",
+            f'    header @immutable Cache-Control "{IMMUTABLE}"',
+        ]
+    lines += [
+        f"    @build_files path /{MANIFEST} /{CADDY_SNIPPET}",
+        "    respond @build_files 404",
+        "    @revalidate path / *.html",
+        f'    header @revalidate Cache-Control "{REVALIDATE}"',
+        "    file_server {",
+        "        precompressed br gzip",
+        "    }",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def build(source: str = "static", output: str = BUILD_DIR) -> Dict[str, str]:
+    """Build ``source`` into ``output``; returns the manifest.
+
+    The directory is built next to ``output`` and then swapped in, so a
+    server never sees half of it. An existing ``output`` is only replaced if
+    it was built here before.
+    """
+    output = output.rstrip("/") or output
+    if os.path.exists(output) and os.listdir(output):
+        if not os.path.isfile(os.path.join(output, MANIFEST)):
+            raise ValueError(f"{output} exists and was not built by veridock")
+
+    contents = {}
+    for dirpath, dirnames, filenames in os.walk(source):
+        dirnames.sort()
+        for name in sorted(filenames):
+            filename = os.path.join(dirpath, name)
+            path = os.path.relpath(filename, source).replace(os.sep, "/")
+            with open(filename, "rb") as f:
+                contents[path] = f.read()
+
+    manifest = {
+        path: _fingerprint(path, data)
+        for path, data in contents.items()
+        if posixpath.splitext(path)[1] in FINGERPRINT_EXTENSIONS
+    }
+
+    staging = f"{output}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for path, data in contents.items():
+        if path.endswith(".html"):
+            data = _rewrite(data.decode("utf-8"), path, manifest).encode("utf-8")
+        _write(staging, path, data)
+        if path in manifest:
+            _write(staging, manifest[path], data)
+    with open(os.path.join(staging, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    with open(os.path.join(staging, CADDY_SNIPPET), "w") as f:
+        f.write(caddy_directives(output, manifest))
+
+    if os.path.exists(output):
+        shutil.rmtree(output)
+    os.replace(staging, output)
+    return manifest
+
+
+class StaticFile(NamedTuple):
+    """A file chosen to answer a request."""
+
+    filename: str
+    mimetype: str
+    encoding: Optional[str]
+    cache_control: str
+    etag: str
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class StaticSite:
+    """Serves a static directory the way the generated Caddy directives do.
+
+    Hashed files listed in the directory's manifest are cached for good,
+    everything else is revalidated with its ETag. A precompressed sibling is
+    sent when the client accepts it, and unknown paths fall back to
+    ``index.html`` for client-side routing.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        manifest = os.path.join(root, MANIFEST)
+        self.immutable = set()
+        if os.path.isfile(manifest):
+            with open(manifest) as f:
+                self.immutable = set(json.load(f).values())
+        self._etags: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["StaticSite"]:
+        """Site from ``HTTP_GATEWAY_STATIC_DIR``, or None when unset."""
+        root = os.getenv("HTTP_GATEWAY_STATIC_DIR", "")
+        if not root:
+            return None
+        return cls(root)
+
+    def lookup(self, path: str, accept_encoding: str = "") -> Optional[StaticFile]:
+        """File answering a request for ``path``, or None if there is none."""
+        # Imported here, as werkzeug is slow to import and `veridock build`
+        # only builds
+        from werkzeug.security import safe_join
+
+        if not path or path.endswith("/"):
+            path += "index.html"
+        filename = safe_join(self.root, path)
+        if filename is None:
+            return None
+        if os.path.isdir(filename):
+            path = posixpath.join(path, "index.html")
+            filename = os.path.join(filename, "index.html")
+        if not os.path.isfile(filename) or path in (MANIFEST, CADDY_SNIPPET):
+            path = "index.html"
+            filename = os.path.join(self.root, path)
+            if not os.path.isfile(filename):
+                return None
+
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        accepted = _accepted_encodings(accept_encoding)
+        encoding = None
+        for name, suffix in (("br", ".br"), ("gzip", ".gz")):
+            wanted = name in accepted or "*" in accepted
+            if wanted and os.path.isfile(filename + suffix):
+                encoding = name
+                filename += suffix
+                break
+
+        cache_control = IMMUTABLE if path in self.immutable else REVALIDATE
+        return StaticFile(
+            filename, mimetype, encoding, cache_control, self._etag(filename)
+        )
+
+    def _etag(self, filename: str) -> str:
+        """Hash of a file's content, kept while its size and mtime hold."""
+        stat = os.stat(filename)
+        key = (filename, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            etag = self._etags.get(key)
+        if etag is None:
+            with open(filename, "rb") as f:
+                etag = hashlib.sha256(f.read()).hexdigest()[:20]
+            with self._lock:
+                self._etags[key] = etag
+        return etag
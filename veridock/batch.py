@@ -0,0 +1,238 @@
+"""Parallel execution of a batch of commands with dependency edges."""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent import futures
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Outcome of one command in a batch
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class BatchError(ValueError):
+    """Raised for a batch that cannot be run, e.g. one with a cycle."""
+
+
+class BatchItem(NamedTuple):
+    """One command of a batch."""
+
+    id: str
+    command: str
+    args: Tuple[str, ...]
+    depends_on: Tuple[str, ...]
+
+
+class ItemResult(NamedTuple):
+    """What happened to one command of a batch.
+
+    ``result`` is whatever the run callback returned, or None when the item
+    was skipped. Times are seconds relative to the start of the batch.
+    """
+
+    item: BatchItem
+    status: str
+    result: object
+    started: float
+    finished: float
+
+
+def validate(items: Sequence[BatchItem]) -> Dict[str, List[str]]:
+    """Check a batch and return, per item id, the ids that depend on it.
+
+    Raises BatchError for duplicate ids, unknown dependencies and cycles.
+    """
+    dependents: Dict[str, List[str]] = {}
+    for item in items:
+        if item.id in dependents:
+            raise BatchError(f"Duplicate id in batch: {item.id}")
+        dependents[item.id] = []
+    for item in items:
+        for dep in item.depends_on:
+            if dep not in dependents:
+                raise BatchError(f"{item.id} depends on unknown id: {dep}")
+            dependents[dep].append(item.id)
+
+    # Kahn's algorithm: anything left unvisited is part of a cycle
+    remaining = {item.id: len(set(item.depends_on)) for item in items}
+    ready = [i for i, n in remaining.items() if n == 0]
+    while ready:
+        for dependent in set(dependents[ready.pop()]):
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+    cyclic = sorted(i for i, n in remaining.items() if n > 0)
+    if cyclic:
+        raise BatchError(f"Dependency cycle between: {', '.join(cyclic)}")
+    return dependents
+
+
+class _Plan:
+    """Bookkeeping shared by the thread and asyncio runners."""
+
+    def __init__(self, items: Sequence[BatchItem]):
+        self.items = {item.id: item for item in items}
+        self.order = [item.id for item in items]
+        self.dependents = validate(items)
+        self.waiting_on = {item.id: set(item.depends_on) for item in items}
+        self.failed = False
+        self.results: Dict[str, ItemResult] = {}
+        self.started_at = time.monotonic()
+
+    def now(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def ready(self) -> List[BatchItem]:
+        """Items whose dependencies are done, in request order."""
+        ready = [
+            self.items[i]
+            for i in self.order
+            if self.waiting_on[i] == set() and i not in self.results
+        ]
+        for item in ready:
+            # Mark as taken so it is handed out once
+            self.waiting_on[item.id] = None
+        return ready
+
+    def finish(self, item: BatchItem, ok: bool, result, started: float) -> None:
+        status = SUCCEEDED if ok else FAILED
+        self.results[item.id] = ItemResult(item, status, result, started, self.now())
+        if ok:
+            for dependent in self.dependents[item.id]:
+                pending = self.waiting_on[dependent]
+                if pending is not None:
+                    pending.discard(item.id)
+            return
+        self.failed = True
+        self._skip_dependents(item.id)
+
+    def skip_unstarted(self, running: Sequence[str]) -> None:
+        """After a failure in fail-fast mode, skip everything not yet started."""
+        for item_id in self.order:
+            if item_id not in self.results and item_id not in running:
+                self._skip(item_id)
+
+    def _skip_dependents(self, item_id: str) -> None:
+        for dependent in self.dependents[item_id]:
+            if dependent not in self.results:
+                self._skip(dependent)
+
+    def _skip(self, item_id: str) -> None:
+        now = self.now()
+        self.results[item_id] = ItemResult(
+            self.items[item_id], SKIPPED, None, now, now
+        )
+        self.waiting_on[item_id] = None
+        self._skip_dependents(item_id)
+
+    def outcome(self) -> Tuple[List[ItemResult], float]:
+        return [self.results[i] for i in self.order], self.now()
+
+
+class BatchRunner:
+    """Runs a batch with independent commands in parallel.
+
+    A command starts once every command it depends on has succeeded; if a
+    dependency fails, its dependents are skipped. At most ``max_parallel``
+    commands of one batch run at once. The execution scheduler still applies
+    to each command, so batches cannot bypass the server's global limits.
+    """
+
+    def __init__(self, max_parallel: int = 4):
+        self.max_parallel = max_parallel
+
+    @classmethod
+    def from_env(cls) -> "BatchRunner":
+        """Build a runner from ``GRPC_BATCH_MAX_PARALLEL``."""
+        return cls(max_parallel=int(os.getenv("GRPC_BATCH_MAX_PARALLEL", "4")))
+
+    def width(self, requested: Optional[int] = None) -> int:
+        """Parallelism for a batch, capped at ``max_parallel``."""
+        if requested and requested > 0:
+            return min(requested, self.max_parallel)
+        return self.max_parallel
+
+    def run(
+        self,
+        items: Sequence[BatchItem],
+        run: Callable[[BatchItem], Tuple[object, bool]],
+        max_parallel: Optional[int] = None,
+        fail_fast: bool = False,
+    ) -> Tuple[List[ItemResult], float]:
+        """Run a batch on a thread pool.
+
+        ``run`` executes one item and returns ``(result, succeeded)``.
+        Returns the item results in request order and the elapsed seconds.
+        """
+        plan = _Plan(items)
+        running: Dict[futures.Future, Tuple[BatchItem, float]] = {}
+        with futures.ThreadPoolExecutor(self.width(max_parallel)) as pool:
+            pending: List[BatchItem] = []
+            while True:
+                if not (plan.failed and fail_fast):
+                    pending.extend(plan.ready())
+                while pending and len(running) < self.width(max_parallel):
+                    item = pending.pop(0)
+                    running[pool.submit(run, item)] = (item, plan.now())
+                if not running:
+                    break
+                done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    item, started = running.pop(future)
+                    result, ok = _result_of(future, item)
+                    plan.finish(item, ok, result, started)
+                if plan.failed and fail_fast:
+                    pending.clear()
+                    plan.skip_unstarted([i.id for i, _ in running.values()])
+        return plan.outcome()
+
+    async def run_async(
+        self,
+        items: Sequence[BatchItem],
+        run,
+        max_parallel: Optional[int] = None,
+        fail_fast: bool = False,
+    ) -> Tuple[List[ItemResult], float]:
+        """asyncio version of ``run``; ``run`` is a coroutine function."""
+        plan = _Plan(items)
+        running: Dict[asyncio.Task, Tuple[BatchItem, float]] = {}
+        pending: List[BatchItem] = []
+        try:
+            while True:
+                if not (plan.failed and fail_fast):
+                    pending.extend(plan.ready())
+                while pending and len(running) < self.width(max_parallel):
+                    item = pending.pop(0)
+                    task = asyncio.ensure_future(run(item))
+                    running[task] = (item, plan.now())
+                if not running:
+                    break
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    item, started = running.pop(task)
+                    result, ok = _result_of(task, item)
+                    plan.finish(item, ok, result, started)
+                if plan.failed and fail_fast:
+                    pending.clear()
+                    plan.skip_unstarted([i.id for i, _ in running.values()])
+        finally:
+            # The batch call was cancelled: stop whatever is still running
+            for task in running:
+                task.cancel()
+        return plan.outcome()
+
+
+def _result_of(future, item: BatchItem) -> Tuple[object, bool]:
+    """Unpack a finished run, treating an exception as a failure."""
+    error = future.exception()
+    if error is not None:
+        logger.error("Batch command %s raised: %s", item.id, error)
+        return error, False
+    return future.result()
@@ -0,0 +1,177 @@
+"""Content-addressed result cache for deterministic Makefile targets."""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResult(NamedTuple):
+    """A finished command result held in the cache."""
+
+    output: str
+    error: str
+    return_code: int
+
+
+class _Entry(NamedTuple):
+    result: CachedResult
+    expires_at: float
+    size: int
+
+
+def parse_cache_targets(spec: str) -> Dict[str, List[str]]:
+    """Parse a ``GRPC_CACHE_TARGETS`` value.
+
+    The value is a comma-separated list of targets. Each target may declare the
+    input files it depends on as colon-separated globs, e.g.
+    ``help,generate-commands:static/*.js:*.proto``.
+    """
+    targets: Dict[str, List[str]] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, *inputs = item.split(":")
+        targets[name.strip()] = [i.strip() for i in inputs if i.strip()]
+    return targets
+
+
+class ResultCache:
+    """Thread-safe TTL + LRU cache of make results for opt-in targets.
+
+    The cache key covers the target, its arguments, the content hash of the
+    Makefile and the content of every file matched by the target's declared
+    input globs, so editing any of them naturally produces a miss. File digests
+    are memoized on (mtime, size) so unchanged inputs are not re-read.
+    """
+
+    def __init__(
+        self,
+        targets: Dict[str, List[str]],
+        ttl: float = 60.0,
+        max_entries: int = 256,
+        max_bytes: int = 16 * 1024 * 1024,
+        global_inputs: Sequence[str] = (),
+        makefile: str = "Makefile",
+    ):
+        self.targets = targets
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.global_inputs = list(global_inputs)
+        self.makefile = makefile
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResultCache"]:
+        """Build a cache from ``GRPC_CACHE_*`` variables, or None if disabled."""
+        targets = parse_cache_targets(os.getenv("GRPC_CACHE_TARGETS", ""))
+        if not targets:
+            return None
+        global_inputs = [
+            g.strip()
+            for g in os.getenv("GRPC_CACHE_INPUTS", "").split(",")
+            if g.strip()
+        ]
+        return cls(
+            targets,
+            ttl=float(os.getenv("GRPC_CACHE_TTL", "60")),
+            max_entries=int(os.getenv("GRPC_CACHE_MAX_ENTRIES", "256")),
+            max_bytes=int(os.getenv("GRPC_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+            global_inputs=global_inputs,
+        )
+
+    def is_cacheable(self, command: str) -> bool:
+        """Return True if results of ``command`` may be cached."""
+        return command in self.targets
+
+    def key(self, command: str, args: Sequence[str], cwd: str) -> str:
+        """Compute the content-addressed key for a command run in ``cwd``."""
+        h = hashlib.sha256()
+        h.update(json.dumps([command, list(args), cwd]).encode("utf-8"))
+        h.update(self._file_digest(os.path.join(cwd, self.makefile)).encode())
+
+        patterns = self.global_inputs + self.targets.get(command, [])
+        paths = set()
+        for pattern in patterns:
+            paths.update(glob.glob(os.path.join(cwd, pattern), recursive=True))
+        for path in sorted(paths):
+            h.update(path.encode("utf-8"))
+            h.update(self._file_digest(path).encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        """Return a live cached result and mark it recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._evict(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.result
+
+    def put(self, key: str, result: CachedResult) -> None:
+        """Store a result, evicting least recently used entries to fit."""
+        size = len(result.output) + len(result.error)
+        if size > self.max_bytes:
+            logger.debug("Result of %d bytes is too large to cache", size)
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = _Entry(result, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._evict(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        """Drop every cached result."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _file_digest(self, path: str) -> str:
+        """Content hash of a file, memoized on its mtime and size."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return "missing"
+        memo = self._digests.get(path)
+        if memo and memo[0] == st.st_mtime_ns and memo[1] == st.st_size:
+            return memo[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        self._digests[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
@@ -1,22 +1,46 @@
 """Veridock CLI entry point."""
 
+import importlib
+
 import click
 
-from .commands import init  # noqa: F401
-from .commands import service  # noqa: F401
-from .commands import server  # noqa: F401
+# Command name -> "module:attribute" of the command, imported when it is used
+COMMANDS = {
+    "build": "veridock.cli.commands.build:build",
+    "server": "veridock.cli.commands.server:server",
+    "service": "veridock.cli.commands.service:service",
+}
+
+
+class LazyGroup(click.Group):
+    """Group importing a command's module only when the command is looked up.
+
+    ``veridock server status`` then imports the server commands only, and
+    each command module defers its own heavy imports to the command that
+    needs them, so the CLI starts quickly.
+    """
 
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = dict(lazy_commands or {})
 
-@click.group()
+    def list_commands(self, ctx):
+        return sorted({*super().list_commands(ctx), *self.lazy_commands})
+
+    def get_command(self, ctx, name):
+        if name not in self.commands and name in self.lazy_commands:
+            module_name, attribute = self.lazy_commands[name].split(":")
+            module = importlib.import_module(module_name)
+            self.add_command(getattr(module, attribute), name)
+        return super().get_command(ctx, name)
+
+
+@click.group(cls=LazyGroup, lazy_commands=COMMANDS)
 @click.version_option()
 def cli() -> None:
     """Veridock - gRPC-powered server management tool."""
     pass
 
 
-# Register command groups
-service.register_cli(cli)
-server.register_cli(cli)
-
 if __name__ == "__main__":
     cli()
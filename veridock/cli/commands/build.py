@@ -0,0 +1,51 @@
+"""Static asset build command."""
+import os
+import sys
+
+import click
+
+from veridock import assets
+
+from ..utils import command_error, command_success
+
+
+@click.command("build")
+@click.option(
+    "--source",
+    type=click.Path(exists=True, file_okay=False),
+    default="static",
+    show_default=True,
+    help="Directory of static files to build",
+)
+@click.option(
+    "--output",
+    envvar="STATIC_BUILD_DIR",
+    default=assets.BUILD_DIR,
+    show_default=True,
+    help="Directory to write the built files to",
+)
+def build(source: str, output: str) -> None:
+    """Fingerprint and precompress static files for long-lived caching."""
+    try:
+        manifest = assets.build(source, output)
+    except (OSError, ValueError) as e:
+        command_error(f"Build failed: {e}")
+        sys.exit(1)
+
+    command_success(
+        f"Built {source} into {output} ({len(manifest)} fingerprinted assets)"
+    )
+    if assets.brotli is None:
+        click.echo(
+            "brotli is not installed, so only .gz files were written "
+            "(pip install 'veridock[assets]')"
+        )
+    click.echo(
+        f"Caddy directives: {os.path.join(output, assets.CADDY_SNIPPET)} "
+        "(picked up by generate_caddyfile.py)"
+    )
+
+
+def register_cli(cli_group):
+    """Register the build command with the main CLI group."""
+    cli_group.add_command(build)
@@ -1,86 +1,127 @@
 """Server management commands."""
+import functools
 import os
-import subprocess
 import sys
+import time
 from pathlib import Path
 from typing import List, Optional
 
 import click
-from dotenv import load_dotenv
+
+from veridock import supervisor
+from veridock.log_collector import LogCollector
+from veridock.supervisor import (
+    Component,
+    Supervisor,
+    SupervisorError,
+    http_ok,
+    port_open,
+)
 
 from ..utils import ProjectContext, command_success, command_error
 
+# Where the output of each component is written, under the project
+LOG_DIR = os.path.join(".veridock", "logs")
+
+
+def _grpc_serving(host: str, port: int) -> bool:
+    """Whether the gRPC server's health check reports SERVING."""
+    # Imports grpc, which `veridock --help` does not need
+    from veridock import health
+
+    return health.serving(host, port)
+
+
 class ServerManager:
-    """Manage Veridock server processes."""
+    """Build the project's server components and supervise them."""
     
     def __init__(self, project_dir: Optional[Path] = None):
         """Initialize with project directory."""
         self.ctx = ProjectContext(project_dir)
-        self.processes: List[subprocess.Popen] = []
+        self.components: List[Component] = []
+        self.state_dir = str(self.ctx.project_dir / supervisor.STATE_DIR)
         
         # Load environment variables
+        from dotenv import load_dotenv
+
         env_path = self.ctx.project_dir / ".env"
         if env_path.exists():
             load_dotenv(env_path)
     
-    def start_grpc_server(self, dev_mode: bool = False) -> None:
-        """Start the gRPC server."""
+    def add_grpc_server(
+        self,
+        mode: Optional[str] = None,
+        http_port: Optional[int] = None,
+        workers: Optional[int] = None,
+    ) -> None:
+        """Add the gRPC server, ready once its health check reports SERVING."""
         cmd = [sys.executable, "-m", "veridock.grpc_server"]
-        if dev_mode:
-            cmd.append("--dev")
-        self._start_process(cmd, "gRPC Server")
+        if mode:
+            cmd.extend(["--mode", mode])
+        if http_port:
+            cmd.extend(["--http-port", str(http_port)])
+        if workers:
+            cmd.extend(["--workers", str(workers)])
+        ready = functools.partial(
+            _grpc_serving,
+            os.getenv("GRPC_HOST", "0.0.0.0"),
+            int(os.getenv("GRPC_PORT", "50051")),
+        )
+        self.components.append(Component("grpc", cmd, ready))
     
-    def start_http_gateway(self, dev_mode: bool = False) -> None:
-        """Start the HTTP gateway."""
+    def add_http_gateway(
+        self, dev_mode: bool = False, server: Optional[str] = None
+    ) -> None:
+        """Add the HTTP gateway, started once the gRPC server is ready, and
+        ready once its /readyz answers."""
         cmd = [sys.executable, "-m", "veridock.http_gateway"]
         if dev_mode:
             cmd.append("--dev")
-        self._start_process(cmd, "HTTP Gateway")
+        if server:
+            cmd.extend(["--server", server])
+        ready = functools.partial(
+            http_ok,
+            os.getenv("HTTP_GATEWAY_HOST", "0.0.0.0"),
+            int(os.getenv("HTTP_GATEWAY_PORT", "8082")),
+            "/readyz",
+        )
+        self.components.append(Component("gateway", cmd, ready, ("grpc",)))
     
-    def start_caddy(self) -> None:
-        """Start the Caddy web server."""
+    def add_caddy(self) -> None:
+        """Add the Caddy web server, started once the gateway is ready."""
         cmd = ["caddy", "run", "--config", "Caddyfile"]
-        self._start_process(cmd, "Caddy")
+        ready = functools.partial(
+            port_open, "127.0.0.1", int(os.getenv("HTTP_PORT", "8088"))
+        )
+        self.components.append(Component("caddy", cmd, ready, ("gateway",)))
     
-    def _start_process(self, cmd: List[str], name: str) -> None:
-        """Start a subprocess and track it."""
-        try:
-            process = subprocess.Popen(
-                cmd,
-                cwd=str(self.ctx.project_dir),
-                env=os.environ.copy(),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True
-            )
-            self.processes.append(process)
-            command_success(f"Started {name} (PID: {process.pid})")
-            
-            # Start a thread to log output
-            import threading
-            def log_output():
-                if process.stdout:
-                    for line in iter(process.stdout.readline, ''):
-                        click.echo(f"[{name}] {line.strip()}")
-            
-            thread = threading.Thread(target=log_output, daemon=True)
-            thread.start()
-            
-        except Exception as e:
-            command_error(f"Failed to start {name}: {e}")
+    def log_collector(
+        self,
+        log_dir: str = LOG_DIR,
+        console: bool = True,
+        console_rate: float = 100.0,
+    ) -> LogCollector:
+        """Collector of the components' output into files under ``log_dir``."""
+        return LogCollector(
+            str(self.ctx.project_dir / log_dir),
+            max_bytes=int(os.getenv("VERIDOCK_LOG_MAX_BYTES", "10485760")),
+            backup_count=int(os.getenv("VERIDOCK_LOG_BACKUP_COUNT", "5")),
+            echo=click.echo if console else None,
+            console_rate=console_rate,
+        )
     
-    def stop_all(self) -> None:
-        """Stop all managed processes."""
-        for process in self.processes:
-            try:
-                process.terminate()
-                process.wait(timeout=5)
-                command_success(f"Stopped process {process.pid}")
-            except Exception as e:
-                command_error(f"Failed to stop process {process.pid}: {e}")
-        self.processes = []
+    def supervisor(self, **options) -> Supervisor:
+        """Supervisor of the added components; options as for Supervisor."""
+        if "log_collector" not in options:
+            options["log_collector"] = self.log_collector()
+        return Supervisor(
+            self.components,
+            self.state_dir,
+            cwd=str(self.ctx.project_dir),
+            env=os.environ.copy(),
+            echo=click.echo,
+            **options,
+        )
 
 @click.group()
 def server() -> None:
@@ -90,41 +131,173 @@ def server() -> None:
 @server.command("start")
 @click.option("--dev", is_flag=True, help="Run in development mode")
 @click.option("--no-caddy", is_flag=True, help="Don't start the Caddy server")
-def start_server(dev: bool, no_caddy: bool) -> None:
-    """Start all server components."""
+@click.option(
+    "--grpc-mode",
+    type=click.Choice(["thread", "aio"]),
+    envvar="GRPC_SERVER_MODE",
+    default="thread",
+    show_default=True,
+    help="Run the gRPC server on a thread pool or on a grpc.aio event loop",
+)
+@click.option(
+    "--gateway-server",
+    type=click.Choice(["threaded", "gunicorn", "development"]),
+    envvar="HTTP_GATEWAY_SERVER",
+    default="threaded",
+    show_default=True,
+    help="WSGI server for the HTTP gateway",
+)
+@click.option(
+    "--grpc-http-port",
+    type=int,
+    envvar="GRPC_HTTP_PORT",
+    default=0,
+    show_default=True,
+    help="Port on which the gRPC server also answers HTTP/JSON and gRPC-Web (0: off)",
+)
+@click.option(
+    "--grpc-workers",
+    type=click.IntRange(min=1),
+    envvar="GRPC_WORKERS",
+    default=1,
+    show_default=True,
+    help="gRPC server processes sharing its port, to use several cores",
+)
+@click.option(
+    "--ready-timeout",
+    type=float,
+    envvar="VERIDOCK_READY_TIMEOUT",
+    default=30.0,
+    show_default=True,
+    help="Seconds a component may take to become ready before startup fails",
+)
+@click.option(
+    "--max-backoff",
+    type=float,
+    envvar="VERIDOCK_MAX_BACKOFF",
+    default=30.0,
+    show_default=True,
+    help="Longest wait in seconds before restarting a component that keeps exiting",
+)
+@click.option(
+    "--log-dir",
+    envvar="VERIDOCK_LOG_DIR",
+    default=LOG_DIR,
+    show_default=True,
+    help="Directory of the components' log files, relative to the project",
+)
+@click.option(
+    "--console-logs/--no-console-logs",
+    envvar="VERIDOCK_CONSOLE_LOGS",
+    default=True,
+    show_default=True,
+    help="Also show the components' output in the terminal",
+)
+@click.option(
+    "--console-rate",
+    type=float,
+    envvar="VERIDOCK_CONSOLE_RATE",
+    default=100.0,
+    show_default=True,
+    help="Most output lines per second shown in the terminal (0: no limit)",
+)
+def start_server(
+    dev: bool,
+    no_caddy: bool,
+    grpc_mode: str,
+    gateway_server: str,
+    grpc_http_port: int,
+    grpc_workers: int,
+    ready_timeout: float,
+    max_backoff: float,
+    log_dir: str,
+    console_logs: bool,
+    console_rate: float,
+) -> None:
+    """Start all server components and restart them when they exit.
+
+    Each component is started once the one it depends on is ready (gRPC
+    server, then HTTP gateway, then Caddy). Stop with Ctrl+C, or with
+    `veridock server stop` from another shell.
+    """
     manager = ServerManager()
+    manager.add_grpc_server(grpc_mode, grpc_http_port, grpc_workers)
+    if no_caddy and not os.getenv("HTTP_GATEWAY_STATIC_DIR"):
+        # Without Caddy the gateway serves the static files, built ones
+        # when `veridock build` has been run
+        from veridock.assets import BUILD_DIR
+
+        build_dir = os.getenv("STATIC_BUILD_DIR", BUILD_DIR)
+        os.environ["HTTP_GATEWAY_STATIC_DIR"] = (
+            build_dir if os.path.isdir(build_dir) else "static"
+        )
+    manager.add_http_gateway(dev, gateway_server)
+    if not no_caddy:
+        manager.add_caddy()
+    runner = manager.supervisor(
+        ready_timeout=ready_timeout,
+        backoff_max=max_backoff,
+        log_collector=manager.log_collector(log_dir, console_logs, console_rate),
+    )
     
+    click.echo("🚀 Starting Veridock server...")
     try:
-        click.echo("🚀 Starting Veridock server...")
-        manager.start_grpc_server(dev)
-        manager.start_http_gateway(dev)
-        
-        if not no_caddy:
-            manager.start_caddy()
-        
-        # Keep running until interrupted
-        click.echo("\n🛑 Press Ctrl+C to stop the server")
-        while True:
-            try:
-                import time
-                time.sleep(1)
-            except KeyboardInterrupt:
-                click.echo("\n🛑 Stopping server...")
-                manager.stop_all()
-                break
-    
-    except Exception as e:
+        runner.start()
+    except (SupervisorError, OSError) as e:
         command_error(f"Server error: {e}")
-        manager.stop_all()
         sys.exit(1)
+    
+    command_success(f"All components ready (state in {manager.state_dir})")
+    click.echo(f"📄 Logs in {runner.logs.directory}")
+    click.echo("\n🛑 Press Ctrl+C to stop the server")
+    runner.run()
+    click.echo("🛑 Server stopped")
 
 @server.command("stop")
 def stop_server() -> None:
-    """Stop all running server components."""
-    # This is a placeholder - in a real implementation, you would track PIDs
-    click.echo("Stopping all server components...")
-    # TODO: Implement proper process management
-    click.echo("Note: This command needs proper process tracking to work correctly")
+    """Stop the running server components, also from another shell."""
+    manager = ServerManager()
+    try:
+        stopped = supervisor.stop_running(manager.state_dir, echo=click.echo)
+    except SupervisorError as e:
+        command_error(str(e))
+        sys.exit(1)
+    if stopped:
+        command_success("Server stopped")
+    else:
+        click.echo("Server is not running")
+
+@server.command("status")
+def server_status() -> None:
+    """Show the state of each server component."""
+    manager = ServerManager()
+    state = supervisor.read_state(manager.state_dir)
+    if state is None:
+        click.echo("Server is not running")
+        sys.exit(3)
+    click.echo(f"Supervisor PID {state['supervisor']}")
+    now = time.time()
+    for name, component in state["components"].items():
+        click.echo(
+            f"  {name:<8} {component['state']:<9} PID {component['pid'] or '-':<8} "
+            f"for {now - component['since']:.0f}s, "
+            f"{component['restarts']} restarts"
+        )
+
+@server.command("restart")
+@click.argument("components", nargs=-1)
+def restart_server(components) -> None:
+    """Restart components of the running server (default: all), in order."""
+    manager = ServerManager()
+    try:
+        pid = supervisor.request_restart(manager.state_dir, components)
+    except SupervisorError as e:
+        command_error(str(e))
+        sys.exit(1)
+    command_success(
+        f"Asked the supervisor (PID {pid}) to restart "
+        f"{', '.join(components) or 'all components'}"
+    )
 
 def register_cli(cli_group):
     """Register server commands with the main CLI group."""
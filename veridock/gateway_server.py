@@ -0,0 +1,152 @@
+"""WSGI servers for the HTTP gateway.
+
+Every gateway request holds its worker until the gRPC call behind it returns,
+which for ``run_command`` is as long as make runs. Werkzeug's development
+server handles one request at a time, so the gateway needs a server that runs
+requests concurrently:
+
+- ``threaded`` (default): werkzeug on a bounded thread pool, one process.
+- ``gunicorn``: a gunicorn master with ``workers`` processes of ``threads``
+  threads each. Needs the optional ``gunicorn`` package.
+- ``development``: werkzeug's single-threaded server, for debugging.
+"""
+
+import logging
+import os
+from concurrent import futures
+from typing import Callable, Optional
+
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler, make_server
+
+logger = logging.getLogger(__name__)
+
+SERVER_MODES = ("threaded", "gunicorn", "development")
+
+
+class _PooledWSGIServer(ThreadedWSGIServer):
+    """``ThreadedWSGIServer`` that runs connections on a fixed thread pool."""
+
+    def __init__(self, *args, threads: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = futures.ThreadPoolExecutor(threads, "gateway")
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class GatewayServer:
+    """Serves the gateway app in one of ``SERVER_MODES``.
+
+    ``threads`` bounds the requests handled at once per process and
+    ``timeout`` is how long a worker may go silent (gunicorn) or a socket read
+    or write may block (threaded) before it is abandoned. ``keepalive`` is how
+    long gunicorn keeps an idle client connection open; werkzeug closes the
+    connection after every response.
+    """
+
+    def __init__(
+        self,
+        mode: str = "threaded",
+        workers: int = 1,
+        threads: int = 16,
+        keepalive: float = 5.0,
+        timeout: float = 300.0,
+    ):
+        if mode not in SERVER_MODES:
+            raise ValueError(
+                f"Unknown gateway server {mode!r}, "
+                f"expected one of: {', '.join(SERVER_MODES)}"
+            )
+        self.mode = mode
+        self.workers = workers
+        self.threads = threads
+        self.keepalive = keepalive
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls) -> "GatewayServer":
+        """Build a server from ``HTTP_GATEWAY_*`` variables."""
+        return cls(
+            mode=os.getenv("HTTP_GATEWAY_SERVER", "threaded"),
+            workers=int(os.getenv("HTTP_GATEWAY_WORKERS", str(os.cpu_count() or 1))),
+            threads=int(os.getenv("HTTP_GATEWAY_THREADS", "16")),
+            keepalive=float(os.getenv("HTTP_GATEWAY_KEEPALIVE", "5")),
+            timeout=float(os.getenv("HTTP_GATEWAY_TIMEOUT", "300")),
+        )
+
+    def serve(
+        self,
+        app,
+        host: str,
+        port: int,
+        post_fork: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """Serve ``app`` until interrupted.
+
+        ``post_fork`` runs in each gunicorn worker after it is forked, to
+        replace state that must not be shared across processes, such as gRPC
+        channels.
+        """
+        if self.mode == "gunicorn":
+            self._serve_gunicorn(app, host, port, post_fork)
+            return
+
+        if self.mode == "development":
+            server = make_server(host, port, app)
+            description = "development server, one request at a time"
+        else:
+            server = self._threaded_server(app, host, port)
+            description = f"{self.threads} threads"
+        logger.info(
+            "HTTP gateway running on http://%s:%s (%s)", host, port, description
+        )
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    def _threaded_server(self, app, host: str, port: int) -> _PooledWSGIServer:
+        # Applied to every connection's socket by StreamRequestHandler.setup
+        handler = type(
+            "RequestHandler", (WSGIRequestHandler,), {"timeout": self.timeout}
+        )
+        return _PooledWSGIServer(host, port, app, handler, threads=self.threads)
+
+    def _serve_gunicorn(self, app, host: str, port: int, post_fork) -> None:
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            raise RuntimeError(
+                "HTTP_GATEWAY_SERVER=gunicorn needs gunicorn: "
+                "pip install 'veridock[server]'"
+            ) from None
+
+        options = {
+            "bind": f"{host}:{port}",
+            "workers": self.workers,
+            "threads": self.threads,
+            "worker_class": "gthread",
+            "keepalive": int(self.keepalive),
+            "timeout": int(self.timeout),
+            "graceful_timeout": int(self.timeout),
+        }
+        if post_fork is not None:
+            options["post_fork"] = lambda server, worker: post_fork()
+
+        class Application(BaseApplication):
+            def load_config(self):
+                for key, value in options.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                return app
+
+        logger.info(
+            "HTTP gateway running on http://%s:%s (gunicorn, %d workers x %d threads)",
+            host, port, self.workers, self.threads,
+        )
+        Application().run()
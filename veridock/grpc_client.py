@@ -0,0 +1,249 @@
+"""gRPC client side of the HTTP gateway: channel pool and call deadlines."""
+
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+import grpc
+
+from veridock import health, service_pb2_grpc
+
+logger = logging.getLogger(__name__)
+
+# Default deadline in seconds per gateway endpoint; the rest use
+# HTTP_GATEWAY_DEADLINE
+DEFAULT_DEADLINES = {
+    "run_command": 600.0,
+    "run_command_stream": 600.0,
+    "run_batch": 1800.0,
+    "MakefileService.RunCommand": 600.0,
+    "MakefileService.RunCommandStream": 600.0,
+    "MakefileService.RunCommands": 1800.0,
+    # Health checks fail fast, so Caddy moves on to another gateway
+    "readyz": 1.0,
+}
+
+# Request header with which a client asks for a different deadline
+DEADLINE_HEADER = "X-Request-Timeout"
+
+
+def _service_config(max_attempts: int) -> str:
+    """Service config retrying calls the server never received."""
+    method: Dict = {"name": [{"service": "makefile.MakefileService"}]}
+    if max_attempts > 1:
+        method["retryPolicy"] = {
+            "maxAttempts": max_attempts,
+            "initialBackoff": "0.1s",
+            "maxBackoff": "2s",
+            "backoffMultiplier": 2,
+            "retryableStatusCodes": ["UNAVAILABLE"],
+        }
+    return json.dumps({"methodConfig": [method]})
+
+
+class _CallTimer(grpc.UnaryUnaryClientInterceptor):
+    """Reports the duration of every blocking unary call."""
+
+    def __init__(self, on_call: Callable[[str, float], None]):
+        self._on_call = on_call
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        start = time.perf_counter()
+        outcome = continuation(client_call_details, request)
+        self._on_call(client_call_details.method, time.perf_counter() - start)
+        return outcome
+
+
+class ChannelPool:
+    """Round-robin pool of channels to the gRPC server.
+
+    A single channel multiplexes every call over one HTTP/2 connection; each
+    channel here gets its own connection (a local subchannel pool), so load is
+    spread over ``size`` connections. Channels send keepalive pings every
+    ``keepalive`` seconds and drop a connection whose ping is not answered
+    within ``keepalive_timeout``, so a hung server is noticed. Calls failing
+    with UNAVAILABLE are retried up to ``max_attempts`` times in total.
+
+    ``on_call(method, seconds)`` is called after every unary call.
+    """
+
+    def __init__(
+        self,
+        target: str,
+        size: int = 4,
+        keepalive: float = 30.0,
+        keepalive_timeout: float = 10.0,
+        max_attempts: int = 3,
+        on_call: Optional[Callable[[str, float], None]] = None,
+    ):
+        self.target = target
+        self.size = max(1, size)
+        options = [
+            ("grpc.use_local_subchannel_pool", 1),
+            ("grpc.keepalive_time_ms", int(keepalive * 1000)),
+            ("grpc.keepalive_timeout_ms", int(keepalive_timeout * 1000)),
+            ("grpc.keepalive_permit_without_calls", 1),
+            ("grpc.http2.max_pings_without_data", 0),
+            ("grpc.enable_retries", 1 if max_attempts > 1 else 0),
+            ("grpc.service_config", _service_config(max_attempts)),
+        ]
+        self._channels = [
+            grpc.insecure_channel(target, options=options) for _ in range(self.size)
+        ]
+        channels = self._channels
+        if on_call is not None:
+            timer = _CallTimer(on_call)
+            channels = [grpc.intercept_channel(c, timer) for c in channels]
+        self._call_channels = channels
+        self._stubs = [service_pb2_grpc.MakefileServiceStub(c) for c in channels]
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._states = [None] * self.size
+        self._transitions: Counter = Counter()
+        self._callbacks = []
+        for index, channel in enumerate(self._channels):
+            callback = self._state_callback(index)
+            channel.subscribe(callback)
+            self._callbacks.append(callback)
+
+    @classmethod
+    def from_env(cls, target: str, on_call=None) -> "ChannelPool":
+        """Build a pool from ``HTTP_GATEWAY_GRPC_*`` variables."""
+        return cls(
+            target,
+            on_call=on_call,
+            size=int(os.getenv("HTTP_GATEWAY_GRPC_CHANNELS", "4")),
+            keepalive=float(os.getenv("HTTP_GATEWAY_GRPC_KEEPALIVE", "30")),
+            keepalive_timeout=float(
+                os.getenv("HTTP_GATEWAY_GRPC_KEEPALIVE_TIMEOUT", "10")
+            ),
+            max_attempts=int(os.getenv("HTTP_GATEWAY_GRPC_MAX_ATTEMPTS", "3")),
+        )
+
+    def stub(self) -> service_pb2_grpc.MakefileServiceStub:
+        """Stub on the next channel in turn."""
+        return self._stubs[next(self._next) % self.size]
+
+    def channel(self) -> grpc.Channel:
+        """Next channel in turn, for calls made from method descriptors."""
+        return self._call_channels[next(self._next) % self.size]
+
+    def health(self, timeout: float) -> str:
+        """Serving status the gRPC server reports, as ``health.check()``.
+
+        Asked over the channels in turn until one reaches the server, within
+        ``timeout`` seconds in all, so a single broken connection does not
+        make the server look down.
+        """
+        start = next(self._next)
+        deadline = time.monotonic() + timeout
+        status = "unavailable"
+        for i in range(self.size):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            channel = self._channels[(start + i) % self.size]
+            status = health.check_channel(channel, remaining)
+            if status != "unavailable":
+                break
+        return status
+
+    def stats(self) -> Dict:
+        """Current state of each channel and transitions seen per state."""
+        with self._lock:
+            return {
+                "channels": [
+                    state.name.lower() if state else "unknown"
+                    for state in self._states
+                ],
+                "transitions": dict(self._transitions),
+            }
+
+    def close(self) -> None:
+        for channel, callback in zip(self._channels, self._callbacks):
+            channel.unsubscribe(callback)
+            channel.close()
+
+    def _state_callback(self, index: int):
+        def on_state(state: grpc.ChannelConnectivity) -> None:
+            with self._lock:
+                previous = self._states[index]
+                self._states[index] = state
+                self._transitions[state.name.lower()] += 1
+            if previous is None or previous == state:
+                return
+            log = (
+                logger.warning
+                if state == grpc.ChannelConnectivity.TRANSIENT_FAILURE
+                else logger.info
+            )
+            log(
+                "gRPC channel %d to %s: %s -> %s",
+                index,
+                self.target,
+                previous.name.lower(),
+                state.name.lower(),
+            )
+
+        return on_state
+
+
+class Deadlines:
+    """Per-endpoint gRPC call deadlines.
+
+    ``overrides`` maps gateway endpoint names to seconds on top of
+    ``DEFAULT_DEADLINES``; other endpoints use ``default``. A client may ask
+    for another deadline with the ``X-Request-Timeout`` header, up to
+    ``maximum`` seconds.
+    """
+
+    def __init__(
+        self,
+        default: float = 30.0,
+        overrides: Optional[Dict[str, float]] = None,
+        maximum: float = 3600.0,
+    ):
+        self.default = default
+        self.deadlines = {**DEFAULT_DEADLINES, **(overrides or {})}
+        self.maximum = maximum
+
+    @classmethod
+    def from_env(cls) -> "Deadlines":
+        """Build deadlines from ``HTTP_GATEWAY_DEADLINE*`` variables.
+
+        ``HTTP_GATEWAY_DEADLINES`` is a comma-separated ``endpoint=seconds``
+        list, e.g. ``run_command=120,run_batch=900``.
+        """
+        overrides = {}
+        for item in os.getenv("HTTP_GATEWAY_DEADLINES", "").split(","):
+            if "=" in item:
+                endpoint, seconds = item.split("=", 1)
+                overrides[endpoint.strip()] = float(seconds)
+        return cls(
+            default=float(os.getenv("HTTP_GATEWAY_DEADLINE", "30")),
+            overrides=overrides,
+            maximum=float(os.getenv("HTTP_GATEWAY_MAX_DEADLINE", "3600")),
+        )
+
+    def timeout(self, endpoint: Optional[str], header: Optional[str] = None) -> float:
+        """Deadline in seconds for a call made by ``endpoint``.
+
+        ``header`` is the value of the request's ``X-Request-Timeout`` header;
+        values that are not positive numbers are ignored.
+        """
+        seconds = self.deadlines.get(endpoint or "", self.default)
+        if header:
+            try:
+                requested = float(header)
+            except ValueError:
+                requested = 0
+            if requested > 0:
+                seconds = requested
+            else:
+                logger.warning("Ignoring invalid %s: %r", DEADLINE_HEADER, header)
+        return min(seconds, self.maximum)
@@ -1,53 +1,1120 @@
 #!/usr/bin/env python3
 """gRPC server for the Makefile Command Runner."""
 
+import asyncio
+import codecs
+import contextlib
+import functools
+import inspect
 import logging
 import os
+import selectors
 import signal
-import subprocess
 import sys
+import threading
+import time
 from concurrent import futures
 
 import grpc
 from veridock import service_pb2
 from veridock import service_pb2_grpc
+from veridock.batch import FAILED, SKIPPED, BatchError, BatchItem, BatchRunner
+from veridock import jobs, metrics, supervisor, tracing
+from veridock.cache import CachedResult, ResultCache
+from veridock.health import HealthReporter, ThreadReservation
+from veridock.jobs import JobQueueFullError, JobStore
+from veridock.launcher import Launcher
+from veridock.log_collector import LogCollector
+from veridock.logs import brief, configure_logging
+from veridock.output import OutputStore
+from veridock.scheduler import QueueFullError, Scheduler
+from veridock.singleflight import SingleFlight
+from veridock.supervisor import Component, Supervisor, SupervisorError
+from veridock.targets import TargetIndex
+from veridock.transcoder import TranscodingListener
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Maximum number of bytes read from a child pipe in one go when streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Server modes: a thread pool running blocking handlers, or a grpc.aio event loop
+SERVER_MODES = ("thread", "aio")
+
+# Trailing metadata key reporting whether a result came from the result cache
+CACHE_METADATA_KEY = "x-cache"
+
+# Metadata keys used by the scheduler
+CLIENT_ID_METADATA_KEY = "x-client-id"
+PRIORITY_METADATA_KEY = "x-priority"
+QUEUE_WAIT_METADATA_KEY = "x-queue-wait-ms"
+
+# Trailing metadata key set when a request shared another request's execution
+COALESCED_METADATA_KEY = "x-coalesced"
+
+# Service name in the names of the RPCs' server spans
+TRACED_SERVICE = "makefile.MakefileService"
+
+# Longest a single WaitJob call blocks before returning the job as it is
+MAX_JOB_WAIT_SECONDS = 60.0
+
+# Accept keepalive pings from the gateway's channels, also between calls,
+# instead of answering them with GOAWAY
+SERVER_OPTIONS = [
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.min_ping_interval_without_data_ms", 10000),
+]
+
+# Handler threads, on top of the scheduler's slots and queue, for the calls
+# that do not go through the scheduler: jobs (WaitJob long-polls), output
+# reads, target lists, batches and coalesced followers
+UNSCHEDULED_THREADS = 8
+
+# Handler threads only health checks may use, so that they are still answered
+# while every other thread is taken
+HEALTH_THREADS = 2
+
+# Pidfiles of the worker processes of a server started with --workers
+WORKERS_STATE_DIR = os.path.join(supervisor.STATE_DIR, "grpc-workers")
+
+
+def _server_options(reuse_port):
+    """SERVER_OPTIONS, sharing the port only between the workers of a server.
+
+    gRPC sets SO_REUSEPORT by default; a single server turns it off, so that
+    it fails to start instead of silently sharing its port with a stale one.
+    """
+    return SERVER_OPTIONS + [("grpc.so_reuseport", 1 if reuse_port else 0)]
+
+
+def _build_command(request):
+    """Build the make invocation for a CommandRequest."""
+    cmd = ["make"]
+    if request.command:
+        cmd.append(request.command)
+    if request.args:
+        cmd.extend(request.args)
+    return cmd
+
+
+def _lookup_cached(result_cache, request, trailing):
+    """Look a request up in the result cache.
+
+    Returns ``(key, response)``: ``key`` is None when the request is not
+    cacheable, and ``response`` is None on a miss. Hit/miss status is appended
+    to ``trailing`` for the caller's trailing metadata.
+    """
+    if result_cache is None or not result_cache.is_cacheable(request.command):
+        return None, None
+
+    key = result_cache.key(request.command, request.args, os.getcwd())
+    cached = result_cache.get(key)
+    trailing.append((CACHE_METADATA_KEY, "hit" if cached is not None else "miss"))
+    if cached is None:
+        return key, None
+    return key, service_pb2.CommandResponse(
+        output=cached.output, error=cached.error, return_code=cached.return_code
+    )
+
+
+def _store_cached(result_cache, key, response):
+    """Remember a successful response under a key from _lookup_cached.
+
+    Truncated responses are not cached: their full output may be evicted from
+    the output store while the cached copy still points at it.
+    """
+    if key is not None and response.return_code == 0 and not response.truncated:
+        result_cache.put(
+            key,
+            CachedResult(response.output, response.error, response.return_code),
+        )
+
+
+def _request_identity(context):
+    """Return the (caller, requested priority) of an RPC from its metadata.
+
+    Callers identify themselves with ``x-client-id`` (the gateway forwards the
+    browser's address); otherwise the peer address without the port is used.
+    """
+    metadata = dict(context.invocation_metadata() or ())
+    caller = metadata.get(CLIENT_ID_METADATA_KEY)
+    if not caller:
+        caller = context.peer().rsplit(":", 1)[0]
+    return caller, metadata.get(PRIORITY_METADATA_KEY)
+
+
+def _slot(scheduler, request, context, is_active=None):
+    """Scheduler slot for a request, or a no-op when scheduling is disabled."""
+    if scheduler is None:
+        return contextlib.nullcontext()
+    caller, requested = _request_identity(context)
+    priority = scheduler.priority_for(request.command, requested)
+    return scheduler.slot(
+        request.command, caller, priority, is_active or context.is_active
+    )
+
+
+def _slot_async(scheduler, request, context):
+    """asyncio version of _slot."""
+    if scheduler is None:
+        return contextlib.nullcontext()
+    caller, requested = _request_identity(context)
+    priority = scheduler.priority_for(request.command, requested)
+    return scheduler.slot_async(request.command, caller, priority)
+
+
+def _record_wait(ticket, trailing):
+    """Report how long a request waited for its slot."""
+    if ticket is None:
+        return
+    wait_ms = int(ticket.wait_time * 1000)
+    tracing.record("queue", ticket.wait_time, priority=ticket.priority)
+    trailing.append((QUEUE_WAIT_METADATA_KEY, str(wait_ms)))
+    if wait_ms:
+        logger.info("Waited %dms in the %s queue", wait_ms, ticket.priority)
+
+
+def _reject(context, error, trailing):
+    """Fail a request that could not be queued, with a retry hint."""
+    logger.warning("Rejected request: %s", error)
+    trailing.append(("retry-after", str(error.retry_after)))
+    context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+    context.set_details(f"{error}; retry after {error.retry_after}s")
+    return service_pb2.CommandResponse(output="", error=str(error), return_code=-1)
+
+
+def _internal_error(context, error):
+    """Report an unexpected execution failure as INTERNAL."""
+    error_msg = f"Error executing command: {str(error)}"
+    logger.error(error_msg, exc_info=True)
+    context.set_code(grpc.StatusCode.INTERNAL)
+    context.set_details(error_msg)
+
+
+def _coalescing(single_flight, request):
+    """Whether identical concurrent runs of this request are shared."""
+    return single_flight is not None and single_flight.is_enabled(request.command)
+
+
+def _flight_key(kind, request):
+    """Single-flight key: identical command, args and working directory."""
+    return (kind, request.command, tuple(request.args), os.getcwd())
+
+
+class _StatusRecorder:
+    """Stands in for a ServicerContext during a shared execution.
+
+    Status and trailing metadata set by the execution are recorded, then
+    applied to the context of every request that shares the result. Anything
+    else (metadata, peer) is read from the leader's context, and so is
+    liveness unless ``is_active`` is given.
+    """
+
+    def __init__(self, context, is_active=None):
+        self._context = context
+        self._is_active = is_active
+        self.code = None
+        self.details = None
+        self.trailing_metadata = ()
+
+    def is_active(self):
+        if self._is_active is not None:
+            return self._is_active()
+        return self._context.is_active()
+
+    def set_code(self, code):
+        self.code = code
+
+    def set_details(self, details):
+        self.details = details
+
+    def set_trailing_metadata(self, trailing_metadata):
+        self.trailing_metadata = tuple(trailing_metadata)
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+    def apply(self, context, coalesced=False):
+        """Copy the recorded status onto ``context``."""
+        if self.code is not None:
+            context.set_code(self.code)
+        if self.details is not None:
+            context.set_details(self.details)
+        trailing = self.trailing_metadata
+        if coalesced:
+            trailing += ((COALESCED_METADATA_KEY, "true"),)
+        if trailing:
+            context.set_trailing_metadata(trailing)
+
+
+def _scheduler_stats(scheduler):
+    """Build a SchedulerStats message from the scheduler's counters."""
+    if scheduler is None:
+        return service_pb2.SchedulerStats()
+    stats = scheduler.stats()
+    return service_pb2.SchedulerStats(
+        running=stats["running"],
+        queued=stats["queued"],
+        running_by_target=stats["running_by_target"],
+        queued_by_priority=stats["queued_by_priority"],
+        oldest_wait_seconds=stats["oldest_wait"],
+        avg_wait_seconds=stats["avg_wait"],
+        max_wait_seconds=stats["max_wait"],
+        admitted=stats["admitted"],
+        rejected=stats["rejected"],
+    )
+
+
+def _scheduler_metrics(scheduler):
+    """Metrics collector reading the scheduler's counters when scraped."""
+
+    def collect():
+        stats = scheduler.stats()
+        return [
+            (
+                "veridock_scheduler_running",
+                "gauge",
+                "Commands executing.",
+                [({}, stats["running"])],
+            ),
+            (
+                "veridock_scheduler_queued",
+                "gauge",
+                "Commands waiting for an execution slot, by priority.",
+                [
+                    ({"priority": priority}, queued)
+                    for priority, queued in stats["queued_by_priority"].items()
+                ],
+            ),
+            (
+                "veridock_scheduler_oldest_wait_seconds",
+                "gauge",
+                "Age of the longest-waiting request.",
+                [({}, stats["oldest_wait"])],
+            ),
+            (
+                "veridock_scheduler_admitted_total",
+                "counter",
+                "Requests admitted to run.",
+                [({}, stats["admitted"])],
+            ),
+            (
+                "veridock_scheduler_rejected_total",
+                "counter",
+                "Requests rejected because the queue was full.",
+                [({}, stats["rejected"])],
+            ),
+        ]
+
+    return collect
+
+
+def _start_metrics(host, scheduler, worker_id=None):
+    """Serve the metrics on ``GRPC_METRICS_PORT``, or return None when unset.
+
+    Worker ``n`` of a multi-process server uses ``GRPC_METRICS_PORT + n``.
+    """
+    metrics.REGISTRY.set_collector("scheduler", _scheduler_metrics(scheduler))
+    server = metrics.MetricsServer.from_env(host, offset=worker_id or 0)
+    if server is not None:
+        server.start()
+        logger.info("Metrics served on %s:%s/metrics", host, server.port)
+    return server
+
+
+def _list_targets(target_index, context):
+    """Build a ListTargetsResponse from the index of the current Makefile."""
+    try:
+        targets = target_index.get(os.getcwd())
+    except Exception as e:
+        error_msg = f"Error indexing Makefile: {str(e)}"
+        logger.error(error_msg, exc_info=True)
+        context.set_code(grpc.StatusCode.INTERNAL)
+        context.set_details(error_msg)
+        return service_pb2.ListTargetsResponse()
+
+    return service_pb2.ListTargetsResponse(
+        targets=[
+            service_pb2.Target(
+                name=t.name,
+                description=t.description,
+                prerequisites=t.prerequisites,
+                phony=t.phony,
+            )
+            for t in targets
+        ]
+    )
+
+
+def _batch_items(request):
+    """Convert a BatchRequest into BatchItems; ids default to the command."""
+    return [
+        BatchItem(
+            id=c.id or c.command,
+            command=c.command,
+            args=tuple(c.args),
+            depends_on=tuple(c.depends_on),
+        )
+        for c in request.commands
+    ]
+
+
+def _batch_item_request(item):
+    return service_pb2.CommandRequest(command=item.command, args=item.args)
+
+
+def _batch_item_outcome(response, recorder):
+    """Return ``(response, succeeded)`` for a command run in a batch."""
+    ok = recorder.code in (None, grpc.StatusCode.OK) and response.return_code == 0
+    return response, ok
+
+
+def _batch_response(results, wall):
+    """Build a BatchResponse from the runner's results."""
+    statuses = {
+        FAILED: service_pb2.BatchResult.FAILED,
+        SKIPPED: service_pb2.BatchResult.SKIPPED,
+    }
+    response = service_pb2.BatchResponse(
+        success=all(r.status not in statuses for r in results),
+        wall_seconds=wall,
+        total_seconds=sum(r.finished - r.started for r in results),
+    )
+    for r in results:
+        result = response.results.add(
+            id=r.item.id,
+            status=statuses.get(r.status, service_pb2.BatchResult.SUCCEEDED),
+            started_seconds=r.started,
+            duration_seconds=r.finished - r.started,
+        )
+        if isinstance(r.result, service_pb2.CommandResponse):
+            result.response.CopyFrom(r.result)
+        elif r.result is not None:
+            result.response.error = f"Error executing command: {r.result}"
+            result.response.return_code = -1
+    logger.info(
+        "Batch of %d commands finished in %.2fs (%.2fs of command time)",
+        len(results), wall, response.total_seconds,
+    )
+    return response
+
+
+def _invalid_batch(context, error):
+    context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+    context.set_details(str(error))
+    return service_pb2.BatchResponse()
+
+
+_JOB_STATES = {
+    jobs.QUEUED: service_pb2.Job.QUEUED,
+    jobs.RUNNING: service_pb2.Job.RUNNING,
+    jobs.SUCCEEDED: service_pb2.Job.SUCCEEDED,
+    jobs.FAILED: service_pb2.Job.FAILED,
+    jobs.CANCELLED: service_pb2.Job.CANCELLED,
+    jobs.LOST: service_pb2.Job.LOST,
+}
+
+
+def _job_message(job):
+    """Build a Job message from a stored job."""
+    message = service_pb2.Job(
+        job_id=job.id,
+        state=_JOB_STATES[job.state],
+        command=job.command,
+        args=job.args,
+        submitted_at=job.submitted_at,
+        started_at=job.started_at or 0,
+        finished_at=job.finished_at or 0,
+    )
+    if job.result is not None:
+        message.response.ParseFromString(job.result)
+    return message
+
+
+def _job_reply(job, context, job_id):
+    """Job message for a lookup, or NOT_FOUND when the job is unknown."""
+    if job is None:
+        context.set_code(grpc.StatusCode.NOT_FOUND)
+        context.set_details(f"Unknown or expired job: {job_id}")
+        return service_pb2.Job()
+    return _job_message(job)
+
+
+def _submit_job(job_store, request, context):
+    """Queue a SubmitCommand request; returns the stored job or None."""
+    caller, priority = _request_identity(context)
+    try:
+        job = job_store.submit(request.command, request.args, caller, priority)
+    except JobQueueFullError as e:
+        logger.warning("Rejected job: %s", e)
+        context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+        context.set_details(str(e))
+        return None
+    logger.info("Submitted job %s: %s", job.id, request.command)
+    return job
+
+
+def _job_wait_timeout(request):
+    timeout = request.timeout_seconds or MAX_JOB_WAIT_SECONDS
+    return min(max(timeout, 0.0), MAX_JOB_WAIT_SECONDS)
+
+
+def _job_result(response, context):
+    """Final job state and serialized result for a finished execution."""
+    ok = context.code in (None, grpc.StatusCode.OK) and response.return_code == 0
+    state = jobs.SUCCEEDED if ok else jobs.FAILED
+    return state, response.SerializeToString()
+
+
+class _JobContext:
+    """Stands in for a ServicerContext while a job runs in the background.
+
+    The submitting caller's identity is replayed to the scheduler, and the
+    job counts as active until it is cancelled.
+    """
+
+    def __init__(self, job, job_store):
+        self._job = job
+        self._job_store = job_store
+        self.code = None
+        self.details = None
+
+    def invocation_metadata(self):
+        metadata = [(CLIENT_ID_METADATA_KEY, self._job.caller)]
+        if self._job.priority:
+            metadata.append((PRIORITY_METADATA_KEY, self._job.priority))
+        return metadata
+
+    def peer(self):
+        return f"job:{self._job.id}"
+
+    def is_active(self):
+        job = self._job_store.get(self._job.id)
+        return job is not None and job.state == jobs.RUNNING
+
+    def set_code(self, code):
+        self.code = code
+
+    def set_details(self, details):
+        self.details = details
+
+    def set_trailing_metadata(self, trailing_metadata):
+        pass
+
+
+def _iter_process_output(process):
+    """Yield (stream, data) pairs from a child's stdout/stderr as they arrive.
+
+    Both pipes are multiplexed with a selector so the interleaving seen by the
+    caller follows the order in which the child wrote its output. ``data`` is
+    raw bytes; an empty ``data`` marks the end of that stream.
+    """
+    streams = {
+        process.stdout.fileno(): service_pb2.CommandOutputChunk.STDOUT,
+        process.stderr.fileno(): service_pb2.CommandOutputChunk.STDERR,
+    }
+
+    with selectors.DefaultSelector() as selector:
+        for fd in streams:
+            selector.register(fd, selectors.EVENT_READ)
+
+        while selector.get_map():
+            for key, _ in selector.select():
+                data = os.read(key.fd, STREAM_CHUNK_SIZE)
+                if not data:
+                    selector.unregister(key.fd)
+                yield streams[key.fd], data
+
+
+def _traced(handler):
+    """Run an RPC handler under a server span.
+
+    The span is a child of the current span for an RPC called from another
+    one (the items of a batch), else of the caller's ``traceparent``.
+    """
+    name = f"{TRACED_SERVICE}/{handler.__name__}"
+    attributes = {"rpc.system": "grpc", "rpc.method": handler.__name__}
+
+    def parent(context):
+        return tracing.current_span() or tracing.metadata_context(
+            context.invocation_metadata()
+        )
+
+    if inspect.isasyncgenfunction(handler):
+        @functools.wraps(handler)
+        async def traced(self, request, context):
+            with tracing.span(name, parent(context), tracing.SERVER, **attributes):
+                async for response in handler(self, request, context):
+                    yield response
+
+    elif inspect.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def traced(self, request, context):
+            with tracing.span(name, parent(context), tracing.SERVER, **attributes):
+                return await handler(self, request, context)
+
+    elif inspect.isgeneratorfunction(handler):
+        @functools.wraps(handler)
+        def traced(self, request, context):
+            span = tracing.start_span(
+                name, parent(context), tracing.SERVER, **attributes
+            )
+            return tracing.iterate(span, handler(self, request, context))
+
+    else:
+        @functools.wraps(handler)
+        def traced(self, request, context):
+            with tracing.span(name, parent(context), tracing.SERVER, **attributes):
+                return handler(self, request, context)
+
+    return traced
+
+
+def _run_span(cmd):
+    """Span of a make run, from its spawn to its exit."""
+    return tracing.start_span(
+        "run",
+        **{"make.target": metrics.command_target(cmd), "make.command": " ".join(cmd)},
+    )
+
+
+def _spawn(launcher, cmd, span):
+    """Start make, passing it the trace context of its run span."""
+    try:
+        with tracing.span("spawn", span, launcher=launcher.mode):
+            return launcher.spawn(cmd, cwd=os.getcwd(), env=tracing.child_env(span))
+    except Exception as e:
+        span.set_error(e)
+        span.end()
+        raise
+
+
+async def _spawn_async(launcher, cmd, span):
+    """asyncio version of _spawn."""
+    try:
+        with tracing.span("spawn", span, launcher=launcher.mode):
+            return await launcher.spawn_async(
+                cmd, cwd=os.getcwd(), env=tracing.child_env(span)
+            )
+    except Exception as e:
+        span.set_error(e)
+        span.end()
+        raise
+
+
+def _record_run(cmd, started, return_code, sizes, span):
+    """Add a finished make run to the metrics, and end its span.
+
+    ``sizes`` maps each stream to its byte count, or to its OutputBuffer.
+    """
+    stdout = sizes[service_pb2.CommandOutputChunk.STDOUT]
+    stderr = sizes[service_pb2.CommandOutputChunk.STDERR]
+    stdout_bytes = getattr(stdout, "size", stdout)
+    stderr_bytes = getattr(stderr, "size", stderr)
+    metrics.record_run(
+        cmd, time.perf_counter() - started, return_code, stdout_bytes, stderr_bytes
+    )
+    span.set_attribute("make.stdout_bytes", stdout_bytes)
+    span.set_attribute("make.stderr_bytes", stderr_bytes)
+    if return_code is not None:
+        span.set_attribute("make.return_code", return_code)
+    if return_code != 0:
+        span.set_error(f"make exited with {return_code}")
+    span.end()
+
+
+def _new_buffers(output_store):
+    """One OutputBuffer per stream, keyed by CommandOutputChunk.Stream."""
+    return {
+        service_pb2.CommandOutputChunk.STDOUT: output_store.new_buffer(),
+        service_pb2.CommandOutputChunk.STDERR: output_store.new_buffer(),
+    }
+
+
+def _command_response(output_store, buffers, return_code):
+    """Build a CommandResponse from captured output.
+
+    Output that outgrew the memory limit is returned as its head and tail, and
+    the full output is kept in the store for ReadOutput.
+    """
+    stdout = buffers[service_pb2.CommandOutputChunk.STDOUT]
+    stderr = buffers[service_pb2.CommandOutputChunk.STDERR]
+    logger.debug(
+        "Command completed with return code %d, %d bytes of stdout, %d of stderr",
+        return_code,
+        stdout.size,
+        stderr.size,
+    )
+
+    response = service_pb2.CommandResponse(
+        output=stdout.text(),
+        error=stderr.text(),
+        return_code=return_code,
+        output_size=stdout.size,
+        error_size=stderr.size,
+    )
+    if stdout.spilled or stderr.spilled:
+        response.truncated = True
+        response.output_id = output_store.register(
+            {"stdout": stdout, "stderr": stderr}
+        )
+        logger.info("Output truncated, full output stored as %s", response.output_id)
+    elif response.error:
+        logger.warning("stderr: %s", brief(response.error))
+    return response
+
+
+def _read_output(output_store, request, context):
+    """Serve a ReadOutput request from the output store."""
+    stream = (
+        "stderr"
+        if request.stream == service_pb2.CommandOutputChunk.STDERR
+        else "stdout"
+    )
+    try:
+        data, total = output_store.read(
+            request.output_id, stream, request.offset, request.length
+        )
+    except KeyError:
+        context.set_code(grpc.StatusCode.NOT_FOUND)
+        context.set_details(f"Unknown or expired output: {request.output_id}")
+        return service_pb2.OutputRange()
+    return service_pb2.OutputRange(
+        data=data,
+        offset=request.offset,
+        total_size=total,
+        eof=request.offset + len(data) >= total,
+    )
+
 
 class MakefileService(service_pb2_grpc.MakefileServiceServicer):
     """Implementation of the MakefileService."""
 
+    def __init__(
+        self,
+        result_cache=None,
+        scheduler=None,
+        single_flight=None,
+        output_store=None,
+        launcher=None,
+        batch_runner=None,
+        job_store=None,
+    ):
+        """Initialize the service.
+
+        ``result_cache``, ``scheduler`` and ``single_flight`` are optional
+        ResultCache, Scheduler and SingleFlight instances. ``output_store``
+        bounds how much command output is held in memory, ``launcher`` starts
+        make, ``batch_runner`` runs RunCommands batches and ``job_store`` holds
+        submitted jobs; defaults are used when they are not given (the default
+        job store is in memory).
+        """
+        self.result_cache = result_cache
+        self.scheduler = scheduler
+        self.single_flight = single_flight
+        self.output_store = output_store or OutputStore()
+        self.launcher = launcher or Launcher()
+        self.batch_runner = batch_runner or BatchRunner()
+        self.job_store = job_store or JobStore()
+        self._job_workers = []
+        self._job_processes = {}
+        self._job_lock = threading.Lock()
+        self.target_index = TargetIndex()
+
+    @_traced
     def RunCommand(self, request, context):
         """Run a Makefile command and return the result."""
+        if _coalescing(self.single_flight, request):
+            return self._run_coalesced(request, context)
+        return self._run(request, context)
+
+    def _run(self, request, context, on_spawn=None):
+        trailing = []
         try:
             # Build the command to run
-            cmd = ["make"]
-            if request.command:
-                cmd.append(request.command)
-            if request.args:
-                cmd.extend(request.args)
+            cmd = _build_command(request)
 
-            logger.info(f"Running command: {' '.join(cmd)}")
+            cache_key, cached = _lookup_cached(self.result_cache, request, trailing)
+            if cached is not None:
+                logger.info("Cache hit: %s", " ".join(cmd))
+                return cached
 
-            # Run the command
-            result = subprocess.run(
-                cmd, capture_output=True, text=True, cwd=os.getcwd()
-            )
+            with _slot(self.scheduler, request, context) as ticket:
+                _record_wait(ticket, trailing)
+                logger.info("Running command: %s", " ".join(cmd))
+                response = self._capture(cmd, on_spawn)
 
-            # Log the result
-            logger.debug(f"Command completed with return code: {result.returncode}")
-            if result.stdout:
-                logger.debug(f"stdout: {result.stdout}")
-            if result.stderr:
-                logger.warning(f"stderr: {result.stderr}")
+            _store_cached(self.result_cache, cache_key, response)
+            return response
 
-            # Return the response
+        except QueueFullError as e:
+            return _reject(context, e, trailing)
+
+        except Exception as e:
+            error_msg = f"Error executing command: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(error_msg)
             return service_pb2.CommandResponse(
-                output=result.stdout, error=result.stderr, return_code=result.returncode
+                output="", error=error_msg, return_code=-1
+            )
+
+        finally:
+            if trailing:
+                context.set_trailing_metadata(tuple(trailing))
+
+    def _capture(self, cmd, on_spawn=None):
+        """Run a command, collecting its output into bounded buffers."""
+        buffers = _new_buffers(self.output_store)
+        try:
+            return_code = self._collect(cmd, buffers, on_spawn)
+            with tracing.span("response"):
+                return _command_response(self.output_store, buffers, return_code)
+        finally:
+            for buffer in buffers.values():
+                buffer.discard()
+
+    def _collect(self, cmd, buffers, on_spawn=None):
+        """Run a command to completion, writing its output to ``buffers``."""
+        started = time.perf_counter()
+        span = _run_span(cmd)
+        process = _spawn(self.launcher, cmd, span)
+        if on_spawn is not None:
+            on_spawn(process)
+        try:
+            for stream, data in _iter_process_output(process):
+                buffers[stream].write(data)
+            return process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            _record_run(cmd, started, process.returncode, buffers, span)
+            process.stdout.close()
+            process.stderr.close()
+
+    def _run_coalesced(self, request, context):
+        """Run a command once for all identical concurrent requests."""
+        key = _flight_key("unary", request)
+        flight, leader = self.single_flight.join(key)
+        try:
+            if leader:
+                # Stays queued while anyone still waits for the result, even
+                # if the leader's own caller has gone away
+                recorder = _StatusRecorder(
+                    context,
+                    is_active=lambda: context.is_active() or flight.subscribers > 1,
+                )
+                try:
+                    response = self._run(request, recorder)
+                except BaseException as e:
+                    self.single_flight.land(key, flight)
+                    flight.finish(error=e)
+                    raise
+                self.single_flight.land(key, flight)
+                flight.finish((response, recorder))
+            else:
+                response, recorder = flight.wait()
+            recorder.apply(context, coalesced=not leader)
+            return response
+        finally:
+            flight.unsubscribe()
+
+    @_traced
+    def RunCommands(self, request, context):
+        """Run a batch of commands, in parallel where dependencies allow."""
+        items = _batch_items(request)
+        logger.info("Running batch: %s", ", ".join(item.id for item in items))
+        span = tracing.current_span()
+
+        def run(item):
+            recorder = _StatusRecorder(context)
+            # Items run on the batch runner's threads
+            with tracing.activate(span):
+                response = self.RunCommand(_batch_item_request(item), recorder)
+            return _batch_item_outcome(response, recorder)
+
+        try:
+            results, wall = self.batch_runner.run(
+                items, run, request.max_parallel, request.fail_fast
             )
+        except BatchError as e:
+            return _invalid_batch(context, e)
+        return _batch_response(results, wall)
+
+    @_traced
+    def RunCommandStream(self, request, context):
+        """Run a Makefile command and stream its output as it is produced."""
+        if _coalescing(self.single_flight, request):
+            yield from self._run_stream_coalesced(request, context)
+            return
+
+        cmd = _build_command(request)
+        trailing = []
+        try:
+            with _slot(self.scheduler, request, context) as ticket:
+                _record_wait(ticket, trailing)
+                yield from self._stream(cmd)
+        except QueueFullError as e:
+            _reject(context, e, trailing)
+        except Exception as e:
+            _internal_error(context, e)
+        finally:
+            if trailing:
+                context.set_trailing_metadata(tuple(trailing))
+
+    def _run_stream_coalesced(self, request, context):
+        """Follow a shared execution; the first request starts its producer."""
+        key = _flight_key("stream", request)
+        flight, leader = self.single_flight.join(key)
+        trailing = []
+        if leader:
+            threading.Thread(
+                target=self._produce,
+                args=(key, flight, request, context, tracing.current_span()),
+                daemon=True,
+            ).start()
+        else:
+            trailing.append((COALESCED_METADATA_KEY, "true"))
+        try:
+            yield from flight.iter_chunks()
+        except QueueFullError as e:
+            _reject(context, e, trailing)
+        except Exception as e:
+            _internal_error(context, e)
+        finally:
+            flight.unsubscribe()
+            if trailing:
+                context.set_trailing_metadata(tuple(trailing))
+
+    def _produce(self, key, flight, request, context, span=None):
+        """Run a shared streaming execution, publishing chunks to its flight.
+
+        ``span`` is the span of the request that started it.
+        """
+        cmd = _build_command(request)
+        try:
+            with tracing.activate(span), _slot(
+                self.scheduler, request, context, lambda: not flight.cancelled
+            ):
+                def on_spawn(process):
+                    flight.add_cancel_callback(process.kill)
+
+                for chunk in self._stream(cmd, on_spawn):
+                    flight.publish(chunk)
+        except Exception as e:
+            self.single_flight.land(key, flight)
+            flight.finish(error=e)
+        else:
+            self.single_flight.land(key, flight)
+            flight.finish()
+
+    def _stream(self, cmd, on_spawn=None):
+        logger.info("Streaming command: %s", " ".join(cmd))
+
+        started = time.perf_counter()
+        span = _run_span(cmd)
+        process = _spawn(self.launcher, cmd, span)
+        if on_spawn is not None:
+            on_spawn(process)
+
+        # Decode incrementally so multi-byte characters split across reads
+        # are never mangled
+        decoders = {
+            stream: codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for stream in (
+                service_pb2.CommandOutputChunk.STDOUT,
+                service_pb2.CommandOutputChunk.STDERR,
+            )
+        }
+        sequence = 0
+        sizes = dict.fromkeys(decoders, 0)
+        try:
+            for stream, data in _iter_process_output(process):
+                sizes[stream] += len(data)
+                text = decoders[stream].decode(data, final=not data)
+                if not text:
+                    continue
+                yield service_pb2.CommandOutputChunk(
+                    sequence=sequence, stream=stream, data=text
+                )
+                sequence += 1
+
+            return_code = process.wait()
+            logger.debug("Command completed with return code %d", return_code)
+            yield service_pb2.CommandOutputChunk(
+                sequence=sequence, done=True, return_code=return_code
+            )
+        finally:
+            # The generator is closed early when the client cancels the call;
+            # don't leave make running with nobody reading its output.
+            if process.poll() is None:
+                logger.info("Stream cancelled, killing: %s", " ".join(cmd))
+                process.kill()
+                process.wait()
+            _record_run(cmd, started, process.returncode, sizes, span)
+            process.stdout.close()
+            process.stderr.close()
+
+    def SubmitCommand(self, request, context):
+        """Queue a command as a background job and return it immediately."""
+        job = _submit_job(self.job_store, request, context)
+        if job is None:
+            return service_pb2.Job()
+        self.start_job_workers()
+        return _job_message(job)
+
+    def GetJob(self, request, context):
+        """Return the current state of a job."""
+        return _job_reply(self.job_store.get(request.job_id), context, request.job_id)
+
+    def WaitJob(self, request, context):
+        """Wait for a job to finish, up to a timeout."""
+        job = self.job_store.wait(
+            request.job_id, _job_wait_timeout(request), context.is_active
+        )
+        return _job_reply(job, context, request.job_id)
+
+    def CancelJob(self, request, context):
+        """Cancel a queued or running job."""
+        job = self.job_store.cancel(request.job_id)
+        process = self._job_processes.get(request.job_id)
+        if process is not None:
+            logger.info("Cancelling job %s", request.job_id)
+            process.kill()
+        return _job_reply(job, context, request.job_id)
+
+    def start_job_workers(self):
+        """Start the threads that run queued jobs, if not yet running."""
+        with self._job_lock:
+            if self._job_workers:
+                return
+            for _ in range(self.job_store.workers):
+                worker = threading.Thread(target=self._job_worker, daemon=True)
+                worker.start()
+                self._job_workers.append(worker)
+            if self.job_store.shared:
+                threading.Thread(
+                    target=self._watch_cancellations, daemon=True
+                ).start()
+
+    def _watch_cancellations(self):
+        """Kill the running jobs cancelled through another worker process."""
+        while True:
+            time.sleep(jobs.SHARED_POLL_INTERVAL)
+            running = dict(self._job_processes)
+            for job_id in self.job_store.cancelled(running):
+                if running[job_id].poll() is None:
+                    logger.info("Cancelling job %s", job_id)
+                    running[job_id].kill()
+
+    def _job_worker(self):
+        while True:
+            job = self.job_store.claim()
+            try:
+                self._execute_job(job)
+            except Exception as e:
+                logger.error("Job %s failed: %s", job.id, e, exc_info=True)
+                self.job_store.finish(job.id, jobs.FAILED, None)
+
+    def _execute_job(self, job):
+        logger.info("Running job %s: %s", job.id, job.command)
+        context = _JobContext(job, self.job_store)
+
+        def on_spawn(process):
+            self._job_processes[job.id] = process
+            # The job may have been cancelled while make was starting
+            if not context.is_active():
+                process.kill()
+
+        request = service_pb2.CommandRequest(command=job.command, args=job.args)
+        try:
+            with tracing.span("job", **{"job.id": job.id}):
+                response = self._run(request, context, on_spawn)
+        finally:
+            self._job_processes.pop(job.id, None)
+        self.job_store.finish(job.id, *_job_result(response, context))
+
+    def ListTargets(self, request, context):
+        """List the targets defined in the Makefile."""
+        return _list_targets(self.target_index, context)
+
+    def GetSchedulerStats(self, request, context):
+        """Report execution queue depth and wait times."""
+        return _scheduler_stats(self.scheduler)
+
+    def ReadOutput(self, request, context):
+        """Read a range of the full output of a truncated response."""
+        return _read_output(self.output_store, request, context)
+
+
+class AsyncMakefileService(service_pb2_grpc.MakefileServiceServicer):
+    """asyncio implementation of the MakefileService for grpc.aio servers.
+
+    make is driven through asyncio subprocesses, so an in-flight command costs
+    a few file descriptors on the event loop rather than a blocked OS thread.
+    """
+
+    def __init__(
+        self,
+        result_cache=None,
+        scheduler=None,
+        single_flight=None,
+        output_store=None,
+        launcher=None,
+        batch_runner=None,
+        job_store=None,
+    ):
+        """Initialize the service.
+
+        ``result_cache``, ``scheduler`` and ``single_flight`` are optional
+        ResultCache, Scheduler and SingleFlight instances. ``output_store``
+        bounds how much command output is held in memory, ``launcher`` starts
+        make, ``batch_runner`` runs RunCommands batches and ``job_store`` holds
+        submitted jobs; defaults are used when they are not given (the default
+        job store is in memory).
+        """
+        self.result_cache = result_cache
+        self.scheduler = scheduler
+        self.single_flight = single_flight
+        self.output_store = output_store or OutputStore()
+        self.launcher = launcher or Launcher()
+        self.batch_runner = batch_runner or BatchRunner()
+        self.job_store = job_store or JobStore()
+        self._job_workers = []
+        self._job_tasks = {}
+        # Jobs whose task has been cancelled
+        self._cancelled_jobs = set()
+        self.target_index = TargetIndex()
+
+    @_traced
+    async def RunCommand(self, request, context):
+        """Run a Makefile command and return the result."""
+        if _coalescing(self.single_flight, request):
+            return await self._run_coalesced(request, context)
+        return await self._run(request, context)
+
+    async def _run(self, request, context):
+        trailing = []
+        try:
+            cmd = _build_command(request)
+
+            cache_key, cached = _lookup_cached(self.result_cache, request, trailing)
+            if cached is not None:
+                logger.info("Cache hit: %s", " ".join(cmd))
+                return cached
+
+            async with _slot_async(self.scheduler, request, context) as ticket:
+                _record_wait(ticket, trailing)
+                logger.info("Running command: %s", " ".join(cmd))
+
+                response = await self._capture(cmd)
+
+            _store_cached(self.result_cache, cache_key, response)
+            return response
+
+        except QueueFullError as e:
+            return _reject(context, e, trailing)
 
         except Exception as e:
             error_msg = f"Error executing command: {str(e)}"
@@ -58,9 +1125,434 @@ class MakefileService(service_pb2_grpc.MakefileServiceServicer):
                 output="", error=error_msg, return_code=-1
             )
 
+        finally:
+            if trailing:
+                context.set_trailing_metadata(tuple(trailing))
+
+    async def _capture(self, cmd):
+        """Run a command, collecting its output into bounded buffers."""
+        buffers = _new_buffers(self.output_store)
+        try:
+            return_code = await self._collect(cmd, buffers)
+            with tracing.span("response"):
+                return _command_response(self.output_store, buffers, return_code)
+        finally:
+            for buffer in buffers.values():
+                buffer.discard()
+
+    async def _collect(self, cmd, buffers):
+        """Run a command to completion, writing its output to ``buffers``."""
+        started = time.perf_counter()
+        span = _run_span(cmd)
+        process = await _spawn_async(self.launcher, cmd, span)
+
+        async def pump(reader, buffer):
+            while True:
+                data = await reader.read(STREAM_CHUNK_SIZE)
+                if not data:
+                    break
+                buffer.write(data)
+
+        try:
+            await asyncio.gather(
+                pump(
+                    process.stdout,
+                    buffers[service_pb2.CommandOutputChunk.STDOUT],
+                ),
+                pump(
+                    process.stderr,
+                    buffers[service_pb2.CommandOutputChunk.STDERR],
+                ),
+            )
+            return await process.wait()
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            _record_run(cmd, started, process.returncode, buffers, span)
+
+    async def _run_coalesced(self, request, context):
+        """Run a command once for all identical concurrent requests.
+
+        The shared run is a separate task, so cancelling the request that
+        started it does not take the result away from the others.
+        """
+        key = _flight_key("unary", request)
+        flight, leader = self.single_flight.join(key)
+        try:
+            if leader:
+                recorder = _StatusRecorder(context)
+
+                async def run():
+                    try:
+                        response = await self._run(request, recorder)
+                    except BaseException as e:
+                        self.single_flight.land(key, flight)
+                        flight.finish(error=e)
+                        raise
+                    self.single_flight.land(key, flight)
+                    flight.finish((response, recorder))
+
+                asyncio.create_task(run())
+            response, recorder = await flight.wait_async()
+            recorder.apply(context, coalesced=not leader)
+            return response
+        finally:
+            flight.unsubscribe()
+
+    @_traced
+    async def RunCommands(self, request, context):
+        """Run a batch of commands, in parallel where dependencies allow."""
+        items = _batch_items(request)
+        logger.info("Running batch: %s", ", ".join(item.id for item in items))
+
+        async def run(item):
+            recorder = _StatusRecorder(context)
+            response = await self.RunCommand(_batch_item_request(item), recorder)
+            return _batch_item_outcome(response, recorder)
+
+        try:
+            results, wall = await self.batch_runner.run_async(
+                items, run, request.max_parallel, request.fail_fast
+            )
+        except BatchError as e:
+            return _invalid_batch(context, e)
+        return _batch_response(results, wall)
+
+    @_traced
+    async def RunCommandStream(self, request, context):
+        """Run a Makefile command and stream its output as it is produced."""
+        if _coalescing(self.single_flight, request):
+            async for chunk in self._run_stream_coalesced(request, context):
+                yield chunk
+            return
+
+        cmd = _build_command(request)
+        trailing = []
+        try:
+            async with _slot_async(self.scheduler, request, context) as ticket:
+                _record_wait(ticket, trailing)
+                async for chunk in self._stream(cmd):
+                    yield chunk
+        except QueueFullError as e:
+            _reject(context, e, trailing)
+        except Exception as e:
+            _internal_error(context, e)
+        finally:
+            if trailing:
+                context.set_trailing_metadata(tuple(trailing))
+
+    async def _run_stream_coalesced(self, request, context):
+        """Follow a shared execution; the first request starts its producer."""
+        key = _flight_key("stream", request)
+        flight, leader = self.single_flight.join(key)
+        trailing = []
+        if leader:
+            loop = asyncio.get_running_loop()
+            task = asyncio.create_task(self._produce(key, flight, request, context))
+            flight.add_cancel_callback(
+                lambda: loop.call_soon_threadsafe(task.cancel)
+            )
+        else:
+            trailing.append((COALESCED_METADATA_KEY, "true"))
+        try:
+            async for chunk in flight.aiter_chunks():
+                yield chunk
+        except QueueFullError as e:
+            _reject(context, e, trailing)
+        except Exception as e:
+            _internal_error(context, e)
+        finally:
+            flight.unsubscribe()
+            if trailing:
+                context.set_trailing_metadata(tuple(trailing))
+
+    async def _produce(self, key, flight, request, context):
+        """Run a shared streaming execution, publishing chunks to its flight."""
+        cmd = _build_command(request)
+        try:
+            async with _slot_async(self.scheduler, request, context):
+                async for chunk in self._stream(cmd):
+                    flight.publish(chunk)
+        except BaseException as e:
+            self.single_flight.land(key, flight)
+            flight.finish(error=e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            self.single_flight.land(key, flight)
+            flight.finish()
+
+    async def _stream(self, cmd):
+        logger.info("Streaming command: %s", " ".join(cmd))
+
+        started = time.perf_counter()
+        span = _run_span(cmd)
+        process = await _spawn_async(self.launcher, cmd, span)
+
+        # One reader task per pipe feeds a shared queue; None marks EOF
+        queue = asyncio.Queue()
+        sizes = {
+            service_pb2.CommandOutputChunk.STDOUT: 0,
+            service_pb2.CommandOutputChunk.STDERR: 0,
+        }
+
+        async def pump(reader, stream):
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            while True:
+                data = await reader.read(STREAM_CHUNK_SIZE)
+                sizes[stream] += len(data)
+                text = decoder.decode(data, final=not data)
+                if text:
+                    await queue.put((stream, text))
+                if not data:
+                    break
+            await queue.put(None)
+
+        readers = [
+            asyncio.create_task(
+                pump(process.stdout, service_pb2.CommandOutputChunk.STDOUT)
+            ),
+            asyncio.create_task(
+                pump(process.stderr, service_pb2.CommandOutputChunk.STDERR)
+            ),
+        ]
+
+        sequence = 0
+        try:
+            open_streams = len(readers)
+            while open_streams:
+                item = await queue.get()
+                if item is None:
+                    open_streams -= 1
+                    continue
+                stream, text = item
+                yield service_pb2.CommandOutputChunk(
+                    sequence=sequence, stream=stream, data=text
+                )
+                sequence += 1
+
+            return_code = await process.wait()
+            logger.debug("Command completed with return code %d", return_code)
+            yield service_pb2.CommandOutputChunk(
+                sequence=sequence, done=True, return_code=return_code
+            )
+        finally:
+            for task in readers:
+                task.cancel()
+            if process.returncode is None:
+                logger.info("Stream cancelled, killing: %s", " ".join(cmd))
+                process.kill()
+                await process.wait()
+            _record_run(cmd, started, process.returncode, sizes, span)
+
+    async def SubmitCommand(self, request, context):
+        """Queue a command as a background job and return it immediately."""
+        job = _submit_job(self.job_store, request, context)
+        if job is None:
+            return service_pb2.Job()
+        self.start_job_workers()
+        return _job_message(job)
+
+    async def GetJob(self, request, context):
+        """Return the current state of a job."""
+        return _job_reply(self.job_store.get(request.job_id), context, request.job_id)
+
+    async def WaitJob(self, request, context):
+        """Wait for a job to finish, up to a timeout."""
+        job = await self.job_store.wait_async(
+            request.job_id, _job_wait_timeout(request)
+        )
+        return _job_reply(job, context, request.job_id)
+
+    async def CancelJob(self, request, context):
+        """Cancel a queued or running job."""
+        job = self.job_store.cancel(request.job_id)
+        self._cancel_job_task(request.job_id)
+        return _job_reply(job, context, request.job_id)
+
+    def _cancel_job_task(self, job_id):
+        """Cancel the task running a job, once."""
+        task = self._job_tasks.get(job_id)
+        if task is not None and job_id not in self._cancelled_jobs:
+            logger.info("Cancelling job %s", job_id)
+            self._cancelled_jobs.add(job_id)
+            task.cancel()
+
+    def start_job_workers(self):
+        """Start the tasks that run queued jobs, if not yet running.
+
+        Must be called from the server's event loop.
+        """
+        if not self._job_workers:
+            self._job_workers = [
+                asyncio.create_task(self._job_worker())
+                for _ in range(self.job_store.workers)
+            ]
+            if self.job_store.shared:
+                self._job_workers.append(
+                    asyncio.create_task(self._watch_cancellations())
+                )
+
+    async def _watch_cancellations(self):
+        """Cancel the running jobs cancelled through another worker process."""
+        while True:
+            await asyncio.sleep(jobs.SHARED_POLL_INTERVAL)
+            for job_id in self.job_store.cancelled(self._job_tasks):
+                self._cancel_job_task(job_id)
+
+    async def _job_worker(self):
+        while True:
+            job = await self.job_store.claim_async()
+            # Each job runs in its own task so cancelling it spares the worker
+            task = asyncio.create_task(self._execute_job(job))
+            self._job_tasks[job.id] = task
+            try:
+                await asyncio.wait({task})
+            finally:
+                self._job_tasks.pop(job.id, None)
+                self._cancelled_jobs.discard(job.id)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("Job %s failed: %s", job.id, task.exception())
+                self.job_store.finish(job.id, jobs.FAILED, None)
+
+    async def _execute_job(self, job):
+        logger.info("Running job %s: %s", job.id, job.command)
+        context = _JobContext(job, self.job_store)
+        request = service_pb2.CommandRequest(command=job.command, args=job.args)
+        response = await self._run(request, context)
+        self.job_store.finish(job.id, *_job_result(response, context))
+
+    async def ListTargets(self, request, context):
+        """List the targets defined in the Makefile."""
+        return _list_targets(self.target_index, context)
+
+    async def GetSchedulerStats(self, request, context):
+        """Report execution queue depth and wait times."""
+        return _scheduler_stats(self.scheduler)
+
+    async def ReadOutput(self, request, context):
+        """Read a range of the full output of a truncated response."""
+        return _read_output(self.output_store, request, context)
+
+
+def _start_transcoder(service, host, port, loop=None, reuse_port=False):
+    """Start the HTTP/JSON and gRPC-Web listener, or None when disabled."""
+    if not port:
+        return None
+    listener = TranscodingListener(
+        service, host, port, loop=loop, reuse_port=reuse_port
+    )
+    listener.start()
+    logger.info("HTTP/JSON and gRPC-Web listener started on %s:%s", host, port)
+    return listener
+
+
+async def _serve_async(server_address, components, http_port=0, worker_id=None):
+    """Run a grpc.aio server until SIGINT/SIGTERM."""
+    server = grpc.aio.server(
+        interceptors=[metrics.AsyncMetricsInterceptor()],
+        options=_server_options(worker_id is not None),
+    )
+    metrics.SERVER_THREADS.set(0)
+    service = AsyncMakefileService(**components)
+    service_pb2_grpc.add_MakefileServiceServicer_to_server(service, server)
+    health = HealthReporter(loop=asyncio.get_running_loop())
+    health.add_to_server(server, components["scheduler"])
+    # Pick up jobs that were still queued when the server last stopped
+    service.start_job_workers()
+    server.add_insecure_port(server_address)
+
+    await server.start()
+    logger.info("gRPC server (aio) started on %s", server_address)
+    listener = _start_transcoder(
+        service,
+        server_address.rsplit(":", 1)[0],
+        http_port,
+        loop=asyncio.get_running_loop(),
+        reuse_port=worker_id is not None,
+    )
+    metrics_server = _start_metrics(
+        server_address.rsplit(":", 1)[0], components["scheduler"], worker_id
+    )
+    logger.info("Environment: %s", os.getenv("ENVIRONMENT", "development"))
+    logger.info("Debug mode: %s", os.getenv("DEBUG", "False"))
+
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await stop_event.wait()
+    logger.info("Shutting down gRPC server...")
+    await health.shutdown_async()
+    if listener is not None:
+        await asyncio.to_thread(listener.stop)
+    if metrics_server is not None:
+        await asyncio.to_thread(metrics_server.stop)
+    await server.stop(0)
+    await asyncio.to_thread(tracing.tracer.shutdown)
+    logger.info("gRPC server stopped")
+
 
-def serve(host='0.0.0.0', port=50051):
-    """Start the gRPC server."""
+def _serve_workers(host, port, mode, http_port, workers):
+    """Run ``workers`` server processes on one port until SIGINT/SIGTERM.
+
+    The workers bind with SO_REUSEPORT, so the kernel spreads connections
+    over them, and each has its own GIL. This process only supervises them:
+    it restarts the ones that exit, and stops them all when stopped.
+    """
+    # The workers share the job store, so they cannot tell the jobs a
+    # previous server left running from the ones their peers run
+    job_store = JobStore.from_env()
+    job_store.close()
+    if job_store.path == ":memory:":
+        logger.warning("Each worker has its own in-memory job store")
+
+    cmd = [
+        sys.executable, "-m", "veridock.grpc_server",
+        "--host", host, "--port", str(port),
+        "--mode", mode, "--http-port", str(http_port),
+    ]
+    group = Supervisor(
+        [
+            Component(f"worker-{i}", cmd + ["--worker-id", str(i)])
+            for i in range(workers)
+        ],
+        WORKERS_STATE_DIR,
+        echo=logger.info,
+        # The output of the workers is the server's output
+        log_collector=LogCollector(
+            echo=functools.partial(print, flush=True), console_rate=0
+        ),
+    )
+    try:
+        group.start()
+    except SupervisorError as e:
+        logger.error("Could not start the gRPC server workers: %s", e)
+        sys.exit(1)
+    logger.info(
+        "gRPC server started on %s:%s with %d worker processes", host, port, workers
+    )
+    group.run()
+    logger.info("gRPC server stopped")
+
+
+def serve(host='0.0.0.0', port=50051, mode=None, http_port=0, workers=None,
+          worker_id=None):
+    """Start the gRPC server.
+
+    ``mode`` selects between the thread-pool server (``"thread"``) and the
+    asyncio server (``"aio"``); it defaults to ``GRPC_SERVER_MODE``.
+    ``http_port`` (``GRPC_HTTP_PORT``) also serves the RPCs as HTTP/JSON and
+    gRPC-Web on that port; 0 leaves it off.
+
+    With ``workers`` (``GRPC_WORKERS``) over 1, that many server processes
+    share the port, under this one; ``worker_id`` is set in each of them.
+
+    The server also answers ``grpc.health.v1`` health checks, NOT_SERVING
+    while the scheduler is saturated (see ``veridock.health``).
+    """
     # Load environment variables
     from dotenv import load_dotenv
     from pathlib import Path
@@ -68,13 +1560,106 @@ def serve(host='0.0.0.0', port=50051):
     # Load environment variables from .env file
     env_path = Path(__file__).parent.parent / '.env'
     load_dotenv(dotenv_path=env_path)
-    
+    configure_logging()
+
     # Get configuration from environment variables
     server_host = os.getenv('GRPC_HOST', host)
     server_port = int(os.getenv('GRPC_PORT', str(port)))
-    
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    service_pb2_grpc.add_MakefileServiceServicer_to_server(MakefileService(), server)
+    server_mode = mode or os.getenv('GRPC_SERVER_MODE', 'thread')
+    server_http_port = int(os.getenv('GRPC_HTTP_PORT', str(http_port)))
+    server_workers = workers or int(os.getenv('GRPC_WORKERS', '1'))
+    if server_mode not in SERVER_MODES:
+        raise ValueError(
+            f"Unknown gRPC server mode {server_mode!r}, "
+            f"expected one of: {', '.join(SERVER_MODES)}"
+        )
+    if server_workers > 1 and worker_id is None:
+        _serve_workers(
+            server_host, server_port, server_mode, server_http_port, server_workers
+        )
+        return
+    # Shared with the other workers of the server
+    shared = worker_id is not None
+    tracing.configure("veridock-grpc")
+
+    result_cache = ResultCache.from_env()
+    if result_cache is not None:
+        logger.info("Result cache enabled for: %s", ", ".join(result_cache.targets))
+
+    scheduler = Scheduler.from_env()
+    logger.info(
+        "Scheduler: %d concurrent, queue of %d",
+        scheduler.max_concurrent, scheduler.max_queue,
+    )
+
+    single_flight = SingleFlight.from_env()
+    if single_flight is not None:
+        targets = ", ".join(single_flight.targets)
+        logger.info("Coalescing identical runs of: %s", targets)
+
+    output_store = OutputStore.from_env(shared=shared)
+    logger.info(
+        "Output over %d bytes spills to %s",
+        output_store.memory_limit, output_store.spool_dir,
+    )
+
+    batch_runner = BatchRunner.from_env()
+
+    job_store = JobStore.from_env(shared=shared)
+    logger.info("Job store: %s", os.path.abspath(job_store.path))
+
+    launcher = Launcher.from_env()
+    launcher.start()
+    logger.info("Starting make with the %s launcher", launcher.mode)
+
+    components = dict(
+        result_cache=result_cache,
+        scheduler=scheduler,
+        single_flight=single_flight,
+        output_store=output_store,
+        launcher=launcher,
+        batch_runner=batch_runner,
+        job_store=job_store,
+    )
+
+    if server_mode == "aio":
+        try:
+            asyncio.run(
+                _serve_async(
+                    f"{server_host}:{server_port}",
+                    components,
+                    server_http_port,
+                    worker_id,
+                )
+            )
+        finally:
+            launcher.close()
+        return
+
+    # Queued requests wait on a handler thread, so size the pool to hold both
+    # the running and the queued requests, the unscheduled calls, and the
+    # health checks, whose threads no other call may take.
+    max_workers = (
+        scheduler.max_concurrent
+        + scheduler.max_queue
+        + UNSCHEDULED_THREADS
+        + HEALTH_THREADS
+    )
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=max_workers),
+        interceptors=[
+            metrics.MetricsInterceptor(),
+            ThreadReservation(max_workers, HEALTH_THREADS),
+        ],
+        options=_server_options(shared),
+    )
+    metrics.SERVER_THREADS.set(max_workers)
+    service = MakefileService(**components)
+    service_pb2_grpc.add_MakefileServiceServicer_to_server(service, server)
+    health = HealthReporter()
+    health.add_to_server(server, scheduler)
+    # Pick up jobs that were still queued when the server last stopped
+    service.start_job_workers()
 
     # Listen on the given port
     server_address = f"{server_host}:{server_port}"
@@ -82,14 +1667,25 @@ def serve(host='0.0.0.0', port=50051):
 
     # Start the server
     server.start()
-    logger.info(f"gRPC server started on {server_address}")
-    logger.info(f"Environment: {os.getenv('ENVIRONMENT', 'development')}")
-    logger.info(f"Debug mode: {os.getenv('DEBUG', 'False')}")
+    logger.info("gRPC server started on %s", server_address)
+    listener = _start_transcoder(
+        service, server_host, server_http_port, reuse_port=shared
+    )
+    metrics_server = _start_metrics(server_host, scheduler, worker_id)
+    logger.info("Environment: %s", os.getenv("ENVIRONMENT", "development"))
+    logger.info("Debug mode: %s", os.getenv("DEBUG", "False"))
 
     # Handle graceful shutdown
     def signal_handler(sig, frame):
         logger.info("Shutting down gRPC server...")
+        health.shutdown()
+        if listener is not None:
+            listener.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
         server.stop(0)
+        launcher.close()
+        tracing.tracer.shutdown()
         logger.info("gRPC server stopped")
         sys.exit(0)
 
@@ -109,10 +1705,14 @@ if __name__ == "__main__":
     
     env_path = Path(__file__).parent.parent / '.env'
     load_dotenv(dotenv_path=env_path)
-    
+    configure_logging()
+
     # Set default port from environment or use default
     default_port = int(os.getenv('GRPC_PORT', '50051'))
     default_host = os.getenv('GRPC_HOST', '0.0.0.0')
+    default_mode = os.getenv('GRPC_SERVER_MODE', 'thread')
+    default_http_port = int(os.getenv('GRPC_HTTP_PORT', '0'))
+    default_workers = int(os.getenv('GRPC_WORKERS', '1'))
 
     parser = argparse.ArgumentParser(
         description="Run the gRPC server for Makefile commands"
@@ -125,6 +1725,29 @@ if __name__ == "__main__":
         "--port", type=int, default=default_port, 
         help=f"The port to listen on (default: {default_port})"
     )
+    parser.add_argument(
+        "--mode", type=str, choices=SERVER_MODES, default=default_mode,
+        help=f"Server mode: thread pool or asyncio (default: {default_mode})"
+    )
+    parser.add_argument(
+        "--http-port", type=int, default=default_http_port,
+        help="Also serve the RPCs as HTTP/JSON and gRPC-Web on this port; "
+        f"0 to disable (default: {default_http_port})"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=default_workers,
+        help="Server processes sharing the port, to use several cores "
+        f"(default: {default_workers})"
+    )
+    # Set by the parent of the workers
+    parser.add_argument("--worker-id", type=int, help=argparse.SUPPRESS)
     args = parser.parse_args()
 
-    serve(host=args.host, port=args.port)
+    serve(
+        host=args.host,
+        port=args.port,
+        mode=args.mode,
+        http_port=args.http_port,
+        workers=args.workers,
+        worker_id=args.worker_id,
+    )
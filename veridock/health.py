@@ -0,0 +1,181 @@
+"""Standard gRPC health checking (grpc.health.v1) of the gRPC server.
+
+The server answers ``grpc.health.v1.Health`` for the whole server (service
+``""``) and for ``makefile.MakefileService``. Both are SERVING while the
+scheduler can admit requests, NOT_SERVING while it is saturated (every slot
+taken and the queue full) and once the server is shutting down, so that load
+balancers and the gateway's ``/readyz`` send traffic elsewhere before
+requests are rejected.
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Optional
+
+import grpc
+from grpc_health.v1 import health, health_pb2, health_pb2_grpc
+
+from veridock import service_pb2
+
+logger = logging.getLogger(__name__)
+
+# The whole server, and the Makefile service
+SERVICES = ("", service_pb2.DESCRIPTOR.services_by_name["MakefileService"].full_name)
+
+# Path prefix of the health service's RPCs
+HEALTH_METHODS = f"/{health_pb2.DESCRIPTOR.services_by_name['Health'].full_name}/"
+
+SERVING = health_pb2.HealthCheckResponse.SERVING
+NOT_SERVING = health_pb2.HealthCheckResponse.NOT_SERVING
+
+
+def status_name(status: int) -> str:
+    """Lowercase name of a serving status, e.g. ``"not_serving"``."""
+    return health_pb2.HealthCheckResponse.ServingStatus.Name(status).lower()
+
+
+class HealthReporter:
+    """Sets the serving status of the server's health service.
+
+    With ``loop``, the servicer is a ``grpc.aio`` one and its status is set
+    on that event loop, whichever thread reports a change.
+    """
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.servicer = health.aio.HealthServicer() if loop else health.HealthServicer()
+        self.status = SERVING
+        self._shutting_down = False
+
+    def add_to_server(self, server, scheduler=None) -> None:
+        """Serve the health service on ``server``, following ``scheduler``."""
+        health_pb2_grpc.add_HealthServicer_to_server(self.servicer, server)
+        self._apply()
+        if scheduler is not None:
+            scheduler.on_saturation = self.on_saturation
+
+    def on_saturation(self, saturated: bool) -> None:
+        if self._shutting_down:
+            return
+        self.status = NOT_SERVING if saturated else SERVING
+        if saturated:
+            logger.warning("Execution queue full: reporting NOT_SERVING")
+        else:
+            logger.info("Execution queue has room again: reporting SERVING")
+        self._apply()
+
+    def shutdown(self) -> None:
+        """Report NOT_SERVING from now on."""
+        self._shutting_down = True
+        self.status = NOT_SERVING
+        self._apply()
+
+    async def shutdown_async(self) -> None:
+        """``shutdown()`` of an aio servicer, from its event loop."""
+        self._shutting_down = True
+        self.status = NOT_SERVING
+        await self._set_async()
+
+    def _apply(self) -> None:
+        if self.loop is None:
+            for service in SERVICES:
+                self.servicer.set(service, self.status)
+        else:
+            # Each task sets the latest status, so their order does not matter
+            self.loop.call_soon_threadsafe(
+                lambda: self.loop.create_task(self._set_async())
+            )
+
+    async def _set_async(self) -> None:
+        for service in SERVICES:
+            await self.servicer.set(service, self.status)
+
+
+class ThreadReservation(grpc.ServerInterceptor):
+    """Keeps ``reserved`` of a thread-pool server's ``threads`` for health checks.
+
+    Calls other than health checks run only while fewer than
+    ``threads - reserved`` of them are running; the rest fail straight away
+    with RESOURCE_EXHAUSTED, so that long calls such as WaitJob, which bypass
+    the scheduler, cannot take every thread.
+    """
+
+    def __init__(self, threads: int, reserved: int):
+        self.limit = threads - reserved
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or handler_call_details.method.startswith(HEALTH_METHODS):
+            return handler
+        if handler.unary_unary is not None:
+            return handler._replace(unary_unary=self._unary(handler.unary_unary))
+        if handler.unary_stream is not None:
+            return handler._replace(unary_stream=self._stream(handler.unary_stream))
+        return handler
+
+    def _admit(self, context) -> None:
+        with self._lock:
+            if self.active < self.limit:
+                self.active += 1
+                return
+        context.abort(
+            grpc.StatusCode.RESOURCE_EXHAUSTED,
+            f"Server busy: {self.limit} calls in progress",
+        )
+
+    def _release(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+    def _unary(self, behavior):
+        def unary(request, context):
+            self._admit(context)
+            try:
+                return behavior(request, context)
+            finally:
+                self._release()
+
+        return unary
+
+    def _stream(self, behavior):
+        def stream(request, context):
+            self._admit(context)
+            try:
+                yield from behavior(request, context)
+            finally:
+                self._release()
+
+        return stream
+
+
+def check(target: str, timeout: float = 1.0, service: str = "") -> str:
+    """Serving status of the gRPC server at ``target``, by name.
+
+    ``"unavailable"`` when the server cannot be reached in ``timeout``
+    seconds, ``"service_unknown"`` when it has no such service.
+    """
+    with grpc.insecure_channel(target) as channel:
+        return check_channel(channel, timeout, service)
+
+
+def check_channel(channel: grpc.Channel, timeout: float = 1.0, service: str = "") -> str:
+    """``check()`` over an open channel."""
+    try:
+        response = health_pb2_grpc.HealthStub(channel).Check(
+            health_pb2.HealthCheckRequest(service=service), timeout=timeout
+        )
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.NOT_FOUND:
+            return "service_unknown"
+        return "unavailable"
+    return status_name(response.status)
+
+
+def serving(host: str, port: int, timeout: float = 1.0) -> bool:
+    """Whether the gRPC server on host:port reports SERVING."""
+    if host in ("", "0.0.0.0", "::"):
+        host = "127.0.0.1"
+    return check(f"{host}:{port}", timeout) == "serving"
@@ -1,129 +1,444 @@
 #!/usr/bin/env python3
-"""HTTP Gateway for gRPC server."""
+"""HTTP Gateway for gRPC server.
 
+Importing the module only builds the Flask app and its routes. The
+configuration is read, and the gRPC channels opened, by ``init_app()``, which
+``serve_http()`` calls, so that importing it stays cheap and free of I/O.
+Under gunicorn the master opens no channels: each worker opens its own after
+it is forked.
+"""
+
+import itertools
 import json
 import logging
+import math
 import os
 import sys
+import time
+from collections import Counter
 from concurrent import futures
 from pathlib import Path
 
 import grpc
-from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import (
+    Flask,
+    Response,
+    g,
+    has_request_context,
+    jsonify,
+    request,
+    send_file,
+    stream_with_context,
+)
 from werkzeug.serving import WSGIRequestHandler
 
-from veridock import service_pb2, service_pb2_grpc
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('http_gateway.log')
-    ]
+from veridock import metrics, rpc_json, service_pb2, service_pb2_grpc, tracing
+from veridock.assets import StaticSite
+from veridock.gateway_server import SERVER_MODES, GatewayServer
+from veridock.grpc_client import DEADLINE_HEADER, ChannelPool, Deadlines
+from veridock.logs import brief, configure_logging
+from veridock.rate_limit import Overloaded, RateLimited, RateLimiter
+from veridock.transcoder import HTTP_STATUS, routes
+from veridock.response_cache import (
+    CACHE_HEADER,
+    HIT,
+    STALE,
+    CachedResponse,
+    ResponseCache,
 )
+
 logger = logging.getLogger(__name__)
+# One line per request, with latencies
+access_logger = logging.getLogger('veridock.access')
 
-# Load environment variables from .env file
+# Loaded over the environment by load_env()
 env_path = Path(__file__).parent.parent / '.env'
-load_dotenv(dotenv_path=env_path, override=True)
-
-# Configuration from environment variables
-GRPC_SERVER_HOST = os.getenv('GRPC_HOST', 'localhost')
-GRPC_SERVER_PORT = int(os.getenv('GRPC_PORT', '50051'))
-HTTP_GATEWAY_HOST = os.getenv('HTTP_GATEWAY_HOST', '0.0.0.0')
-HTTP_GATEWAY_PORT = int(os.getenv('HTTP_GATEWAY_PORT', '8082'))
 
-# Log configuration
-logger.info("=== Starting HTTP Gateway ===")
-logger.info(f"gRPC server configured at: {GRPC_SERVER_HOST}:{GRPC_SERVER_PORT}")
-logger.info(f"HTTP gateway will listen on: {HTTP_GATEWAY_HOST}:{HTTP_GATEWAY_PORT}")
-
-# Debug output for environment variables
-logger.debug("Environment variables:")
-for key, value in dict(os.environ).items():
-    if key.startswith(('GRPC_', 'HTTP_')):
-        logger.debug(f"  {key}={value}")
+# Configuration from environment variables, read by init_app()
+GRPC_SERVER_HOST = 'localhost'
+GRPC_SERVER_PORT = 50051
+HTTP_GATEWAY_HOST = '0.0.0.0'
+HTTP_GATEWAY_PORT = 8082
 
 app = Flask(__name__)
 app.config['JSON_SORT_KEYS'] = False  # Keep JSON output in the order we define it
 
-# gRPC channel to communicate with the gRPC server
-channel = grpc.insecure_channel(f'{GRPC_SERVER_HOST}:{GRPC_SERVER_PORT}')
-stub = service_pb2_grpc.MakefileServiceStub(channel)
 
-print(f"gRPC server configured at: {GRPC_SERVER_HOST}:{GRPC_SERVER_PORT}")
-print(f"HTTP gateway will listen on port: {HTTP_GATEWAY_PORT}")
+def _connect():
+    """Open the pool of gRPC channels to the server.
+
+    Called again in every forked gunicorn worker: a gRPC channel must not be
+    used across a fork.
+    """
+    global pool
+    pool = ChannelPool.from_env(
+        f'{GRPC_SERVER_HOST}:{GRPC_SERVER_PORT}', on_call=_record_upstream
+    )
+    _rpc_callables.clear()
+
+
+def _disconnect():
+    """Close the pool of gRPC channels, if open."""
+    global pool
+    if pool is not None:
+        pool.close()
+        pool = None
+    _rpc_callables.clear()
+
+
+def _record_upstream(method, seconds):
+    """Add a gRPC call's duration to the current request's upstream time."""
+    metrics.UPSTREAM_SECONDS.observe(seconds, method.rsplit('/', 1)[-1])
+    if has_request_context():
+        g.upstream_seconds = g.get('upstream_seconds', 0.0) + seconds
+
+
+# Multi-callables of the descriptor-driven routes, per channel and method
+_rpc_callables = {}
+# gRPC channels to communicate with the gRPC server, opened by init_app()
+pool = None
+deadlines = Deadlines()
+# Responses of read-only routes, kept for their configured TTL
+response_cache = None
+# Per-client token buckets and the cap on requests in flight
+rate_limiter = RateLimiter({})
+# Static files, for running without Caddy in front of the gateway
+static_site = None
+_initialized = False
+
+
+def load_env():
+    """Load the project's .env file, over the environment."""
+    from dotenv import load_dotenv
+
+    load_dotenv(dotenv_path=env_path, override=True)
+
+
+def init_app(connect=True):
+    """Read the configuration from the environment and open the gRPC channels.
+
+    Also adds the routes that depend on the configuration (metrics, static
+    files). Called once, before serving; later calls do nothing. With
+    ``connect=False`` the channels are left for ``serve_http()`` to open.
+    """
+    global GRPC_SERVER_HOST, GRPC_SERVER_PORT, HTTP_GATEWAY_HOST, HTTP_GATEWAY_PORT
+    global deadlines, response_cache, rate_limiter, static_site, _initialized
+    if _initialized:
+        return
+    _initialized = True
+    GRPC_SERVER_HOST = os.getenv('GRPC_HOST', 'localhost')
+    GRPC_SERVER_PORT = int(os.getenv('GRPC_PORT', '50051'))
+    HTTP_GATEWAY_HOST = os.getenv('HTTP_GATEWAY_HOST', '0.0.0.0')
+    HTTP_GATEWAY_PORT = int(os.getenv('HTTP_GATEWAY_PORT', '8082'))
+
+    if connect:
+        _connect()
+    deadlines = Deadlines.from_env()
+    response_cache = ResponseCache.from_env()
+    rate_limiter = RateLimiter.from_env()
+    tracing.configure('veridock-gateway')
+
+    if os.getenv('HTTP_GATEWAY_METRICS', 'true').lower() in ('1', 'true', 'yes'):
+        for rule in ('/makefile/metrics', '/metrics'):
+            app.add_url_rule(rule, 'metrics', prometheus_metrics, methods=['GET'])
+    static_site = StaticSite.from_env()
+    if static_site is not None:
+        app.add_url_rule('/', 'static_file', static_file, methods=['GET'])
+        app.add_url_rule('/<path:path>', 'static_file', static_file, methods=['GET'])
+
+
+def _client_id():
+    """The browser client's address, as forwarded by Caddy."""
+    client = request.headers.get('X-Real-IP')
+    if not client and request.headers.get('X-Forwarded-For'):
+        client = request.headers['X-Forwarded-For'].split(',')[0].strip()
+    return client or request.remote_addr or 'unknown'
+
+
+@app.before_request
+def _start_timer():
+    g.started = time.perf_counter()
+    # A child of Caddy's or the browser's span, if the request carries one
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.span = tracing.start_span(
+        f'{request.method} {rule}',
+        tracing.parse_traceparent(request.headers.get(tracing.TRACEPARENT_HEADER)),
+        tracing.SERVER,
+        **{'http.method': request.method, 'http.target': request.path,
+           'client.address': _client_id()},
+    )
+
+
+# Never shed: static files, and the health checks, which must tell an
+# overloaded gateway from one that is down
+UNLIMITED_ENDPOINTS = (None, 'static_file', 'healthz', 'readyz')
+
+
+def _request_json():
+    """The request's JSON body, None if it is not JSON; parsed once per request."""
+    if 'json_body' not in g:
+        g.json_body = request.get_json(silent=True)
+    return g.json_body
+
+
+@app.before_request
+def _limit_rate():
+    """Shed the request if its client is over a rate limit or the gateway is full."""
+    if request.method == 'OPTIONS' or request.endpoint in UNLIMITED_ENDPOINTS:
+        return None
+    target = None
+    # Only parsed when a per-target limit needs it; the handler reuses it
+    if request.method == 'POST' and rate_limiter.limits_targets(request.endpoint):
+        data = _request_json()
+        if isinstance(data, dict) and isinstance(data.get('command'), str):
+            target = data['command']
+    try:
+        # The slot first, so that a shed request takes no token
+        rate_limiter.acquire()
+        try:
+            rate_limiter.check(_client_id(), request.endpoint, target)
+        except RateLimited:
+            rate_limiter.release()
+            raise
+    except (RateLimited, Overloaded) as e:
+        status = 429 if isinstance(e, RateLimited) else 503
+        logger.warning("Rejected %s from %s: %s", request.endpoint, _client_id(), e)
+        response = jsonify({
+            'error': str(e),
+            'output': '',
+            'return_code': -1
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+        return response, status
+    g.in_flight = True
+    return None
+
+
+@app.teardown_request
+def _release_slot(error=None):
+    # Runs once the response has been sent, streamed ones included
+    if g.pop('in_flight', False):
+        rate_limiter.release()
+
+
+@app.after_request
+def _access_log(response):
+    """Log the request once its response body has been sent."""
+    started = g.get('started', time.perf_counter())
+    request_globals = g._get_current_object()
+    endpoint = request.endpoint or 'unmatched'
+    fields = {
+        'client': _client_id(),
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+    }
+    span = g.get('span')
+    if span is not None and span.context is not None:
+        fields['trace_id'] = span.context.trace_id
+        if span.recording:
+            response.headers['traceresponse'] = span.context.traceparent()
+
+    def log():
+        seconds = time.perf_counter() - started
+        fields['duration_ms'] = round(seconds * 1000, 1)
+        fields['upstream_ms'] = round(
+            request_globals.get('upstream_seconds', 0.0) * 1000, 1
+        )
+        fields['bytes'] = response.content_length
+        if CACHE_HEADER in response.headers:
+            fields['cache'] = response.headers[CACHE_HEADER]
+        metrics.HTTP_REQUESTS.inc(endpoint, fields['method'], str(fields['status']))
+        metrics.HTTP_SECONDS.observe(seconds, endpoint)
+        if fields['bytes']:
+            metrics.HTTP_BYTES.inc(endpoint, amount=fields['bytes'])
+        if span is not None:
+            span.set_attribute('http.status_code', fields['status'])
+            span.set_attribute('upstream_ms', fields['upstream_ms'])
+            if 'cache' in fields:
+                span.set_attribute('cache', fields['cache'])
+            if fields['status'] >= 500:
+                span.set_error(f"HTTP {fields['status']}")
+            span.end()
+        access_logger.info(
+            '%s "%s %s" %s %s %.1fms upstream=%.1fms',
+            fields['client'], fields['method'], fields['path'], fields['status'],
+            fields['bytes'] if fields['bytes'] is not None else '-',
+            fields['duration_ms'], fields['upstream_ms'],
+            extra=fields,
+        )
+
+    response.call_on_close(log)
+    return response
+
+
+def _call_metadata():
+    """gRPC metadata identifying the browser client, its requested priority
+    and the trace the request belongs to."""
+    metadata = [('x-client-id', _client_id())]
+    priority = request.headers.get('X-Priority')
+    if priority:
+        metadata.append(('x-priority', priority.lower()))
+    span = g.get('span')
+    if span is not None and span.context is not None:
+        metadata.append((tracing.TRACEPARENT_HEADER, span.context.traceparent()))
+    return metadata
+
+
+def _timeout(minimum=0):
+    """Deadline in seconds for the current endpoint's gRPC call."""
+    seconds = deadlines.timeout(request.endpoint, request.headers.get(DEADLINE_HEADER))
+    return max(seconds, minimum)
+
+
+def _rpc_status(error, default=502):
+    """HTTP status for a failed gRPC call."""
+    if error.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+        return 504
+    if error.code() == grpc.StatusCode.UNAVAILABLE:
+        return 503
+    return default
+
+
+def _cache_ttl(target=None):
+    """TTL of the current endpoint's cached responses, or None if not cached."""
+    if response_cache is None:
+        return None
+    return response_cache.ttl(request.endpoint, target)
+
+
+def _cached_json(key, ttl, load):
+    """JSON response with the data from ``load``, through the response cache.
+
+    ``load()`` makes the gRPC call and returns (data, headers, cacheable), data
+    being JSON-serializable or an already encoded body. With
+    a ``ttl`` the response is cached under ``key``; a stale one is refreshed by
+    calling ``load`` on a background thread, so it must not use the request.
+    """
+    def load_response():
+        data, headers, cacheable = load()
+        if isinstance(data, bytes):
+            body = data
+        else:
+            body = app.json.response(data).get_data()
+        return CachedResponse(body, tuple(headers)), cacheable
+
+    if ttl is None:
+        cached, status, age = load_response()[0], None, 0
+    else:
+        cache_control = (
+            request.headers.get('Cache-Control') or request.headers.get('Pragma', '')
+        )
+        cached, status, age = response_cache.fetch(
+            key, ttl, load_response, cache_control
+        )
+
+    response = Response(cached.body, mimetype='application/json')
+    for name, value in cached.headers:
+        response.headers[name] = value
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    if status is not None:
+        response.headers[CACHE_HEADER] = status
+        if status in (HIT, STALE):
+            response.headers['Age'] = str(int(age))
+    return response
+
+
+def _resource_exhausted_response(error):
+    """Turn a RESOURCE_EXHAUSTED rejection into a 429 with Retry-After."""
+    retry_after = dict(error.trailing_metadata() or ()).get('retry-after', '1')
+    logger.warning(
+        "gRPC server busy, retry after %ss: %s", retry_after, error.details()
+    )
+    response = jsonify({
+        'error': error.details(),
+        'output': '',
+        'return_code': -1
+    })
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers['Retry-After'] = retry_after
+    return response, 429
 
 
 @app.route('/makefile/run_command', methods=['POST', 'OPTIONS'])
 @app.route('/run_command', methods=['POST'])  # Add this line to handle both paths
 def run_command():
     """Handle HTTP POST request to run a Makefile command."""
-    # Log the incoming request
-    logger.info(f"Incoming request: {request.method} {request.path}")
-    logger.debug(f"Headers: {dict(request.headers)}")
-    logger.debug(f"Data: {request.data}")
-    
+    logger.debug("Headers: %s", brief(request.headers))
+
     # Handle CORS preflight request
     if request.method == 'OPTIONS':
-        logger.info("Handling OPTIONS preflight request")
         response = jsonify({'status': 'ok'})
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response
 
+    data = _request_json()
+    if not isinstance(data, dict):
+        response = jsonify({
+            'error': 'Expected a JSON object',
+            'output': '',
+            'return_code': -1
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 400
+
     try:
-        # Log incoming request
-        print(f"\n=== Received request ===")
-        print(f"Headers: {dict(request.headers)}")
-        print(f"Method: {request.method}")
-        print(f"Content-Type: {request.content_type}")
-        
-        # Parse JSON request
-        data = request.get_json()
-        print(f"Request data: {data}")
-        
         command = data.get('command', '')
         args = data.get('args', [])
-        print(f"Command: {command}, Args: {args}")
+        logger.debug("Running command %s with args %s", command, brief(args))
+        metadata = _call_metadata()
+        timeout = _timeout()
 
-        # Call gRPC service
-        print("Calling gRPC service...")
-        response = stub.RunCommand(
-            service_pb2.CommandRequest(command=command, args=args)
-        )
-        print("Received response from gRPC service")
+        def load():
+            # Call gRPC service
+            response, call = pool.stub().RunCommand.with_call(
+                service_pb2.CommandRequest(command=command, args=args),
+                metadata=metadata,
+                timeout=timeout,
+            )
+            cache_status = dict(call.trailing_metadata() or ()).get('x-cache')
 
-        # Prepare JSON response
-        response_data = {
-            'output': response.output,
-            'error': response.error,
-            'return_code': response.return_code
-        }
-        print(f"Sending response: {response_data}")
-        
-        response = jsonify(response_data)
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
+            # Prepare JSON response
+            response_data = {
+                'output': response.output,
+                'error': response.error,
+                'return_code': response.return_code,
+                'truncated': response.truncated,
+                'output_size': response.output_size,
+                'error_size': response.error_size,
+            }
+            if response.truncated:
+                response_data['output_id'] = response.output_id
+            logger.debug(
+                "Command %s returned %d with %d bytes of output",
+                command, response.return_code, response.output_size,
+            )
+            headers = [('X-Cache', cache_status.upper())] if cache_status else []
+            cacheable = response.return_code == 0 and not response.truncated
+            return response_data, headers, cacheable
 
-    except json.JSONDecodeError as e:
-        error_msg = f"Invalid JSON: {str(e)}"
-        print(f"Error: {error_msg}")
+        key = json.dumps(['run_command', command, args])
+        return _cached_json(key, _cache_ttl(command), load)
+
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED:
+            return _resource_exhausted_response(e)
+        error_msg = f"Internal server error: {str(e)}"
+        logger.error("gRPC call failed: %s: %s", e.code(), e.details())
         response = jsonify({
             'error': error_msg,
             'output': '',
             'return_code': -1
         })
         response.headers.add('Access-Control-Allow-Origin', '*')
-        return response, 400
-        
+        return response, _rpc_status(e, 500)
+
     except Exception as e:
         error_msg = f"Internal server error: {str(e)}"
-        print(f"Error: {error_msg}")
+        logger.exception("run_command failed")
         response = jsonify({
             'error': error_msg,
             'output': '',
@@ -133,36 +448,797 @@ def run_command():
         return response, 500
 
 
-def serve_http(host=HTTP_GATEWAY_HOST, port=HTTP_GATEWAY_PORT, debug=False):
-    """Start the HTTP server."""
+@app.route('/makefile/targets', methods=['GET'])
+@app.route('/targets', methods=['GET'])
+def list_targets():
+    """Return the targets defined in the Makefile."""
+    timeout = _timeout()
+
+    def load():
+        response = pool.stub().ListTargets(
+            service_pb2.ListTargetsRequest(), timeout=timeout
+        )
+        return {
+            'targets': [
+                {
+                    'name': target.name,
+                    'description': target.description,
+                    'prerequisites': list(target.prerequisites),
+                    'phony': target.phony,
+                }
+                for target in response.targets
+            ]
+        }, (), True
+
+    try:
+        return _cached_json('list_targets', _cache_ttl(), load)
+
+    except grpc.RpcError as e:
+        error_msg = f"Failed to list targets: {e.details() or e.code()}"
+        logger.error("%s", error_msg)
+        response = jsonify({'error': error_msg, 'targets': []})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, _rpc_status(e)
+
+
+@app.route('/makefile/scheduler', methods=['GET'])
+@app.route('/scheduler', methods=['GET'])
+def scheduler_stats():
+    """Return the gRPC server's execution queue depth and wait times."""
+    timeout = _timeout()
+
+    def load():
+        stats = pool.stub().GetSchedulerStats(
+            service_pb2.SchedulerStatsRequest(), timeout=timeout
+        )
+        return {
+            'running': stats.running,
+            'queued': stats.queued,
+            'running_by_target': dict(stats.running_by_target),
+            'queued_by_priority': dict(stats.queued_by_priority),
+            'oldest_wait_seconds': stats.oldest_wait_seconds,
+            'avg_wait_seconds': stats.avg_wait_seconds,
+            'max_wait_seconds': stats.max_wait_seconds,
+            'admitted': stats.admitted,
+            'rejected': stats.rejected,
+        }, (), True
+
+    try:
+        return _cached_json('scheduler_stats', _cache_ttl(), load)
+
+    except grpc.RpcError as e:
+        error_msg = f"Failed to get scheduler stats: {e.details() or e.code()}"
+        logger.error("%s", error_msg)
+        response = jsonify({'error': error_msg})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, _rpc_status(e)
+
+
+@app.route('/makefile/healthz', methods=['GET'])
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the gateway answers requests, whatever the gRPC server's state."""
+    response = jsonify({'status': 'ok'})
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+@app.route('/makefile/readyz', methods=['GET'])
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 200 while the gRPC server reports SERVING, 503 otherwise.
+
+    The server is asked with a standard gRPC health check over the pool's
+    channels; it is not serving when it cannot be reached, and while its
+    execution queue is full.
+    """
+    grpc_status = pool.health(_timeout())
+    ready = grpc_status == 'serving'
+    response = jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'grpc_server': grpc_status,
+        'channels': pool.stats()['channels'],
+    })
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers['Cache-Control'] = 'no-store'
+    return response, 200 if ready else 503
+
+
+BATCH_STATUSES = {
+    service_pb2.BatchResult.SUCCEEDED: 'succeeded',
+    service_pb2.BatchResult.FAILED: 'failed',
+    service_pb2.BatchResult.SKIPPED: 'skipped',
+}
+
+
+@app.route('/makefile/run_batch', methods=['POST', 'OPTIONS'])
+@app.route('/run_batch', methods=['POST'])
+def run_batch():
+    """Run several Makefile commands in one request.
+
+    The body lists ``commands``, each either a target name or an object with
+    ``command``, ``args``, ``id`` and ``depends_on``. Independent commands run
+    in parallel, up to ``max_parallel``.
+    """
+
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response
+
+    data = _request_json()
+    if not isinstance(data, dict) or not isinstance(data.get('commands'), list):
+        response = jsonify({'error': 'Expected a JSON object with a commands list'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 400
+
+    batch = service_pb2.BatchRequest(
+        max_parallel=int(data.get('max_parallel') or 0),
+        fail_fast=bool(data.get('fail_fast', False)),
+    )
+    for item in data['commands']:
+        if isinstance(item, str):
+            item = {'command': item}
+        batch.commands.add(
+            id=item.get('id', ''),
+            command=item.get('command', ''),
+            args=item.get('args', []),
+            depends_on=item.get('depends_on', []),
+        )
+
+    try:
+        result = pool.stub().RunCommands(
+            batch, metadata=_call_metadata(), timeout=_timeout()
+        )
+    except grpc.RpcError as e:
+        status = 400 if e.code() == grpc.StatusCode.INVALID_ARGUMENT else _rpc_status(e)
+        response = jsonify({'error': e.details() or str(e.code())})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, status
+
+    results = []
+    for r in result.results:
+        item = {
+            'id': r.id,
+            'status': BATCH_STATUSES[r.status],
+            'started_seconds': r.started_seconds,
+            'duration_seconds': r.duration_seconds,
+        }
+        if r.HasField('response'):
+            item.update({
+                'output': r.response.output,
+                'error': r.response.error,
+                'return_code': r.response.return_code,
+                'truncated': r.response.truncated,
+            })
+            if r.response.truncated:
+                item['output_id'] = r.response.output_id
+        results.append(item)
+
+    response = jsonify({
+        'success': result.success,
+        'wall_seconds': result.wall_seconds,
+        'total_seconds': result.total_seconds,
+        'results': results,
+    })
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+JOB_STATES = {
+    service_pb2.Job.QUEUED: 'queued',
+    service_pb2.Job.RUNNING: 'running',
+    service_pb2.Job.SUCCEEDED: 'succeeded',
+    service_pb2.Job.FAILED: 'failed',
+    service_pb2.Job.CANCELLED: 'cancelled',
+    service_pb2.Job.LOST: 'lost',
+}
+
+
+def _job_json(job):
+    """JSON-ready dict for a Job message."""
+    data = {
+        'job_id': job.job_id,
+        'state': JOB_STATES[job.state],
+        'command': job.command,
+        'args': list(job.args),
+        'submitted_at': job.submitted_at,
+        'started_at': job.started_at or None,
+        'finished_at': job.finished_at or None,
+    }
+    if job.HasField('response'):
+        data.update({
+            'output': job.response.output,
+            'error': job.response.error,
+            'return_code': job.response.return_code,
+            'truncated': job.response.truncated,
+        })
+        if job.response.truncated:
+            data['output_id'] = job.response.output_id
+    return data
+
+
+def _job_rpc_error(e):
+    """Map a failed job RPC to an HTTP error response."""
+    statuses = {
+        grpc.StatusCode.NOT_FOUND: 404,
+        grpc.StatusCode.RESOURCE_EXHAUSTED: 429,
+    }
+    response = jsonify({'error': e.details() or str(e.code())})
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response, statuses.get(e.code(), _rpc_status(e))
+
+
+@app.route('/makefile/jobs', methods=['POST', 'OPTIONS'])
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a Makefile command as a background job.
+
+    Responds with 202 and the job as soon as it is queued; poll
+    ``GET /makefile/jobs/<job_id>`` for its progress.
+    """
+
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response
+
+    data = _request_json()
+    if not isinstance(data, dict):
+        response = jsonify({'error': 'Invalid JSON'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 400
+
+    try:
+        job = pool.stub().SubmitCommand(
+            service_pb2.CommandRequest(
+                command=data.get('command', ''), args=data.get('args', [])
+            ),
+            metadata=_call_metadata(),
+            timeout=_timeout(),
+        )
+    except grpc.RpcError as e:
+        return _job_rpc_error(e)
+
+    response = jsonify(_job_json(job))
+    response.headers['Location'] = f"{request.path.rstrip('/')}/{job.job_id}"
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response, 202
+
+
+@app.route('/makefile/jobs/<job_id>', methods=['GET', 'DELETE', 'OPTIONS'])
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job(job_id):
+    """Return a job, long-polling with ``?wait=<seconds>``; DELETE cancels it."""
+
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, DELETE, OPTIONS')
+        return response
+
+    wait = request.args.get('wait', 0, type=float)
+    stub = pool.stub()
+    try:
+        if request.method == 'DELETE':
+            job = stub.CancelJob(
+                service_pb2.JobRequest(job_id=job_id), timeout=_timeout()
+            )
+        elif wait > 0:
+            # Leave the long poll time to return before the deadline hits
+            job = stub.WaitJob(
+                service_pb2.WaitJobRequest(job_id=job_id, timeout_seconds=wait),
+                timeout=_timeout(minimum=wait + 5),
+            )
+        else:
+            job = stub.GetJob(service_pb2.JobRequest(job_id=job_id), timeout=_timeout())
+    except grpc.RpcError as e:
+        return _job_rpc_error(e)
+
+    response = jsonify(_job_json(job))
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+def _sse_event(event, data, event_id=None):
+    """Format a single Server-Sent Events message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+@app.route('/makefile/run_command_stream', methods=['POST', 'OPTIONS'])
+@app.route('/run_command_stream', methods=['POST'])
+def run_command_stream():
+    """Run a Makefile command and relay its output as Server-Sent Events.
+
+    Each output chunk becomes a ``stdout`` or ``stderr`` event carrying the
+    chunk's sequence number; the stream ends with a single ``exit`` event.
+    """
+
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response
+
+    data = _request_json()
+    if not isinstance(data, dict):
+        response = jsonify({
+            'error': 'Expected a JSON object',
+            'output': '',
+            'return_code': -1
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 400
+
+    command = data.get('command', '')
+    args = data.get('args', [])
+    logger.debug("Streaming command %s with args %s", command, brief(args))
+
+    call = pool.stub().RunCommandStream(
+        service_pb2.CommandRequest(command=command, args=args),
+        metadata=_call_metadata(),
+        timeout=_timeout(),
+    )
+
+    # Wait for the first chunk so an admission rejection can still be
+    # reported with a proper status code before the event stream starts.
+    pending_error = None
+    try:
+        first = next(call, None)
+    except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED:
+            return _resource_exhausted_response(e)
+        first, pending_error = None, e
+
+    def generate():
+        try:
+            if pending_error is not None:
+                raise pending_error
+            head = [first] if first is not None else []
+            for chunk in itertools.chain(head, call):
+                if chunk.done:
+                    yield _sse_event(
+                        'exit',
+                        {'return_code': chunk.return_code},
+                        chunk.sequence,
+                    )
+                    continue
+                stream = (
+                    'stderr'
+                    if chunk.stream == service_pb2.CommandOutputChunk.STDERR
+                    else 'stdout'
+                )
+                yield _sse_event(
+                    stream,
+                    {'seq': chunk.sequence, 'data': chunk.data},
+                    chunk.sequence,
+                )
+        except grpc.RpcError as e:
+            logger.error("Stream failed: %s: %s", e.code(), e.details())
+            yield _sse_event('error', {'error': e.details() or str(e.code())})
+        finally:
+            # Stops the remote make run if the browser went away mid-stream
+            call.cancel()
+
+    response = Response(
+        stream_with_context(generate()), mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+# Bytes fetched from the gRPC server per ReadOutput call
+OUTPUT_READ_SIZE = 1024 * 1024
+
+OUTPUT_STREAMS = {
+    'stdout': service_pb2.CommandOutputChunk.STDOUT,
+    'stderr': service_pb2.CommandOutputChunk.STDERR,
+}
+
+
+def _parse_range(header):
+    """Parse a single ``bytes=`` Range header into (start, end, suffix).
+
+    ``end`` is inclusive and None when open-ended; ``suffix`` is the length of
+    a ``bytes=-N`` range. Returns None for a missing or unsupported header.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start, _, end = header[len('bytes='):].strip().partition('-')
+    # int() would also take a sign, as in bytes=5--3
+    if not any((start, end)) or not all(p.isdigit() for p in (start, end) if p):
+        return None
+    try:
+        if not start:
+            return None, None, int(end)
+        return int(start), int(end) if end else None, None
+    except ValueError:
+        return None
+
+
+@app.route('/makefile/output/<output_id>', methods=['GET'])
+@app.route('/output/<output_id>', methods=['GET'])
+def read_output(output_id):
+    """Return the full output of a truncated command response.
+
+    The stream is chosen with ``?stream=stdout|stderr``. A byte range can be
+    requested with ``?offset=&length=`` or a standard ``Range`` header, which
+    yields a 206 response. The body is relayed from the gRPC server in
+    bounded pieces rather than loaded whole.
+    """
+    stream = OUTPUT_STREAMS.get(request.args.get('stream', 'stdout'))
+    if stream is None:
+        response = jsonify({'error': 'stream must be stdout or stderr'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 400
+
+    offset = request.args.get('offset', 0, type=int)
+    length = request.args.get('length', 0, type=int)
+    if offset < 0 or length < 0:
+        # ReadOutputRequest fields are unsigned and would not take them
+        response = jsonify({'error': 'offset and length must not be negative'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 400
+    byte_range = _parse_range(request.headers.get('Range'))
+    if byte_range is not None:
+        start, end, _ = byte_range
+        if start is not None and end is not None and end < start:
+            response = Response(status=416)
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
+
+    timeout = _timeout()
+
+    def read(at, size):
+        return pool.stub().ReadOutput(service_pb2.ReadOutputRequest(
+            output_id=output_id, stream=stream, offset=at, length=size
+        ), timeout=timeout)
+
+    try:
+        if byte_range is not None:
+            start, end, suffix = byte_range
+            if suffix is not None:
+                # The total size is needed to resolve "the last N bytes"
+                total = read(0, 1).total_size
+                start, end = max(total - suffix, 0), None
+            offset = start
+            length = end - start + 1 if end is not None else 0
+        first = read(offset, min(length or OUTPUT_READ_SIZE, OUTPUT_READ_SIZE))
+    except grpc.RpcError as e:
+        status = 404 if e.code() == grpc.StatusCode.NOT_FOUND else _rpc_status(e)
+        response = jsonify({'error': e.details() or str(e.code())})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, status
+
+    total = first.total_size
+    if byte_range is not None and offset >= total:
+        response = Response(status=416)
+        response.headers['Content-Range'] = f'bytes */{total}'
+        return response
+    end = min(offset + length, total) if length else total
+
+    def generate():
+        yield first.data
+        position = offset + len(first.data)
+        while position < end:
+            piece = read(position, min(end - position, OUTPUT_READ_SIZE))
+            if not piece.data:
+                break
+            yield piece.data
+            position += len(piece.data)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/plain',
+        status=206 if byte_range is not None else 200,
+    )
+    response.headers['Content-Length'] = str(max(end - offset, 0))
+    response.headers['Accept-Ranges'] = 'bytes'
+    if byte_range is not None:
+        response.headers['Content-Range'] = f'bytes {offset}-{end - 1}/{total}'
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+def _rpc_callable(path, method):
+    """Multi-callable for an RPC on the next channel of the pool."""
+    channel = pool.channel()
+    key = (channel, path)
+    rpc = _rpc_callables.get(key)
+    if rpc is None:
+        make = channel.unary_stream if method.server_streaming else channel.unary_unary
+        rpc = _rpc_callables[key] = make(
+            path,
+            request_serializer=method.request_class.SerializeToString,
+            response_deserializer=method.response_class.FromString,
+        )
+    return rpc
+
+
+def _rpc_error(code, details, trailing_metadata=(), errors=None):
+    """JSON error of a descriptor-driven route, with the gRPC status code."""
+    body = {'code': code.value[0], 'message': details}
+    if errors:
+        body['errors'] = errors
+    response = Response(rpc_json.dumps(body), mimetype='application/json')
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    if code == grpc.StatusCode.RESOURCE_EXHAUSTED:
+        retry_after = dict(trailing_metadata or ()).get('retry-after', '1')
+        response.headers['Retry-After'] = retry_after
+    return response, HTTP_STATUS.get(code, 500)
+
+
+def _rpc_stream(call):
+    """NDJSON response with the messages of a server-streaming call.
+
+    The first message is awaited before answering, so a call failing straight
+    away gets its HTTP status. A later failure ends the stream with an
+    ``{"error": {"code": ..., "message": ...}}`` line.
+    """
+    try:
+        first = next(call, None)
+    except grpc.RpcError as e:
+        logger.warning("gRPC stream failed: %s: %s", e.code(), e.details())
+        return _rpc_error(e.code(), e.details(), e.trailing_metadata())
+
+    def generate():
+        try:
+            if first is None:
+                return
+            yield rpc_json.message_json(first) + b'\n'
+            for message in call:
+                yield rpc_json.message_json(message) + b'\n'
+        except grpc.RpcError as e:
+            logger.error("gRPC stream failed: %s: %s", e.code(), e.details())
+            error = {'code': e.code().value[0], 'message': e.details()}
+            yield rpc_json.dumps({'error': error}) + b'\n'
+        finally:
+            call.cancel()
+
+    response = Response(
+        stream_with_context(generate()), mimetype='application/x-ndjson'
+    )
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _rpc_view(path, method):
+    """View calling ``method`` with the request message given as JSON."""
+
+    def call_rpc():
+        if request.method == 'OPTIONS':
+            response = jsonify({'status': 'ok'})
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+            response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+            return response
+
+        try:
+            message = rpc_json.parse(method.request_class, request.get_data())
+        except rpc_json.SchemaError as e:
+            logger.warning("Invalid %s request: %s", method.name, e)
+            return _rpc_error(
+                grpc.StatusCode.INVALID_ARGUMENT, 'Invalid request', errors=e.errors
+            )
+        except ValueError as e:
+            logger.warning("Invalid JSON for %s: %s", method.name, e)
+            return _rpc_error(grpc.StatusCode.INVALID_ARGUMENT, f"Invalid JSON: {e}")
+        logger.debug("Calling %s with %s", method.name, brief(message))
+
+        rpc = _rpc_callable(path, method)
+        metadata = _call_metadata()
+        # A long poll must be able to return before the deadline hits
+        wait = getattr(message, 'timeout_seconds', 0)
+        timeout = _timeout(minimum=wait + 5 if wait > 0 else 0)
+        if method.server_streaming:
+            return _rpc_stream(rpc(message, metadata=metadata, timeout=timeout))
+
+        def load():
+            response, call = rpc.with_call(
+                message, metadata=metadata, timeout=timeout
+            )
+            cache_status = dict(call.trailing_metadata() or ()).get('x-cache')
+            headers = [('X-Cache', cache_status.upper())] if cache_status else []
+            data = rpc_json.message_dict(response)
+            # Only successful, complete runs are worth caching
+            cacheable = data.get('return_code', 0) == 0 and not data.get('truncated')
+            return rpc_json.dumps(data), headers, cacheable
+
+        request_bytes = message.SerializeToString(deterministic=True)
+        key = f'{request.endpoint}:{request_bytes.hex()}'
+        ttl = _cache_ttl(getattr(message, 'command', None))
+        try:
+            return _cached_json(key, ttl, load)
+        except grpc.RpcError as e:
+            logger.warning(
+                "gRPC call %s failed: %s: %s", method.name, e.code(), e.details()
+            )
+            return _rpc_error(e.code(), e.details(), e.trailing_metadata())
+
+    call_rpc.__doc__ = f"Call {path} with its request message as JSON."
+    return call_rpc
+
+
+def _register_rpc_routes():
+    """Route ``/<package>.<Service>/<Method>`` to every RPC of service.proto.
+
+    The routes are built from the compiled service descriptors, so a new RPC
+    needs no gateway code: the JSON body is validated against the request
+    message and converted with protobuf's JSON mapping, and the response
+    message is sent back as JSON, or one JSON object per line for a
+    server-streaming RPC. Their endpoint names, for deadlines, rate limits and
+    the response cache, are ``<Service>.<Method>``.
+    """
+    for service in service_pb2.DESCRIPTOR.services_by_name.values():
+        for path, method in routes(service).items():
+            endpoint = f'{service.name}.{method.name}'
+            view = _rpc_view(path, method)
+            app.add_url_rule(
+                f'/makefile{path}', endpoint, view, methods=['POST', 'OPTIONS']
+            )
+            app.add_url_rule(path, endpoint, view, methods=['POST'])
+
+
+_register_rpc_routes()
+
+
+def _gateway_metrics():
+    """Metrics collector reading the gateway's own counters when scraped."""
+    limits = rate_limiter.stats()
+    families = [
+        (
+            'veridock_http_requests_in_flight',
+            'gauge',
+            'Requests being handled by this gateway process.',
+            [({}, limits['in_flight'])],
+        ),
+        (
+            'veridock_http_rejected_total',
+            'counter',
+            'Requests shed by rate limits or the in-flight cap, by reason.',
+            [
+                ({'reason': reason}, count)
+                for reason, count in limits['rejected'].items()
+            ],
+        ),
+        (
+            'veridock_gateway_grpc_channels',
+            'gauge',
+            'Channels to the gRPC server, by connectivity state.',
+            [
+                ({'state': state}, count)
+                for state, count in Counter(
+                    pool.stats()['channels'] if pool is not None else ()
+                ).items()
+            ],
+        ),
+    ]
+    if response_cache is not None:
+        families.append((
+            'veridock_http_cache_lookups_total',
+            'counter',
+            'Response cache lookups, by result.',
+            [
+                ({'result': 'hit'}, response_cache.hits),
+                ({'result': 'stale'}, response_cache.stale_hits),
+                ({'result': 'miss'}, response_cache.misses),
+            ],
+        ))
+    return families
+
+
+metrics.REGISTRY.set_collector('gateway', _gateway_metrics)
+
+
+def prometheus_metrics():
+    """Request, gRPC call, cache and rate limit metrics of this process."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/makefile/limits', methods=['GET'])
+@app.route('/limits', methods=['GET'])
+def rate_limits():
+    """Rate limits, requests in flight and rejections of this gateway process."""
+    response = jsonify(rate_limiter.stats())
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+def static_file(path=''):
+    """Serve a static file the way Caddy does: precompressed, with ETag/304."""
+    found = static_site.lookup(path, request.headers.get('Accept-Encoding', ''))
+    if found is None:
+        return jsonify({'error': 'Not found'}), 404
+    response = send_file(
+        found.filename,
+        mimetype=found.mimetype,
+        etag=found.etag,
+        conditional=True,
+        max_age=None,
+    )
+    response.headers['Cache-Control'] = found.cache_control
+    response.vary.add('Accept-Encoding')
+    if found.encoding and response.status_code != 304:
+        response.headers['Content-Encoding'] = found.encoding
+    return response
+
+
+def serve_http(host=None, port=None, debug=False, server=None):
+    """Start the HTTP server with a GatewayServer (from the environment by default).
+
+    ``host`` and ``port`` default to ``HTTP_GATEWAY_HOST`` and
+    ``HTTP_GATEWAY_PORT``.
+    """
+    init_app(connect=False)
+    host = host or HTTP_GATEWAY_HOST
+    port = port or HTTP_GATEWAY_PORT
+    server = server or GatewayServer.from_env()
+    if server.mode == 'gunicorn':
+        # The master must not carry channels into the fork: every worker
+        # opens its own pool in post_fork
+        _disconnect()
+    elif pool is None:
+        _connect()
     if debug:
-        logger.setLevel(logging.DEBUG)
         logger.info("Debug mode enabled")
         app.debug = True
-    
-    # Log all routes
-    logger.info("Registered routes:")
+    # Requests are logged by the access log
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    logger.info("gRPC server configured at: %s:%s", GRPC_SERVER_HOST, GRPC_SERVER_PORT)
+    if static_site is not None:
+        logger.info("Serving static files from %s", static_site.root)
     for rule in app.url_map.iter_rules():
-        logger.info(f"  {rule.endpoint}: {rule.rule} {list(rule.methods)}")
-    
-    # Use a simple WSGI server for development
-    from werkzeug.serving import make_server
-    server = make_server(host, port, app)
-    logger.info(f"HTTP gateway running on http://{host}:{port}")
+        logger.debug("Route %s: %s %s", rule.endpoint, rule.rule, sorted(rule.methods))
+
+    metrics.HTTP_THREADS.set(server.threads)
     logger.info("Ready to accept requests...")
-    server.serve_forever()
+    server.serve(app, host, port, post_fork=_connect)
 
 
 if __name__ == '__main__':
     import argparse
+
+    load_env()
+    init_app(connect=False)
     parser = argparse.ArgumentParser(description='HTTP Gateway for gRPC server')
     parser.add_argument('--port', type=int, default=HTTP_GATEWAY_PORT, help='Port to run the HTTP gateway on')
     parser.add_argument('--host', type=str, default=HTTP_GATEWAY_HOST, help='Host to bind the HTTP gateway to')
-    parser.add_argument('--debug', action='store_true', help='Enable debug mode with verbose logging')
+    parser.add_argument('--debug', '--dev', action='store_true', help='Enable debug mode with verbose logging')
+    defaults = GatewayServer.from_env()
+    parser.add_argument('--server', choices=SERVER_MODES, default=defaults.mode,
+                        help=f'WSGI server to run (default: {defaults.mode})')
+    parser.add_argument('--workers', type=int, default=defaults.workers,
+                        help=f'gunicorn worker processes (default: {defaults.workers})')
+    parser.add_argument('--threads', type=int, default=defaults.threads,
+                        help=f'Request threads per process (default: {defaults.threads})')
+    parser.add_argument('--keepalive', type=float, default=defaults.keepalive,
+                        help=f'Seconds gunicorn keeps idle connections open (default: {defaults.keepalive:g})')
+    parser.add_argument('--timeout', type=float, default=defaults.timeout,
+                        help=f'Request timeout in seconds (default: {defaults.timeout:g})')
     args = parser.parse_args()
-    
-    logger.info(f"Starting HTTP gateway on {args.host}:{args.port}")
-    if args.debug:
-        logger.info("Debug mode enabled")
-    
-    serve_http(host=args.host, port=args.port, debug=args.debug)
+
+    configure_logging('http_gateway.log', level='DEBUG' if args.debug else None)
+    logger.info("Starting HTTP gateway on %s:%s", args.host, args.port)
+
+    server = GatewayServer(
+        mode=args.server,
+        workers=args.workers,
+        threads=args.threads,
+        keepalive=args.keepalive,
+        timeout=args.timeout,
+    )
+    serve_http(host=args.host, port=args.port, debug=args.debug, server=server)
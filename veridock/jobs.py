@@ -0,0 +1,362 @@
+"""Persistent store of asynchronous command jobs."""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+# The server stopped while the job was running
+LOST = "lost"
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED, LOST)
+
+# How often a shared store looks for changes made by other processes
+SHARED_POLL_INTERVAL = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    command TEXT NOT NULL,
+    args TEXT NOT NULL,
+    caller TEXT NOT NULL,
+    priority TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result BLOB
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, submitted_at);
+"""
+
+_COLUMNS = (
+    "id, state, command, args, caller, priority, "
+    "submitted_at, started_at, finished_at, result"
+)
+
+
+class JobQueueFullError(Exception):
+    """Raised when too many jobs are waiting to run."""
+
+
+class Job(NamedTuple):
+    """A submitted command and what became of it.
+
+    Times are Unix timestamps. ``result`` holds the serialized result once
+    the job has finished; the store does not interpret it.
+    """
+
+    id: str
+    state: str
+    command: str
+    args: Tuple[str, ...]
+    caller: str
+    priority: Optional[str]
+    submitted_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+    result: Optional[bytes]
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+
+def _row_to_job(row) -> Job:
+    row = list(row)
+    row[3] = tuple(json.loads(row[3]))
+    return Job(*row)
+
+
+class JobStore:
+    """SQLite-backed job queue and history.
+
+    Queued jobs survive a restart and are picked up again; jobs that were
+    running when the server stopped are marked ``lost``. Finished jobs are
+    kept for ``ttl`` seconds, and at most ``max_jobs`` jobs are stored, the
+    oldest finished ones being dropped first. ``workers`` is how many jobs
+    the server runs at once.
+
+    A ``shared`` store is used by several server processes at once: opening
+    it does not mark running jobs as lost, as another process may be running
+    them, and waits look at the database every ``SHARED_POLL_INTERVAL``
+    seconds, as the other processes cannot wake them up. A job cancelled
+    through another process is only marked cancelled; the process running
+    it finds out with ``cancelled()``.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        max_jobs: int = 1000,
+        ttl: float = 86400.0,
+        workers: int = 4,
+        shared: bool = False,
+    ):
+        self.path = path
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.workers = workers
+        self.shared = shared
+        self._poll_interval = SHARED_POLL_INTERVAL if shared else None
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if shared:
+            # Readers do not block the writer of another process
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        if not shared:
+            self.recover()
+
+    @classmethod
+    def from_env(cls, shared: bool = False) -> "JobStore":
+        """Build a store from ``GRPC_JOB_*`` variables."""
+        return cls(
+            path=os.getenv("GRPC_JOB_DB", os.path.join(".veridock", "jobs.db")),
+            max_jobs=int(os.getenv("GRPC_JOB_MAX", "1000")),
+            ttl=float(os.getenv("GRPC_JOB_TTL", "86400")),
+            workers=int(os.getenv("GRPC_JOB_WORKERS", "4")),
+            shared=shared,
+        )
+
+    def submit(
+        self,
+        command: str,
+        args: Sequence[str],
+        caller: str,
+        priority: Optional[str] = None,
+    ) -> Job:
+        """Queue a job. Raises JobQueueFullError when the store is full."""
+        job = Job(
+            id=uuid.uuid4().hex,
+            state=QUEUED,
+            command=command,
+            args=tuple(args),
+            caller=caller,
+            priority=priority,
+            submitted_at=time.time(),
+            started_at=None,
+            finished_at=None,
+            result=None,
+        )
+        with self._cond:
+            self._prune()
+            (count,) = self._db.execute("SELECT COUNT(*) FROM jobs").fetchone()
+            if count >= self.max_jobs:
+                raise JobQueueFullError(
+                    f"Too many unfinished jobs ({count} of {self.max_jobs})"
+                )
+            with self._db:
+                self._db.execute(
+                    f"INSERT INTO jobs ({_COLUMNS}) VALUES (?,?,?,?,?,?,?,?,?,?)",
+                    (*job[:3], json.dumps(list(job.args)), *job[4:]),
+                )
+            self._notify()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job, or None if it is unknown or was pruned."""
+        with self._cond:
+            return self._get(job_id)
+
+    def claim(self, timeout: Optional[float] = None) -> Optional[Job]:
+        """Mark the oldest queued job as running and return it.
+
+        Blocks for up to ``timeout`` seconds (forever if None) for a job to be
+        submitted; returns None on timeout.
+        """
+        with self._cond:
+            job = self._claim()
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while job is None:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(self._wait_time(remaining))
+                job = self._claim()
+            return job
+
+    async def claim_async(self) -> Job:
+        """asyncio version of ``claim`` without a timeout."""
+        while True:
+            with self._cond:
+                job = self._claim()
+                if job is not None:
+                    return job
+                waiter = self._add_async_waiter()
+            try:
+                await asyncio.wait_for(waiter, self._poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def finish(self, job_id: str, state: str, result: bytes) -> Optional[Job]:
+        """Record a job's outcome. A cancelled job stays cancelled."""
+        with self._cond:
+            with self._db:
+                self._db.execute(
+                    "UPDATE jobs SET result = ?, finished_at = ?, "
+                    "state = CASE WHEN state = ? THEN state ELSE ? END "
+                    "WHERE id = ?",
+                    (result, time.time(), CANCELLED, state, job_id),
+                )
+            self._notify()
+            return self._get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job; finished jobs are left as they are."""
+        with self._cond:
+            with self._db:
+                self._db.execute(
+                    "UPDATE jobs SET state = ?, finished_at = ? "
+                    "WHERE id = ? AND state IN (?, ?)",
+                    (CANCELLED, time.time(), job_id, QUEUED, RUNNING),
+                )
+            self._notify()
+            return self._get(job_id)
+
+    def cancelled(self, job_ids: Iterable[str]) -> Set[str]:
+        """Those of ``job_ids`` that have been cancelled."""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return set()
+        placeholders = ",".join("?" * len(job_ids))
+        with self._cond:
+            rows = self._db.execute(
+                f"SELECT id FROM jobs WHERE state = ? AND id IN ({placeholders})",
+                (CANCELLED, *job_ids),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def wait(self, job_id: str, timeout: float, is_active=None) -> Optional[Job]:
+        """Wait up to ``timeout`` seconds for a job to finish; returns it.
+
+        ``is_active`` is polled so a long-poll ends when its caller goes away.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                job = self._get(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job.finished or remaining <= 0:
+                    return job
+                if is_active is not None and not is_active():
+                    return job
+                self._cond.wait(min(remaining, self._poll_interval or 1.0))
+
+    async def wait_async(self, job_id: str, timeout: float) -> Optional[Job]:
+        """asyncio version of ``wait``."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                job = self._get(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job.finished or remaining <= 0:
+                    return job
+                waiter = self._add_async_waiter()
+            try:
+                await asyncio.wait_for(waiter, self._wait_time(remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    def close(self) -> None:
+        with self._cond:
+            self._db.close()
+
+    def _get(self, job_id: str) -> Optional[Job]:
+        row = self._db.execute(
+            f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return _row_to_job(row) if row else None
+
+    def _wait_time(self, remaining: Optional[float]) -> Optional[float]:
+        """How long to wait for a change, at most ``remaining`` seconds."""
+        if self._poll_interval is None:
+            return remaining
+        if remaining is None:
+            return self._poll_interval
+        return min(remaining, self._poll_interval)
+
+    def _claim(self) -> Optional[Job]:
+        while True:
+            row = self._db.execute(
+                "SELECT id FROM jobs WHERE state = ? ORDER BY submitted_at LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                return None
+            with self._db:
+                # Not claimed by another process in the meantime
+                claimed = self._db.execute(
+                    "UPDATE jobs SET state = ?, started_at = ? "
+                    "WHERE id = ? AND state = ?",
+                    (RUNNING, time.time(), row[0], QUEUED),
+                ).rowcount
+            if claimed:
+                return self._get(row[0])
+
+    def recover(self) -> None:
+        """Mark jobs interrupted by a restart as lost.
+
+        Done when the store is opened, unless it is shared.
+        """
+        with self._db:
+            lost = self._db.execute(
+                "UPDATE jobs SET state = ?, finished_at = ? WHERE state = ?",
+                (LOST, time.time(), RUNNING),
+            ).rowcount
+            (queued,) = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = ?", (QUEUED,)
+            ).fetchone()
+        if lost or queued:
+            logger.info("Job store: %d interrupted jobs lost, %d queued", lost, queued)
+
+    def _prune(self) -> None:
+        """Drop expired finished jobs, then the oldest ones over the limit."""
+        placeholders = ",".join("?" * len(FINISHED_STATES))
+        with self._db:
+            self._db.execute(
+                f"DELETE FROM jobs WHERE state IN ({placeholders}) "
+                "AND finished_at < ?",
+                (*FINISHED_STATES, time.time() - self.ttl),
+            )
+            self._db.execute(
+                f"DELETE FROM jobs WHERE id IN (SELECT id FROM jobs "
+                f"WHERE state IN ({placeholders}) ORDER BY finished_at "
+                "LIMIT max(0, (SELECT COUNT(*) FROM jobs) - ?))",
+                (*FINISHED_STATES, self.max_jobs - 1),
+            )
+
+    def _add_async_waiter(self) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._async_waiters.append((loop, future))
+        return future
+
+    def _notify(self) -> None:
+        """Wake all waiters. Condition lock held."""
+        self._cond.notify_all()
+        for loop, future in self._async_waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        self._async_waiters.clear()
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,530 @@
+"""Strategies for starting make child processes.
+
+The gRPC server is a large Python process. Forking it to run make means
+copying its page tables on every command, which shows up as several
+milliseconds of latency even for trivial targets. Besides plain
+``subprocess``, two cheaper launchers are available:
+
+- ``posix_spawn`` starts the child with ``os.posix_spawnp``, which glibc
+  implements with ``vfork``-style cloning, so the parent's memory is never
+  duplicated.
+- ``forkserver`` hands the request to a small helper interpreter started once
+  at boot (see ``_spawn_helper``), which forks from its tiny address space.
+
+Every launcher returns an object with the parts of the ``subprocess.Popen``
+interface the server uses: ``pid``, ``stdout``/``stderr`` binary pipes,
+``returncode``, ``poll``, ``wait`` and ``kill``.
+
+Children run in their own session, and ``kill`` kills the whole process group.
+Killing only make would leave its recipes running, still holding the output
+pipes open.
+"""
+
+import abc
+import asyncio
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Sequence
+
+from veridock import metrics
+
+logger = logging.getLogger(__name__)
+
+LAUNCHER_MODES = ("subprocess", "posix_spawn", "forkserver")
+
+_HELPER_PATH = os.path.join(os.path.dirname(__file__), "_spawn_helper.py")
+
+
+def _kill_group(pid: int) -> None:
+    """Kill a child and everything it started."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class _Popen(subprocess.Popen):
+    """``subprocess.Popen`` whose ``kill`` kills the child's process group."""
+
+    def kill(self) -> None:
+        if self.poll() is None:
+            _kill_group(self.pid)
+
+
+class _ChildProcess(abc.ABC):
+    """A child started by a non-subprocess launcher."""
+
+    def __init__(self, pid: int, stdout, stderr):
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode: Optional[int] = None
+
+    @abc.abstractmethod
+    def poll(self) -> Optional[int]:
+        """The exit code, or None while the child runs."""
+
+    @abc.abstractmethod
+    def wait(self) -> int:
+        """Block until the child exits; returns its exit code."""
+
+    @abc.abstractmethod
+    def kill(self) -> None:
+        """Kill the child and its process group, if it still runs."""
+
+    @abc.abstractmethod
+    def watch(self, loop: asyncio.AbstractEventLoop, future: asyncio.Future) -> None:
+        """Set ``future`` to the exit code once the child exits, on ``loop``,
+        without a thread blocked waiting for it."""
+
+
+class _SpawnedProcess(_ChildProcess):
+    """A direct child of this process, started with posix_spawn."""
+
+    def __init__(self, pid: int, stdout, stderr):
+        super().__init__(pid, stdout, stderr)
+        self._lock = threading.Lock()
+
+    def poll(self) -> Optional[int]:
+        with self._lock:
+            if self.returncode is None:
+                pid, status = os.waitpid(self.pid, os.WNOHANG)
+                if pid:
+                    self.returncode = os.waitstatus_to_exitcode(status)
+            return self.returncode
+
+    def wait(self) -> int:
+        if self.returncode is None:
+            # Wait without reaping, so the pid stays ours until poll() reaps
+            # it under the lock
+            try:
+                os.waitid(os.P_PID, self.pid, os.WEXITED | os.WNOWAIT)
+            except ChildProcessError:
+                pass
+            self.poll()
+        return self.returncode
+
+    def kill(self) -> None:
+        # Holding the lock keeps the pid from being reaped (and reused)
+        # between the check and the signal
+        with self._lock:
+            if self.returncode is None:
+                _kill_group(self.pid)
+
+    def watch(self, loop, future):
+        # A pidfd becomes readable once the child has exited
+        try:
+            pidfd = os.pidfd_open(self.pid)
+        except ProcessLookupError:
+            # Already reaped
+            _set_result(future, self.poll())
+            return
+
+        def exited():
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+            _set_result(future, self.poll())
+
+        loop.add_reader(pidfd, exited)
+
+
+class _ForkServerProcess(_ChildProcess):
+    """A child of the fork server; its exit status arrives over the socket."""
+
+    def __init__(self, pid: int, stdout, stderr, server: "ForkServer"):
+        super().__init__(pid, stdout, stderr)
+        self._server = server
+        self._exited = threading.Event()
+        self._watchers = []
+
+    def poll(self) -> Optional[int]:
+        return self.returncode
+
+    def wait(self) -> int:
+        self._exited.wait()
+        return self.returncode
+
+    def kill(self) -> None:
+        if self.returncode is None:
+            self._server.kill(self.pid)
+
+    def watch(self, loop, future):
+        # The exit status is delivered by the fork server's reader thread
+        with self._server._lock:
+            if self.returncode is None:
+                self._watchers.append((loop, future))
+                return
+        _set_result(future, self.returncode)
+
+    def _set_returncode(self, returncode: int) -> None:
+        with self._server._lock:
+            self.returncode = returncode
+            watchers, self._watchers = self._watchers, []
+        self._exited.set()
+        for loop, future in watchers:
+            loop.call_soon_threadsafe(_set_result, future, returncode)
+
+
+class ForkServer:
+    """Client for the fork server helper process.
+
+    The helper is started lazily and restarted if it dies. A reader thread
+    matches replies to pending spawn requests and delivers exit statuses.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._helper: Optional[subprocess.Popen] = None
+        self._ids = itertools.count()
+        self._pending: Dict[int, list] = {}
+        self._processes: Dict[int, _ForkServerProcess] = {}
+
+    def spawn(self, argv: Sequence[str], cwd: Optional[str], env, fds) -> int:
+        """Ask the helper to start ``argv`` with ``fds`` as stdin/out/err."""
+        request_id = next(self._ids)
+        done = threading.Event()
+        slot = [done, None]
+        message = json.dumps({
+            "op": "spawn",
+            "id": request_id,
+            "argv": list(argv),
+            "cwd": cwd,
+            "env": dict(env) if env is not None else None,
+        }).encode("utf-8")
+        with self._lock:
+            sock = self._ensure_started()
+            self._pending[request_id] = slot
+            try:
+                socket.send_fds(sock, [message], fds)
+            except OSError:
+                self._pending.pop(request_id, None)
+                raise
+        done.wait()
+        reply = slot[1]
+        if reply is None:
+            raise OSError("Fork server exited")
+        if reply["op"] == "error":
+            raise OSError(reply["errno"], reply["error"], argv[0])
+        return reply["pid"]
+
+    def attach(self, pid: int, stdout, stderr) -> _ForkServerProcess:
+        """Track a spawned pid, picking up an exit that was already reported."""
+        with self._lock:
+            process = _ForkServerProcess(pid, stdout, stderr, self)
+            self._processes[pid] = process
+            early = self._pending.pop(("exit", pid), None)
+        if early is not None:
+            self._deliver_exit(pid, early)
+        return process
+
+    def kill(self, pid: int) -> None:
+        """Ask the helper to kill a child it has not reaped yet."""
+        message = json.dumps({"op": "kill", "pid": pid}).encode("utf-8")
+        with self._lock:
+            if self._sock is not None:
+                try:
+                    self._sock.send(message)
+                except OSError:
+                    pass
+
+    def close(self) -> None:
+        """Stop the helper; it kills any children still running."""
+        with self._lock:
+            if self._sock is not None:
+                # shutdown() wakes the reader thread and signals EOF to the helper
+                self._sock.shutdown(socket.SHUT_RDWR)
+                self._sock.close()
+                self._sock = None
+            helper, self._helper = self._helper, None
+        if helper is not None:
+            helper.wait()
+
+    def _ensure_started(self) -> socket.socket:
+        """Start the helper if needed. Lock held."""
+        if self._sock is not None:
+            return self._sock
+        if self._helper is not None:
+            # Reap a helper that died
+            self._helper.poll()
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        with child:
+            self._helper = subprocess.Popen(
+                [sys.executable, "-S", _HELPER_PATH, str(child.fileno())],
+                pass_fds=[child.fileno()],
+                stdin=subprocess.DEVNULL,
+            )
+        self._sock = parent
+        threading.Thread(
+            target=self._read_replies, args=(parent,), daemon=True
+        ).start()
+        logger.info("Started fork server helper (pid %d)", self._helper.pid)
+        return parent
+
+    def _read_replies(self, sock: socket.socket) -> None:
+        while True:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                data = b""
+            if not data:
+                break
+            reply = json.loads(data)
+            if reply["op"] == "exit":
+                self._deliver_exit(reply["pid"], reply["returncode"])
+                continue
+            with self._lock:
+                slot = self._pending.pop(reply["id"], None)
+            if slot is not None:
+                slot[1] = reply
+                slot[0].set()
+
+        # The helper is gone: fail waiting spawns and orphaned children
+        with self._lock:
+            if self._sock is sock:
+                logger.warning("Fork server helper exited unexpectedly")
+                self._sock = None
+            pending = [s for k, s in self._pending.items() if isinstance(k, int)]
+            self._pending.clear()
+            processes = list(self._processes.values())
+            self._processes.clear()
+        for slot in pending:
+            slot[0].set()
+        for process in processes:
+            process._set_returncode(-signal.SIGKILL)
+
+    def _deliver_exit(self, pid: int, returncode: int) -> None:
+        with self._lock:
+            process = self._processes.pop(pid, None)
+            if process is None:
+                # The spawn reply has not been attached yet
+                self._pending[("exit", pid)] = returncode
+                return
+        process._set_returncode(returncode)
+
+
+class Launcher:
+    """Starts make children with the configured strategy."""
+
+    def __init__(self, mode: str = "subprocess"):
+        if mode not in LAUNCHER_MODES:
+            raise ValueError(
+                f"Unknown launcher mode {mode!r}, "
+                f"expected one of: {', '.join(LAUNCHER_MODES)}"
+            )
+        self.mode = mode
+        self._fork_server = ForkServer() if mode == "forkserver" else None
+        self._children = weakref.WeakSet()
+
+    @classmethod
+    def from_env(cls) -> "Launcher":
+        """Build a launcher from ``GRPC_LAUNCHER``."""
+        return cls(os.getenv("GRPC_LAUNCHER", "subprocess"))
+
+    def start(self) -> None:
+        """Start any helper process up front, before the first command."""
+        if self._fork_server is not None:
+            with self._fork_server._lock:
+                self._fork_server._ensure_started()
+
+    def close(self) -> None:
+        """Kill children that are still running and stop any helper process."""
+        for process in list(self._children):
+            process.kill()
+        if self._fork_server is not None:
+            self._fork_server.close()
+
+    def spawn(self, cmd: List[str], cwd: Optional[str] = None, env=None):
+        """Start ``cmd`` with piped stdout and stderr."""
+        started = time.perf_counter()
+        process = self._spawn(cmd, cwd, env)
+        metrics.SPAWN_SECONDS.observe(time.perf_counter() - started, self.mode)
+        self._children.add(process)
+        return process
+
+    def _spawn(self, cmd, cwd, env):
+        if self.mode == "subprocess":
+            return _Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd,
+                env=env,
+                start_new_session=True,
+            )
+
+        stdout_read, stdout_write = os.pipe2(os.O_CLOEXEC)
+        stderr_read, stderr_write = os.pipe2(os.O_CLOEXEC)
+        stdin = os.open(os.devnull, os.O_RDONLY | os.O_CLOEXEC)
+        child_fds = [stdin, stdout_write, stderr_write]
+        try:
+            if self.mode == "posix_spawn":
+                pid = self._posix_spawn(cmd, cwd, env, child_fds)
+            else:
+                pid = self._fork_server.spawn(cmd, cwd, env, child_fds)
+        except BaseException:
+            os.close(stdout_read)
+            os.close(stderr_read)
+            raise
+        finally:
+            for fd in child_fds:
+                os.close(fd)
+
+        stdout = os.fdopen(stdout_read, "rb", buffering=0)
+        stderr = os.fdopen(stderr_read, "rb", buffering=0)
+        if self._fork_server is not None:
+            return self._fork_server.attach(pid, stdout, stderr)
+        return _SpawnedProcess(pid, stdout, stderr)
+
+    @staticmethod
+    def _posix_spawn(cmd, cwd, env, child_fds) -> int:
+        if cwd is not None and not os.path.samefile(cwd, os.getcwd()):
+            # posix_spawn cannot change directory; let make do it
+            cmd = [cmd[0], "--no-print-directory", "-C", cwd, *cmd[1:]]
+        file_actions = [
+            (os.POSIX_SPAWN_DUP2, fd, target) for target, fd in enumerate(child_fds)
+        ]
+        return os.posix_spawnp(
+            cmd[0],
+            cmd,
+            os.environ if env is None else env,
+            file_actions=file_actions,
+            setsid=True,
+        )
+
+    async def spawn_async(
+        self, cmd: List[str], cwd: Optional[str] = None, env=None
+    ):
+        """asyncio version of ``spawn``.
+
+        Returns an object with the parts of ``asyncio.subprocess.Process`` the
+        server uses: ``stdout``/``stderr`` stream readers, ``returncode``,
+        ``wait`` and ``kill``. The subprocess launcher uses asyncio's own
+        subprocess support. The others spawn on the loop's default executor,
+        so a slow spawn does not hold up the loop, and their children's exit
+        is watched on the loop, without a thread per child.
+        """
+        started = time.perf_counter()
+        if self.mode == "subprocess":
+            process = _AsyncSubprocess(
+                await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    cwd=cwd,
+                    env=env,
+                    start_new_session=True,
+                )
+            )
+        else:
+            loop = asyncio.get_running_loop()
+            spawning = loop.run_in_executor(None, self._spawn, cmd, cwd, env)
+            try:
+                child = await asyncio.shield(spawning)
+            except asyncio.CancelledError:
+                spawning.add_done_callback(_abandon)
+                raise
+            process = await _AsyncProcess.attach(child)
+        metrics.SPAWN_SECONDS.observe(time.perf_counter() - started, self.mode)
+        self._children.add(process)
+        return process
+
+
+class _AsyncSubprocess:
+    """``asyncio.subprocess.Process`` whose ``kill`` kills the process group."""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self._process = process
+        self.stdout = process.stdout
+        self.stderr = process.stderr
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._process.returncode
+
+    def kill(self) -> None:
+        if self._process.returncode is None:
+            _kill_group(self._process.pid)
+
+    async def wait(self) -> int:
+        return await self._process.wait()
+
+
+class _AsyncProcess:
+    """asyncio view of a child started by a non-subprocess launcher."""
+
+    def __init__(self, process, stdout, stderr, transports):
+        self._process = process
+        self.stdout = stdout
+        self.stderr = stderr
+        self._transports = transports
+        self._exit: Optional[asyncio.Future] = None
+
+    @classmethod
+    async def attach(cls, process: _ChildProcess) -> "_AsyncProcess":
+        loop = asyncio.get_running_loop()
+        readers, transports = [], []
+        for pipe in (process.stdout, process.stderr):
+            reader = asyncio.StreamReader()
+            transport, _ = await loop.connect_read_pipe(
+                lambda reader=reader: asyncio.StreamReaderProtocol(reader), pipe
+            )
+            readers.append(reader)
+            transports.append(transport)
+        return cls(process, readers[0], readers[1], transports)
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._process.poll()
+
+    def kill(self) -> None:
+        self._process.kill()
+
+    async def wait(self) -> int:
+        """Wait for exit without blocking the event loop."""
+        if self._exit is None:
+            loop = asyncio.get_running_loop()
+            self._exit = loop.create_future()
+            self._process.watch(loop, self._exit)
+        try:
+            return await asyncio.shield(self._exit)
+        finally:
+            if self._exit.done():
+                for transport in self._transports:
+                    transport.close()
+
+
+def _abandon(spawning: asyncio.Future) -> None:
+    """Kill a child whose spawn_async call was cancelled while it started."""
+    if spawning.cancelled() or spawning.exception() is not None:
+        return
+    child = spawning.result()
+    child.kill()
+    child.stdout.close()
+    child.stderr.close()
+    # Reap it once it is gone
+    asyncio.get_running_loop().run_in_executor(None, child.wait)
+
+
+def _set_result(future: asyncio.Future, result) -> None:
+    if not future.done():
+        future.set_result(result)
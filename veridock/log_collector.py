@@ -0,0 +1,310 @@
+"""Collector of the output of supervised processes.
+
+One thread waits on the pipes of every process with a selector and reads
+whatever they have written as raw bytes, so a process that logs heavily never
+blocks on a full pipe because the terminal, or the thread relaying it, is slow.
+The output of each component is buffered and appended in batches to its own
+size-rotated file. Mirroring to the console is optional and limited to a
+number of lines per second; the lines over that rate are only in the files.
+"""
+
+import os
+import selectors
+import threading
+import time
+from typing import IO, Callable, Dict, Optional, Union
+
+# Bytes read from a pipe at once
+READ_SIZE = 65536
+
+
+class RotatingLog:
+    """Append-only file rotated to ``<path>.1`` ... once ``max_bytes`` is reached.
+
+    With ``backup_count`` 0 the file is truncated instead. ``max_bytes`` 0
+    disables rotation.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10485760, backup_count: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "ab", buffering=0)
+        self.size = self._file.tell()
+
+    def write(self, data: bytes) -> None:
+        if self.max_bytes and self.size and self.size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self.size += len(data)
+
+    def _rotate(self) -> None:
+        self._file.close()
+        if self.backup_count:
+            for i in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{i}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+            self._file = open(self.path, "ab", buffering=0)
+        else:
+            self._file = open(self.path, "wb", buffering=0)
+        self.size = 0
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _Stream:
+    """Output of one component: its pipe, pending bytes and console state."""
+
+    __slots__ = ("name", "log", "buffer", "since", "partial", "suppressed")
+
+    def __init__(self, name: str, log: Optional[RotatingLog]):
+        self.name = name
+        self.log = log
+        self.buffer = bytearray()
+        # When the oldest byte of buffer was read
+        self.since = 0.0
+        # Start of a line not ended yet, for the console
+        self.partial = b""
+        # Lines not mirrored to the console since the last notice
+        self.suppressed = 0
+
+
+class LogCollector:
+    """Reads the output of components in one thread and writes it to files.
+
+    Output is written to ``<directory>/<name>.log`` when ``directory`` is
+    set, once ``flush_bytes`` are pending or ``flush_interval`` seconds
+    after they were read. With ``echo``, lines are also mirrored to it as
+    ``[name] line``, at most ``console_rate`` per second (0: no limit).
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_bytes: int = 10485760,
+        backup_count: int = 5,
+        echo: Optional[Callable[[str], None]] = None,
+        console_rate: float = 100.0,
+        flush_bytes: int = 65536,
+        flush_interval: float = 0.2,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.echo = echo
+        self.console_rate = console_rate
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self._tokens = console_rate
+        self._refilled = time.monotonic()
+        self._logs: Dict[str, RotatingLog] = {}
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._added = []
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        self._selector.register(self._wake_read, selectors.EVENT_READ)
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+
+    def path(self, name: str) -> Optional[str]:
+        """File the output of component ``name`` is written to."""
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, f"{name}.log")
+
+    def add(self, name: str, pipe: Union[IO[bytes], int]) -> None:
+        """Collect the output of component ``name`` from ``pipe`` until its end.
+
+        The collector owns the pipe from then on and closes it at its end.
+        A component added again, when restarted, goes on in the same file.
+        """
+        fd = pipe if isinstance(pipe, int) else os.dup(pipe.fileno())
+        if not isinstance(pipe, int):
+            pipe.close()
+        os.set_blocking(fd, False)
+        with self._lock:
+            if self._closing:
+                os.close(fd)
+                return
+            self._added.append((fd, name))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="log-collector", daemon=True
+                )
+                self._thread.start()
+        self._wake()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write what the pipes still hold, then close them and the files."""
+        with self._lock:
+            if self._closing:
+                return
+            self._closing = True
+            thread = self._thread
+        self._wake()
+        if thread is not None:
+            thread.join(timeout)
+        if thread is None or not thread.is_alive():
+            self._selector.close()
+            os.close(self._wake_read)
+            os.close(self._wake_write)
+
+    def _wake(self) -> None:
+        try:
+            os.write(self._wake_write, b"\0")
+        except BlockingIOError:
+            # Already woken up
+            pass
+
+    def _log(self, name: str) -> Optional[RotatingLog]:
+        path = self.path(name)
+        if path is None:
+            return None
+        if name not in self._logs:
+            self._logs[name] = RotatingLog(path, self.max_bytes, self.backup_count)
+        return self._logs[name]
+
+    def _register_added(self) -> None:
+        with self._lock:
+            added, self._added = self._added, []
+        for fd, name in added:
+            stream = _Stream(name, self._log(name))
+            self._selector.register(fd, selectors.EVENT_READ, stream)
+
+    def _run(self) -> None:
+        while True:
+            self._register_added()
+            for key, _ in self._selector.select(self._timeout()):
+                if key.fd == self._wake_read:
+                    try:
+                        while os.read(self._wake_read, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    self._read(key)
+            now = time.monotonic()
+            for stream in self._streams():
+                if stream.buffer and (
+                    now - stream.since >= self.flush_interval
+                    or len(stream.buffer) >= self.flush_bytes
+                ):
+                    self._flush(stream)
+            self._report_suppressed()
+            if self._closing:
+                break
+        self._drain()
+
+    def _streams(self):
+        return [
+            key.data
+            for key in self._selector.get_map().values()
+            if key.data is not None
+        ]
+
+    def _timeout(self) -> Optional[float]:
+        """Until the next flush is due, or a suppressed lines notice."""
+        waits = [
+            self.flush_interval - (time.monotonic() - stream.since)
+            for stream in self._streams()
+            if stream.buffer
+        ]
+        if any(stream.suppressed for stream in self._streams()):
+            waits.append(1.0 / self.console_rate)
+        return max(0.0, min(waits)) if waits else None
+
+    def _read(self, key: selectors.SelectorKey) -> Optional[bytes]:
+        """Read from one pipe: None if it has nothing yet, b"" once it has ended."""
+        stream = key.data
+        try:
+            data = os.read(key.fd, READ_SIZE)
+        except BlockingIOError:
+            return None
+        except OSError:
+            data = b""
+        if not data:
+            self._end(key)
+            return data
+        if not stream.buffer:
+            stream.since = time.monotonic()
+        stream.buffer += data
+        if len(stream.buffer) >= self.flush_bytes:
+            self._flush(stream)
+        if self.echo is not None:
+            self._mirror(stream, data)
+        return data
+
+    def _end(self, key: selectors.SelectorKey) -> None:
+        stream = key.data
+        self._selector.unregister(key.fd)
+        os.close(key.fd)
+        self._flush(stream)
+        if self.echo is not None:
+            if stream.partial:
+                self._mirror(stream, b"\n")
+            # Whatever the rate, so the console says output is missing
+            self._report(stream)
+
+    def _flush(self, stream: _Stream) -> None:
+        if stream.buffer and stream.log is not None:
+            stream.log.write(bytes(stream.buffer))
+        stream.buffer.clear()
+
+    def _mirror(self, stream: _Stream, data: bytes) -> None:
+        lines = (stream.partial + data).split(b"\n")
+        stream.partial = lines.pop()
+        for line in lines:
+            if self._take_token():
+                self._report(stream)
+                self.echo(f"[{stream.name}] {line.decode(errors='replace').rstrip()}")
+            else:
+                stream.suppressed += 1
+
+    def _take_token(self) -> bool:
+        if not self.console_rate:
+            return True
+        now = time.monotonic()
+        self._tokens = min(
+            self.console_rate,
+            self._tokens + (now - self._refilled) * self.console_rate,
+        )
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _report(self, stream: _Stream) -> None:
+        if stream.suppressed:
+            where = f" (see {self.path(stream.name)})" if self.directory else ""
+            self.echo(
+                f"[{stream.name}] ... {stream.suppressed} lines not shown{where}"
+            )
+            stream.suppressed = 0
+
+    def _report_suppressed(self) -> None:
+        for stream in self._streams():
+            if stream.suppressed and self._take_token():
+                self._report(stream)
+
+    def _drain(self) -> None:
+        """Read the pipes until they are empty, then close everything."""
+        self._register_added()
+        for key in list(self._selector.get_map().values()):
+            if key.data is None:
+                continue
+            while self._read(key):
+                pass
+            if key.fd in self._selector.get_map():
+                self._end(key)
+        for log in self._logs.values():
+            log.close()
+        self._logs.clear()
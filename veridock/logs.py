@@ -0,0 +1,218 @@
+"""Logging setup shared by the gRPC server and the HTTP gateway.
+
+Records are handed to a background thread through a bounded queue, so request
+threads never wait on the console or the disk. The thread writes them to
+stderr and, optionally, to a size-rotated file, as text or JSON lines.
+
+Configured from the environment:
+
+- ``LOG_LEVEL``: level name (default ``INFO``)
+- ``LOG_FORMAT``: ``text`` or ``json`` (default ``text``)
+- ``LOG_FILE``: file to write as well; empty for none
+- ``LOG_MAX_BYTES`` / ``LOG_BACKUP_COUNT``: rotation of ``LOG_FILE``; a
+  forked child (a gunicorn worker) writes and rotates its own
+  ``<name>.<pid><ext>`` file next to it
+- ``LOG_PAYLOAD_LIMIT``: characters of a payload (command output, request
+  body) kept by ``brief``
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from typing import Optional
+
+# Longest queue of records waiting to be written; further records are dropped
+QUEUE_SIZE = 10000
+
+# LogRecord attributes that are not extra fields
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["_QueueHandler"] = None
+_payload_limit = 500
+
+
+class brief:
+    """Payload for a log message, cut to ``LOG_PAYLOAD_LIMIT`` characters.
+
+    The value is only converted and cut when the record is actually
+    formatted, so passing large output to a disabled level costs nothing:
+
+        logger.debug("stdout: %s", brief(output))
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit: Optional[int] = None):
+        self.value = value
+        self.limit = _payload_limit if limit is None else limit
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... [{len(text) - self.limit} more characters]"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records rather than block when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.dropped:
+                self.queue.put_nowait(
+                    logging.makeLogRecord({
+                        "name": __name__,
+                        "levelno": logging.WARNING,
+                        "levelname": "WARNING",
+                        "msg": "Dropped %d log records, the log queue was full",
+                        "args": (self.dropped,),
+                    })
+                )
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _handlers(log_file: str, json_format: bool):
+    formatter = JsonFormatter() if json_format else logging.Formatter(_TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(
+            logging.handlers.RotatingFileHandler(
+                log_file,
+                maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+                backupCount=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+            )
+        )
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _process_file_handler(
+    handler: logging.handlers.RotatingFileHandler,
+) -> logging.handlers.RotatingFileHandler:
+    """A copy of ``handler`` writing to a file of this process's own.
+
+    Processes rotating one file each on their own would keep writing to the
+    renamed file, or truncate each other's records.
+    """
+    root, ext = os.path.splitext(handler.baseFilename)
+    own = logging.handlers.RotatingFileHandler(
+        f"{root}.{os.getpid()}{ext}",
+        maxBytes=handler.maxBytes,
+        backupCount=handler.backupCount,
+    )
+    own.setFormatter(handler.formatter)
+    own.setLevel(handler.level)
+    handler.close()
+    return own
+
+
+def configure_logging(default_file: str = "", level: Optional[str] = None) -> None:
+    """Send the root logger's records through a queue to a writer thread.
+
+    ``default_file`` is written when ``LOG_FILE`` is not set. ``level``
+    overrides ``LOG_LEVEL``. Calling it again replaces the previous setup.
+    """
+    global _listener, _queue_handler, _payload_limit
+    _payload_limit = int(os.getenv("LOG_PAYLOAD_LIMIT", "500"))
+    log_file = os.getenv("LOG_FILE", default_file)
+    json_format = os.getenv("LOG_FORMAT", "text").lower() == "json"
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+
+    with _lock:
+        _stop()
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+        log_queue = queue.Queue(QUEUE_SIZE)
+        _queue_handler = _QueueHandler(log_queue)
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        _listener = logging.handlers.QueueListener(
+            log_queue, *_handlers(log_file, json_format), respect_handler_level=True
+        )
+        _listener.start()
+
+
+def _stop() -> None:
+    """Flush queued records and stop the writer thread. Module lock held."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def shutdown() -> None:
+    """Write out queued records; called at exit."""
+    with _lock:
+        _stop()
+
+
+def _after_fork_in_child() -> None:
+    """Give a forked child (a gunicorn worker) its own writer thread and file.
+
+    The parent's thread does not exist in the child, so records would pile up
+    in the queue unwritten.
+    """
+    global _listener
+    _lock.release()
+    if _listener is None:
+        return
+    handlers = [
+        _process_file_handler(handler)
+        if isinstance(handler, logging.handlers.RotatingFileHandler)
+        else handler
+        for handler in _listener.handlers
+    ]
+    log_queue = queue.Queue(QUEUE_SIZE)
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+
+
+atexit.register(shutdown)
+os.register_at_fork(
+    before=_lock.acquire,
+    after_in_parent=_lock.release,
+    after_in_child=_after_fork_in_child,
+)
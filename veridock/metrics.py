@@ -0,0 +1,514 @@
+"""Metrics in the Prometheus text format, shared by the gateway and the server.
+
+A small in-process registry rather than a client library: every update is a
+dict lookup and an addition under the metric's own lock, so the metrics can
+stay on in production. Values that other components already keep, such as
+the scheduler's queue depth or the response cache counters, are read by
+collectors when the metrics are scraped instead of being updated on every
+request.
+
+Metrics are per process. With several gunicorn workers, each scrape of the
+gateway reports the worker that answered it.
+"""
+
+import asyncio
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import grpc
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; from a cached reply to a long make run
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0, 60.0, 300.0, 900.0,
+)
+SPAWN_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Label sets kept per metric; further ones are counted under "other", so a
+# client sending arbitrary targets cannot grow the registry without bound
+MAX_SERIES = 500
+OVERFLOW = "other"
+
+# A collector returns (name, type, help, samples) families, samples being
+# (labels, value) pairs
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = (f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._series: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, values: tuple) -> tuple:
+        """Label values to store under; lock held."""
+        if len(values) != len(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {values}")
+        if values in self._series or len(self._series) < MAX_SERIES:
+            return values
+        return (OVERFLOW,) * len(values)
+
+    def _label_dict(self, values: tuple) -> Dict[str, str]:
+        return dict(zip(self.labels, values))
+
+
+class Counter(_Metric):
+    """A value that only goes up, per label set."""
+
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._series.get(labels, 0)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            series = list(self._series.items())
+        return [(self.name, self._label_dict(key), value) for key, value in series]
+
+
+class Gauge(Counter):
+    """A value that goes up and down, per label set."""
+
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, per label set."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            series = self._series.get(labels)
+            return sum(series[:-1]) if series else 0
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        samples = []
+        for key, values in series:
+            labels = self._label_dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), values):
+                cumulative += count
+                bucket_labels = {**labels, "le": _format_value(bound)}
+                samples.append((f"{self.name}_bucket", bucket_labels, cumulative))
+            samples.append((f"{self.name}_count", labels, cumulative))
+            samples.append((f"{self.name}_sum", labels, values[-1]))
+        return samples
+
+
+class Registry:
+    """Metrics and collectors of one process."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[Family]]] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def set_collector(
+        self, name: str, collector: Callable[[], Iterable[Family]]
+    ) -> None:
+        """Call ``collector()`` on every scrape for values kept elsewhere.
+
+        A collector set again under the same ``name`` replaces the previous one.
+        """
+        with self._lock:
+            self._collectors[name] = collector
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.values())
+        lines = []
+        for metric in metrics:
+            samples = metric.samples()
+            if not samples:
+                continue  # not used by this process
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", collector, e)
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(
+                        f"{name}{_format_labels(labels)} {_format_value(value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+# The registry of this process
+REGISTRY = Registry()
+
+# gRPC server: RPCs, from gRPC clients and the HTTP/JSON listener alike
+RPCS = REGISTRY.counter(
+    "veridock_grpc_server_handled_total",
+    "RPCs completed by the gRPC server, by method and status code.",
+    ("method", "code"),
+)
+RPC_SECONDS = REGISTRY.histogram(
+    "veridock_grpc_server_handling_seconds",
+    "Time the gRPC server took to complete an RPC.",
+    ("method",),
+)
+ACTIVE_RPCS = REGISTRY.gauge(
+    "veridock_grpc_server_active_rpcs",
+    "RPCs being handled, each holding a handler thread in thread mode.",
+)
+SERVER_THREADS = REGISTRY.gauge(
+    "veridock_grpc_server_threads",
+    "Size of the gRPC server's handler thread pool (0 in aio mode).",
+)
+
+# gRPC server: make children
+SPAWN_SECONDS = REGISTRY.histogram(
+    "veridock_make_spawn_seconds",
+    "Time taken to start a make child, by launcher.",
+    ("launcher",),
+    buckets=SPAWN_BUCKETS,
+)
+RUNS = REGISTRY.counter(
+    "veridock_make_runs_total",
+    "make runs that ended, by target and exit code (negative: killed by a signal).",
+    ("target", "exit_code"),
+)
+RUN_SECONDS = REGISTRY.histogram(
+    "veridock_make_run_seconds",
+    "Wall time of make runs, from spawn to exit, by target.",
+    ("target",),
+)
+OUTPUT_BYTES = REGISTRY.counter(
+    "veridock_make_output_bytes_total",
+    "Bytes written by make runs, by target and stream.",
+    ("target", "stream"),
+)
+
+# HTTP gateway
+HTTP_REQUESTS = REGISTRY.counter(
+    "veridock_http_requests_total",
+    "Requests answered by the HTTP gateway, by endpoint, method and status.",
+    ("endpoint", "method", "status"),
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "veridock_http_request_seconds",
+    "Time from receiving a gateway request to sending the end of its response.",
+    ("endpoint",),
+)
+HTTP_BYTES = REGISTRY.counter(
+    "veridock_http_response_bytes_total",
+    "Bytes of gateway response bodies with a known length, by endpoint.",
+    ("endpoint",),
+)
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "veridock_gateway_grpc_call_seconds",
+    "Duration of the gateway's unary calls to the gRPC server, by method.",
+    ("method",),
+)
+HTTP_THREADS = REGISTRY.gauge(
+    "veridock_http_threads",
+    "Requests the gateway process can handle at once.",
+)
+
+
+def command_target(cmd: Sequence[str]) -> str:
+    """Target label of a make invocation (``make [target] [args...]``)."""
+    return cmd[1] if len(cmd) > 1 else "default"
+
+
+def record_run(cmd, seconds: float, return_code, stdout_bytes, stderr_bytes):
+    """Count a finished make run."""
+    target = command_target(cmd)
+    exit_code = "unknown" if return_code is None else str(return_code)
+    RUNS.inc(target, exit_code)
+    RUN_SECONDS.observe(seconds, target)
+    OUTPUT_BYTES.inc(target, "stdout", amount=stdout_bytes)
+    OUTPUT_BYTES.inc(target, "stderr", amount=stderr_bytes)
+
+
+def record_rpc(method: str, code, seconds: float) -> None:
+    """Count a completed RPC; ``code`` is a grpc.StatusCode or None for OK."""
+    RPCS.inc(method, code.name if code is not None else "OK")
+    RPC_SECONDS.observe(seconds, method)
+
+
+def _method_name(handler_call_details) -> str:
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+
+def _final_code(context, code):
+    """Status an RPC ended with; a client that went away cancelled it."""
+    code = code or context.code()
+    if code is None and not context.is_active():
+        return grpc.StatusCode.CANCELLED
+    return code
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """Counts and times the RPCs of a thread-pool gRPC server."""
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = _method_name(handler_call_details)
+        if handler.unary_unary is not None:
+            return handler._replace(
+                unary_unary=self._unary(handler.unary_unary, method)
+            )
+        if handler.unary_stream is not None:
+            return handler._replace(
+                unary_stream=self._stream(handler.unary_stream, method)
+            )
+        return handler
+
+    @staticmethod
+    def _unary(behavior, method):
+        def unary(request, context):
+            ACTIVE_RPCS.inc()
+            started = time.perf_counter()
+            code = None
+            try:
+                return behavior(request, context)
+            except Exception:
+                # abort() raises once the status is set
+                code = context.code() or grpc.StatusCode.UNKNOWN
+                raise
+            finally:
+                ACTIVE_RPCS.dec()
+                record_rpc(
+                    method, _final_code(context, code), time.perf_counter() - started
+                )
+
+        return unary
+
+    @staticmethod
+    def _stream(behavior, method):
+        def stream(request, context):
+            ACTIVE_RPCS.inc()
+            started = time.perf_counter()
+            code = None
+            try:
+                yield from behavior(request, context)
+            except Exception:
+                code = context.code() or grpc.StatusCode.UNKNOWN
+                raise
+            finally:
+                ACTIVE_RPCS.dec()
+                record_rpc(
+                    method, _final_code(context, code), time.perf_counter() - started
+                )
+
+        return stream
+
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """Counts and times the RPCs of a grpc.aio server."""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = _method_name(handler_call_details)
+        if handler.unary_unary is not None:
+            return handler._replace(
+                unary_unary=self._unary(handler.unary_unary, method)
+            )
+        if handler.unary_stream is not None:
+            return handler._replace(
+                unary_stream=self._stream(handler.unary_stream, method)
+            )
+        return handler
+
+    @staticmethod
+    def _unary(behavior, method):
+        async def unary(request, context):
+            ACTIVE_RPCS.inc()
+            started = time.perf_counter()
+            code = None
+            try:
+                return await behavior(request, context)
+            except asyncio.CancelledError:
+                code = grpc.StatusCode.CANCELLED
+                raise
+            except Exception:
+                code = context.code() or grpc.StatusCode.UNKNOWN
+                raise
+            finally:
+                ACTIVE_RPCS.dec()
+                record_rpc(
+                    method, code or context.code(), time.perf_counter() - started
+                )
+
+        return unary
+
+    @staticmethod
+    def _stream(behavior, method):
+        async def stream(request, context):
+            ACTIVE_RPCS.inc()
+            started = time.perf_counter()
+            code = None
+            try:
+                async for response in behavior(request, context):
+                    yield response
+            except asyncio.CancelledError:
+                code = grpc.StatusCode.CANCELLED
+                raise
+            except Exception:
+                code = context.code() or grpc.StatusCode.UNKNOWN
+                raise
+            finally:
+                ACTIVE_RPCS.dec()
+                record_rpc(
+                    method, code or context.code(), time.perf_counter() - started
+                )
+
+        return stream
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - " + format, self.address_string(), *args)
+
+
+class MetricsServer:
+    """Serves ``GET /metrics`` on its own port, from a background thread."""
+
+    def __init__(self, host: str, port: int, registry: Registry = REGISTRY):
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.registry = registry
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls, host: str, offset: int = 0) -> Optional["MetricsServer"]:
+        """Server on ``GRPC_METRICS_PORT`` plus ``offset``, or None when it is
+        unset or 0."""
+        port = int(os.getenv("GRPC_METRICS_PORT", "0"))
+        if not port:
+            return None
+        return cls(host, port + offset)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,253 @@
+"""Bounded command output buffering with spill-to-disk and ranged reads."""
+
+import json
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Largest range returned by a single read, well below gRPC's 4 MiB message limit
+MAX_READ_SIZE = 1024 * 1024
+
+_OUTPUT_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class OutputBuffer:
+    """Collects one stream of a command's output with bounded memory use.
+
+    Output is kept in memory up to ``memory_limit`` bytes. Past that, it is
+    spilled to a temp file and only the first and last ``preview`` bytes are
+    kept in memory for the response.
+    """
+
+    def __init__(self, memory_limit: int, preview: int, spool_dir: str):
+        self.memory_limit = memory_limit
+        self.preview = preview
+        self.spool_dir = spool_dir
+        self.size = 0
+        self.path: Optional[str] = None
+        self.registered = False
+        self._memory = bytearray()
+        self._file = None
+        self._head = b""
+        self._tail = bytearray()
+
+    @property
+    def spilled(self) -> bool:
+        """Whether the output outgrew memory and lives in a file."""
+        return self.path is not None
+
+    def write(self, data: bytes) -> None:
+        """Append a chunk of output."""
+        self.size += len(data)
+        if self._file is None:
+            self._memory += data
+            if len(self._memory) > self.memory_limit:
+                self._spill()
+            return
+        self._file.write(data)
+        self._tail += data
+        # Not [:-preview], which keeps everything when preview is 0
+        del self._tail[: max(0, len(self._tail) - self.preview)]
+
+    def close(self) -> None:
+        """Flush and close the spill file, if any."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self) -> None:
+        """Close and delete the spill file unless the store has taken it over."""
+        self.close()
+        if self.path is not None and not self.registered:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def getvalue(self) -> bytes:
+        """The in-memory output (only the complete output when not spilled)."""
+        return bytes(self._memory)
+
+    def text(self) -> str:
+        """Decoded output, or its head and tail with a marker if it spilled."""
+        if not self.spilled:
+            return self._memory.decode("utf-8", errors="replace")
+        omitted = self.size - len(self._head) - len(self._tail)
+        return (
+            self._head.decode("utf-8", errors="replace")
+            + f"\n... [{omitted} bytes omitted, use ReadOutput for the full output]"
+            + " ...\n"
+            + bytes(self._tail).decode("utf-8", errors="replace")
+        )
+
+    def _spill(self) -> None:
+        os.makedirs(self.spool_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix="output-", dir=self.spool_dir)
+        self._file = os.fdopen(fd, "wb")
+        self._file.write(self._memory)
+        self._head = bytes(self._memory[: self.preview])
+        self._tail = bytearray(self._memory[max(0, len(self._memory) - self.preview):])
+        self._memory = bytearray()
+        logger.debug(
+            "Output exceeded %d bytes, spilling to %s", self.memory_limit, self.path
+        )
+
+
+class OutputStore:
+    """Registry of full outputs for responses that had to be truncated.
+
+    Entries expire after ``ttl`` seconds and at most ``max_entries`` are kept;
+    their spill files are deleted on eviction. Ranges are read through
+    ``mmap`` so large outputs are never copied into memory as a whole.
+
+    A ``shared`` store serves outputs registered by other server processes
+    too: every registered output is written to ``spool_dir`` with a
+    ``<output_id>.json`` index, which the other processes read.
+    """
+
+    def __init__(
+        self,
+        memory_limit: int = 1024 * 1024,
+        preview: int = 64 * 1024,
+        spool_dir: Optional[str] = None,
+        ttl: float = 3600.0,
+        max_entries: int = 100,
+        shared: bool = False,
+    ):
+        self.memory_limit = memory_limit
+        self.preview = preview
+        self.spool_dir = spool_dir or os.path.join(
+            tempfile.gettempdir(), "veridock-output"
+        )
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, object]]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, shared: bool = False) -> "OutputStore":
+        """Build a store from ``GRPC_OUTPUT_*`` variables."""
+        return cls(
+            memory_limit=int(
+                os.getenv("GRPC_OUTPUT_MEMORY_LIMIT", str(1024 * 1024))
+            ),
+            preview=int(os.getenv("GRPC_OUTPUT_PREVIEW", str(64 * 1024))),
+            spool_dir=os.getenv("GRPC_OUTPUT_DIR") or None,
+            ttl=float(os.getenv("GRPC_OUTPUT_TTL", "3600")),
+            max_entries=int(os.getenv("GRPC_OUTPUT_MAX_ENTRIES", "100")),
+            shared=shared,
+        )
+
+    def new_buffer(self) -> OutputBuffer:
+        """Create a buffer for one output stream."""
+        return OutputBuffer(self.memory_limit, self.preview, self.spool_dir)
+
+    def register(self, buffers: Dict[str, OutputBuffer]) -> str:
+        """Keep the full output of a finished command; returns its handle."""
+        sources: Dict[str, object] = {}
+        for stream, buffer in buffers.items():
+            buffer.close()
+            buffer.registered = True
+            sources[stream] = buffer.path if buffer.spilled else buffer.getvalue()
+
+        output_id = uuid.uuid4().hex
+        if self.shared:
+            sources = self._publish(output_id, sources)
+        with self._lock:
+            self._expire()
+            self._entries[output_id] = (time.monotonic() + self.ttl, sources)
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+        return output_id
+
+    def read(
+        self, output_id: str, stream: str, offset: int, length: int = 0
+    ) -> Tuple[bytes, int]:
+        """Read ``length`` bytes at ``offset`` of a stored stream.
+
+        Returns the data and the stream's total size. A ``length`` of 0 reads
+        as much as allowed in one call. Raises KeyError for unknown or expired
+        handles.
+        """
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(output_id)
+        sources = entry[1] if entry is not None else self._load_shared(output_id)
+        source = sources[stream]
+
+        length = min(length or MAX_READ_SIZE, MAX_READ_SIZE)
+        if isinstance(source, bytes):
+            return source[offset:offset + length], len(source)
+
+        try:
+            f = open(source, "rb")
+        except FileNotFoundError:
+            # Evicted by the process that registered it
+            raise KeyError(output_id) from None
+        with f:
+            total = os.fstat(f.fileno()).st_size
+            if offset >= total:
+                return b"", total
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                return view[offset:offset + length], total
+
+    def _index_path(self, output_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{output_id}.json")
+
+    def _publish(self, output_id: str, sources: Dict[str, object]) -> Dict[str, object]:
+        """Write ``sources`` to files, and their index; returns the files."""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        paths: Dict[str, object] = {}
+        for stream, source in sources.items():
+            if isinstance(source, bytes):
+                path = os.path.join(self.spool_dir, f"{output_id}.{stream}")
+                with open(path, "wb") as f:
+                    f.write(source)
+                source = path
+            paths[stream] = source
+        index = self._index_path(output_id)
+        with open(index + ".tmp", "w") as f:
+            json.dump({"expires": time.time() + self.ttl, "sources": paths}, f)
+        os.replace(index + ".tmp", index)
+        return paths
+
+    def _load_shared(self, output_id: str) -> Dict[str, object]:
+        """Sources of an output registered by another process."""
+        if not self.shared or not _OUTPUT_ID.fullmatch(output_id):
+            raise KeyError(output_id)
+        try:
+            with open(self._index_path(output_id)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            raise KeyError(output_id) from None
+        if index["expires"] <= time.time():
+            raise KeyError(output_id)
+        return index["sources"]
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for output_id in [k for k, (exp, _) in self._entries.items() if exp <= now]:
+            self._evict(output_id)
+
+    def _evict(self, output_id: str) -> None:
+        _, sources = self._entries.pop(output_id)
+        if self.shared:
+            sources = {**sources, "index": self._index_path(output_id)}
+        for source in sources.values():
+            if isinstance(source, str):
+                try:
+                    os.unlink(source)
+                except OSError:
+                    pass
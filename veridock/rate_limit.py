@@ -0,0 +1,182 @@
+"""Per-client rate limits and load shedding for the HTTP gateway."""
+
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+# Route whose limit applies to every request of a client
+ALL_ROUTES = "*"
+
+
+class Limit(NamedTuple):
+    """Requests per second and the burst allowed above that rate."""
+
+    rate: float
+    burst: float
+
+
+class RateLimited(Exception):
+    """A request over one of its client's limits."""
+
+    def __init__(self, route: str, retry_after: float):
+        super().__init__(f"Rate limit of {route} exceeded")
+        self.route = route
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    """A request over the gateway's in-flight cap."""
+
+    def __init__(self, limit: int, retry_after: float = 1.0):
+        super().__init__(f"Gateway busy: {limit} requests in flight")
+        self.retry_after = retry_after
+
+
+def parse_limits(spec: str) -> Dict[str, Limit]:
+    """Parse a ``HTTP_GATEWAY_RATE_LIMITS`` value.
+
+    The value is a comma-separated ``route=rate[/burst]`` list, with ``rate``
+    in requests per second. A route is a gateway endpoint name,
+    ``run_command:<target>`` for the runs of one target, or ``*`` for every
+    request, e.g. ``*=20/40,run_command=2/10,run_command:test=0.1/1``. The
+    burst defaults to the rate, and is at least one request.
+    """
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        route, value = item.split("=", 1)
+        rate, _, burst = value.partition("/")
+        limits[route.strip()] = Limit(
+            float(rate), max(1.0, float(burst) if burst else float(rate))
+        )
+    return limits
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+
+class RateLimiter:
+    """Token buckets per client and route, and a cap on requests in flight.
+
+    A request is counted against every limit that matches it: ``*``, its
+    endpoint and, for a command, ``<endpoint>:<target>``. It is admitted only
+    if each of its client's buckets holds a token. Buckets of clients not
+    seen for a while are dropped once more than ``max_clients`` are tracked;
+    a dropped bucket was full anyway.
+
+    ``max_in_flight`` (0 for no cap) bounds the requests being handled at
+    once across all clients; further requests are shed straight away rather
+    than queued behind them.
+
+    The state is per process: with several gunicorn workers each enforces
+    the limits on its own.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, Limit],
+        max_in_flight: int = 0,
+        max_clients: int = 10000,
+    ):
+        self.limits = limits
+        self.max_in_flight = max_in_flight
+        self.max_clients = max_clients
+        self.in_flight = 0
+        self.rejected: Counter = Counter()
+
+        self._buckets: "OrderedDict[tuple, _Bucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """Build a limiter from ``HTTP_GATEWAY_RATE_LIMITS`` and
+        ``HTTP_GATEWAY_MAX_IN_FLIGHT``."""
+        return cls(
+            parse_limits(os.getenv("HTTP_GATEWAY_RATE_LIMITS", "*=20/40")),
+            max_in_flight=int(os.getenv("HTTP_GATEWAY_MAX_IN_FLIGHT", "64")),
+            max_clients=int(os.getenv("HTTP_GATEWAY_RATE_LIMIT_CLIENTS", "10000")),
+        )
+
+    def routes(self, endpoint: str, target: Optional[str] = None) -> List[str]:
+        """Configured limits that apply to a request, least specific first."""
+        routes = [ALL_ROUTES, endpoint]
+        if target:
+            routes.append(f"{endpoint}:{target}")
+        return [route for route in routes if route in self.limits]
+
+    def limits_targets(self, endpoint: str) -> bool:
+        """Whether some limit applies to the runs of one target of ``endpoint``."""
+        prefix = f"{endpoint}:"
+        return any(route.startswith(prefix) for route in self.limits)
+
+    def check(self, client: str, endpoint: str, target: Optional[str] = None):
+        """Take a token from each of the client's buckets for a request.
+
+        Raises RateLimited, without taking any token, if one is empty.
+        """
+        routes = self.routes(endpoint, target)
+        if not routes:
+            return
+        now = time.monotonic()
+        with self._lock:
+            buckets = [(route, self._bucket(client, route, now)) for route in routes]
+            for route, bucket in buckets:
+                limit = self.limits[route]
+                bucket.tokens = min(
+                    limit.burst, bucket.tokens + (now - bucket.updated) * limit.rate
+                )
+                bucket.updated = now
+            for route, bucket in reversed(buckets):
+                if bucket.tokens < 1:
+                    self.rejected[f"rate_limited:{route}"] += 1
+                    rate = self.limits[route].rate
+                    retry_after = (1 - bucket.tokens) / rate if rate > 0 else 60.0
+                    raise RateLimited(route, retry_after)
+            for _, bucket in buckets:
+                bucket.tokens -= 1
+
+    def acquire(self) -> None:
+        """Count a request in flight; raises Overloaded over the cap."""
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.rejected["overloaded"] += 1
+                raise Overloaded(self.max_in_flight)
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict:
+        """Configured limits, requests in flight and rejections so far."""
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "clients": len({client for client, _ in self._buckets}),
+                "limits": {
+                    route: {"rate": limit.rate, "burst": limit.burst}
+                    for route, limit in self.limits.items()
+                },
+                "rejected": dict(self.rejected),
+            }
+
+    def _bucket(self, client: str, route: str, now: float) -> _Bucket:
+        """The client's bucket for a route, created full. Lock held."""
+        key = (client, route)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self.limits[route].burst, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
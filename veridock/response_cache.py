@@ -0,0 +1,219 @@
+"""Response cache of the HTTP gateway for read-only routes."""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Value of the X-Gateway-Cache response header
+HIT = "HIT"
+STALE = "STALE"
+MISS = "MISS"
+BYPASS = "BYPASS"
+
+CACHE_HEADER = "X-Gateway-Cache"
+
+
+class CachedResponse(NamedTuple):
+    """A response body and the headers that go with it."""
+
+    body: bytes
+    headers: Tuple[Tuple[str, str], ...] = ()
+
+
+class _Entry(NamedTuple):
+    response: CachedResponse
+    stored_at: float
+    ttl: float
+    size: int
+
+
+def parse_routes(spec: str) -> Dict[str, float]:
+    """Parse a ``HTTP_GATEWAY_CACHE_ROUTES`` value.
+
+    The value is a comma-separated ``route=seconds`` list. A route is a gateway
+    endpoint name, or ``run_command:<target>`` for the runs of one target, e.g.
+    ``list_targets=30,run_command:help=300``.
+    """
+    routes = {}
+    for item in spec.split(","):
+        if "=" in item:
+            route, seconds = item.split("=", 1)
+            routes[route.strip()] = float(seconds)
+    return routes
+
+
+def _directives(cache_control: str) -> Dict[str, Optional[str]]:
+    directives = {}
+    for item in cache_control.split(","):
+        name, _, value = item.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+class ResponseCache:
+    """Thread-safe TTL + LRU cache of gateway responses.
+
+    Each route has its own TTL. Once an entry expires it is still served for
+    ``stale`` seconds while one background call refreshes it
+    (stale-while-revalidate), so clients polling a route never wait on the
+    gRPC server. Entries are evicted least recently used first to stay within
+    ``max_entries`` and ``max_bytes``.
+
+    Clients can ask for fresher data with ``Cache-Control``: ``no-cache``
+    skips the cached entry and replaces it, ``max-age=<seconds>`` accepts only
+    an entry at most that old, and ``no-store`` bypasses the cache entirely.
+    """
+
+    def __init__(
+        self,
+        routes: Dict[str, float],
+        stale: float = 30.0,
+        max_entries: int = 256,
+        max_bytes: int = 8 * 1024 * 1024,
+    ):
+        self.routes = routes
+        self.stale = stale
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """Build a cache from ``HTTP_GATEWAY_CACHE_*`` variables.
+
+        Returns None when ``HTTP_GATEWAY_CACHE_ROUTES`` is empty.
+        """
+        routes = parse_routes(
+            os.getenv("HTTP_GATEWAY_CACHE_ROUTES", "list_targets=10,scheduler_stats=1")
+        )
+        if not routes:
+            return None
+        return cls(
+            routes,
+            stale=float(os.getenv("HTTP_GATEWAY_CACHE_STALE", "30")),
+            max_entries=int(os.getenv("HTTP_GATEWAY_CACHE_MAX_ENTRIES", "256")),
+            max_bytes=int(
+                os.getenv("HTTP_GATEWAY_CACHE_MAX_BYTES", str(8 * 1024 * 1024))
+            ),
+        )
+
+    def ttl(self, endpoint: str, target: Optional[str] = None) -> Optional[float]:
+        """TTL of an endpoint's responses (for ``target``), or None if not cached."""
+        if target is not None and f"{endpoint}:{target}" in self.routes:
+            return self.routes[f"{endpoint}:{target}"]
+        return self.routes.get(endpoint)
+
+    def fetch(
+        self,
+        key: str,
+        ttl: float,
+        load: Callable[[], Tuple[CachedResponse, bool]],
+        cache_control: str = "",
+    ) -> Tuple[CachedResponse, str, float]:
+        """Return (response, cache status, age in seconds) for ``key``.
+
+        ``load()`` produces the response and whether it may be cached; it is
+        called here on a miss, or on a background thread to refresh a stale
+        entry. Its exceptions propagate on a miss.
+        """
+        directives = _directives(cache_control)
+        if "no-store" in directives:
+            response, _ = load()
+            return response, BYPASS, 0.0
+
+        max_age = None
+        if directives.get("max-age") is not None:
+            try:
+                max_age = float(directives["max-age"])
+            except ValueError:
+                pass
+        if "no-cache" in directives:
+            max_age = -1.0
+
+        now = time.monotonic()
+        refresh = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.stored_at
+                if max_age is not None and age > max_age:
+                    entry = None
+                elif age < entry.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.response, HIT, age
+                elif age < entry.ttl + self.stale:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    refresh = key not in self._refreshing
+                    self._refreshing.add(key)
+                else:
+                    entry = None
+            if entry is None:
+                self.misses += 1
+
+        if entry is not None:
+            if refresh:
+                threading.Thread(
+                    target=self._refresh, args=(key, ttl, load), daemon=True
+                ).start()
+            return entry.response, STALE, age
+
+        response, cacheable = load()
+        if cacheable:
+            self._put(key, ttl, response)
+        return response, MISS, 0.0
+
+    def clear(self) -> None:
+        """Drop every cached response."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _refresh(self, key, ttl, load) -> None:
+        try:
+            response, cacheable = load()
+            if cacheable:
+                self._put(key, ttl, response)
+        except Exception as e:
+            logger.warning("Refreshing cached response %s failed: %s", key, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _put(self, key: str, ttl: float, response: CachedResponse) -> None:
+        """Store a response, evicting least recently used entries to fit."""
+        size = len(key) + len(response.body)
+        if size > self.max_bytes:
+            logger.debug("Response of %d bytes is too large to cache", size)
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = _Entry(response, time.monotonic(), ttl, size)
+            self._bytes += size
+            while (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
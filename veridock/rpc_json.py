@@ -0,0 +1,222 @@
+"""Proto3 JSON mapping of the service's messages, for the HTTP routes.
+
+Requests are checked against the message schema before they are converted,
+so a client is told about every wrong field at once, by path, instead of
+getting the first error of ``json_format``. JSON is encoded with ``orjson``
+when it is installed.
+"""
+
+import inspect
+import json
+from typing import Any, List
+
+from google.protobuf import json_format
+from google.protobuf.descriptor import FieldDescriptor
+
+try:
+    import orjson
+except ImportError:  # optional: pip install 'veridock[json]'
+    orjson = None
+
+# Response fields are written even when they hold the default value, so
+# clients see e.g. ``"return_code": 0``. The option was renamed in protobuf 5.
+if "always_print_fields_with_no_presence" in inspect.signature(
+    json_format.MessageToDict
+).parameters:
+    PRINT_DEFAULTS = {"always_print_fields_with_no_presence": True}
+else:
+    PRINT_DEFAULTS = {"including_default_value_fields": True}
+
+_INT32_RANGE = {
+    FieldDescriptor.TYPE_INT32: (-(2**31), 2**31 - 1),
+    FieldDescriptor.TYPE_SINT32: (-(2**31), 2**31 - 1),
+    FieldDescriptor.TYPE_SFIXED32: (-(2**31), 2**31 - 1),
+    FieldDescriptor.TYPE_UINT32: (0, 2**32 - 1),
+    FieldDescriptor.TYPE_FIXED32: (0, 2**32 - 1),
+}
+_INT64_RANGE = {
+    FieldDescriptor.TYPE_INT64: (-(2**63), 2**63 - 1),
+    FieldDescriptor.TYPE_SINT64: (-(2**63), 2**63 - 1),
+    FieldDescriptor.TYPE_SFIXED64: (-(2**63), 2**63 - 1),
+    FieldDescriptor.TYPE_UINT64: (0, 2**64 - 1),
+    FieldDescriptor.TYPE_FIXED64: (0, 2**64 - 1),
+}
+_FLOAT_TYPES = (FieldDescriptor.TYPE_DOUBLE, FieldDescriptor.TYPE_FLOAT)
+_SPECIAL_FLOATS = ("NaN", "Infinity", "-Infinity")
+
+
+class SchemaError(ValueError):
+    """A JSON request that does not match its message."""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def dumps(data: Any) -> bytes:
+    """Encode JSON data, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def loads(body: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def message_dict(message) -> dict:
+    """A message as JSON data, with proto field names and default values."""
+    return json_format.MessageToDict(
+        message, preserving_proto_field_name=True, **PRINT_DEFAULTS
+    )
+
+
+def message_json(message) -> bytes:
+    return dumps(message_dict(message))
+
+
+def is_repeated(field) -> bool:
+    # FieldDescriptor.label was replaced by is_repeated in protobuf 6
+    if hasattr(field, "is_repeated"):
+        return field.is_repeated
+    return field.label == field.LABEL_REPEATED
+
+
+def _is_map(field) -> bool:
+    return (
+        field.type == field.TYPE_MESSAGE
+        and field.message_type.GetOptions().map_entry
+    )
+
+
+def _kind(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, list):
+        return "array"
+    return "object"
+
+
+def _integer(value):
+    """Integer value of a JSON number or numeric string, else None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, int):
+        return value
+    return None
+
+
+def _check_value(field, value, path: str, errors: List[str]) -> None:
+    """Check one (non-repeated) value of a field."""
+    if value is None:
+        return
+    kind = field.type
+    if kind == field.TYPE_MESSAGE:
+        if field.message_type.full_name.startswith("google.protobuf."):
+            return  # well-known types have their own JSON forms
+        if not isinstance(value, dict):
+            errors.append(f"{path}: expected an object, got {_kind(value)}")
+        else:
+            errors.extend(validate(field.message_type, value, path + "."))
+    elif kind in (field.TYPE_STRING, field.TYPE_BYTES):
+        if not isinstance(value, str):
+            errors.append(f"{path}: expected a string, got {_kind(value)}")
+    elif kind == field.TYPE_BOOL:
+        if not isinstance(value, bool):
+            errors.append(f"{path}: expected a boolean, got {_kind(value)}")
+    elif kind == field.TYPE_ENUM:
+        names = field.enum_type.values_by_name
+        if isinstance(value, str):
+            if value not in names:
+                errors.append(
+                    f"{path}: expected one of {', '.join(names)}, got {value!r}"
+                )
+        elif _integer(value) is None:
+            errors.append(f"{path}: expected an enum name, got {_kind(value)}")
+    elif kind in _FLOAT_TYPES:
+        if isinstance(value, str) and value in _SPECIAL_FLOATS:
+            return
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            errors.append(f"{path}: expected a number, got {_kind(value)}")
+        elif isinstance(value, str):
+            try:
+                float(value)
+            except ValueError:
+                errors.append(f"{path}: expected a number, got {value!r}")
+    else:
+        bounds = _INT32_RANGE.get(kind) or _INT64_RANGE.get(kind)
+        number = _integer(value)
+        if number is None:
+            errors.append(f"{path}: expected an integer, got {_kind(value)}")
+        elif bounds and not bounds[0] <= number <= bounds[1]:
+            errors.append(f"{path}: {number} is out of range")
+
+
+def validate(descriptor, data: Any, prefix: str = "") -> List[str]:
+    """Check JSON data against a message descriptor; returns the errors.
+
+    Fields may be given by their proto or JSON (lowerCamelCase) name. Unknown
+    fields, values of the wrong type, unknown enum names and integers out of
+    range are reported with the path of the field, e.g.
+    ``commands[1].args[0]: expected a string, got number``.
+    """
+    if not isinstance(data, dict):
+        path = prefix.rstrip(".") or "request"
+        return [f"{path}: expected an object, got {_kind(data)}"]
+    fields = dict(descriptor.fields_by_name)
+    fields.update({field.json_name: field for field in descriptor.fields})
+    errors = []
+    for key, value in data.items():
+        path = prefix + key
+        field = fields.get(key)
+        if field is None:
+            errors.append(f"{path}: unknown field")
+        elif value is None:
+            continue
+        elif _is_map(field):
+            if not isinstance(value, dict):
+                errors.append(f"{path}: expected an object, got {_kind(value)}")
+                continue
+            value_field = field.message_type.fields_by_name["value"]
+            for name, item in value.items():
+                _check_value(value_field, item, f"{path}[{name!r}]", errors)
+        elif is_repeated(field):
+            if not isinstance(value, list):
+                errors.append(f"{path}: expected an array, got {_kind(value)}")
+                continue
+            for index, item in enumerate(value):
+                _check_value(field, item, f"{path}[{index}]", errors)
+        else:
+            _check_value(field, value, path, errors)
+    return errors
+
+
+def parse(request_class, body: bytes):
+    """Request message from a JSON body; an empty body is an empty message.
+
+    Raises SchemaError (a ValueError) listing every field that does not fit
+    the message, or a ValueError for a body that is not JSON.
+    """
+    data = loads(body) if body.strip() else {}
+    errors = validate(request_class.DESCRIPTOR, data)
+    if errors:
+        raise SchemaError(errors)
+    try:
+        return json_format.ParseDict(data, request_class())
+    except json_format.ParseError as e:
+        raise SchemaError([str(e)]) from e
@@ -0,0 +1,293 @@
+"""Admission control and scheduling of make executions."""
+
+import asyncio
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest first
+PRIORITIES = ("interactive", "batch")
+
+
+class QueueFullError(Exception):
+    """Raised when a request cannot be queued because the queue is full."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _parse_mapping(spec: str, cast=int) -> Dict[str, float]:
+    """Parse ``"a=1,b=2"`` into a dict."""
+    result = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        result[key.strip()] = cast(value.strip())
+    return result
+
+
+class Ticket:
+    """A request waiting for, or holding, an execution slot."""
+
+    def __init__(self, target: str, caller: str, priority: str, seq: int):
+        self.target = target
+        self.caller = caller
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self._event = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._future: Optional[asyncio.Future] = None
+
+    @property
+    def wait_time(self) -> float:
+        """Seconds spent in the queue (so far, if still waiting)."""
+        end = self.granted_at if self.granted_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+    def _grant(self) -> None:
+        self.granted_at = time.monotonic()
+        self._event.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._resolve_future)
+
+    def _resolve_future(self) -> None:
+        if self._future is not None and not self._future.done():
+            self._future.set_result(None)
+
+
+class Scheduler:
+    """Admit make executions under global and per-target concurrency caps.
+
+    Waiting requests are ordered by priority class first. Within a class,
+    callers are served by weighted fair queuing: each grant advances the
+    caller's virtual time by ``1 / weight`` and the waiting caller with the
+    lowest virtual time goes next, so one chatty client cannot starve others.
+    Lower classes may run when every higher-class request is blocked on a
+    per-target cap. The queue is bounded; when it is full, submission fails
+    with a retry hint derived from recent run times.
+
+    ``on_saturation(saturated)`` is called, with the scheduler's lock held,
+    whenever ``saturated()`` changes.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 10,
+        max_queue: int = 50,
+        target_limits: Optional[Dict[str, int]] = None,
+        batch_targets: Optional[List[str]] = None,
+        caller_weights: Optional[Dict[str, float]] = None,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.target_limits = target_limits or {}
+        self.batch_targets = set(batch_targets or ())
+        self.caller_weights = caller_weights or {}
+        self.on_saturation: Optional[Callable[[bool], None]] = None
+
+        self._lock = threading.Lock()
+        self._queues: Dict[str, List[Ticket]] = {p: [] for p in PRIORITIES}
+        self._running: Dict[str, int] = {}
+        self._running_total = 0
+        self._vtime: Dict[str, float] = {}
+        self._global_vtime = 0.0
+        self._seq = itertools.count()
+        self._saturated = False
+
+        # Monitoring counters
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._avg_runtime = 1.0
+
+    @classmethod
+    def from_env(cls) -> "Scheduler":
+        """Build a scheduler from ``GRPC_*`` scheduling variables."""
+        batch = os.getenv("GRPC_BATCH_TARGETS", "")
+        return cls(
+            max_concurrent=int(os.getenv("GRPC_MAX_CONCURRENT", "10")),
+            max_queue=int(os.getenv("GRPC_MAX_QUEUE", "50")),
+            target_limits=_parse_mapping(os.getenv("GRPC_TARGET_LIMITS", "")),
+            batch_targets=[t.strip() for t in batch.split(",") if t.strip()],
+            caller_weights=_parse_mapping(
+                os.getenv("GRPC_CALLER_WEIGHTS", ""), cast=float
+            ),
+        )
+
+    def priority_for(self, target: str, requested: Optional[str] = None) -> str:
+        """Resolve the priority class for a request."""
+        if requested in PRIORITIES:
+            return requested
+        return "batch" if target in self.batch_targets else "interactive"
+
+    def submit(self, target: str, caller: str, priority: str) -> Ticket:
+        """Queue a request; it may be granted immediately.
+
+        Raises QueueFullError when the request would have to wait and the
+        queue is already at capacity.
+        """
+        with self._lock:
+            ticket = Ticket(target, caller, priority, next(self._seq))
+            if self._queued() >= self.max_queue and not self._can_run(target):
+                self.rejected += 1
+                raise QueueFullError(
+                    f"Execution queue is full ({self.max_queue} waiting)",
+                    self._retry_after(),
+                )
+            # A caller that was idle re-enters at the current virtual time
+            self._vtime[caller] = max(
+                self._vtime.get(caller, 0.0), self._global_vtime
+            )
+            self._queues[priority].append(ticket)
+            self._dispatch()
+            return ticket
+
+    def cancel(self, ticket: Ticket) -> None:
+        """Withdraw a waiting ticket, or release it if it was already granted."""
+        with self._lock:
+            queue = self._queues[ticket.priority]
+            if ticket in queue:
+                queue.remove(ticket)
+                self._update_saturation()
+                return
+        if ticket.granted_at is not None:
+            self.release(ticket)
+
+    def release(self, ticket: Ticket) -> None:
+        """Return a granted ticket's slot and admit the next request."""
+        with self._lock:
+            self._running[ticket.target] -= 1
+            self._running_total -= 1
+            runtime = time.monotonic() - ticket.granted_at
+            self._avg_runtime = 0.8 * self._avg_runtime + 0.2 * runtime
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, target: str, caller: str, priority: str, is_active=None):
+        """Hold an execution slot for the duration of the block.
+
+        ``is_active`` is polled while waiting, so a cancelled RPC leaves the
+        queue instead of running after its caller has gone away.
+        """
+        ticket = self.submit(target, caller, priority)
+        try:
+            while not ticket._event.wait(0.5):
+                if is_active is not None and not is_active():
+                    raise TimeoutError("Caller went away while queued")
+        except BaseException:
+            self.cancel(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def slot_async(self, target: str, caller: str, priority: str):
+        """asyncio version of ``slot``; waiting does not block a thread."""
+        ticket = self.submit(target, caller, priority)
+        loop = asyncio.get_running_loop()
+        ticket._loop = loop
+        ticket._future = loop.create_future()
+        if ticket._event.is_set():
+            ticket._resolve_future()
+        try:
+            await ticket._future
+        except BaseException:
+            self.cancel(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def saturated(self) -> bool:
+        """Whether every slot is taken and the queue is full, so that a new
+        request would be rejected whatever its target."""
+        with self._lock:
+            return self._saturated
+
+    def stats(self) -> Dict[str, object]:
+        """Snapshot of queue depth, running executions and wait times."""
+        with self._lock:
+            return {
+                "running": self._running_total,
+                "running_by_target": {
+                    t: n for t, n in self._running.items() if n
+                },
+                "queued": self._queued(),
+                "queued_by_priority": {
+                    p: len(q) for p, q in self._queues.items()
+                },
+                "oldest_wait": max(
+                    (t.wait_time for q in self._queues.values() for t in q),
+                    default=0.0,
+                ),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+    def _queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _can_run(self, target: str) -> bool:
+        if self._running_total >= self.max_concurrent:
+            return False
+        limit = self.target_limits.get(target)
+        return limit is None or self._running.get(target, 0) < limit
+
+    def _retry_after(self) -> int:
+        waves = (self._queued() + 1) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(waves * self._avg_runtime))
+
+    def _update_saturation(self) -> None:
+        """Report a change of ``saturated()`` to ``on_saturation``. Lock held."""
+        saturated = (
+            self._running_total >= self.max_concurrent
+            and self._queued() >= self.max_queue
+        )
+        if saturated != self._saturated:
+            self._saturated = saturated
+            if self.on_saturation is not None:
+                self.on_saturation(saturated)
+
+    def _dispatch(self) -> None:
+        """Grant slots to waiting tickets while capacity allows. Lock held."""
+        while self._running_total < self.max_concurrent:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            self._queues[ticket.priority].remove(ticket)
+            self._running[ticket.target] = self._running.get(ticket.target, 0) + 1
+            self._running_total += 1
+
+            weight = self.caller_weights.get(ticket.caller, 1.0)
+            self._global_vtime = self._vtime[ticket.caller]
+            self._vtime[ticket.caller] += 1.0 / weight
+
+            ticket._grant()
+            self.admitted += 1
+            self.total_wait += ticket.wait_time
+            self.max_wait = max(self.max_wait, ticket.wait_time)
+        self._update_saturation()
+
+    def _next_ticket(self) -> Optional[Ticket]:
+        for priority in PRIORITIES:
+            candidates = [t for t in self._queues[priority] if self._can_run(t.target)]
+            if candidates:
+                return min(candidates, key=lambda t: (self._vtime[t.caller], t.seq))
+        return None
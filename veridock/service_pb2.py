@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: service.proto
+# Protobuf Python Version: 7.35.1
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    7,
+    35,
+    1,
+    '',
+    'service.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rservice.proto\x12\x08makefile\"/\n\x0e\x43ommandRequest\x12\x0f\n\x07\x63ommand\x18\x01 \x01(\t\x12\x0c\n\x04\x61rgs\x18\x02 \x03(\t\"\x94\x01\n\x0f\x43ommandResponse\x12\x0e\n\x06output\x18\x01 \x01(\t\x12\r\n\x05\x65rror\x18\x02 \x01(\t\x12\x13\n\x0breturn_code\x18\x03 \x01(\x05\x12\x11\n\ttruncated\x18\x04 \x01(\x08\x12\x11\n\toutput_id\x18\x05 \x01(\t\x12\x13\n\x0boutput_size\x18\x06 \x01(\x04\x12\x12\n\nerror_size\x18\x07 \x01(\x04\"\xae\x01\n\x12\x43ommandOutputChunk\x12\x10\n\x08sequence\x18\x01 \x01(\x04\x12\x33\n\x06stream\x18\x02 \x01(\x0e\x32#.makefile.CommandOutputChunk.Stream\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\t\x12\x0c\n\x04\x64one\x18\x04 \x01(\x08\x12\x13\n\x0breturn_code\x18\x05 \x01(\x05\" \n\x06Stream\x12\n\n\x06STDOUT\x10\x00\x12\n\n\x06STDERR\x10\x01\"\x14\n\x12ListTargetsRequest\"Q\n\x06Target\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x13\n\x0b\x64\x65scription\x18\x02 \x01(\t\x12\x15\n\rprerequisites\x18\x03 \x03(\t\x12\r\n\x05phony\x18\x04 \x01(\x08\"8\n\x13ListTargetsResponse\x12!\n\x07targets\x18\x01 \x03(\x0b\x32\x10.makefile.Target\"\x17\n\x15SchedulerStatsRequest\"\xad\x03\n\x0eSchedulerStats\x12\x0f\n\x07running\x18\x01 \x01(\x05\x12\x0e\n\x06queued\x18\x02 \x01(\x05\x12H\n\x11running_by_target\x18\x03 \x03(\x0b\x32-.makefile.SchedulerStats.RunningByTargetEntry\x12J\n\x12queued_by_priority\x18\x04 \x03(\x0b\x32..makefile.SchedulerStats.QueuedByPriorityEntry\x12\x1b\n\x13oldest_wait_seconds\x18\x05 \x01(\x01\x12\x18\n\x10\x61vg_wait_seconds\x18\x06 \x01(\x01\x12\x18\n\x10max_wait_seconds\x18\x07 \x01(\x01\x12\x10\n\x08\x61\x64mitted\x18\x08 \x01(\x04\x12\x10\n\x08rejected\x18\t \x01(\x04\x1a\x36\n\x14RunningByTargetEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x05:\x02\x38\x01\x1a\x37\n\x15QueuedByPriorityEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x05:\x02\x38\x01\"{\n\x11ReadOutputRequest\x12\x11\n\toutput_id\x18\x01 \x01(\t\x12\x33\n\x06stream\x18\x02 \x01(\x0e\x32#.makefile.CommandOutputChunk.Stream\x12\x0e\n\x06offset\x18\x03 \x01(\x04\x12\x0e\n\x06length\x18\x04 \x01(\x04\"L\n\x0bOutputRange\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\x0c\x12\x0e\n\x06offset\x18\x02 \x01(\x04\x12\x12\n\ntotal_size\x18\x03 \x01(\x04\x12\x0b\n\x03\x65of\x18\x04 \x01(\x08\"M\n\x0c\x42\x61tchCommand\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0f\n\x07\x63ommand\x18\x02 \x01(\t\x12\x0c\n\x04\x61rgs\x18\x03 \x03(\t\x12\x12\n\ndepends_on\x18\x04 \x03(\t\"a\n\x0c\x42\x61tchRequest\x12(\n\x08\x63ommands\x18\x01 \x03(\x0b\x32\x16.makefile.BatchCommand\x12\x14\n\x0cmax_parallel\x18\x02 \x01(\x05\x12\x11\n\tfail_fast\x18\x03 \x01(\x08\"\xd9\x01\n\x0b\x42\x61tchResult\x12\n\n\x02id\x18\x01 \x01(\t\x12,\n\x06status\x18\x02 \x01(\x0e\x32\x1c.makefile.BatchResult.Status\x12+\n\x08response\x18\x03 \x01(\x0b\x32\x19.makefile.CommandResponse\x12\x17\n\x0fstarted_seconds\x18\x04 \x01(\x01\x12\x18\n\x10\x64uration_seconds\x18\x05 \x01(\x01\"0\n\x06Status\x12\r\n\tSUCCEEDED\x10\x00\x12\n\n\x06\x46\x41ILED\x10\x01\x12\x0b\n\x07SKIPPED\x10\x02\"u\n\rBatchResponse\x12&\n\x07results\x18\x01 \x03(\x0b\x32\x15.makefile.BatchResult\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\x14\n\x0cwall_seconds\x18\x03 \x01(\x01\x12\x15\n\rtotal_seconds\x18\x04 \x01(\x01\"\x9a\x02\n\x03Job\x12\x0e\n\x06job_id\x18\x01 \x01(\t\x12\"\n\x05state\x18\x02 \x01(\x0e\x32\x13.makefile.Job.State\x12\x0f\n\x07\x63ommand\x18\x03 \x01(\t\x12\x0c\n\x04\x61rgs\x18\x04 \x03(\t\x12+\n\x08response\x18\x05 \x01(\x0b\x32\x19.makefile.CommandResponse\x12\x14\n\x0csubmitted_at\x18\x06 \x01(\x01\x12\x12\n\nstarted_at\x18\x07 \x01(\x01\x12\x13\n\x0b\x66inished_at\x18\x08 \x01(\x01\"T\n\x05State\x12\n\n\x06QUEUED\x10\x00\x12\x0b\n\x07RUNNING\x10\x01\x12\r\n\tSUCCEEDED\x10\x02\x12\n\n\x06\x46\x41ILED\x10\x03\x12\r\n\tCANCELLED\x10\x04\x12\x08\n\x04LOST\x10\x05\"\x1c\n\nJobRequest\x12\x0e\n\x06job_id\x18\x01 \x01(\t\"9\n\x0eWaitJobRequest\x12\x0e\n\x06job_id\x18\x01 \x01(\t\x12\x17\n\x0ftimeout_seconds\x18\x02 \x01(\x01\x32\xa3\x05\n\x0fMakefileService\x12\x43\n\nRunCommand\x12\x18.makefile.CommandRequest\x1a\x19.makefile.CommandResponse\"\x00\x12N\n\x10RunCommandStream\x12\x18.makefile.CommandRequest\x1a\x1c.makefile.CommandOutputChunk\"\x00\x30\x01\x12L\n\x0bListTargets\x12\x1c.makefile.ListTargetsRequest\x1a\x1d.makefile.ListTargetsResponse\"\x00\x12P\n\x11GetSchedulerStats\x12\x1f.makefile.SchedulerStatsRequest\x1a\x18.makefile.SchedulerStats\"\x00\x12@\n\x0bRunCommands\x12\x16.makefile.BatchRequest\x1a\x17.makefile.BatchResponse\"\x00\x12:\n\rSubmitCommand\x12\x18.makefile.CommandRequest\x1a\r.makefile.Job\"\x00\x12/\n\x06GetJob\x12\x14.makefile.JobRequest\x1a\r.makefile.Job\"\x00\x12\x34\n\x07WaitJob\x12\x18.makefile.WaitJobRequest\x1a\r.makefile.Job\"\x00\x12\x32\n\tCancelJob\x12\x14.makefile.JobRequest\x1a\r.makefile.Job\"\x00\x12\x42\n\nReadOutput\x12\x1b.makefile.ReadOutputRequest\x1a\x15.makefile.OutputRange\"\x00\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'service_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_SCHEDULERSTATS_RUNNINGBYTARGETENTRY']._loaded_options = None
+  _globals['_SCHEDULERSTATS_RUNNINGBYTARGETENTRY']._serialized_options = b'8\001'
+  _globals['_SCHEDULERSTATS_QUEUEDBYPRIORITYENTRY']._loaded_options = None
+  _globals['_SCHEDULERSTATS_QUEUEDBYPRIORITYENTRY']._serialized_options = b'8\001'
+  _globals['_COMMANDREQUEST']._serialized_start=27
+  _globals['_COMMANDREQUEST']._serialized_end=74
+  _globals['_COMMANDRESPONSE']._serialized_start=77
+  _globals['_COMMANDRESPONSE']._serialized_end=225
+  _globals['_COMMANDOUTPUTCHUNK']._serialized_start=228
+  _globals['_COMMANDOUTPUTCHUNK']._serialized_end=402
+  _globals['_COMMANDOUTPUTCHUNK_STREAM']._serialized_start=370
+  _globals['_COMMANDOUTPUTCHUNK_STREAM']._serialized_end=402
+  _globals['_LISTTARGETSREQUEST']._serialized_start=404
+  _globals['_LISTTARGETSREQUEST']._serialized_end=424
+  _globals['_TARGET']._serialized_start=426
+  _globals['_TARGET']._serialized_end=507
+  _globals['_LISTTARGETSRESPONSE']._serialized_start=509
+  _globals['_LISTTARGETSRESPONSE']._serialized_end=565
+  _globals['_SCHEDULERSTATSREQUEST']._serialized_start=567
+  _globals['_SCHEDULERSTATSREQUEST']._serialized_end=590
+  _globals['_SCHEDULERSTATS']._serialized_start=593
+  _globals['_SCHEDULERSTATS']._serialized_end=1022
+  _globals['_SCHEDULERSTATS_RUNNINGBYTARGETENTRY']._serialized_start=911
+  _globals['_SCHEDULERSTATS_RUNNINGBYTARGETENTRY']._serialized_end=965
+  _globals['_SCHEDULERSTATS_QUEUEDBYPRIORITYENTRY']._serialized_start=967
+  _globals['_SCHEDULERSTATS_QUEUEDBYPRIORITYENTRY']._serialized_end=1022
+  _globals['_READOUTPUTREQUEST']._serialized_start=1024
+  _globals['_READOUTPUTREQUEST']._serialized_end=1147
+  _globals['_OUTPUTRANGE']._serialized_start=1149
+  _globals['_OUTPUTRANGE']._serialized_end=1225
+  _globals['_BATCHCOMMAND']._serialized_start=1227
+  _globals['_BATCHCOMMAND']._serialized_end=1304
+  _globals['_BATCHREQUEST']._serialized_start=1306
+  _globals['_BATCHREQUEST']._serialized_end=1403
+  _globals['_BATCHRESULT']._serialized_start=1406
+  _globals['_BATCHRESULT']._serialized_end=1623
+  _globals['_BATCHRESULT_STATUS']._serialized_start=1575
+  _globals['_BATCHRESULT_STATUS']._serialized_end=1623
+  _globals['_BATCHRESPONSE']._serialized_start=1625
+  _globals['_BATCHRESPONSE']._serialized_end=1742
+  _globals['_JOB']._serialized_start=1745
+  _globals['_JOB']._serialized_end=2027
+  _globals['_JOB_STATE']._serialized_start=1943
+  _globals['_JOB_STATE']._serialized_end=2027
+  _globals['_JOBREQUEST']._serialized_start=2029
+  _globals['_JOBREQUEST']._serialized_end=2057
+  _globals['_WAITJOBREQUEST']._serialized_start=2059
+  _globals['_WAITJOBREQUEST']._serialized_end=2116
+  _globals['_MAKEFILESERVICE']._serialized_start=2119
+  _globals['_MAKEFILESERVICE']._serialized_end=2794
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,497 @@
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+import warnings
+
+from veridock import service_pb2 as service__pb2
+
+GRPC_GENERATED_VERSION = '1.84.0'
+GRPC_VERSION = grpc.__version__
+_version_not_supported = False
+
+try:
+    from grpc._utilities import first_version_is_lower
+    _version_not_supported = first_version_is_lower(GRPC_VERSION, GRPC_GENERATED_VERSION)
+except ImportError:
+    _version_not_supported = True
+
+if _version_not_supported:
+    raise RuntimeError(
+        f'The grpc package installed is at version {GRPC_VERSION},'
+        + ' but the generated code in service_pb2_grpc.py depends on'
+        + f' grpcio>={GRPC_GENERATED_VERSION}.'
+        + f' Please upgrade your grpc module to grpcio>={GRPC_GENERATED_VERSION}'
+        + f' or downgrade your generated code using grpcio-tools<={GRPC_VERSION}.'
+    )
+
+
+class MakefileServiceStub:
+    """The Makefile service definition.
+    """
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.RunCommand = channel.unary_unary(
+                '/makefile.MakefileService/RunCommand',
+                request_serializer=service__pb2.CommandRequest.SerializeToString,
+                response_deserializer=service__pb2.CommandResponse.FromString,
+                _registered_method=True)
+        self.RunCommandStream = channel.unary_stream(
+                '/makefile.MakefileService/RunCommandStream',
+                request_serializer=service__pb2.CommandRequest.SerializeToString,
+                response_deserializer=service__pb2.CommandOutputChunk.FromString,
+                _registered_method=True)
+        self.ListTargets = channel.unary_unary(
+                '/makefile.MakefileService/ListTargets',
+                request_serializer=service__pb2.ListTargetsRequest.SerializeToString,
+                response_deserializer=service__pb2.ListTargetsResponse.FromString,
+                _registered_method=True)
+        self.GetSchedulerStats = channel.unary_unary(
+                '/makefile.MakefileService/GetSchedulerStats',
+                request_serializer=service__pb2.SchedulerStatsRequest.SerializeToString,
+                response_deserializer=service__pb2.SchedulerStats.FromString,
+                _registered_method=True)
+        self.RunCommands = channel.unary_unary(
+                '/makefile.MakefileService/RunCommands',
+                request_serializer=service__pb2.BatchRequest.SerializeToString,
+                response_deserializer=service__pb2.BatchResponse.FromString,
+                _registered_method=True)
+        self.SubmitCommand = channel.unary_unary(
+                '/makefile.MakefileService/SubmitCommand',
+                request_serializer=service__pb2.CommandRequest.SerializeToString,
+                response_deserializer=service__pb2.Job.FromString,
+                _registered_method=True)
+        self.GetJob = channel.unary_unary(
+                '/makefile.MakefileService/GetJob',
+                request_serializer=service__pb2.JobRequest.SerializeToString,
+                response_deserializer=service__pb2.Job.FromString,
+                _registered_method=True)
+        self.WaitJob = channel.unary_unary(
+                '/makefile.MakefileService/WaitJob',
+                request_serializer=service__pb2.WaitJobRequest.SerializeToString,
+                response_deserializer=service__pb2.Job.FromString,
+                _registered_method=True)
+        self.CancelJob = channel.unary_unary(
+                '/makefile.MakefileService/CancelJob',
+                request_serializer=service__pb2.JobRequest.SerializeToString,
+                response_deserializer=service__pb2.Job.FromString,
+                _registered_method=True)
+        self.ReadOutput = channel.unary_unary(
+                '/makefile.MakefileService/ReadOutput',
+                request_serializer=service__pb2.ReadOutputRequest.SerializeToString,
+                response_deserializer=service__pb2.OutputRange.FromString,
+                _registered_method=True)
+
+
+class MakefileServiceServicer:
+    """The Makefile service definition.
+    """
+
+    def RunCommand(self, request, context):
+        """Executes a Makefile command
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def RunCommandStream(self, request, context):
+        """Executes a Makefile command and streams its output as it is produced
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ListTargets(self, request, context):
+        """Lists the targets defined in the Makefile
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetSchedulerStats(self, request, context):
+        """Reports execution queue depth and wait times
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def RunCommands(self, request, context):
+        """Runs several Makefile commands, in parallel where dependencies allow
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SubmitCommand(self, request, context):
+        """Queues a Makefile command as a background job and returns immediately
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetJob(self, request, context):
+        """Returns the current state of a job
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def WaitJob(self, request, context):
+        """Waits until a job finishes or the timeout passes, then returns its state
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def CancelJob(self, request, context):
+        """Cancels a queued or running job
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ReadOutput(self, request, context):
+        """Reads a range of the full output of a truncated RunCommand response
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_MakefileServiceServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'RunCommand': grpc.unary_unary_rpc_method_handler(
+                    servicer.RunCommand,
+                    request_deserializer=service__pb2.CommandRequest.FromString,
+                    response_serializer=service__pb2.CommandResponse.SerializeToString,
+            ),
+            'RunCommandStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.RunCommandStream,
+                    request_deserializer=service__pb2.CommandRequest.FromString,
+                    response_serializer=service__pb2.CommandOutputChunk.SerializeToString,
+            ),
+            'ListTargets': grpc.unary_unary_rpc_method_handler(
+                    servicer.ListTargets,
+                    request_deserializer=service__pb2.ListTargetsRequest.FromString,
+                    response_serializer=service__pb2.ListTargetsResponse.SerializeToString,
+            ),
+            'GetSchedulerStats': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetSchedulerStats,
+                    request_deserializer=service__pb2.SchedulerStatsRequest.FromString,
+                    response_serializer=service__pb2.SchedulerStats.SerializeToString,
+            ),
+            'RunCommands': grpc.unary_unary_rpc_method_handler(
+                    servicer.RunCommands,
+                    request_deserializer=service__pb2.BatchRequest.FromString,
+                    response_serializer=service__pb2.BatchResponse.SerializeToString,
+            ),
+            'SubmitCommand': grpc.unary_unary_rpc_method_handler(
+                    servicer.SubmitCommand,
+                    request_deserializer=service__pb2.CommandRequest.FromString,
+                    response_serializer=service__pb2.Job.SerializeToString,
+            ),
+            'GetJob': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetJob,
+                    request_deserializer=service__pb2.JobRequest.FromString,
+                    response_serializer=service__pb2.Job.SerializeToString,
+            ),
+            'WaitJob': grpc.unary_unary_rpc_method_handler(
+                    servicer.WaitJob,
+                    request_deserializer=service__pb2.WaitJobRequest.FromString,
+                    response_serializer=service__pb2.Job.SerializeToString,
+            ),
+            'CancelJob': grpc.unary_unary_rpc_method_handler(
+                    servicer.CancelJob,
+                    request_deserializer=service__pb2.JobRequest.FromString,
+                    response_serializer=service__pb2.Job.SerializeToString,
+            ),
+            'ReadOutput': grpc.unary_unary_rpc_method_handler(
+                    servicer.ReadOutput,
+                    request_deserializer=service__pb2.ReadOutputRequest.FromString,
+                    response_serializer=service__pb2.OutputRange.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'makefile.MakefileService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('makefile.MakefileService', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class MakefileService:
+    """The Makefile service definition.
+    """
+
+    @staticmethod
+    def RunCommand(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/makefile.MakefileService/RunCommand',
+            service__pb2.CommandRequest.SerializeToString,
+            service__pb2.CommandResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def RunCommandStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/makefile.MakefileService/RunCommandStream',
+            service__pb2.CommandRequest.SerializeToString,
+            service__pb2.CommandOutputChunk.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ListTargets(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/makefile.MakefileService/ListTargets',
+            service__pb2.ListTargetsRequest.SerializeToString,
+            service__pb2.ListTargetsResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetSchedulerStats(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/makefile.MakefileService/GetSchedulerStats',
+            service__pb2.SchedulerStatsRequest.SerializeToString,
+            service__pb2.SchedulerStats.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def RunCommands(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/makefile.MakefileService/RunCommands',
+            service__pb2.BatchRequest.SerializeToString,
+            service__pb2.BatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def SubmitCommand(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/makefile.MakefileService/SubmitCommand',
+            service__pb2.CommandRequest.SerializeToString,
+            service__pb2.Job.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetJob(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/makefile.MakefileService/GetJob',
+            service__pb2.JobRequest.SerializeToString,
+            service__pb2.Job.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def WaitJob(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/makefile.MakefileService/WaitJob',
+            service__pb2.WaitJobRequest.SerializeToString,
+            service__pb2.Job.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def CancelJob(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/makefile.MakefileService/CancelJob',
+            service__pb2.JobRequest.SerializeToString,
+            service__pb2.Job.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ReadOutput(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/makefile.MakefileService/ReadOutput',
+            service__pb2.ReadOutputRequest.SerializeToString,
+            service__pb2.OutputRange.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,191 @@
+"""Coalescing of identical concurrent command executions."""
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """One in-progress execution shared by every identical request.
+
+    The execution publishes output chunks and finally a result or an error.
+    Subscribers may follow the chunks (replayed from the start, so late joiners
+    see the whole output) or just wait for the result, from threads or from
+    asyncio tasks. When the last subscriber leaves before the execution is
+    done, the registered cancel callbacks run so the work can be stopped.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._cancel_callbacks: List[Callable[[], None]] = []
+        self.chunks: List[object] = []
+        self.done = False
+        self.result: object = None
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.cancelled = False
+
+    def publish(self, chunk) -> None:
+        """Append an output chunk and wake followers."""
+        with self._cond:
+            self.chunks.append(chunk)
+            self._notify()
+
+    def finish(self, result=None, error: Optional[BaseException] = None) -> None:
+        """Complete the flight with a result or an error."""
+        with self._cond:
+            self.done = True
+            self.result = result
+            self.error = error
+            self._notify()
+
+    def subscribe(self) -> None:
+        """Register interest in the flight."""
+        with self._cond:
+            self.subscribers += 1
+
+    def unsubscribe(self) -> None:
+        """Drop interest; cancels the work when nobody is left waiting."""
+        with self._cond:
+            self.subscribers -= 1
+            if self.subscribers > 0 or self.done or self.cancelled:
+                return
+            self.cancelled = True
+            callbacks = list(self._cancel_callbacks)
+        for callback in callbacks:
+            callback()
+
+    def add_cancel_callback(self, callback: Callable[[], None]) -> None:
+        """Run ``callback`` if the flight is abandoned (immediately if it was)."""
+        with self._cond:
+            if not self.cancelled:
+                self._cancel_callbacks.append(callback)
+                return
+        callback()
+
+    def wait(self):
+        """Block until the flight is done and return its result."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.done)
+        return self._outcome()
+
+    async def wait_async(self):
+        """Wait for the result without blocking the event loop."""
+        while True:
+            with self._cond:
+                if self.done:
+                    break
+                waiter = self._add_async_waiter()
+            await waiter
+        return self._outcome()
+
+    def iter_chunks(self):
+        """Yield every chunk, blocking for new ones until the flight is done."""
+        index = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self.chunks) > index or self.done)
+                pending = self.chunks[index:]
+                finished = self.done
+            index += len(pending)
+            yield from pending
+            if finished and not pending:
+                self._outcome()
+                return
+
+    async def aiter_chunks(self):
+        """asyncio version of ``iter_chunks``."""
+        index = 0
+        while True:
+            with self._cond:
+                pending = self.chunks[index:]
+                finished = self.done
+                waiter = None
+                if not pending and not finished:
+                    waiter = self._add_async_waiter()
+            if waiter is not None:
+                await waiter
+                continue
+            index += len(pending)
+            for chunk in pending:
+                yield chunk
+            if finished and not pending:
+                self._outcome()
+                return
+
+    def _outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def _add_async_waiter(self) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._async_waiters.append((loop, future))
+        return future
+
+    def _notify(self) -> None:
+        """Wake all waiters. Condition lock held."""
+        self._cond.notify_all()
+        for loop, future in self._async_waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        self._async_waiters.clear()
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight:
+    """Registry of in-progress flights for targets that opted in to coalescing.
+
+    Coalescing is opt-in per target because targets with side effects must run
+    once per request.
+    """
+
+    def __init__(self, targets):
+        self.targets = set(targets)
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["SingleFlight"]:
+        """Build from ``GRPC_COALESCE_TARGETS``, or None when it is unset."""
+        spec = os.getenv("GRPC_COALESCE_TARGETS", "")
+        targets = [t.strip() for t in spec.split(",") if t.strip()]
+        return cls(targets) if targets else None
+
+    def is_enabled(self, command: str) -> bool:
+        """Return True if identical runs of ``command`` may be shared."""
+        return command in self.targets
+
+    def join(self, key: Hashable) -> Tuple[Flight, bool]:
+        """Subscribe to the flight for ``key``, starting one if needed.
+
+        Returns the flight and whether the caller is its leader, i.e. is
+        responsible for running the work and calling ``land``.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+            else:
+                self.coalesced += 1
+            flight.subscribe()
+        if not leader:
+            logger.info("Coalesced request onto in-flight run: %s", key)
+        return flight, leader
+
+    def land(self, key: Hashable, flight: Flight) -> None:
+        """Stop routing new requests for ``key`` to ``flight``."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
@@ -0,0 +1,515 @@
+"""Supervisor of the server components started by ``veridock server start``.
+
+Components are started in dependency order, each once the ones it depends on
+are ready, and are restarted with exponential backoff when they
+exit. The supervisor keeps its state under the project's ``.veridock/run``:
+a pidfile per process and ``state.json``, so that ``veridock server stop``,
+``status`` and ``restart`` work from another shell.
+
+The output of the components is collected by a LogCollector, into a log
+file per component and, rate-limited, to the console.
+
+Every component runs in its own session, so Ctrl+C reaches the supervisor
+only, which then stops the components in reverse order, and stopping a
+component also stops the processes it started (gunicorn workers, make).
+"""
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from veridock.log_collector import LogCollector
+
+STATE_DIR = os.path.join(".veridock", "run")
+STATE_FILE = "state.json"
+SUPERVISOR_PIDFILE = "supervisor.pid"
+# Names of the components to restart, written by request_restart()
+RESTART_FILE = "restart"
+
+# Component states
+STARTING = "starting"
+RUNNING = "running"
+BACKOFF = "backoff"
+STOPPED = "stopped"
+
+
+class SupervisorError(Exception):
+    """A component that could not be started, or a supervisor already running."""
+
+
+class Component(NamedTuple):
+    """A process to supervise.
+
+    ``ready`` answers whether the process is ready to serve; a component
+    without one is ready as soon as it is started.
+    """
+
+    name: str
+    cmd: List[str]
+    ready: Optional[Callable[[], bool]] = None
+    depends_on: Tuple[str, ...] = ()
+
+
+def port_open(host: str, port: int, timeout: float = 0.2) -> bool:
+    """Whether something accepts TCP connections on host:port."""
+    if host in ("", "0.0.0.0", "::"):
+        host = "127.0.0.1"
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def http_ok(host: str, port: int, path: str, timeout: float = 1.0) -> bool:
+    """Whether GET http://host:port/path answers with a 2xx status."""
+    import http.client
+
+    if host in ("", "0.0.0.0", "::"):
+        host = "127.0.0.1"
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request("GET", path)
+        return 200 <= connection.getresponse().status < 300
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        connection.close()
+
+
+def startup_order(components: Sequence[Component]) -> List[Component]:
+    """Components ordered so that each comes after its dependencies."""
+    by_name = {component.name: component for component in components}
+    order: List[Component] = []
+    visiting = set()
+
+    def visit(component):
+        if component in order:
+            return
+        if component.name in visiting:
+            raise SupervisorError(f"Dependency cycle through {component.name}")
+        visiting.add(component.name)
+        for name in component.depends_on:
+            if name not in by_name:
+                raise SupervisorError(
+                    f"{component.name} depends on unknown component {name}"
+                )
+            visit(by_name[name])
+        visiting.discard(component.name)
+        order.append(component)
+
+    for component in components:
+        visit(component)
+    return order
+
+
+def _alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_pid(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _signal_group(pid: int, sig: int) -> None:
+    """Signal a component's session, falling back to the process itself."""
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+
+class _Child:
+    """A supervised component and its current process."""
+
+    def __init__(self, component: Component):
+        self.component = component
+        self.process: Optional[subprocess.Popen] = None
+        self.state = STOPPED
+        self.since = time.time()
+        self.started = 0.0
+        self.restarts = 0
+        self.failures = 0
+        self.retry_at = 0.0
+
+    @property
+    def name(self) -> str:
+        return self.component.name
+
+    def set_state(self, state: str) -> None:
+        self.state = state
+        self.since = time.time()
+
+
+class Supervisor:
+    """Starts, watches and restarts a set of components.
+
+    A component that exits is started again after ``backoff_initial``
+    seconds, doubling with every consecutive failure up to ``backoff_max``.
+    Failures are forgotten once a process has stayed up for
+    ``stable_after`` seconds. Exits are noticed within ``poll_interval``.
+
+    Output goes to ``log_collector``, by default mirrored to ``echo`` only.
+    """
+
+    def __init__(
+        self,
+        components: Sequence[Component],
+        state_dir: str = STATE_DIR,
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+        ready_timeout: float = 30.0,
+        backoff_initial: float = 0.1,
+        backoff_max: float = 30.0,
+        stable_after: float = 30.0,
+        poll_interval: float = 0.1,
+        echo: Callable[[str], None] = print,
+        log_collector: Optional[LogCollector] = None,
+    ):
+        self.children = [_Child(c) for c in startup_order(components)]
+        self.state_dir = state_dir
+        self.cwd = cwd
+        self.env = env
+        self.ready_timeout = ready_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.poll_interval = poll_interval
+        self.echo = echo
+        self.logs = log_collector or LogCollector(echo=echo)
+        self._stopping = threading.Event()
+        self._restart_requested = threading.Event()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.state_dir, name)
+
+    def start(self) -> None:
+        """Start every component in order, each once its dependencies are ready.
+
+        Raises SupervisorError, having stopped what it started, if one does
+        not become ready; or if another supervisor runs from the same state
+        directory.
+        """
+        running = supervisor_pid(self.state_dir)
+        if running is not None:
+            raise SupervisorError(f"Already running (supervisor PID {running})")
+        os.makedirs(self.state_dir, exist_ok=True)
+        stop_orphans(self.state_dir, echo=self.echo)
+        _write_atomic(self._path(SUPERVISOR_PIDFILE), f"{os.getpid()}\n")
+        try:
+            self._start_in_order(self.children)
+        except BaseException:
+            self.stop()
+            raise
+
+    def _start_in_order(self, children: List[_Child]) -> None:
+        for child in children:
+            self._spawn(child)
+            self._wait_ready(child)
+
+    def _spawn(self, child: _Child) -> None:
+        process = subprocess.Popen(
+            child.component.cmd,
+            cwd=self.cwd,
+            env=self.env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        child.process = process
+        child.started = time.monotonic()
+        child.set_state(STARTING)
+        _write_atomic(self._path(f"{child.name}.pid"), f"{process.pid}\n")
+        self._write_state()
+        self.logs.add(child.name, process.stdout)
+        self.echo(f"Started {child.name} (PID: {process.pid})")
+
+    def _is_ready(self, child: _Child) -> bool:
+        ready = child.component.ready
+        return ready is None or ready()
+
+    def _wait_ready(self, child: _Child) -> None:
+        deadline = time.monotonic() + self.ready_timeout
+        while not self._is_ready(child):
+            code = child.process.poll()
+            if code is not None:
+                raise SupervisorError(
+                    f"{child.name} exited with {code} before it was ready"
+                )
+            if time.monotonic() > deadline:
+                raise SupervisorError(
+                    f"{child.name} not ready after {self.ready_timeout:g}s"
+                )
+            if self._stopping.wait(0.05):
+                raise SupervisorError(f"Stopped while starting {child.name}")
+        child.set_state(RUNNING)
+        self._write_state()
+        self.echo(f"{child.name} is ready")
+
+    def run(self) -> None:
+        """Watch the components until stopped (SIGTERM, SIGINT or shutdown()).
+
+        SIGHUP restarts the components named by request_restart(), or all.
+        """
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, lambda *_: self._stopping.set())
+            signal.signal(signal.SIGHUP, lambda *_: self._restart_requested.set())
+        try:
+            while not self._stopping.wait(self.poll_interval):
+                if self._restart_requested.is_set():
+                    self._restart_requested.clear()
+                    self._handle_restart_request()
+                self.check()
+        finally:
+            self.stop()
+
+    def shutdown(self) -> None:
+        """Make run() stop the components and return."""
+        self._stopping.set()
+
+    def check(self) -> None:
+        """Notice exited processes, and start those whose backoff is over."""
+        now = time.monotonic()
+        changed = False
+        for child in self.children:
+            if child.state in (STARTING, RUNNING):
+                code = child.process.poll()
+                if code is not None:
+                    self._schedule_restart(child, f"exited with {code}", now)
+                    changed = True
+                elif child.state == STARTING and self._is_ready(child):
+                    child.set_state(RUNNING)
+                    changed = True
+                    self.echo(f"{child.name} is ready")
+                elif child.failures and now - child.started >= self.stable_after:
+                    child.failures = 0
+            elif child.state == BACKOFF and now >= child.retry_at:
+                child.restarts += 1
+                try:
+                    self._spawn(child)
+                except OSError as e:
+                    self._schedule_restart(child, f"could not start: {e}", now)
+                    changed = True
+        if changed:
+            self._write_state()
+
+    def _schedule_restart(self, child: _Child, reason: str, now: float) -> None:
+        if now - child.started >= self.stable_after:
+            child.failures = 0
+        child.failures += 1
+        delay = min(
+            self.backoff_max, self.backoff_initial * 2 ** (child.failures - 1)
+        )
+        child.retry_at = now + delay
+        child.set_state(BACKOFF)
+        self.echo(f"{child.name} {reason}; restarting in {delay:g}s")
+
+    def restart(self, names: Optional[Sequence[str]] = None) -> None:
+        """Restart some components (default: all), in dependency order."""
+        children = [c for c in self.children if not names or c.name in names]
+        self._stop_children(children)
+        for child in children:
+            child.failures = 0
+        try:
+            self._start_in_order(children)
+        except SupervisorError as e:
+            # Left to the backoff restarts
+            self.echo(f"Restart failed: {e}")
+
+    def _handle_restart_request(self) -> None:
+        path = self._path(RESTART_FILE)
+        try:
+            with open(path) as f:
+                names = f.read().split()
+            os.remove(path)
+        except OSError:
+            names = []
+        self.echo(f"Restarting {', '.join(names) or 'all components'}")
+        self.restart(names)
+
+    def _stop_children(self, children: List[_Child], timeout: float = 10.0) -> None:
+        """Stop components in reverse order; those that do not depend on one
+        another at the same time."""
+        batch: List[_Child] = []
+        for child in reversed(children):
+            if any(child.name in other.component.depends_on for other in batch):
+                self._stop_batch(batch, timeout)
+                batch = []
+            batch.append(child)
+        self._stop_batch(batch, timeout)
+
+    def _stop_batch(self, batch: List[_Child], timeout: float) -> None:
+        running = []
+        for child in batch:
+            child.set_state(STOPPED)
+            if child.process is not None and child.process.poll() is None:
+                _signal_group(child.process.pid, signal.SIGTERM)
+                running.append(child)
+        deadline = time.monotonic() + timeout
+        for child in running:
+            process = child.process
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                _signal_group(process.pid, signal.SIGKILL)
+                process.wait()
+            self.echo(f"Stopped {child.name}")
+        for child in batch:
+            pidfile = self._path(f"{child.name}.pid")
+            if child.process is not None and _read_pid(pidfile) == child.process.pid:
+                os.remove(pidfile)
+
+    def stop(self) -> None:
+        """Stop every component in reverse order, and remove the state files.
+
+        The output the components left in their pipes is written first.
+        """
+        self._stop_children(self.children)
+        self.logs.close()
+        if _read_pid(self._path(SUPERVISOR_PIDFILE)) != os.getpid():
+            return
+        for name in (STATE_FILE, SUPERVISOR_PIDFILE):
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+
+    def _write_state(self) -> None:
+        state = {
+            "supervisor": os.getpid(),
+            "components": {
+                child.name: {
+                    "pid": child.process.pid if child.process else None,
+                    "state": child.state,
+                    "since": child.since,
+                    "restarts": child.restarts,
+                }
+                for child in self.children
+            },
+        }
+        _write_atomic(self._path(STATE_FILE), json.dumps(state, indent=2))
+
+
+def supervisor_pid(state_dir: str = STATE_DIR) -> Optional[int]:
+    """PID of the supervisor running from ``state_dir``, if any."""
+    pid = _read_pid(os.path.join(state_dir, SUPERVISOR_PIDFILE))
+    return pid if _alive(pid) else None
+
+
+def read_state(state_dir: str = STATE_DIR) -> Optional[Dict]:
+    """State written by the running supervisor, with each process checked.
+
+    None when no supervisor is running.
+    """
+    if supervisor_pid(state_dir) is None:
+        return None
+    try:
+        with open(os.path.join(state_dir, STATE_FILE)) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    for component in state["components"].values():
+        if component["state"] in (STARTING, RUNNING) and not _alive(
+            component["pid"]
+        ):
+            component["state"] = "exited"
+    return state
+
+
+def stop_orphans(state_dir: str = STATE_DIR, timeout: float = 10.0, echo=print):
+    """Stop components left behind by a supervisor that died, from their pidfiles.
+
+    They are stopped in the reverse of the order they were started in, and
+    the dead supervisor's state is removed.
+    """
+    if not os.path.isdir(state_dir):
+        return
+    try:
+        with open(os.path.join(state_dir, STATE_FILE)) as f:
+            started = list(json.load(f)["components"])
+    except (OSError, ValueError, KeyError):
+        started = []
+    pidfiles = sorted(
+        (n for n in os.listdir(state_dir) if n.endswith(".pid")),
+        key=lambda n: started.index(n[:-4]) if n[:-4] in started else -1,
+        reverse=True,
+    )
+    for name in pidfiles:
+        if name == SUPERVISOR_PIDFILE:
+            continue
+        path = os.path.join(state_dir, name)
+        pid = _read_pid(path)
+        if _alive(pid):
+            echo(f"Stopping {name[:-4]} left running (PID: {pid})")
+            _signal_group(pid, signal.SIGTERM)
+            deadline = time.monotonic() + timeout
+            while _alive(pid) and time.monotonic() < deadline:
+                time.sleep(0.05)
+            if _alive(pid):
+                _signal_group(pid, signal.SIGKILL)
+        os.remove(path)
+    for name in (STATE_FILE, SUPERVISOR_PIDFILE):
+        try:
+            os.remove(os.path.join(state_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+def stop_running(state_dir: str = STATE_DIR, timeout: float = 30.0, echo=print):
+    """Stop the supervisor running from ``state_dir`` and its components.
+
+    Returns False if there was nothing to stop.
+    """
+    pid = supervisor_pid(state_dir)
+    if pid is not None:
+        os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        while _alive(pid) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if _alive(pid):
+            raise SupervisorError(f"Supervisor (PID {pid}) did not stop")
+    orphans = os.path.isdir(state_dir) and any(
+        name.endswith(".pid") and name != SUPERVISOR_PIDFILE
+        for name in os.listdir(state_dir)
+    )
+    stop_orphans(state_dir, echo=echo)
+    return pid is not None or orphans
+
+
+def request_restart(state_dir: str = STATE_DIR, names: Sequence[str] = ()) -> int:
+    """Ask the running supervisor to restart components; returns its PID."""
+    pid = supervisor_pid(state_dir)
+    if pid is None:
+        raise SupervisorError("Not running")
+    _write_atomic(os.path.join(state_dir, RESTART_FILE), " ".join(names))
+    os.kill(pid, signal.SIGHUP)
+    return pid
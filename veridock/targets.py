@@ -0,0 +1,205 @@
+"""Parsed index of the targets defined in a Makefile."""
+
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "name [name...] : [prerequisites] [; recipe] [## help]" but not ":=", "::="
+_RULE_RE = re.compile(
+    r"^(?P<targets>[^:#=\s][^:#=]*?)\s*::?(?![=:])\s*(?P<rest>.*)$"
+)
+_INCLUDE_RE = re.compile(r"^\s*(?:-|s)?include\s+(?P<files>.+)$")
+_ASSIGNMENT_RE = re.compile(r"^[^:#=\s]+\s*(?:[:?+!]?=|::=)")
+
+# (mtime_ns, size) per parsed file, or None for an include that does not exist
+_Signatures = Dict[str, Optional[Tuple[int, int]]]
+
+
+class Target(NamedTuple):
+    """A Makefile target as exposed to clients."""
+
+    name: str
+    description: str
+    prerequisites: Tuple[str, ...]
+    phony: bool
+
+
+def _logical_lines(text: str) -> List[str]:
+    """Join backslash-continued lines."""
+    lines: List[str] = []
+    pending = ""
+    for raw in text.splitlines():
+        if raw.endswith("\\") and not raw.startswith("\t"):
+            pending += raw[:-1] + " "
+            continue
+        lines.append(pending + raw)
+        pending = ""
+    if pending:
+        lines.append(pending)
+    return lines
+
+
+def parse_makefile(
+    path: str, _seen: Optional[_Signatures] = None
+) -> Tuple[List[Target], _Signatures]:
+    """Parse a Makefile and the files it includes.
+
+    Returns the targets in definition order and the signature of every file
+    that was read, which callers use to detect changes. Pattern rules, special
+    targets and names that need variable expansion are skipped, since they are
+    not something a user can sensibly run by name.
+
+    A target's description is its trailing ``## help`` comment, or failing
+    that the comment line directly above the rule.
+    """
+    seen = {} if _seen is None else _seen
+    path = os.path.abspath(path)
+    if path in seen:
+        return [], seen
+    try:
+        st = os.stat(path)
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+    except OSError:
+        # Remember missing files too, so creating one invalidates the index
+        seen[path] = None
+        return [], seen
+    seen[path] = (st.st_mtime_ns, st.st_size)
+
+    order: List[str] = []
+    descriptions: Dict[str, str] = {}
+    prerequisites: Dict[str, List[str]] = {}
+    phony = set()
+    included: List[Target] = []
+
+    comments: List[str] = []
+    in_define = False
+    for line in _logical_lines(text):
+        stripped = line.strip()
+
+        if in_define:
+            in_define = stripped != "endef"
+            continue
+        if stripped.startswith("define "):
+            in_define = True
+            continue
+        if line.startswith("\t"):
+            # Recipe line
+            comments = []
+            continue
+        if stripped.startswith("#"):
+            comments.append(stripped.lstrip("#").strip())
+            continue
+        if not stripped:
+            comments = []
+            continue
+
+        include = _INCLUDE_RE.match(line)
+        if include:
+            base = os.path.dirname(path)
+            for name in include.group("files").split():
+                if "$" not in name:
+                    targets, _ = parse_makefile(os.path.join(base, name), seen)
+                    included.extend(targets)
+            comments = []
+            continue
+
+        if _ASSIGNMENT_RE.match(line):
+            comments = []
+            continue
+
+        rule = _RULE_RE.match(line)
+        if not rule:
+            comments = []
+            continue
+
+        rest = rule.group("rest")
+        help_text = ""
+        if "##" in rest:
+            rest, help_text = rest.split("##", 1)
+            help_text = help_text.strip()
+        rest = rest.split(";", 1)[0]
+        if "=" in rest:
+            # Target-specific variable assignment
+            comments = []
+            continue
+        prereqs = [p for p in rest.split() if p != "|"]
+        description = help_text or (comments[-1] if comments else "")
+        comments = []
+
+        for name in rule.group("targets").split():
+            if name == ".PHONY":
+                phony.update(prereqs)
+                continue
+            if name.startswith(".") or "%" in name or "$" in name:
+                continue
+            if name not in prerequisites:
+                order.append(name)
+                prerequisites[name] = []
+                descriptions[name] = ""
+            prerequisites[name].extend(
+                p for p in prereqs if p not in prerequisites[name]
+            )
+            if description and not descriptions[name]:
+                descriptions[name] = description
+
+    targets = [
+        Target(
+            name=name,
+            description=descriptions[name],
+            prerequisites=tuple(prerequisites[name]),
+            phony=name in phony,
+        )
+        for name in order
+    ]
+    # Rules from included files come after the including file's own rules
+    known = set(order)
+    targets.extend(
+        t._replace(phony=t.phony or t.name in phony)
+        for t in included
+        if t.name not in known
+    )
+    return targets, seen
+
+
+class TargetIndex:
+    """Cached target index, rebuilt only when the Makefile or an include changes.
+
+    Checking freshness costs one ``stat`` per parsed file, so listing targets
+    does not spawn ``make`` or re-read the Makefile on every call.
+    """
+
+    def __init__(self, makefile: str = "Makefile"):
+        self.makefile = makefile
+        self._cache: Dict[str, Tuple[_Signatures, List[Target]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, directory: str) -> List[Target]:
+        """Return the targets of the Makefile in ``directory``."""
+        path = os.path.abspath(os.path.join(directory, self.makefile))
+        cached = self._cache.get(path)
+        if cached is not None and self._is_fresh(cached[0]):
+            return cached[1]
+
+        with self._lock:
+            targets, files = parse_makefile(path)
+            self._cache[path] = (files, targets)
+        logger.info("Indexed %d targets from %s", len(targets), path)
+        return targets
+
+    @staticmethod
+    def _is_fresh(files: _Signatures) -> bool:
+        for path, signature in files.items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                if signature is not None:
+                    return False
+                continue
+            if (st.st_mtime_ns, st.st_size) != signature:
+                return False
+        return True
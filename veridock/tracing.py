@@ -0,0 +1,470 @@
+"""Request tracing with W3C trace context, shared by the gateway and the server.
+
+A request's ``traceparent`` header is carried from Caddy through the gateway
+to the gRPC server as metadata, and on to make as the ``TRACEPARENT``
+environment variable, so the spans of every hop share one trace id.
+
+Spans are written by a background thread, in batches, as OTLP/JSON: either
+appended to a file, one ``{"resourceSpans": [...]}`` object per line (the
+format of the OpenTelemetry Collector's file exporter), or posted to an
+OTLP/HTTP endpoint such as a local collector or Jaeger. With no exporter
+configured, no span is recorded, but trace context received from upstream is
+still passed on.
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+EXPORTERS = ("none", "file", "otlp")
+
+# HTTP header and gRPC metadata key of the W3C trace context
+TRACEPARENT_HEADER = "traceparent"
+# Environment variable carrying the trace context to make and its recipes
+TRACEPARENT_ENV = "TRACEPARENT"
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+# OTLP status code of a failed span
+STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(
+    r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})(-.*)?$"
+)
+_ZERO_TRACE_ID = "0" * 32
+_ZERO_SPAN_ID = "0" * 16
+
+
+class SpanContext(NamedTuple):
+    """The part of a span that is propagated to the next hop."""
+
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+    def traceparent(self) -> str:
+        flags = "01" if self.sampled else "00"
+        return f"00-{self.trace_id}-{self.span_id}-{flags}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """SpanContext of a ``traceparent`` value, or None if it is not valid."""
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if match is None:
+        return None
+    version, trace_id, span_id, flags, rest = match.groups()
+    if version == "ff" or (version == "00" and rest):
+        return None
+    if trace_id == _ZERO_TRACE_ID or span_id == _ZERO_SPAN_ID:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+def _attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class Span:
+    """A timed operation of a trace; ended once, then handed to the exporter."""
+
+    recording = True
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        parent: Optional[SpanContext],
+        kind: int = INTERNAL,
+        attributes: Optional[Dict] = None,
+        start_ns: Optional[int] = None,
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.parent_id = parent.span_id if parent else None
+        self.context = SpanContext(
+            parent.trace_id if parent else f"{random.getrandbits(128):032x}",
+            f"{random.getrandbits(64):016x}",
+        )
+        self.attributes = dict(attributes or {})
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, error) -> None:
+        self.error = str(error) or type(error).__name__
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        self.tracer.exporter.export(self)
+
+    def to_otlp(self) -> Dict:
+        """The span in the OTLP/JSON encoding."""
+        span = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [
+                _attribute(key, value) for key, value in self.attributes.items()
+            ],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error is not None:
+            span["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return span
+
+
+class _NonRecordingSpan:
+    """Stands in for a span when tracing is off or the trace is not sampled.
+
+    It carries the incoming trace context, so it is still propagated.
+    """
+
+    recording = False
+
+    def __init__(self, context: Optional[SpanContext]):
+        self.context = context
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def set_error(self, error) -> None:
+        pass
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        pass
+
+
+# Span of the operation running in the current thread or asyncio task
+_current: contextvars.ContextVar = contextvars.ContextVar("span", default=None)
+
+
+def current_span():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def activate(span):
+    """Make ``span`` the parent of the spans started in this block.
+
+    For work handed to another thread, which does not inherit the caller's
+    current span.
+    """
+    token = _current.set(span)
+    try:
+        yield span
+    finally:
+        _reset(token)
+
+
+def _reset(token) -> None:
+    try:
+        _current.reset(token)
+    except ValueError:
+        # A generator closed from another thread than the one it ran in
+        pass
+
+
+def iterate(span, iterator):
+    """Yield from ``iterator`` under ``span``, then end the span.
+
+    The span is current only while the iterator runs: a generator may be
+    closed from another thread than the one that iterated it, which could
+    not reset a span left current across its yields.
+    """
+    try:
+        while True:
+            with activate(span):
+                item = next(iterator, _DONE)
+            if item is _DONE:
+                return
+            yield item
+    except Exception as e:
+        span.set_error(e)
+        raise
+    finally:
+        with activate(span):
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        span.end()
+
+
+_DONE = object()
+
+
+def _parent_context(parent) -> Optional[SpanContext]:
+    if parent is None:
+        parent = _current.get()
+    if isinstance(parent, SpanContext) or parent is None:
+        return parent
+    return parent.context
+
+
+class _BatchExporter:
+    """Queues ended spans and sends them in batches from a daemon thread."""
+
+    def __init__(
+        self,
+        service_name: str,
+        max_queue: int = 10000,
+        max_batch: int = 512,
+        interval: float = 1.0,
+    ):
+        self.service_name = service_name
+        self.max_batch = max_batch
+        self.interval = interval
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        # The thread does not survive a fork: start one in each worker
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self._queue.maxsize)
+            self._thread = threading.Thread(
+                target=self._run, name="trace-exporter", daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch and batch[-1] is not None:
+                try:
+                    timeout = max(0.0, deadline - time.monotonic())
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            spans = [span for span in batch if span is not None]
+            if spans:
+                try:
+                    self.write(self.payload(spans))
+                except Exception as e:
+                    logger.warning("Could not export %d spans: %s", len(spans), e)
+            if stop:
+                return
+
+    def payload(self, spans: List[Span]) -> Dict:
+        """An OTLP/JSON ExportTraceServiceRequest."""
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            _attribute("service.name", self.service_name)
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "veridock"},
+                            "spans": [span.to_otlp() for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def write(self, payload: Dict) -> None:
+        raise NotImplementedError
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Send the queued spans and stop the thread."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+class FileExporter(_BatchExporter):
+    """Appends batches of spans to a file, one OTLP/JSON object per line."""
+
+    def __init__(self, service_name: str, path: str, **kwargs):
+        super().__init__(service_name, **kwargs)
+        self.path = path
+
+    def write(self, payload: Dict) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        line = json.dumps(payload, separators=(",", ":")) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class OtlpExporter(_BatchExporter):
+    """Posts batches of spans to an OTLP/HTTP endpoint, JSON encoded."""
+
+    def __init__(self, service_name: str, endpoint: str, timeout=10.0, **kwargs):
+        super().__init__(service_name, **kwargs)
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def write(self, payload: Dict) -> None:
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class Tracer:
+    """Starts spans for one service; spans are recorded only with an exporter."""
+
+    def __init__(self, exporter: Optional[_BatchExporter] = None):
+        self.exporter = exporter
+
+    @classmethod
+    def from_env(cls, service_name: str) -> "Tracer":
+        """Tracer exporting as ``TRACING_EXPORTER`` says: none, file or otlp."""
+        kind = os.getenv("TRACING_EXPORTER", "none").strip().lower() or "none"
+        if kind not in EXPORTERS:
+            raise ValueError(
+                f"Unknown TRACING_EXPORTER {kind!r}, expected one of "
+                f"{', '.join(EXPORTERS)}"
+            )
+        if kind == "file":
+            path = os.getenv("TRACING_FILE", ".veridock/traces.jsonl")
+            return cls(FileExporter(service_name, path))
+        if kind == "otlp":
+            endpoint = os.getenv(
+                "TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"
+            )
+            return cls(OtlpExporter(service_name, endpoint))
+        return cls()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start_span(
+        self, name: str, parent=None, kind: int = INTERNAL, start_ns=None, **attributes
+    ):
+        """Start a span; end it with ``span.end()``.
+
+        ``parent`` is a span or SpanContext, and defaults to the current span.
+        """
+        context = _parent_context(parent)
+        if self.exporter is None or (context is not None and not context.sampled):
+            return _NonRecordingSpan(context)
+        return Span(self, name, context, kind, attributes, start_ns)
+
+    @contextlib.contextmanager
+    def span(self, name: str, parent=None, kind: int = INTERNAL, **attributes):
+        """A span around a block, which is its current span meanwhile."""
+        span = self.start_span(name, parent, kind, **attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set_error(e)
+            raise
+        finally:
+            _reset(token)
+            span.end()
+
+    def record(self, name: str, seconds: float, parent=None, **attributes) -> None:
+        """Add a span that ended now, for an operation timed elsewhere."""
+        end_ns = time.time_ns()
+        span = self.start_span(
+            name, parent, start_ns=end_ns - int(seconds * 1e9), **attributes
+        )
+        span.end(end_ns)
+
+    def shutdown(self) -> None:
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+# The process's tracer, set up by configure()
+tracer = Tracer()
+
+
+def configure(service_name: str) -> Tracer:
+    """Set up the process's tracer from the environment."""
+    global tracer
+    tracer.shutdown()
+    tracer = Tracer.from_env(service_name)
+    if tracer.enabled:
+        logger.info(
+            "Tracing %s with the %s",
+            service_name,
+            type(tracer.exporter).__name__,
+        )
+    return tracer
+
+
+def start_span(name: str, parent=None, kind: int = INTERNAL, **attributes):
+    return tracer.start_span(name, parent, kind, **attributes)
+
+
+def span(name: str, parent=None, kind: int = INTERNAL, **attributes):
+    return tracer.span(name, parent, kind, **attributes)
+
+
+def record(name: str, seconds: float, parent=None, **attributes) -> None:
+    tracer.record(name, seconds, parent, **attributes)
+
+
+def metadata_context(metadata) -> Optional[SpanContext]:
+    """Trace context of a gRPC call from its invocation metadata."""
+    for key, value in metadata or ():
+        if key == TRACEPARENT_HEADER:
+            return parse_traceparent(value)
+    return None
+
+
+def child_env(span=None) -> Optional[Dict[str, str]]:
+    """Environment for a child process continuing the trace of ``span``.
+
+    None, meaning the inherited environment, when there is no trace context.
+    """
+    context = _parent_context(span)
+    if context is None:
+        return None
+    return {**os.environ, TRACEPARENT_ENV: context.traceparent()}
@@ -0,0 +1,508 @@
+"""HTTP/JSON and gRPC-Web listener for the Makefile service.
+
+Runs inside the gRPC server process and calls the servicer directly, so
+Caddy can send browser calls to the service without the Flask gateway hop.
+Every RPC in ``service.proto`` gets a route,
+``/makefile.MakefileService/<Method>``:
+
+- A ``POST`` with an ``application/grpc-web`` or
+  ``application/grpc-web+proto`` body is a gRPC-Web call: length-prefixed
+  protobuf messages in, and out, followed by a trailer frame with the status.
+- Any other ``POST`` body is the request message in proto3 JSON (an empty body
+  is an empty message); a ``GET`` takes the fields from the query string. The
+  reply is the response message in JSON, or one JSON object per line for
+  server-streaming RPCs. Errors are JSON objects with the gRPC ``code`` and
+  ``message``, sent with the matching HTTP status.
+
+Callers are identified to the scheduler by ``X-Real-IP``/``X-Forwarded-For``
+and may pass ``X-Priority``, as with the gateway.
+"""
+
+import asyncio
+import logging
+import socket
+import sys
+import threading
+import time
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import parse_qs, quote, urlsplit
+
+import grpc
+from google.protobuf import json_format, message_factory
+from google.protobuf.message import DecodeError
+
+from veridock import metrics, rpc_json, service_pb2, tracing
+from veridock.logs import brief
+
+logger = logging.getLogger(__name__)
+
+GRPC_WEB_CONTENT_TYPES = ("application/grpc-web", "application/grpc-web+proto")
+
+# HTTP status of a JSON reply for each gRPC status code
+HTTP_STATUS = {
+    grpc.StatusCode.OK: 200,
+    grpc.StatusCode.CANCELLED: 499,
+    grpc.StatusCode.UNKNOWN: 500,
+    grpc.StatusCode.INVALID_ARGUMENT: 400,
+    grpc.StatusCode.DEADLINE_EXCEEDED: 504,
+    grpc.StatusCode.NOT_FOUND: 404,
+    grpc.StatusCode.ALREADY_EXISTS: 409,
+    grpc.StatusCode.PERMISSION_DENIED: 403,
+    grpc.StatusCode.RESOURCE_EXHAUSTED: 429,
+    grpc.StatusCode.FAILED_PRECONDITION: 400,
+    grpc.StatusCode.ABORTED: 409,
+    grpc.StatusCode.OUT_OF_RANGE: 400,
+    grpc.StatusCode.UNIMPLEMENTED: 501,
+    grpc.StatusCode.INTERNAL: 500,
+    grpc.StatusCode.UNAVAILABLE: 503,
+    grpc.StatusCode.DATA_LOSS: 500,
+    grpc.StatusCode.UNAUTHENTICATED: 401,
+}
+
+
+class Method(NamedTuple):
+    """An RPC as routed by the listener."""
+
+    name: str
+    request_class: type
+    server_streaming: bool
+    response_class: type
+
+
+def routes(service_descriptor) -> Dict[str, Method]:
+    """Map ``/<service>/<Method>`` paths to the service's RPCs.
+
+    Client-streaming RPCs cannot be expressed as one HTTP request and are
+    left out.
+    """
+    result = {}
+    for method in service_descriptor.methods:
+        if method.client_streaming:
+            continue
+        result[f"/{service_descriptor.full_name}/{method.name}"] = Method(
+            method.name,
+            message_factory.GetMessageClass(method.input_type),
+            method.server_streaming,
+            message_factory.GetMessageClass(method.output_type),
+        )
+    return result
+
+
+class _CallError(Exception):
+    """A call that failed before the servicer was reached."""
+
+    def __init__(self, code: grpc.StatusCode, details: str):
+        super().__init__(details)
+        self.code = code
+        self.details = details
+
+
+class _HttpContext:
+    """Stands in for a ServicerContext for a call made over HTTP."""
+
+    def __init__(self, metadata, peer):
+        self._metadata = metadata
+        self._peer = peer
+        self.active = True
+        self.code = None
+        self.details = None
+        self.trailing_metadata = ()
+
+    def invocation_metadata(self):
+        return self._metadata
+
+    def peer(self):
+        return self._peer
+
+    def is_active(self):
+        return self.active
+
+    def set_code(self, code):
+        self.code = code
+
+    def set_details(self, details):
+        self.details = details
+
+    def set_trailing_metadata(self, trailing_metadata):
+        self.trailing_metadata = tuple(trailing_metadata)
+
+    def status(self):
+        """(code, details) the servicer finished with."""
+        return self.code or grpc.StatusCode.OK, self.details or ""
+
+
+def _query_message(request_class, query: str):
+    """Request message from a query string, e.g. ``?command=build``."""
+    fields = request_class.DESCRIPTOR.fields_by_name
+    data = {}
+    for key, values in parse_qs(query, keep_blank_values=True).items():
+        field = fields.get(key)
+        if field is not None and field.type == field.TYPE_BOOL:
+            values = [value.lower() in ("1", "true", "yes") for value in values]
+        repeated = field is not None and rpc_json.is_repeated(field)
+        data[key] = values if repeated else values[-1]
+    return json_format.ParseDict(data, request_class())
+
+
+def _grpc_web_message(request_class, body: bytes):
+    """Request message from the first frame of a gRPC-Web body."""
+    if not body:
+        return request_class()
+    if len(body) < 5:
+        raise ValueError("truncated gRPC-Web frame")
+    if body[0] & 0x01:
+        raise ValueError("compressed gRPC-Web messages are not supported")
+    length = int.from_bytes(body[1:5], "big")
+    if len(body) < 5 + length:
+        raise ValueError("truncated gRPC-Web frame")
+    return request_class.FromString(body[5:5 + length])
+
+
+def _grpc_web_frame(data: bytes, trailer: bool = False) -> bytes:
+    return bytes([0x80 if trailer else 0x00]) + len(data).to_bytes(4, "big") + data
+
+
+def _grpc_web_trailer(code: grpc.StatusCode, details: str, metadata=()) -> bytes:
+    lines = [f"grpc-status: {code.value[0]}"]
+    if details:
+        lines.append(f"grpc-message: {quote(details)}")
+    lines.extend(f"{key}: {value}" for key, value in metadata)
+    return _grpc_web_frame("".join(f"{line}\r\n" for line in lines).encode(), True)
+
+
+def _error_json(code: grpc.StatusCode, details: str) -> bytes:
+    return rpc_json.dumps({"code": code.value[0], "message": details})
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "veridock-transcoder"
+
+    def do_OPTIONS(self):
+        """CORS preflight, as sent by browser gRPC-Web clients."""
+        self.send_response(204)
+        self._cors_headers()
+        self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+        self.send_header(
+            "Access-Control-Allow-Headers",
+            "Content-Type, X-Grpc-Web, X-User-Agent, X-Priority, Traceparent",
+        )
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self._call(get=True)
+
+    def do_POST(self):
+        self._call(get=False)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - " + format, self.address_string(), *args)
+
+    def _cors_headers(self):
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Expose-Headers", "Grpc-Status, Grpc-Message")
+
+    def _metadata(self):
+        client = self.headers.get("X-Real-IP")
+        if not client and self.headers.get("X-Forwarded-For"):
+            client = self.headers["X-Forwarded-For"].split(",")[0].strip()
+        metadata = [("x-client-id", client or self.client_address[0])]
+        priority = self.headers.get("X-Priority")
+        if priority:
+            metadata.append(("x-priority", priority.lower()))
+        traceparent = self.headers.get(tracing.TRACEPARENT_HEADER)
+        if traceparent:
+            metadata.append((tracing.TRACEPARENT_HEADER, traceparent))
+        return metadata
+
+    def _call(self, get: bool):
+        listener = self.server.listener
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+        grpc_web = not get and content_type.lower() in GRPC_WEB_CONTENT_TYPES
+
+        method = listener.routes.get(url.path)
+        try:
+            if method is None:
+                raise _CallError(
+                    grpc.StatusCode.UNIMPLEMENTED, f"Unknown method {url.path}"
+                )
+            try:
+                if grpc_web:
+                    request = _grpc_web_message(method.request_class, body)
+                elif get:
+                    request = _query_message(method.request_class, url.query)
+                else:
+                    request = rpc_json.parse(method.request_class, body)
+            except (ValueError, DecodeError, json_format.ParseError) as e:
+                raise _CallError(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        except _CallError as e:
+            logger.warning("Rejected %s %s: %s", self.command, url.path, e)
+            self._send_status(grpc_web, e.code, e.details)
+            return
+
+        logger.debug("%s %s: %s", self.command, url.path, brief(request))
+        context = _HttpContext(
+            self._metadata(), f"ipv4:{self.client_address[0]}:{self.client_address[1]}"
+        )
+        metrics.ACTIVE_RPCS.inc()
+        started = time.perf_counter()
+        if method.server_streaming:
+            responses = listener.call_stream(method.name, request, context)
+        else:
+            responses = listener.call_unary(method.name, request, context)
+        try:
+            self._send_responses(
+                grpc_web, responses, context, method.server_streaming
+            )
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("Client went away during %s", method.name)
+            self.close_connection = True
+            if context.code is None:
+                context.set_code(grpc.StatusCode.CANCELLED)
+        finally:
+            context.active = False
+            responses.close()
+            metrics.ACTIVE_RPCS.dec()
+            metrics.record_rpc(
+                method.name, context.status()[0], time.perf_counter() - started
+            )
+
+    def _send_responses(self, grpc_web, responses, context, streaming):
+        """Send the servicer's messages, then its status.
+
+        The first message is awaited before the headers go out, so a call that
+        fails straight away gets a proper HTTP status.
+        """
+        first = next(responses, None)
+        code, details = context.status()
+        if first is None or code != grpc.StatusCode.OK:
+            self._send_status(grpc_web, code, details, context.trailing_metadata)
+            return
+
+        if grpc_web:
+            content_type = "application/grpc-web+proto"
+        elif streaming:
+            content_type = "application/x-ndjson"
+        else:
+            # A unary reply: its trailing metadata (x-cache, ...) can still go
+            # out as headers, since the call is already complete
+            self._send_body(
+                200,
+                "application/json",
+                rpc_json.message_json(first),
+                context.trailing_metadata,
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self._cors_headers()
+        self.end_headers()
+        message = first
+        while message is not None:
+            if grpc_web:
+                self._write_chunk(_grpc_web_frame(message.SerializeToString()))
+            else:
+                self._write_chunk(rpc_json.message_json(message) + b"\n")
+            message = next(responses, None)
+
+        code, details = context.status()
+        if grpc_web:
+            self._write_chunk(
+                _grpc_web_trailer(code, details, context.trailing_metadata)
+            )
+        elif code != grpc.StatusCode.OK:
+            self._write_chunk(b'{"error": ' + _error_json(code, details) + b"}\n")
+        self._write_chunk(b"")
+
+    def _send_status(self, grpc_web, code, details, metadata=()):
+        """Reply with no message, only a status."""
+        if grpc_web:
+            self._send_body(
+                200,
+                "application/grpc-web+proto",
+                _grpc_web_trailer(code, details, metadata),
+            )
+        else:
+            self._send_body(
+                HTTP_STATUS.get(code, 500),
+                "application/json",
+                _error_json(code, details),
+                metadata,
+            )
+
+    def _send_body(self, status, content_type, body, metadata=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in metadata:
+            self.send_header(key, value)
+        self._cors_headers()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        logger.exception("Error handling a request from %s", client_address[0])
+
+
+class _SharedPortServer(_Server):
+    """Shares its port with the listeners of the other server processes."""
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+class TranscodingListener:
+    """HTTP listener calling a MakefileService servicer in the same process.
+
+    ``loop`` is the event loop of an ``AsyncMakefileService``; calls are then
+    run on it from the listener's threads. Without it the servicer is called
+    directly, as the thread-pool gRPC server does. With ``reuse_port`` the
+    port is shared with the listeners of other server processes.
+    """
+
+    def __init__(self, servicer, host: str, port: int, loop=None, reuse_port=False):
+        self.servicer = servicer
+        self.loop = loop
+        self.routes = routes(
+            service_pb2.DESCRIPTOR.services_by_name["MakefileService"]
+        )
+        server_class = _SharedPortServer if reuse_port else _Server
+        self._server = server_class((host, port), _Handler)
+        self._server.listener = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="transcoder", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def call_unary(self, name, request, context):
+        """Iterator over the single reply of a unary RPC, or over nothing."""
+        handler = getattr(self.servicer, name)
+        return _Reply(self._run, handler, request, context)
+
+    def call_stream(self, name, request, context):
+        """Iterator over the replies of a server-streaming RPC."""
+        responses = getattr(self.servicer, name)(request, context)
+        if self.loop is None:
+            return _Stream(responses, context)
+        return _AsyncStream(responses, context, self.loop)
+
+    def _run(self, handler, request, context):
+        if self.loop is None:
+            return handler(request, context)
+        return asyncio.run_coroutine_threadsafe(
+            handler(request, context), self.loop
+        ).result()
+
+
+class _Reply:
+    """The reply of a unary call as a one-item iterator."""
+
+    def __init__(self, run, handler, request, context):
+        self._call = (run, handler, request, context)
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        self._done = True
+        run, handler, request, context = self._call
+        return _guarded(context, run, handler, request, context)
+
+    def close(self):
+        self._done = True
+
+
+class _Stream:
+    """Replies of a streaming call on the thread-pool servicer."""
+
+    def __init__(self, responses, context):
+        self._responses = responses
+        self._context = context
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        message = _guarded(self._context, next, self._responses, None)
+        if message is None:
+            raise StopIteration
+        return message
+
+    def close(self):
+        # Closing the generator stops make, as a cancelled gRPC call would
+        self._responses.close()
+
+
+class _AsyncStream(_Stream):
+    """Replies of a streaming call on the asyncio servicer."""
+
+    def __init__(self, responses, context, loop):
+        super().__init__(responses, context)
+        self._loop = loop
+
+    def __next__(self):
+        message = _guarded(self._context, self._anext)
+        if message is None:
+            raise StopIteration
+        return message
+
+    def _anext(self):
+        try:
+            return asyncio.run_coroutine_threadsafe(
+                self._responses.__anext__(), self._loop
+            ).result()
+        except StopAsyncIteration:
+            return None
+        except futures.CancelledError:
+            # The server is shutting down
+            self._context.set_code(grpc.StatusCode.CANCELLED)
+            self._context.set_details("Server shutting down")
+            return None
+
+    def close(self):
+        # Not waited for: the loop may already be stopping
+        if not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._responses.aclose(), self._loop)
+
+
+def _guarded(context, function, *args):
+    """Call into the servicer; an exception ends the call as UNKNOWN."""
+    try:
+        return function(*args)
+    except Exception as e:
+        logger.exception("Error in transcoded call")
+        context.set_code(grpc.StatusCode.UNKNOWN)
+        context.set_details(f"Exception calling application: {e}")
+        return None